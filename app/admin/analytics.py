@@ -1,5 +1,15 @@
 """
 Analytics for admin panel.
+
+Reads the rollup tables from migrations/015_analytics_rollups.sql (maintained
+by triggers on jobs / ledger / free_usage / users), so a panel open costs the
+same regardless of how much history the source tables hold. Period filters use the rollup granularity:
+hour buckets for counts and sums, day buckets for distinct-user counts.
+All-time totals are summed from the buckets here rather than kept in single
+rows that every write would contend on.
+
+Rebuild after manual data fixes: Analytics.rebuild_rollups() or
+scripts/backfill_analytics_rollups.py.
 """
 import logging
 from decimal import Decimal
@@ -29,6 +39,28 @@ class Analytics:
             return False
         return True
     
+    async def rebuild_rollups(self) -> bool:
+        """
+        Recompute all rollup tables from jobs / ledger / free_usage / users.
+        
+        Blocks writes to those tables while it runs (see analytics_rollups_rebuild).
+        
+        Returns:
+            True if rebuilt, False if DB unavailable or rebuild failed
+        """
+        if not self._check_db_service():
+            logger.warning("[ANALYTICS] Database service unavailable, rollups not rebuilt")
+            return False
+        
+        try:
+            async with self.db_service.get_connection() as conn:
+                await conn.execute("SELECT analytics_rollups_rebuild()")
+            logger.info("[ANALYTICS] ✅ Rollups rebuilt")
+            return True
+        except Exception as e:
+            logger.warning(f"[ANALYTICS] Failed to rebuild rollups: {e}")
+            return False
+    
     async def get_top_models(self, limit: int = 10, period_days: int = 30) -> List[Dict[str, Any]]:
         """Get top models by usage."""
         if not self._check_db_service():
@@ -43,13 +75,14 @@ class Analytics:
                     """
                     SELECT 
                         model_id,
-                        COUNT(*) as total_uses,
-                        COUNT(*) FILTER (WHERE status = 'done') as success_count,
-                        COUNT(*) FILTER (WHERE status = 'failed') as fail_count,
-                        COALESCE(SUM(price_rub) FILTER (WHERE status = 'done'), 0) as revenue
-                    FROM jobs
-                    WHERE created_at >= $1
+                        SUM(total_uses)::BIGINT as total_uses,
+                        SUM(success_count)::BIGINT as success_count,
+                        SUM(fail_count)::BIGINT as fail_count,
+                        COALESCE(SUM(revenue_rub), 0) as revenue
+                    FROM analytics_jobs_hourly
+                    WHERE bucket >= date_trunc('hour', $1::timestamp)
                     GROUP BY model_id
+                    HAVING SUM(total_uses) > 0
                     ORDER BY total_uses DESC
                     LIMIT $2
                     """,
@@ -89,24 +122,17 @@ class Analytics:
         
         try:
             async with self.db_service.get_connection() as conn:
-                # Total users who used free
-                total_free_users = await conn.fetchval(
-                    "SELECT COUNT(DISTINCT user_id) FROM free_usage"
-                ) or 0
-                
-                # Users who also used paid
-                converted_users = await conn.fetchval(
+                # Users who used free / of them also paid (counted once per user by triggers)
+                row = await conn.fetchrow(
                     """
-                    SELECT COUNT(DISTINCT fu.user_id)
-                    FROM free_usage fu
-                    WHERE EXISTS (
-                        SELECT 1 FROM jobs j
-                        WHERE j.user_id = fu.user_id
-                        AND j.status = 'done'
-                        AND j.price_rub > 0
-                    )
+                    SELECT
+                        COALESCE(SUM(free_users), 0)::BIGINT as free_users,
+                        COALESCE(SUM(converted_users), 0)::BIGINT as converted_users
+                    FROM analytics_conversion_daily
                     """
-                ) or 0
+                )
+                total_free_users = (row["free_users"] if row else None) or 0
+                converted_users = (row["converted_users"] if row else None) or 0
                 
                 conversion_rate = (converted_users / total_free_users * 100) if total_free_users > 0 else 0
             
@@ -135,11 +161,11 @@ class Analytics:
                     """
                     SELECT 
                         model_id,
-                        COUNT(*) as fail_count,
-                        MAX(updated_at) as last_fail
-                    FROM jobs
-                    WHERE status = 'failed'
+                        SUM(fail_count)::BIGINT as fail_count,
+                        MAX(last_fail_at) as last_fail
+                    FROM analytics_jobs_hourly
                     GROUP BY model_id
+                    HAVING SUM(fail_count) > 0
                     ORDER BY fail_count DESC
                     LIMIT $1
                     """,
@@ -178,39 +204,33 @@ class Analytics:
                 # Total revenue
                 total_revenue = await conn.fetchval(
                     """
-                    SELECT COALESCE(SUM(price_rub), 0)
-                    FROM jobs
-                    WHERE status = 'done' AND created_at >= $1
-                    """,
-                    cutoff
-                ) or Decimal("0.00")
-                
-                # Total topups
-                total_topups = await conn.fetchval(
-                    """
-                    SELECT COALESCE(SUM(amount_rub), 0)
-                    FROM ledger
-                    WHERE kind = 'topup' AND created_at >= $1
+                    SELECT COALESCE(SUM(revenue_rub), 0)
+                    FROM analytics_jobs_hourly
+                    WHERE bucket >= date_trunc('hour', $1::timestamp)
                     """,
                     cutoff
                 ) or Decimal("0.00")
                 
-                # Total refunds
-                total_refunds = await conn.fetchval(
+                # Total topups / refunds
+                ledger_row = await conn.fetchrow(
                     """
-                    SELECT COALESCE(SUM(amount_rub), 0)
-                    FROM ledger
-                    WHERE kind = 'refund' AND created_at >= $1
+                    SELECT
+                        COALESCE(SUM(amount_rub) FILTER (WHERE kind = 'topup'), 0) as topups,
+                        COALESCE(SUM(amount_rub) FILTER (WHERE kind = 'refund'), 0) as refunds
+                    FROM analytics_ledger_hourly
+                    WHERE bucket >= date_trunc('hour', $1::timestamp)
                     """,
                     cutoff
-                ) or Decimal("0.00")
+                )
+                total_topups = (ledger_row["topups"] if ledger_row else None) or Decimal("0.00")
+                total_refunds = (ledger_row["refunds"] if ledger_row else None) or Decimal("0.00")
                 
                 # Number of paying users
                 paying_users = await conn.fetchval(
                     """
                     SELECT COUNT(DISTINCT user_id)
-                    FROM jobs
-                    WHERE status = 'done' AND price_rub > 0 AND created_at >= $1
+                    FROM analytics_user_daily
+                    WHERE day >= $1::date AND paid_done > 0
                     """,
                     cutoff
                 ) or 0
@@ -251,7 +271,7 @@ class Analytics:
             async with self.db_service.get_connection() as conn:
                 # New users
                 new_users = await conn.fetchval(
-                    "SELECT COUNT(*) FROM users WHERE created_at >= $1",
+                    "SELECT COALESCE(SUM(new_users), 0)::BIGINT FROM analytics_new_users_daily WHERE day >= $1::date",
                     cutoff
                 ) or 0
                 
@@ -259,15 +279,15 @@ class Analytics:
                 active_users = await conn.fetchval(
                     """
                     SELECT COUNT(DISTINCT user_id)
-                    FROM jobs
-                    WHERE created_at >= $1
+                    FROM analytics_user_daily
+                    WHERE day >= $1::date AND jobs > 0
                     """,
                     cutoff
                 ) or 0
                 
                 # Total users
                 total_users = await conn.fetchval(
-                    "SELECT COUNT(*) FROM users"
+                    "SELECT COALESCE(SUM(new_users), 0)::BIGINT FROM analytics_new_users_daily"
                 ) or 0
             
             return {
@@ -117,7 +117,29 @@ class Settings:
         except ValueError:
             self.price_multiplier = 2.0
             logger.warning(f"Invalid PRICE_MULTIPLIER: {price_multiplier_str}, using 2.0")
-    
+
+        # PostgreSQL connection pool
+        pool_min_str = os.getenv('DB_POOL_MIN_SIZE', '1')
+        try:
+            self.db_pool_min_size = max(int(pool_min_str), 0)
+        except ValueError:
+            self.db_pool_min_size = 1
+            logger.warning(f"Invalid DB_POOL_MIN_SIZE: {pool_min_str}, using 1")
+
+        pool_max_str = os.getenv('DB_POOL_MAX_SIZE', '10')
+        try:
+            self.db_pool_max_size = max(int(pool_max_str), 1)
+        except ValueError:
+            self.db_pool_max_size = 10
+            logger.warning(f"Invalid DB_POOL_MAX_SIZE: {pool_max_str}, using 10")
+
+        probe_interval_str = os.getenv('DB_POOL_PROBE_INTERVAL_SECONDS', '30')
+        try:
+            self.db_pool_probe_interval = float(probe_interval_str)
+        except ValueError:
+            self.db_pool_probe_interval = 30.0
+            logger.warning(f"Invalid DB_POOL_PROBE_INTERVAL_SECONDS: {probe_interval_str}, using 30")
+
     def get_storage_mode(self) -> str:
         """
         Определяет режим хранения данных.
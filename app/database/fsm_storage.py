@@ -0,0 +1,328 @@
+"""
+aiogram FSM storage on the ui_state table (write-behind, LRU read cache).
+
+MemoryStorage loses every in-progress input flow on restart or ACTIVE/PASSIVE
+handover. PostgresFSMStorage keeps the same hot path (state/data served from
+an in-process dict) and persists behind it:
+- reads: LRU cache; a miss costs one SELECT, then the key is cached
+  (missing rows are cached as empty);
+- writes: applied to the cache, the key is marked dirty and a flush is
+  scheduled; all keys dirtied within FSM_FLUSH_INTERVAL_MS go out as one
+  upsert + one delete (coalesced: N update_data calls -> one row write);
+- TTL: every write pushes expires_at to now + FSM_STATE_TTL_MINUTES; expired
+  rows are ignored on read and deleted in small batches piggybacked on
+  flushes (replaces the periodic fsm_cleanup_loop sweep).
+
+ui_state is keyed by user_id (FK to users), so only the default private-chat
+key (chat_id == user_id, no thread / business connection) is persisted.
+Other keys and users without a users row stay in memory, as before.
+
+Fail-open: while the pool is unavailable or a flush fails, the cache stays
+authoritative and dirty keys are retried on the next flush.
+
+Handover: flush() before releasing the singleton lock (or a scale-out shard)
+so the next owner reads the latest state; invalidate() after acquiring one so
+entries cached during an earlier ACTIVE period are re-read.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from app.utils.runtime_state import runtime_state
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        logger.warning(f"[FSM_STORAGE] Invalid {name}, using {default}")
+        return default
+
+
+class _Entry:
+    __slots__ = ("state", "data", "expires_at")
+
+    def __init__(self, state: Optional[str], data: Dict[str, Any], expires_at: float) -> None:
+        self.state = state
+        self.data = data
+        self.expires_at = expires_at
+
+    @property
+    def empty(self) -> bool:
+        return self.state is None and not self.data
+
+
+class PostgresFSMStorage(BaseStorage):
+    """aiogram BaseStorage backed by ui_state with write-behind flushes."""
+
+    def __init__(
+        self,
+        pool_getter: Callable[[], Any],
+        *,
+        ttl_minutes: Optional[int] = None,
+        cache_size: Optional[int] = None,
+        flush_interval: Optional[float] = None,
+        sweep_interval: float = 300.0,
+        sweep_batch: int = 500,
+    ) -> None:
+        self._pool_getter = pool_getter
+        self.ttl_seconds = 60 * (ttl_minutes if ttl_minutes is not None else _env_int("FSM_STATE_TTL_MINUTES", 60))
+        self.cache_size = cache_size if cache_size is not None else _env_int("FSM_CACHE_SIZE", 10000)
+        self.flush_interval = (
+            flush_interval if flush_interval is not None else _env_int("FSM_FLUSH_INTERVAL_MS", 500) / 1000
+        )
+        self.sweep_interval = sweep_interval
+        self.sweep_batch = sweep_batch
+        self._cache: "OrderedDict[StorageKey, _Entry]" = OrderedDict()
+        self._dirty: Set[StorageKey] = set()
+        self._flushing: Set[StorageKey] = set()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self._next_sweep = time.monotonic() + sweep_interval
+        self.stats = {"hits": 0, "misses": 0, "flushes": 0, "rows_written": 0, "flush_errors": 0, "expired": 0}
+
+    @staticmethod
+    def persistable(key: StorageKey) -> bool:
+        """ui_state holds one row per user: only the default private-chat key maps onto it."""
+        return (
+            key.destiny == "default"
+            and key.chat_id == key.user_id
+            and key.user_id > 0
+            and key.thread_id is None
+            and getattr(key, "business_connection_id", None) is None
+        )
+
+    # ==================== BaseStorage ====================
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        entry = await self._entry(key)
+        entry.state = state.state if isinstance(state, State) else state
+        self._touch(key, entry)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._entry(key)).state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise TypeError(f"FSM data must be a dict, got {type(data).__name__}")
+        entry = await self._entry(key)
+        entry.data = dict(data)
+        self._touch(key, entry)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return dict((await self._entry(key)).data)
+
+    async def close(self) -> None:
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+
+    # ==================== Cache ====================
+
+    async def _entry(self, key: StorageKey) -> _Entry:
+        now = time.monotonic()
+        entry = self._cache.get(key)
+        if entry is not None:
+            if entry.expires_at > now:
+                self._cache.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry
+            # Expired in memory: same as an expired row (flush deletes it if it was persisted)
+            self.stats["expired"] += 1
+            entry.state, entry.data = None, {}
+            entry.expires_at = now + self.ttl_seconds
+            if self.persistable(key):
+                self._dirty.add(key)
+            return entry
+
+        self.stats["misses"] += 1
+        loaded = await self._load(key) if self.persistable(key) else None
+        # Another coroutine may have filled the key while we were waiting on the DB
+        entry = self._cache.get(key)
+        if entry is None:
+            state, data, ttl_left = loaded or (None, {}, self.ttl_seconds)
+            entry = _Entry(state, data, now + ttl_left)
+            self._cache[key] = entry
+            self._evict()
+        return entry
+
+    def _touch(self, key: StorageKey, entry: _Entry) -> None:
+        entry.expires_at = time.monotonic() + self.ttl_seconds
+        self._cache.move_to_end(key)
+        if self.persistable(key):
+            self._dirty.add(key)
+            self._schedule_flush()
+
+    def _evict(self) -> None:
+        """Drop least recently used clean entries; dirty ones wait for their flush."""
+        excess = len(self._cache) - self.cache_size
+        if excess <= 0:
+            return
+        for key in list(self._cache.keys()):
+            if excess <= 0:
+                break
+            if key not in self._dirty and key not in self._flushing:
+                del self._cache[key]
+                excess -= 1
+
+    def invalidate(self, chat_filter: Optional[Callable[[int], bool]] = None) -> int:
+        """
+        Drop clean cached entries (all, or those whose chat matches chat_filter).
+
+        Call when this instance takes over chats another instance may have
+        written meanwhile (lock acquired, scale-out shard acquired).
+        """
+        stale = [
+            key for key in self._cache
+            if key not in self._dirty and key not in self._flushing
+            and (chat_filter is None or chat_filter(key.chat_id))
+        ]
+        for key in stale:
+            del self._cache[key]
+        return len(stale)
+
+    # ==================== Postgres ====================
+
+    async def _load(self, key: StorageKey) -> Optional[Tuple[Optional[str], Dict[str, Any], float]]:
+        pool = self._pool_getter()
+        if pool is None:
+            return None
+        try:
+            row = await pool.fetchrow(
+                """
+                SELECT state, data::text AS data,
+                       EXTRACT(EPOCH FROM (expires_at - NOW()))::float8 AS ttl_left
+                FROM ui_state
+                WHERE user_id = $1 AND (expires_at IS NULL OR expires_at > NOW())
+                """,
+                key.user_id,
+            )
+        except Exception as e:
+            logger.warning(f"[FSM_STORAGE] ⚠️ Load failed for user {key.user_id}, starting empty: {e}")
+            return None
+        if row is None:
+            return None
+        data = json.loads(row["data"]) if row["data"] else {}
+        ttl_left = row["ttl_left"] if row["ttl_left"] is not None else self.ttl_seconds
+        return (row["state"] or None), (data if isinstance(data, dict) else {}), ttl_left
+
+    def _schedule_flush(self, delay: Optional[float] = None) -> None:
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later(delay or self.flush_interval))
+
+    async def _flush_later(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+        # Writes that land while this flush runs schedule the next one
+        self._flush_task = None
+        if not await self.flush() and self._dirty and self._pool_getter() is not None:
+            self._schedule_flush(max(self.flush_interval, 5.0))
+
+    async def flush(self) -> int:
+        """Write every dirty key in one round trip. Returns rows written (0 if DB unavailable)."""
+        async with self._flush_lock:
+            if not self._dirty:
+                await self._maybe_sweep()
+                return 0
+            pool = self._pool_getter()
+            if pool is None:
+                # Kept dirty; the next write schedules another attempt
+                return 0
+
+            keys, self._dirty = self._dirty, set()
+            self._flushing = keys
+            upserts: List[Tuple[int, str, str]] = []
+            deletes: List[int] = []
+            for key in keys:
+                entry = self._cache.get(key)
+                if entry is None or entry.empty:
+                    deletes.append(key.user_id)
+                else:
+                    upserts.append((key.user_id, entry.state or "", json.dumps(entry.data, default=str)))
+
+            try:
+                async with pool.acquire() as conn:
+                    async with conn.transaction():
+                        if upserts:
+                            await conn.execute(
+                                """
+                                INSERT INTO ui_state (user_id, state, data, updated_at, expires_at)
+                                SELECT t.user_id, t.state, t.data::jsonb, NOW(),
+                                       NOW() + make_interval(secs => $4)
+                                FROM unnest($1::bigint[], $2::text[], $3::text[]) AS t(user_id, state, data)
+                                WHERE EXISTS (SELECT 1 FROM users u WHERE u.user_id = t.user_id)
+                                ON CONFLICT (user_id) DO UPDATE
+                                SET state = EXCLUDED.state,
+                                    data = EXCLUDED.data,
+                                    updated_at = EXCLUDED.updated_at,
+                                    expires_at = EXCLUDED.expires_at
+                                """,
+                                [u[0] for u in upserts], [u[1] for u in upserts], [u[2] for u in upserts],
+                                float(self.ttl_seconds),
+                            )
+                        if deletes:
+                            await conn.execute("DELETE FROM ui_state WHERE user_id = ANY($1::bigint[])", deletes)
+            except asyncio.CancelledError:
+                self._dirty |= keys
+                raise
+            except Exception as e:
+                self._dirty |= keys
+                self.stats["flush_errors"] += 1
+                logger.warning(f"[FSM_STORAGE] ⚠️ Flush of {len(keys)} states failed, will retry: {e}")
+                return 0
+            finally:
+                self._flushing = set()
+
+            self.stats["flushes"] += 1
+            self.stats["rows_written"] += len(keys)
+            self._evict()
+            await self._maybe_sweep()
+            return len(keys)
+
+    async def _maybe_sweep(self) -> None:
+        """Delete a batch of expired rows, at most once per sweep_interval."""
+        now = time.monotonic()
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + self.sweep_interval
+        pool = self._pool_getter()
+        if pool is None:
+            return
+        try:
+            result = await pool.execute(
+                """
+                DELETE FROM ui_state
+                WHERE user_id IN (
+                    SELECT user_id FROM ui_state WHERE expires_at < NOW() LIMIT $1
+                )
+                """,
+                self.sweep_batch,
+            )
+            # Health check reads this (was set by the old fsm_cleanup_loop)
+            runtime_state.fsm_cleanup_last_run = datetime.now(timezone.utc).isoformat()
+            if result and result != "DELETE 0":
+                logger.info(f"[FSM_STORAGE] Expired states removed: {result}")
+        except Exception as e:
+            logger.debug(f"[FSM_STORAGE] Expired state sweep failed: {e}")
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "cached": len(self._cache),
+            "dirty": len(self._dirty),
+            "persistent": self._pool_getter() is not None,
+        }
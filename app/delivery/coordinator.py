@@ -17,8 +17,9 @@ Responsibilities:
 import logging
 from typing import Optional, Dict, Any, List
 from aiogram import Bot
-from aiogram.types import BufferedInputFile, FSInputFile
-import aiohttp
+
+from app.delivery.media_stream import get_media_pipeline
+from app.delivery.send_scheduler import SendLane, send_lane
 
 logger = logging.getLogger(__name__)
 
@@ -115,6 +116,7 @@ async def deliver_result_atomic(
         }
     
     # STEP 3: Deliver media based on category (with retry for Telegram API failures)
+    # Sends go through the RESULT lane of the send scheduler (ahead of menus/broadcasts)
     url = result_urls[0]  # Primary result
     logger.info(f"{tag} [DELIVER_START] task_id={task_id} category={category} url={url[:80]}")
     
@@ -216,61 +218,32 @@ async def deliver_result_atomic(
 
 
 async def _deliver_image(bot: Bot, chat_id: int, url: str, category: str, tag: str):
-    """Deliver image with 3-level fallback"""
+    """Deliver image: direct URL -> streamed upload -> document"""
     caption = "✅ Генерация завершена"
     if category in {"upscale", "enhance"}:
         caption = "✅ Улучшено"
     
-    try:
-        # Level 1: Direct URL (Telegram fetches)
-        await bot.send_photo(chat_id, url, caption=caption)
-        logger.info(f"{tag} [DELIVER_IMAGE_OK] method=direct_url")
-    except Exception as e1:
-        logger.warning(f"{tag} [DELIVER_IMAGE_FALLBACK_BYTES] direct_url failed: {e1}")
-        try:
-            # Level 2: Download bytes
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, timeout=aiohttp.ClientTimeout(total=30)) as resp:
-                    resp.raise_for_status()
-                    image_bytes = await resp.read()
-            
-            input_file = BufferedInputFile(image_bytes, filename="result.jpg")
-            await bot.send_photo(chat_id, photo=input_file, caption=caption)
-            logger.info(f"{tag} [DELIVER_IMAGE_OK] method=bytes")
-        except Exception as e2:
-            logger.warning(f"{tag} [DELIVER_IMAGE_FALLBACK_DOCUMENT] bytes failed: {e2}")
-            # Level 3: Send as document
-            await bot.send_document(chat_id, url, caption=f"{caption}\n\nURL: {url}")
-            logger.info(f"{tag} [DELIVER_IMAGE_OK] method=document")
+    with send_lane(SendLane.RESULT):
+        method = await get_media_pipeline().deliver(bot, chat_id, url, category, caption, tag)
+    logger.info(f"{tag} [DELIVER_IMAGE_OK] method={method}")
 
 
 async def _deliver_video(bot: Bot, chat_id: int, url: str, tag: str):
-    """Deliver video with fallback"""
-    caption = "✅ Видео готово"
-    
-    try:
-        await bot.send_video(chat_id, url, caption=caption)
-        logger.info(f"{tag} [DELIVER_VIDEO_OK] method=direct_url")
-    except Exception as e:
-        logger.warning(f"{tag} [DELIVER_VIDEO_FALLBACK_DOCUMENT] {e}")
-        await bot.send_document(chat_id, url, caption=f"{caption}\n\nURL: {url}")
-        logger.info(f"{tag} [DELIVER_VIDEO_OK] method=document")
+    """Deliver video: direct URL -> streamed upload -> document/link"""
+    with send_lane(SendLane.RESULT):
+        method = await get_media_pipeline().deliver(bot, chat_id, url, "video", "✅ Видео готово", tag)
+    logger.info(f"{tag} [DELIVER_VIDEO_OK] method={method}")
 
 
 async def _deliver_audio(bot: Bot, chat_id: int, url: str, tag: str):
-    """Deliver audio with fallback"""
-    caption = "✅ Аудио готово"
-    
-    try:
-        await bot.send_audio(chat_id, url, caption=caption)
-        logger.info(f"{tag} [DELIVER_AUDIO_OK] method=direct_url")
-    except Exception as e:
-        logger.warning(f"{tag} [DELIVER_AUDIO_FALLBACK_DOCUMENT] {e}")
-        await bot.send_document(chat_id, url, caption=f"{caption}\n\nURL: {url}")
-        logger.info(f"{tag} [DELIVER_AUDIO_OK] method=document")
+    """Deliver audio: direct URL -> streamed upload -> document/link"""
+    with send_lane(SendLane.RESULT):
+        method = await get_media_pipeline().deliver(bot, chat_id, url, "audio", "✅ Аудио готово", tag)
+    logger.info(f"{tag} [DELIVER_AUDIO_OK] method={method}")
 
 
 async def _deliver_document(bot: Bot, chat_id: int, url: str, tag: str):
     """Deliver as document (generic fallback)"""
-    await bot.send_document(chat_id, url, caption="✅ Результат готов")
-    logger.info(f"{tag} [DELIVER_DOCUMENT_OK]")
+    with send_lane(SendLane.RESULT):
+        method = await get_media_pipeline().deliver(bot, chat_id, url, "document", "✅ Результат готов", tag)
+    logger.info(f"{tag} [DELIVER_DOCUMENT_OK] method={method}")
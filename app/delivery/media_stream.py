@@ -0,0 +1,269 @@
+"""
+Streaming media delivery for generation results.
+
+Result files are never buffered whole in memory: fallback uploads stream
+from one pooled aiohttp session straight into the Telegram multipart request
+in DELIVERY_CHUNK_SIZE pieces, and at most DELIVERY_MAX_DOWNLOADS
+downloads run at once. This matters for video results on 512 MB instances.
+
+Send method is chosen from a HEAD probe (Content-Length / Content-Type)
+against Telegram Bot API limits:
+- by URL (Telegram fetches): photo <= 5 MB, other files <= 20 MB
+- multipart upload: photo <= 10 MB, other files <= 50 MB
+Anything larger is delivered as a link.
+
+Configuration (ENV):
+- DELIVERY_MAX_DOWNLOADS: concurrent streaming downloads (default 4)
+- DELIVERY_CHUNK_SIZE: upload chunk size in bytes (default 65536)
+- DELIVERY_HTTP_POOL_LIMIT: pooled connections for result hosts (default 20)
+"""
+
+import asyncio
+import logging
+import mimetypes
+import os
+from dataclasses import dataclass, field
+from typing import Any, AsyncGenerator, Dict, Optional
+from urllib.parse import urlparse
+
+import aiohttp
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.types import InputFile
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+# Telegram Bot API limits per send kind
+URL_LIMITS = {"photo": 5 * MB, "video": 20 * MB, "audio": 20 * MB, "document": 20 * MB}
+UPLOAD_LIMITS = {"photo": 10 * MB, "video": 50 * MB, "audio": 50 * MB, "document": 50 * MB}
+
+# MIME types Telegram plays inline; others go as document
+VIDEO_MIME = {"video/mp4"}
+AUDIO_MIME = {"audio/mpeg", "audio/mp3", "audio/mp4", "audio/x-m4a", "audio/m4a"}
+
+CATEGORY_KINDS = {
+    "image": "photo", "text2image": "photo", "image2image": "photo", "upscale": "photo", "enhance": "photo",
+    "video": "video", "text2video": "video", "image2video": "video",
+    "audio": "audio", "music": "audio", "text2audio": "audio", "text2music": "audio",
+}
+
+
+@dataclass
+class MediaProbe:
+    """Size/MIME of a result URL (None = unknown)."""
+    size: Optional[int] = None
+    mime: Optional[str] = None
+
+
+def choose_kind(category: str, probe: MediaProbe) -> str:
+    """Pick Telegram send method (photo/video/audio/document) for a result."""
+    kind = CATEGORY_KINDS.get(category, "document")
+    mime = probe.mime
+    if mime:
+        if kind == "photo" and not mime.startswith("image/"):
+            kind = "document"
+        elif kind == "video" and mime not in VIDEO_MIME:
+            kind = "document"
+        elif kind == "audio" and mime not in AUDIO_MIME:
+            kind = "document"
+    if kind == "photo" and probe.size is not None and probe.size > UPLOAD_LIMITS["photo"]:
+        # Too big to be a photo, still fits as a document
+        kind = "document"
+    return kind
+
+
+def _fits(size: Optional[int], limit: int) -> bool:
+    return size is None or size <= limit
+
+
+def _filename(url: str, mime: Optional[str], kind: str) -> str:
+    name = os.path.basename(urlparse(url).path)
+    if name and "." in name:
+        return name
+    ext = mimetypes.guess_extension(mime) if mime else None
+    default_ext = {"photo": ".jpg", "video": ".mp4", "audio": ".mp3"}.get(kind, ".bin")
+    return f"result{ext or default_ext}"
+
+
+@dataclass
+class DeliveryStats:
+    """Counters for /diagnostics."""
+    downloads_active: int = 0
+    downloads_total: int = 0
+    bytes_streamed: int = 0
+    by_method: Dict[str, int] = field(default_factory=dict)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "downloads_active": self.downloads_active,
+            "downloads_total": self.downloads_total,
+            "bytes_streamed": self.bytes_streamed,
+            "by_method": dict(self.by_method),
+        }
+
+
+class StreamingInputFile(InputFile):
+    """InputFile that streams a URL through the pipeline's pooled session."""
+
+    def __init__(self, pipeline: "MediaPipeline", url: str, filename: str) -> None:
+        super().__init__(filename=filename, chunk_size=pipeline.chunk_size)
+        self.pipeline = pipeline
+        self.url = url
+
+    async def read(self, bot: Bot) -> AsyncGenerator[bytes, None]:
+        async for chunk in self.pipeline.stream(self.url):
+            yield chunk
+
+
+class MediaPipeline:
+    """Pooled session + download cap + per-category send method selection."""
+
+    def __init__(
+        self,
+        max_downloads: Optional[int] = None,
+        chunk_size: Optional[int] = None,
+        pool_limit: Optional[int] = None,
+    ) -> None:
+        self.max_downloads = max_downloads or int(os.getenv("DELIVERY_MAX_DOWNLOADS", "4"))
+        self.chunk_size = chunk_size or int(os.getenv("DELIVERY_CHUNK_SIZE", "65536"))
+        self.pool_limit = pool_limit or int(os.getenv("DELIVERY_HTTP_POOL_LIMIT", "20"))
+        self.stats = DeliveryStats()
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Get or create the shared session (re-created if closed or on a new loop)."""
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            connector = aiohttp.TCPConnector(limit=self.pool_limit, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._semaphore = asyncio.Semaphore(self.max_downloads)
+            self._loop = loop
+        return self._session
+
+    async def probe(self, url: str) -> MediaProbe:
+        """HEAD the result URL; unknown probe on any failure."""
+        try:
+            session = self._get_session()
+            async with session.head(
+                url, allow_redirects=True, timeout=aiohttp.ClientTimeout(total=10)
+            ) as resp:
+                if resp.status >= 400:
+                    return MediaProbe()
+                mime = resp.headers.get("Content-Type", "").split(";")[0].strip().lower() or None
+                length = resp.headers.get("Content-Length")
+                return MediaProbe(size=int(length) if length and length.isdigit() else None, mime=mime)
+        except Exception as e:
+            logger.debug(f"[DELIVER_PROBE] HEAD failed for {url[:80]}: {e}")
+            return MediaProbe()
+
+    async def stream(self, url: str) -> AsyncGenerator[bytes, None]:
+        """Yield the body of url in chunk_size pieces (bounded concurrency)."""
+        session = self._get_session()
+        async with self._semaphore:
+            self.stats.downloads_active += 1
+            self.stats.downloads_total += 1
+            try:
+                async with session.get(url, timeout=aiohttp.ClientTimeout(total=None, sock_read=60)) as resp:
+                    resp.raise_for_status()
+                    async for chunk in resp.content.iter_chunked(self.chunk_size):
+                        self.stats.bytes_streamed += len(chunk)
+                        yield chunk
+            finally:
+                self.stats.downloads_active -= 1
+
+    async def _send(self, bot: Bot, kind: str, chat_id: int, media: Any, caption: str) -> None:
+        if kind == "photo":
+            await bot.send_photo(chat_id, photo=media, caption=caption)
+        elif kind == "video":
+            await bot.send_video(chat_id, video=media, caption=caption, supports_streaming=True)
+        elif kind == "audio":
+            await bot.send_audio(chat_id, audio=media, caption=caption)
+        else:
+            await bot.send_document(chat_id, document=media, caption=caption)
+
+    async def deliver(self, bot: Bot, chat_id: int, url: str, category: str, caption: str, tag: str = "") -> str:
+        """
+        Send one result, cheapest working method first.
+
+        Returns:
+            Method used: '<kind>_url', '<kind>_stream' or 'link'
+
+        Raises:
+            TelegramRetryAfter immediately (caller backs off); last error if every level failed
+        """
+        probe = await self.probe(url)
+        kind = choose_kind(category, probe)
+        last_error: Optional[Exception] = None
+
+        # Level 1: Direct URL (Telegram fetches, no bytes through this instance)
+        if _fits(probe.size, URL_LIMITS[kind]):
+            try:
+                await self._send(bot, kind, chat_id, url, caption)
+                return self._count(f"{kind}_url")
+            except TelegramRetryAfter:
+                raise
+            except Exception as e:
+                last_error = e
+                logger.warning(f"{tag} [DELIVER_FALLBACK_STREAM] {kind} by url failed: {e}")
+
+        # Level 2: Stream upload (no whole-file buffering)
+        if _fits(probe.size, UPLOAD_LIMITS[kind]):
+            try:
+                media = StreamingInputFile(self, url, _filename(url, probe.mime, kind))
+                await self._send(bot, kind, chat_id, media, caption)
+                return self._count(f"{kind}_stream")
+            except TelegramRetryAfter:
+                raise
+            except Exception as e:
+                last_error = e
+                logger.warning(f"{tag} [DELIVER_FALLBACK_DOCUMENT] {kind} stream failed: {e}")
+
+        # Level 3: Document by URL (different Telegram fetch path), then plain link
+        if kind != "document" and _fits(probe.size, URL_LIMITS["document"]):
+            try:
+                await bot.send_document(chat_id, url, caption=f"{caption}\n\nURL: {url}")
+                return self._count("document_url")
+            except TelegramRetryAfter:
+                raise
+            except Exception as e:
+                last_error = e
+                logger.warning(f"{tag} [DELIVER_FALLBACK_LINK] document by url failed: {e}")
+
+        if probe.size is not None and probe.size > UPLOAD_LIMITS[kind]:
+            await bot.send_message(chat_id, f"{caption}\n\n{url}")
+            return self._count("link")
+
+        raise last_error or RuntimeError("No delivery method available")
+
+    def _count(self, method: str) -> str:
+        self.stats.by_method[method] = self.stats.by_method.get(method, 0) + 1
+        return method
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._semaphore = None
+        self._loop = None
+
+
+# Global pipeline instance
+_pipeline: Optional[MediaPipeline] = None
+
+
+def get_media_pipeline() -> MediaPipeline:
+    """Get process-wide media delivery pipeline."""
+    global _pipeline
+    if _pipeline is None:
+        _pipeline = MediaPipeline()
+    return _pipeline
+
+
+async def close_media_pipeline() -> None:
+    """Close the shared session (call on shutdown)."""
+    if _pipeline is not None:
+        await _pipeline.close()
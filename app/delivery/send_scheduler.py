@@ -0,0 +1,331 @@
+"""
+Outbound Telegram send scheduler (aiogram request middleware).
+
+Every Bot API call goes through bot.session; calls addressed to a chat
+(send*/edit*/copy*/forward*) are paced by:
+- a global token bucket (Telegram: ~30 msg/s per bot);
+- a per-chat bucket (private chats ~1 msg/s, groups ~20 msg/min);
+- priority lanes for the global bucket: results > menus > broadcasts. When
+  the bot is at its global limit, waiting results go first and broadcasts
+  only take the capacity nobody else wants.
+
+429 (TelegramRetryAfter): the chat is paused for retry_after, the global
+bucket is drained, and the request is re-queued (up to max_retries, only if
+retry_after <= max_retry_after). Callers keep their own error handling for
+everything else.
+
+Lane is picked by the caller:
+
+    with send_lane(SendLane.RESULT):
+        await bot.send_photo(...)
+
+Default lane is MENU (interactive handler replies).
+"""
+
+import asyncio
+import contextvars
+import logging
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+from app.utils.metrics import get_registry
+
+logger = logging.getLogger(__name__)
+
+
+class SendLane(IntEnum):
+    """Priority lanes (lower value = served first)."""
+
+    RESULT = 0
+    MENU = 1
+    BROADCAST = 2
+
+
+_current_lane: contextvars.ContextVar[SendLane] = contextvars.ContextVar("send_lane", default=SendLane.MENU)
+
+
+@contextmanager
+def send_lane(lane: SendLane) -> Iterator[None]:
+    """Send everything inside the block through the given lane."""
+    token = _current_lane.set(lane)
+    try:
+        yield
+    finally:
+        _current_lane.reset(token)
+
+
+# Chat-addressed methods that do not produce messages (not paced)
+EXEMPT_METHODS = frozenset({
+    "GetChat",
+    "GetChatAdministrators",
+    "GetChatMember",
+    "GetChatMemberCount",
+    "SendChatAction",
+    "LeaveChat",
+})
+
+# Idle buckets are dropped after this many seconds
+CHAT_BUCKET_IDLE_SECONDS = 300.0
+
+_SENDS = get_registry().counter("telegram_sends_total", "Paced Telegram API calls", ("lane", "outcome"))
+_WAIT_SECONDS = get_registry().histogram("telegram_send_wait_seconds", "Time spent waiting for send capacity", ("lane",))
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)))
+    except ValueError:
+        logger.warning(f"[SEND_SCHEDULER] Invalid {name}, using {default}")
+        return default
+
+
+class TokenBucket:
+    """Token bucket with an explicit pause (for retry_after)."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated", "paused_until")
+
+    def __init__(self, rate: float, capacity: float, now: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+        self.paused_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Seconds until one token is available (0 if available now)."""
+        if now < self.paused_until:
+            return self.paused_until - now
+        self._refill(now)
+        if self.tokens >= 1.0:
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1.0
+
+    def pause(self, seconds: float, now: float) -> None:
+        self.paused_until = max(self.paused_until, now + seconds)
+        self.tokens = 0.0
+        self.updated = max(self.updated, now)
+
+    def idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity and now >= self.paused_until
+
+
+@dataclass
+class SendSchedulerStats:
+    sent: int = 0
+    waited: int = 0
+    retry_after_hits: int = 0
+    retries: int = 0
+    gave_up: int = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return {
+            "sent": self.sent,
+            "waited": self.waited,
+            "retry_after_hits": self.retry_after_hits,
+            "retries": self.retries,
+            "gave_up": self.gave_up,
+        }
+
+
+class SendScheduler(BaseRequestMiddleware):
+    """Global + per-chat pacing with priority lanes and 429 handling."""
+
+    def __init__(
+        self,
+        global_rate: Optional[float] = None,
+        chat_rate: Optional[float] = None,
+        chat_burst: Optional[float] = None,
+        group_per_minute: Optional[float] = None,
+        max_retries: int = 3,
+        max_retry_after: Optional[float] = None,
+    ) -> None:
+        self.global_rate = global_rate if global_rate is not None else _env_float("TELEGRAM_GLOBAL_RPS", 28.0)
+        self.chat_rate = chat_rate if chat_rate is not None else _env_float("TELEGRAM_CHAT_RPS", 1.0)
+        self.chat_burst = chat_burst if chat_burst is not None else _env_float("TELEGRAM_CHAT_BURST", 3.0)
+        self.group_per_minute = (
+            group_per_minute if group_per_minute is not None else _env_float("TELEGRAM_GROUP_PER_MINUTE", 20.0)
+        )
+        self.max_retries = max_retries
+        self.max_retry_after = (
+            max_retry_after if max_retry_after is not None else _env_float("TELEGRAM_MAX_RETRY_AFTER", 30.0)
+        )
+
+        now = time.monotonic()
+        self._global = TokenBucket(self.global_rate, max(1.0, self.global_rate), now)
+        self._chats: Dict[Any, TokenBucket] = {}
+        self._waiters: List[Deque[asyncio.Future]] = [deque() for _ in SendLane]
+        self._pump: Optional[asyncio.Task] = None
+        self._next_sweep = now + CHAT_BUCKET_IDLE_SECONDS
+        self.stats = SendSchedulerStats()
+
+    # ------------------------------------------------------------------ buckets
+
+    def _chat_bucket(self, chat_id: Any, now: float) -> TokenBucket:
+        if now >= self._next_sweep:
+            self._sweep(now)
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if isinstance(chat_id, int) and chat_id > 0:
+                bucket = TokenBucket(self.chat_rate, max(1.0, self.chat_burst), now)
+            else:
+                # Groups/channels (negative ids, @usernames)
+                bucket = TokenBucket(self.group_per_minute / 60.0, max(1.0, self.chat_burst), now)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def _sweep(self, now: float) -> None:
+        idle = [chat_id for chat_id, bucket in self._chats.items() if bucket.idle(now)]
+        for chat_id in idle:
+            del self._chats[chat_id]
+        self._next_sweep = now + CHAT_BUCKET_IDLE_SECONDS
+
+    async def _acquire_chat(self, chat_id: Any) -> float:
+        waited = 0.0
+        while True:
+            now = time.monotonic()
+            bucket = self._chat_bucket(chat_id, now)
+            delay = bucket.delay(now)
+            if delay <= 0:
+                bucket.take(now)
+                return waited
+            waited += delay
+            await asyncio.sleep(delay)
+
+    def _has_waiters(self, up_to: SendLane) -> bool:
+        return any(self._waiters[lane] for lane in range(up_to + 1))
+
+    async def _acquire_global(self, lane: SendLane) -> None:
+        now = time.monotonic()
+        if not self._has_waiters(lane) and self._global.delay(now) <= 0:
+            self._global.take(now)
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[lane].append(future)
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.create_task(self._run_pump())
+        await future
+
+    def _next_waiter(self) -> Optional[asyncio.Future]:
+        for queue in self._waiters:
+            while queue:
+                future = queue.popleft()
+                if not future.done():
+                    return future
+        return None
+
+    async def _run_pump(self) -> None:
+        """Hand out global tokens to waiters, highest-priority lane first."""
+        while self._has_waiters(SendLane.BROADCAST):
+            delay = self._global.delay(time.monotonic())
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            future = self._next_waiter()
+            if future is None:
+                break
+            self._global.take(time.monotonic())
+            future.set_result(None)
+
+    async def acquire(self, chat_id: Any = None, lane: Optional[SendLane] = None) -> float:
+        """
+        Wait for capacity to send one message.
+
+        Args:
+            chat_id: target chat (None: global bucket only)
+            lane: priority lane (default: lane of the current context)
+
+        Returns:
+            Seconds spent waiting
+        """
+        lane = _current_lane.get() if lane is None else lane
+        started = time.monotonic()
+        if chat_id is not None:
+            await self._acquire_chat(chat_id)
+        await self._acquire_global(lane)
+        waited = time.monotonic() - started
+        if waited > 0.001:
+            self.stats.waited += 1
+        _WAIT_SECONDS.labels(lane.name.lower()).observe(waited)
+        return waited
+
+    def on_retry_after(self, chat_id: Any, retry_after: float) -> None:
+        """Apply a 429: pause the chat and drain the global bucket."""
+        now = time.monotonic()
+        self.stats.retry_after_hits += 1
+        if chat_id is not None:
+            self._chat_bucket(chat_id, now).pause(retry_after, now)
+        self._global.pause(0.0, now)
+
+    # --------------------------------------------------------------- middleware
+
+    async def __call__(self, make_request, bot, method):
+        if type(method).__name__ in EXEMPT_METHODS:
+            return await make_request(bot, method)
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            # answerCallbackQuery, getUpdates, inline edits: not chat-paced
+            return await make_request(bot, method)
+
+        lane = _current_lane.get()
+        lane_name = lane.name.lower()
+        attempt = 0
+        while True:
+            await self.acquire(chat_id, lane)
+            try:
+                result = await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.on_retry_after(chat_id, e.retry_after)
+                if attempt >= self.max_retries or e.retry_after > self.max_retry_after:
+                    self.stats.gave_up += 1
+                    _SENDS.labels(lane_name, "retry_after").inc()
+                    logger.warning(
+                        f"[SEND_SCHEDULER] 429 for chat={chat_id} retry_after={e.retry_after}s, "
+                        f"giving up after {attempt} retries"
+                    )
+                    raise
+                attempt += 1
+                self.stats.retries += 1
+                logger.info(f"[SEND_SCHEDULER] 429 for chat={chat_id}, chat paused {e.retry_after}s (retry {attempt})")
+                continue
+            except Exception:
+                _SENDS.labels(lane_name, "error").inc()
+                raise
+            self.stats.sent += 1
+            _SENDS.labels(lane_name, "ok").inc()
+            return result
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            **self.stats.as_dict(),
+            "chats_tracked": len(self._chats),
+            "waiting": {lane.name.lower(): len(self._waiters[lane]) for lane in SendLane},
+        }
+
+
+_scheduler: Optional[SendScheduler] = None
+
+
+def get_send_scheduler() -> SendScheduler:
+    """Get global send scheduler."""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = SendScheduler()
+    return _scheduler
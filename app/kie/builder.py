@@ -1,24 +1,25 @@
 """
 Universal payload builder for Kie.ai createTask based on model schema from source_of_truth.
 """
-import json
-import os
 from typing import Dict, Any, Optional, List
 from pathlib import Path
-from functools import lru_cache
 import logging
 
+from app.kie.catalog import get_catalog
+
 logger = logging.getLogger(__name__)
 
 
-@lru_cache(maxsize=1)
 def load_source_of_truth(file_path: str = "models/KIE_SOURCE_OF_TRUTH.json") -> Dict[str, Any]:
     """
-    Load KIE model catalog from SSOT (Single Source of Truth) - cached for performance.
+    Load KIE model catalog from SSOT (Single Source of Truth).
     
     CRITICAL: Only models/KIE_SOURCE_OF_TRUTH.json is used in runtime.
     All other JSON files in models/ are deprecated and moved to models/_deprecated/.
     
+    Served from the in-memory catalog (app.kie.catalog): the file is parsed
+    once and re-parsed only when its mtime changes.
+    
     Args:
         file_path: SSOT path (default: models/KIE_SOURCE_OF_TRUTH.json)
     
@@ -26,17 +27,7 @@ def load_source_of_truth(file_path: str = "models/KIE_SOURCE_OF_TRUTH.json") ->
         Dict with models, pricing, schemas
     """
     # SSOT enforcement: ignore file_path parameter, always use canonical path
-    master_path = "models/KIE_SOURCE_OF_TRUTH.json"
-    
-    if not os.path.exists(master_path):
-        logger.error(f"CRITICAL: SOURCE_OF_TRUTH not found: {master_path}")
-        return {}
-    
-    logger.info(f"✅ Loading SOURCE_OF_TRUTH v1.2.0 (cached): {master_path}")
-    
-    with open(master_path, 'r', encoding='utf-8') as f:
-        return json.load(f)
-
+    return get_catalog().raw
 
 
 def get_model_schema(model_id: str, source_of_truth: Optional[Dict] = None) -> Optional[Dict[str, Any]]:
@@ -0,0 +1,503 @@
+"""
+Durable KIE callback inbox.
+
+The HTTP handler only validates the payload and INSERTs it into
+kie_callback_inbox (migration 017), then returns 200 at once. Job lookup,
+status updates, the delivery lock and the Telegram send happen in a worker
+pool that drains the inbox with FOR UPDATE SKIP LOCKED, so a slow Telegram
+send never holds the KIE request open.
+
+Inbox rows:
+- pending → processing (claimed with a lease; an expired lease is reclaimed
+  after a crash) → done | failed
+- callbacks for a task are processed in arrival order (a row is not claimed
+  while an older row of the same task is pending/processing)
+- "job not found" (callback raced job creation) is retried every
+  orphan_retry_seconds until orphan_max_age_minutes; this replaces the
+  orphan_callbacks table + OrphanCallbackReconciler
+- processing errors are retried with exponential backoff up to max_attempts
+
+Storage without inbox support (JSON mode) or a failed INSERT falls back to
+inline processing in the handler (previous behaviour).
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+OUTCOME_PROCESSED = "processed"
+OUTCOME_ORPHAN = "orphan"
+OUTCOME_IGNORED = "ignored"
+
+
+def notify_completion_engine(task_id: str, state: str, result_urls: list, error_msg: Optional[str]) -> None:
+    """Wake the in-process generator waiting on task_id (callback-first completion)."""
+    if state not in ("success", "fail"):
+        return
+    try:
+        from app.kie.completion import get_completion_engine
+
+        record = {"taskId": task_id, "state": state}
+        if state == "success":
+            record["resultJson"] = json.dumps({"resultUrls": result_urls or []})
+        else:
+            record["failMsg"] = error_msg or ""
+        get_completion_engine().notify(task_id, record)
+    except Exception as exc:
+        logger.debug(f"[KIE_CALLBACK] Completion engine notify failed: {exc}")
+
+
+def supports_inbox(storage: Any) -> bool:
+    return hasattr(storage, "enqueue_kie_callback") and hasattr(storage, "claim_kie_callbacks")
+
+
+def _job_chat_id(job: Dict[str, Any]) -> Optional[int]:
+    user_id = job.get('user_id')
+    chat_id = job.get('chat_id') or user_id  # Use chat_id from job if available
+    if not chat_id and job.get('params'):
+        params = job.get('params')
+        if isinstance(params, dict):
+            chat_id = params.get('chat_id') or user_id
+        elif isinstance(params, str):
+            try:
+                params_dict = json.loads(params)
+                chat_id = params_dict.get('chat_id') or user_id
+            except Exception:
+                pass
+    return chat_id
+
+
+def _delivery_category(model_id: str) -> str:
+    model_id = (model_id or '').lower()
+    if 'video' in model_id:
+        return 'video'
+    if 'audio' in model_id or 'music' in model_id:
+        return 'audio'
+    if 'upscale' in model_id or 'enhance' in model_id:
+        return 'upscale'
+    return 'image'
+
+
+async def process_kie_callback(
+    raw_payload: Any,
+    *,
+    storage: Any,
+    bot: Any,
+    db_pool: Any = None,
+    save_orphan: bool = True,
+) -> str:
+    """
+    Apply one KIE callback: job status update + result/error delivery.
+
+    Args:
+        raw_payload: callback JSON as received
+        storage: app storage (find_job_by_task_id, update_job_status, delivery lock)
+        bot: aiogram Bot
+        db_pool: asyncpg pool for JobServiceV2 (atomic balance updates), optional
+        save_orphan: store callbacks without a job in orphan_callbacks and log processing
+            errors (inline mode); the inbox worker retries both itself, so errors are raised
+
+    Returns:
+        OUTCOME_PROCESSED, OUTCOME_ORPHAN (job not found yet) or OUTCOME_IGNORED
+    """
+    from app.kie.state_parser import parse_kie_state, extract_task_id
+    from app.utils.correlation import ensure_correlation_id
+
+    task_id = extract_task_id(raw_payload)
+    if not task_id:
+        logger.warning(f"[KIE_CALLBACK] No taskId in payload: {str(raw_payload)[:200]}")
+        return OUTCOME_IGNORED
+
+    corr_id = ensure_correlation_id(task_id)
+
+    # Parse state using unified parser
+    state, result_urls, error_msg = parse_kie_state(raw_payload, corr_id)
+    logger.info(f"[{corr_id}] [CALLBACK_PARSED] task_id={task_id} state={state} urls={len(result_urls)} error={error_msg or 'none'}")
+
+    # Get job from storage
+    job = None
+    try:
+        job = await storage.find_job_by_task_id(task_id)
+    except Exception as exc:
+        logger.warning(f"[{corr_id}] find_job_by_task_id failed: {exc}")
+
+    if not job:
+        if not save_orphan:
+            logger.info(f"[{corr_id}] [CALLBACK_ORPHAN] task_id={task_id} - job not found yet, will retry")
+            return OUTCOME_ORPHAN
+
+        logger.warning(f"[{corr_id}] [CALLBACK_ORPHAN] task_id={task_id} - saving for reconciliation")
+        from app.utils.runtime_state import runtime_state
+        runtime_state.callback_job_not_found_count += 1
+
+        # Save orphan callback
+        try:
+            await storage._save_orphan_callback(task_id, {
+                'state': state,
+                'result_urls': result_urls,
+                'error': error_msg,
+                'payload': raw_payload
+            })
+        except Exception as e:
+            logger.error(f"[{corr_id}] Failed to save orphan: {e}")
+
+        notify_completion_engine(task_id, state, result_urls, error_msg)
+        return OUTCOME_ORPHAN
+
+    # Get job_id (support both old storage and new jobs table)
+    job_id = job.get("job_id") or job.get("id")
+    if not job_id:
+        logger.warning(f"[{corr_id}] [CALLBACK_ERROR] No job_id found in job record")
+        return OUTCOME_IGNORED
+
+    # Try to use JobServiceV2 if DB pool is available (atomic balance updates)
+    job_service = None
+    if db_pool:
+        try:
+            from app.services.job_service_v2 import JobServiceV2
+            job_service = JobServiceV2(db_pool)
+            # Try to get job by task_id from jobs table
+            db_job = await job_service.get_by_task_id(task_id)
+            if db_job:
+                job_id = db_job['id']  # Use integer ID from jobs table
+                logger.info(f"[{corr_id}] [CALLBACK_JOB_V2] Found job in jobs table: id={job_id}")
+        except Exception as e:
+            logger.warning(f"[{corr_id}] [CALLBACK_FALLBACK] JobServiceV2 not available: {e}, using legacy storage")
+
+    # Update job status based on state
+    try:
+        if state in ('waiting', 'running'):
+            if job_service:
+                await job_service.update_with_kie_task(job_id, task_id, 'running')
+            else:
+                await storage.update_job_status(str(job_id), 'running')
+            logger.debug(f"[{corr_id}] [CALLBACK_PROGRESS] task_id={task_id} state={state}")
+
+        elif state == 'fail':
+            # Use JobServiceV2 for atomic balance release on failure
+            if job_service:
+                await job_service.update_from_callback(
+                    job_id=job_id,
+                    status='failed',
+                    error_text=error_msg,
+                    kie_status=state
+                )
+                logger.info(f"[{corr_id}] [CALLBACK_FAIL] task_id={task_id} error={error_msg} (balance released via JobServiceV2)")
+            else:
+                await storage.update_job_status(str(job_id), 'failed', error_message=error_msg)
+                logger.info(f"[{corr_id}] [CALLBACK_FAIL] task_id={task_id} error={error_msg} (legacy storage)")
+
+            # Try to acquire delivery lock for error notification (prevent spam)
+            lock_job = await storage.try_acquire_delivery_lock(task_id, timeout_minutes=5)
+            if lock_job:
+                logger.info(f"[{corr_id}] [DELIVER_LOCK_WIN] Won lock for error notification")
+                chat_id = _job_chat_id(job)
+                if chat_id:
+                    try:
+                        await bot.send_message(chat_id, f"❌ Генерация не завершилась: {error_msg}\nID: {task_id}")
+                        await storage.mark_delivered(task_id, success=True)
+                        logger.info(f"[{corr_id}] [MARK_DELIVERED] Error notified")
+                    except Exception as e:
+                        logger.exception(f"[{corr_id}] Failed to send error to user: {e}")
+                        await storage.mark_delivered(task_id, success=False, error=str(e))
+            else:
+                logger.info(f"[{corr_id}] [DELIVER_LOCK_SKIP] Error already notified")
+
+        elif state == 'success':
+            # Use JobServiceV2 for atomic balance charge on success
+            result_json = {'resultUrls': result_urls} if result_urls else None
+            if job_service:
+                await job_service.update_from_callback(
+                    job_id=job_id,
+                    status='done',
+                    result_json=result_json,
+                    kie_status=state
+                )
+                logger.info(f"[{corr_id}] [CALLBACK_SUCCESS] task_id={task_id} urls={len(result_urls)} (balance charged via JobServiceV2)")
+            else:
+                await storage.update_job_status(str(job_id), 'done', result_urls=result_urls)
+                logger.info(f"[{corr_id}] [CALLBACK_SUCCESS] task_id={task_id} urls={len(result_urls)} (legacy storage)")
+
+            # Get chat_id and category for delivery
+            user_id = job.get('user_id')
+            chat_id = _job_chat_id(job)
+
+            # Fallback: if still no chat_id, use user_id
+            if not chat_id:
+                chat_id = user_id
+                logger.warning(f"[{corr_id}] [CALLBACK_WARN] No chat_id in job, using user_id={user_id}")
+
+            category = _delivery_category(job.get('model_id', ''))
+
+            if chat_id and result_urls:
+                # UNIFIED DELIVERY COORDINATOR (platform-wide atomic lock)
+                from app.delivery import deliver_result_atomic
+
+                delivery_result = await deliver_result_atomic(
+                    storage=storage,
+                    bot=bot,
+                    task_id=task_id,
+                    chat_id=chat_id,
+                    result_urls=result_urls,
+                    category=category,
+                    corr_id=corr_id,
+                    timeout_minutes=5
+                )
+
+                if not delivery_result['delivered'] and delivery_result['error']:
+                    # Delivery failed, notify user
+                    try:
+                        await bot.send_message(chat_id, f"⚠️ Генерация готова, но не удалось отправить результат.\nID: {task_id}")
+                    except Exception:
+                        pass
+            elif not chat_id:
+                logger.error(f"[{corr_id}] [CALLBACK_ERROR] Cannot deliver: no chat_id and no user_id")
+            elif not result_urls:
+                logger.warning(f"[{corr_id}] [CALLBACK_WARN] No result_urls to deliver")
+
+    except Exception as e:
+        logger.exception(f"[{corr_id}] [CALLBACK_ERROR] task_id={task_id}: {e}")
+        if not save_orphan:
+            # Inbox row: the worker retries it with backoff (status updates and delivery are idempotent)
+            raise
+
+    notify_completion_engine(task_id, state, result_urls, error_msg)
+    return OUTCOME_PROCESSED
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        logger.warning(f"[CALLBACK_INBOX] Invalid {name}, using {default}")
+        return default
+
+
+class CallbackInboxWorker:
+    """Worker pool draining kie_callback_inbox."""
+
+    def __init__(
+        self,
+        storage: Any,
+        bot: Any,
+        *,
+        concurrency: Optional[int] = None,
+        batch_size: int = 10,
+        poll_interval: float = 2.0,
+        lease_seconds: int = 120,
+        orphan_retry_seconds: int = 10,
+        orphan_max_age_minutes: int = 30,
+        max_attempts: int = 5,
+        db_pool_getter: Optional[Callable[[], Any]] = None,
+        worker_id: Optional[str] = None,
+    ):
+        """
+        Args:
+            storage: storage with the inbox methods (PostgresStorage)
+            bot: Telegram bot for deliveries
+            concurrency: parallel workers (env KIE_CALLBACK_WORKERS, default 4)
+            batch_size: rows claimed per worker per round
+            poll_interval: idle wait between empty polls (seconds); wake() skips it
+            lease_seconds: claim lease; rows of a crashed worker are reclaimed after it
+            orphan_retry_seconds: retry delay while the job does not exist yet
+            orphan_max_age_minutes: give up on callbacks without a job after this
+            max_attempts: retries for processing errors
+            db_pool_getter: returns asyncpg pool for JobServiceV2 (default runtime_state.db_pool)
+        """
+        if worker_id is None:
+            from app.utils.runtime_state import runtime_state
+            worker_id = runtime_state.instance_id
+        self.storage = storage
+        self.bot = bot
+        self.concurrency = concurrency or _env_int("KIE_CALLBACK_WORKERS", 4)
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.orphan_retry_seconds = orphan_retry_seconds
+        self.orphan_max_age_minutes = orphan_max_age_minutes
+        self.max_attempts = max_attempts
+        self.worker_id = worker_id
+        self._db_pool_getter = db_pool_getter
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self._running = False
+        self._last_cleanup = 0.0
+        self.stats: Dict[str, int] = {"processed": 0, "ignored": 0, "orphan_retries": 0, "retries": 0, "failed": 0, "lease_lost": 0}
+
+    def _db_pool(self) -> Any:
+        if self._db_pool_getter is not None:
+            return self._db_pool_getter()
+        from app.utils.runtime_state import runtime_state
+        return runtime_state.db_pool
+
+    def wake(self) -> None:
+        """New row enqueued by this process: skip the poll wait."""
+        self._wakeup.set()
+
+    async def start(self) -> None:
+        if self._running:
+            return
+        self._running = True
+        self._tasks = [
+            asyncio.create_task(self._loop(i), name=f"kie_callback_inbox_{i}")
+            for i in range(self.concurrency)
+        ]
+        logger.info(f"[CALLBACK_INBOX] ✅ Started {self.concurrency} workers (worker_id={self.worker_id})")
+
+    async def stop(self) -> None:
+        self._running = False
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._tasks = []
+        logger.info("[CALLBACK_INBOX] Stopped")
+
+    async def _loop(self, index: int) -> None:
+        while self._running:
+            try:
+                drained = await self.drain_once()
+                if index == 0:
+                    await self._maybe_cleanup()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception(f"[CALLBACK_INBOX] Worker {index} error: {e}")
+                drained = 0
+            if drained:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def drain_once(self) -> int:
+        """Claim and process one batch; returns number of rows handled."""
+        items = await self.storage.claim_kie_callbacks(self.worker_id, self.batch_size, self.lease_seconds)
+        for item in items:
+            await self._handle(item)
+        return len(items)
+
+    async def _handle(self, item: Dict[str, Any]) -> None:
+        payload = item["payload"]
+        if isinstance(payload, str):
+            payload = json.loads(payload)
+        try:
+            outcome = await process_kie_callback(
+                payload, storage=self.storage, bot=self.bot, db_pool=self._db_pool(), save_orphan=False
+            )
+        except Exception as e:
+            attempts = item.get("attempts", 1)
+            if attempts >= self.max_attempts:
+                self.stats["failed"] += 1
+                logger.error(f"[CALLBACK_INBOX] ❌ task_id={item.get('task_id')} failed after {attempts} attempts: {e}")
+                await self._finish(item, "failed", error=str(e))
+            else:
+                self.stats["retries"] += 1
+                delay = min(300, 5 * 2 ** (attempts - 1))
+                logger.warning(f"[CALLBACK_INBOX] task_id={item.get('task_id')} attempt {attempts} failed, retry in {delay}s: {e}")
+                await self._retry(item, str(e), delay)
+            return
+
+        if outcome == OUTCOME_ORPHAN:
+            await self._handle_orphan(item, payload)
+            return
+        self.stats[outcome] += 1
+        await self._finish(item, "done")
+
+    async def _finish(self, item: Dict[str, Any], status: str, error: Optional[str] = None) -> None:
+        released = await self.storage.finish_kie_callback(
+            item["id"], status, error=error, worker_id=self.worker_id, attempts=item.get("attempts", 1)
+        )
+        if not released:
+            self._lease_lost(item)
+
+    async def _retry(self, item: Dict[str, Any], error: str, delay: float) -> None:
+        released = await self.storage.retry_kie_callback(
+            item["id"], error, delay, worker_id=self.worker_id, attempts=item.get("attempts", 1)
+        )
+        if not released:
+            self._lease_lost(item)
+
+    def _lease_lost(self, item: Dict[str, Any]) -> None:
+        # Lease expired mid-processing and the row was re-claimed: its new owner records the outcome
+        self.stats["lease_lost"] += 1
+        logger.warning(
+            f"[CALLBACK_INBOX] task_id={item.get('task_id')} inbox row {item['id']} was re-claimed "
+            f"after its lease expired; outcome left to the new claim"
+        )
+
+    async def _handle_orphan(self, item: Dict[str, Any], payload: Any) -> None:
+        from app.utils.runtime_state import runtime_state
+
+        if item.get("attempts", 1) <= 1:
+            runtime_state.callback_job_not_found_count += 1
+            # Waiters in this process need not wait for the job row
+            from app.kie.state_parser import parse_kie_state
+            state, result_urls, error_msg = parse_kie_state(payload, "")
+            notify_completion_engine(item["task_id"], state, result_urls, error_msg)
+
+        received_at = item.get("received_at")
+        if received_at is not None and received_at.tzinfo is None:
+            received_at = received_at.replace(tzinfo=timezone.utc)
+        age = (datetime.now(timezone.utc) - received_at).total_seconds() if received_at else 0.0
+        if age > self.orphan_max_age_minutes * 60:
+            self.stats["failed"] += 1
+            error_msg = f"Orphan timeout: no job found after {self.orphan_max_age_minutes} minutes"
+            logger.warning(f"[CALLBACK_INBOX] ⏰ task_id={item['task_id']} {error_msg}")
+            await self._finish(item, "failed", error=error_msg)
+        else:
+            self.stats["orphan_retries"] += 1
+            await self._retry(item, "job_not_found", self.orphan_retry_seconds)
+
+    async def _maybe_cleanup(self) -> None:
+        now = time.monotonic()
+        if now - self._last_cleanup < 3600:
+            return
+        self._last_cleanup = now
+        try:
+            deleted = await self.storage.cleanup_kie_callback_inbox(keep_days=7)
+            if deleted:
+                logger.info(f"[CALLBACK_INBOX] Cleaned up {deleted} finished callbacks")
+        except Exception as e:
+            logger.warning(f"[CALLBACK_INBOX] Cleanup failed: {e}")
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"running": self._running, "workers": len(self._tasks), "worker_id": self.worker_id, **self.stats}
+
+
+_worker: Optional[CallbackInboxWorker] = None
+
+
+def get_callback_inbox() -> Optional[CallbackInboxWorker]:
+    """Running inbox worker of this process (None if not started)."""
+    return _worker
+
+
+async def start_callback_inbox(storage: Any, bot: Any) -> Optional[CallbackInboxWorker]:
+    """Start the inbox worker pool (ACTIVE instance). Returns None if storage has no inbox."""
+    global _worker
+    if not supports_inbox(storage):
+        logger.info("[CALLBACK_INBOX] Storage has no callback inbox, callbacks processed inline")
+        return None
+    if _worker is None:
+        _worker = CallbackInboxWorker(storage, bot)
+        await _worker.start()
+    return _worker
+
+
+async def stop_callback_inbox() -> None:
+    global _worker
+    if _worker is not None:
+        await _worker.stop()
+        _worker = None
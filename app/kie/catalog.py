@@ -0,0 +1,257 @@
+"""
+In-memory index over models/KIE_SOURCE_OF_TRUTH.json.
+
+The SOURCE_OF_TRUTH file is parsed once into an immutable ModelCatalog with
+prebuilt indexes (model_id, category, provider, price bucket, free flag).
+Readers always get the current snapshot via get_catalog(); when the file
+mtime changes the catalog is rebuilt and swapped atomically, so a reader
+never sees a half-built index.
+
+Model dicts inside the catalog are shared between all readers and must be
+treated as read-only.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = Path(__file__).parent.parent.parent
+SOURCE_OF_TRUTH_PATH = ROOT_DIR / "models" / "KIE_SOURCE_OF_TRUTH.json"
+
+# How often (seconds) readers stat() the file to detect changes
+MTIME_CHECK_INTERVAL = float(os.getenv("KIE_CATALOG_MTIME_CHECK_SECONDS", "2.0"))
+
+# Upper bounds (RUB per generation) for price buckets, cheapest first
+PRICE_BUCKETS: Tuple[Tuple[str, float], ...] = (
+    ("free", 0.0),
+    ("cheap", 10.0),
+    ("standard", 50.0),
+    ("premium", float("inf")),
+)
+
+_EMPTY: Mapping[str, Tuple[Dict[str, Any], ...]] = MappingProxyType({})
+
+
+def price_bucket(rub_per_gen: float) -> str:
+    """Map a RUB price to its bucket name from PRICE_BUCKETS."""
+    for name, upper in PRICE_BUCKETS:
+        if rub_per_gen <= upper:
+            return name
+    return PRICE_BUCKETS[-1][0]
+
+
+def _model_price_rub(model: Dict[str, Any]) -> float:
+    pricing = model.get("pricing") or {}
+    try:
+        return float(pricing.get("rub_per_gen", 0) or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _is_free(model: Dict[str, Any]) -> bool:
+    pricing = model.get("pricing") or {}
+    return bool(pricing.get("is_free", False))
+
+
+@dataclass(frozen=True)
+class ModelCatalog:
+    """Immutable snapshot of SOURCE_OF_TRUTH with lookup indexes."""
+
+    raw: Dict[str, Any]
+    path: str
+    mtime: float
+    models: Tuple[Dict[str, Any], ...]
+    by_id: Mapping[str, Dict[str, Any]]
+    by_category: Mapping[str, Tuple[Dict[str, Any], ...]]
+    by_provider: Mapping[str, Tuple[Dict[str, Any], ...]]
+    by_price_bucket: Mapping[str, Tuple[Dict[str, Any], ...]]
+    free_models: Tuple[Dict[str, Any], ...]
+
+    @property
+    def version(self) -> str:
+        """Catalog version: SOT version plus file mtime (changes on every reload)."""
+        return f"{self.raw.get('version', 'unknown')}@{int(self.mtime)}"
+
+    def get(self, model_id: str) -> Optional[Dict[str, Any]]:
+        return self.by_id.get(model_id)
+
+    def in_category(self, category: str) -> Tuple[Dict[str, Any], ...]:
+        return self.by_category.get(category, ())
+
+    def from_provider(self, provider: str) -> Tuple[Dict[str, Any], ...]:
+        return self.by_provider.get(provider, ())
+
+    def in_price_bucket(self, bucket: str) -> Tuple[Dict[str, Any], ...]:
+        return self.by_price_bucket.get(bucket, ())
+
+    def __len__(self) -> int:
+        return len(self.models)
+
+
+def build_catalog(raw: Dict[str, Any], path: str = "", mtime: float = 0.0) -> ModelCatalog:
+    """
+    Build catalog indexes from parsed SOURCE_OF_TRUTH data.
+
+    Supports both formats:
+    - V7: {"models": {model_id: {...}}}  (dict)
+    - V6: {"models": [{model_id: ...}]}  (list)
+    """
+    models_raw = raw.get("models", {})
+    if isinstance(models_raw, dict):
+        models = [m for m in models_raw.values() if isinstance(m, dict)]
+    elif isinstance(models_raw, list):
+        models = [m for m in models_raw if isinstance(m, dict)]
+    else:
+        models = []
+
+    by_id: Dict[str, Dict[str, Any]] = {}
+    by_category: Dict[str, List[Dict[str, Any]]] = {}
+    by_provider: Dict[str, List[Dict[str, Any]]] = {}
+    by_bucket: Dict[str, List[Dict[str, Any]]] = {}
+    free: List[Dict[str, Any]] = []
+
+    for model in models:
+        model_id = model.get("model_id")
+        if model_id:
+            by_id.setdefault(model_id, model)
+        by_category.setdefault(model.get("category") or "other", []).append(model)
+        provider = model.get("provider") or model.get("vendor")
+        if provider:
+            by_provider.setdefault(provider, []).append(model)
+        by_bucket.setdefault(price_bucket(_model_price_rub(model)), []).append(model)
+        if _is_free(model):
+            free.append(model)
+
+    def _freeze(index: Dict[str, List[Dict[str, Any]]]) -> Mapping[str, Tuple[Dict[str, Any], ...]]:
+        return MappingProxyType({key: tuple(values) for key, values in index.items()})
+
+    return ModelCatalog(
+        raw=raw,
+        path=path,
+        mtime=mtime,
+        models=tuple(models),
+        by_id=MappingProxyType(by_id),
+        by_category=_freeze(by_category),
+        by_provider=_freeze(by_provider),
+        by_price_bucket=_freeze(by_bucket),
+        free_models=tuple(free),
+    )
+
+
+def _empty_catalog(path: str) -> ModelCatalog:
+    return ModelCatalog(
+        raw={},
+        path=path,
+        mtime=0.0,
+        models=(),
+        by_id=MappingProxyType({}),
+        by_category=_EMPTY,
+        by_provider=_EMPTY,
+        by_price_bucket=_EMPTY,
+        free_models=(),
+    )
+
+
+class _CatalogHolder:
+    """Holds the current catalog for one file and reloads it on mtime change."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._catalog: Optional[ModelCatalog] = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+
+    def get(self) -> ModelCatalog:
+        catalog = self._catalog
+        now = time.monotonic()
+        if catalog is not None and now < self._next_check:
+            return catalog
+
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            mtime = None
+
+        if catalog is not None and mtime == catalog.mtime:
+            self._next_check = now + MTIME_CHECK_INTERVAL
+            return catalog
+
+        with self._lock:
+            # Another thread may have reloaded while we waited for the lock
+            catalog = self._catalog
+            if catalog is None or mtime != catalog.mtime:
+                catalog = self._load(mtime)
+                self._catalog = catalog
+            self._next_check = time.monotonic() + MTIME_CHECK_INTERVAL
+        return catalog
+
+    def _load(self, mtime: Optional[float]) -> ModelCatalog:
+        if mtime is None:
+            logger.error(f"CRITICAL: SOURCE_OF_TRUTH not found: {self.path}")
+            if self._catalog is not None:
+                # Keep serving the last good snapshot
+                return self._catalog
+            return _empty_catalog(str(self.path))
+
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to load SOURCE_OF_TRUTH {self.path}: {e}")
+            if self._catalog is not None:
+                return self._catalog
+            return _empty_catalog(str(self.path))
+
+        catalog = build_catalog(raw, path=str(self.path), mtime=mtime)
+        logger.info(
+            f"✅ Loaded SOURCE_OF_TRUTH catalog: {self.path.name} "
+            f"version={catalog.version} models={len(catalog)} "
+            f"categories={len(catalog.by_category)}"
+        )
+        return catalog
+
+    def reset(self) -> None:
+        with self._lock:
+            self._catalog = None
+            self._next_check = 0.0
+
+
+_holders: Dict[Path, _CatalogHolder] = {}
+_holders_lock = threading.Lock()
+
+
+def _holder(path: Optional[Path]) -> _CatalogHolder:
+    key = Path(path) if path is not None else SOURCE_OF_TRUTH_PATH
+    holder = _holders.get(key)
+    if holder is None:
+        with _holders_lock:
+            holder = _holders.setdefault(key, _CatalogHolder(key))
+    return holder
+
+
+def get_catalog(path: Optional[Path] = None) -> ModelCatalog:
+    """
+    Get the current catalog snapshot (hot path, no parsing).
+
+    Args:
+        path: SOT file (default: models/KIE_SOURCE_OF_TRUTH.json)
+
+    Returns:
+        ModelCatalog; empty catalog if the file is missing or invalid
+    """
+    return _holder(path).get()
+
+
+def reset_catalog_cache() -> None:
+    """Drop all cached catalogs (for tests)."""
+    with _holders_lock:
+        for holder in _holders.values():
+            holder.reset()
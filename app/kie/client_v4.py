@@ -7,7 +7,7 @@ import logging
 import os
 from typing import Dict, Any, Optional
 
-import requests
+import aiohttp
 from tenacity import (
     retry,
     stop_after_attempt,
@@ -22,6 +22,7 @@ from app.kie.router import (
     get_base_url_for_category,
     load_v4_source_of_truth
 )
+from app.kie.http_transport import KieHttpTransport, TransportResponse, get_kie_transport
 
 logger = logging.getLogger(__name__)
 
@@ -32,13 +33,24 @@ class KieApiClientV4:
     Поддерживает category-specific endpoints.
     """
     
-    def __init__(self, api_key: str | None = None, timeout: int = 30) -> None:
+    def __init__(
+        self,
+        api_key: str | None = None,
+        timeout: int = 30,
+        transport: Optional[KieHttpTransport] = None,
+        api_url: str | None = None,
+    ) -> None:
         self.api_key = api_key or os.getenv("KIE_API_KEY")
         if not self.api_key:
             raise ValueError("KIE_API_KEY environment variable is required")
         
         self.timeout = timeout
         self.source_v4 = load_v4_source_of_truth()
+        # Shared keep-alive session (one per process) unless injected
+        self.transport = transport or get_kie_transport()
+        self.api_url = (api_url or os.getenv("KIE_API_URL", "https://api.kie.ai")).rstrip("/")
+        # Explicit API URL (staging proxy, load-test fake) also replaces the per-category hosts
+        self._base_url_override = (api_url or os.getenv("KIE_API_URL", "")).rstrip("/") or None
         
     def _headers(self) -> Dict[str, str]:
         return {
@@ -49,25 +61,26 @@ class KieApiClientV4:
     @retry(
         stop=stop_after_attempt(3),
         wait=wait_exponential(multiplier=1, min=2, max=10),
-        retry=retry_if_exception_type((requests.ConnectionError, requests.Timeout)),
-        before_sleep=before_sleep_log(logger, logging.WARNING)
+        retry=retry_if_exception_type((aiohttp.ClientConnectionError, asyncio.TimeoutError)),
+        before_sleep=before_sleep_log(logger, logging.WARNING),
+        reraise=True
     )
-    def _make_request(self, url: str, payload: Dict[str, Any]) -> requests.Response:
+    async def _make_request(self, url: str, payload: Dict[str, Any]) -> TransportResponse:
         """
         Make HTTP request with automatic retry.
         
         Retries on:
-        - ConnectionError (network issues)
-        - Timeout (slow response)
+        - ClientConnectionError (network issues)
+        - TimeoutError (slow response)
         
         Does NOT retry on:
         - 4xx errors (client errors - bad request)
         - 5xx errors (server errors - will be handled by caller)
         """
-        return requests.post(
+        return await self.transport.post_json(
             url,
+            payload,
             headers=self._headers(),
-            json=payload,
             timeout=self.timeout
         )
     
@@ -93,7 +106,7 @@ class KieApiClientV4:
                 "state": "fail"
             }
         
-        base_url = get_base_url_for_category(category, self.source_v4)
+        base_url = self._base_url_override or get_base_url_for_category(category, self.source_v4)
         endpoint = get_api_endpoint_for_model(model_id, self.source_v4)
         
         # Полный URL для category-specific API
@@ -107,14 +120,10 @@ class KieApiClientV4:
         logger.debug(f"Full payload: {payload}")
         
         try:
-            response = await asyncio.to_thread(
-                self._make_request,
-                url,
-                payload
-            )
+            response = await self._make_request(url, payload)
             
             logger.info(
-                f"✅ RESPONSE | Status: {response.status_code} | "
+                f"✅ RESPONSE | Status: {response.status} | "
                 f"Body preview: {response.text[:200]}"
             )
             logger.debug(f"Full response: {response.text}")
@@ -153,9 +162,10 @@ class KieApiClientV4:
                 "state": "fail"
             }
             
-        except requests.RequestException as exc:
-            # RequestException includes ConnectionError, Timeout, etc.
-            # _make_request already retries these, so if we get here, all retries failed
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as exc:
+            # ClientError includes connection errors and HTTP status errors;
+            # ValueError covers a non-JSON body.
+            # _make_request already retries network errors, so if we get here, all retries failed
             error_type = type(exc).__name__
             error_msg = str(exc)
             
@@ -167,9 +177,9 @@ class KieApiClientV4:
             )
             
             # Classify error for better user message
-            if isinstance(exc, requests.Timeout):
+            if isinstance(exc, asyncio.TimeoutError):
                 user_friendly = "Превышено время ожидания ответа от сервера. Попробуйте позже."
-            elif isinstance(exc, requests.ConnectionError):
+            elif isinstance(exc, aiohttp.ClientConnectionError):
                 user_friendly = "Ошибка подключения к серверу. Проверьте интернет-соединение."
             else:
                 user_friendly = f"Ошибка сети: {error_type}"
@@ -192,14 +202,13 @@ class KieApiClientV4:
         Returns:
             Task status and results
         """
-        url = "https://api.kie.ai/api/v1/jobs/recordInfo"
+        url = f"{self.api_url}/api/v1/jobs/recordInfo"
         params = {"taskId": task_id}
         
         max_retries = 3
         for attempt in range(max_retries):
             try:
-                response = await asyncio.to_thread(
-                    requests.get,
+                response = await self.transport.get(
                     url,
                     headers=self._headers(),
                     params=params,
@@ -209,7 +218,7 @@ class KieApiClientV4:
                 response.raise_for_status()
                 return response.json()
                 
-            except requests.RequestException as exc:
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as exc:
                 logger.warning(f"recordInfo attempt {attempt+1}/{max_retries} failed: {exc}")
                 if attempt == max_retries - 1:
                     logger.error(f"Get record info failed: {exc}", exc_info=True)
@@ -0,0 +1,332 @@
+"""
+Callback-first completion engine for KIE tasks.
+
+KieGenerator registers every created task here and awaits its outcome.
+A task completes as soon as the KIE callback for it is received
+(main_render.kie_callback -> notify()); polling recordInfo is only a
+fallback when the callback is late or missing.
+
+All pending tasks are driven by ONE scheduler coroutine that keeps a
+deadline-ordered heap, instead of one sleep/poll loop per generation, and
+polls due tasks with bounded concurrency. Poll timing is per model category
+(images finish in seconds, videos in minutes):
+
+- callback_grace: delay before the first poll when a callBackUrl was registered
+- initial_interval/backoff/max_interval: fallback polling schedule
+"""
+
+import asyncio
+import heapq
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# poll(record) -> terminal result dict, or None if the task is still pending.
+# record is the callback payload when the callback arrived, None for an API poll.
+PollFn = Callable[[Optional[Dict[str, Any]]], Awaitable[Optional[Dict[str, Any]]]]
+
+
+@dataclass(frozen=True)
+class PollPolicy:
+    """Fallback polling schedule for one model category."""
+    callback_grace: float
+    initial_interval: float
+    max_interval: float
+    backoff: float = 1.5
+
+    def first_delay(self, callback_registered: bool) -> float:
+        return self.callback_grace if callback_registered else 0.0
+
+    def next_interval(self, interval: float) -> float:
+        return min(interval * self.backoff, self.max_interval)
+
+
+POLL_POLICIES: Dict[str, PollPolicy] = {
+    "image": PollPolicy(callback_grace=8.0, initial_interval=2.0, max_interval=10.0),
+    "audio": PollPolicy(callback_grace=15.0, initial_interval=3.0, max_interval=20.0),
+    "video": PollPolicy(callback_grace=30.0, initial_interval=5.0, max_interval=30.0),
+}
+DEFAULT_POLICY_CATEGORY = "image"
+
+# SOURCE_OF_TRUTH category -> completion policy
+_CATEGORY_ALIASES = {
+    "video": "video",
+    "avatar": "video",
+    "audio": "audio",
+    "music": "audio",
+}
+
+
+def policy_category_for_model(model_id: str) -> str:
+    """Pick the polling policy for a model (catalog category, then model_id hints)."""
+    try:
+        from app.kie.catalog import get_catalog
+        model = get_catalog().get(model_id)
+    except Exception:
+        model = None
+    category = (model or {}).get("category") or ""
+    if category in _CATEGORY_ALIASES:
+        return _CATEGORY_ALIASES[category]
+
+    lowered = (model_id or "").lower()
+    if "video" in lowered:
+        return "video"
+    if "audio" in lowered or "music" in lowered or "speech" in lowered:
+        return "audio"
+    return DEFAULT_POLICY_CATEGORY
+
+
+@dataclass
+class _PendingTask:
+    task_id: str
+    poll: PollFn
+    policy: PollPolicy
+    deadline: float
+    future: "asyncio.Future[Optional[Dict[str, Any]]]"
+    interval: float
+    next_at: float
+    callback_record: Optional[Dict[str, Any]] = None
+    polls: int = 0
+    busy: bool = False
+
+
+@dataclass
+class CompletionStats:
+    """Counters for /diagnostics and tests."""
+    registered: int = 0
+    completed_by_callback: int = 0
+    completed_by_poll: int = 0
+    timed_out: int = 0
+    api_polls: int = 0
+    early_callbacks: int = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return dict(self.__dict__)
+
+
+class CompletionEngine:
+    """Single-scheduler registry of in-flight KIE tasks."""
+
+    def __init__(
+        self,
+        policies: Optional[Dict[str, PollPolicy]] = None,
+        max_concurrent_polls: Optional[int] = None,
+        early_callback_limit: int = 1000,
+        early_callback_ttl: float = 600.0,
+    ) -> None:
+        self.policies = policies or POLL_POLICIES
+        self.max_concurrent_polls = max_concurrent_polls or int(os.getenv("KIE_POLL_CONCURRENCY", "20"))
+        self.stats = CompletionStats()
+        self._pending: Dict[str, _PendingTask] = {}
+        self._heap: List[Tuple[float, int, str]] = []
+        self._seq = 0
+        # Callbacks that arrived before wait() registered the task
+        self._early: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._early_limit = early_callback_limit
+        self._early_ttl = early_callback_ttl
+        self._wakeup: Optional[asyncio.Event] = None
+        self._scheduler: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def _policy(self, category: str) -> PollPolicy:
+        return self.policies.get(category) or self.policies[DEFAULT_POLICY_CATEGORY]
+
+    def _schedule(self, task: _PendingTask) -> None:
+        self._seq += 1
+        heapq.heappush(self._heap, (task.next_at, self._seq, task.task_id))
+
+    def _ensure_scheduler(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # New event loop (tests / restart): drop state bound to the old loop
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._scheduler = None
+        if self._scheduler is None or self._scheduler.done():
+            self._scheduler = loop.create_task(self._run(), name="kie-completion-scheduler")
+
+    def _wake(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def wait(
+        self,
+        task_id: str,
+        poll: PollFn,
+        *,
+        category: str = DEFAULT_POLICY_CATEGORY,
+        timeout: float = 300.0,
+        callback_registered: bool = False,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Wait for task completion.
+
+        Returns:
+            Terminal result returned by poll(), or None on timeout
+        """
+        self._ensure_scheduler()
+        policy = self._policy(category)
+        now = time.monotonic()
+        future: "asyncio.Future[Optional[Dict[str, Any]]]" = asyncio.get_running_loop().create_future()
+        task = _PendingTask(
+            task_id=task_id,
+            poll=poll,
+            policy=policy,
+            deadline=now + timeout,
+            future=future,
+            interval=policy.initial_interval,
+            next_at=now + policy.first_delay(callback_registered),
+        )
+
+        early = self._early.pop(task_id, None)
+        if early is not None and now - early[0] <= self._early_ttl:
+            task.callback_record = early[1]
+            task.next_at = now
+
+        self._pending[task_id] = task
+        self.stats.registered += 1
+        self._schedule(task)
+        self._wake()
+        logger.info(
+            f"[COMPLETION] Registered task_id={task_id} category={category} "
+            f"first_poll_in={max(task.next_at - now, 0):.1f}s timeout={timeout}s "
+            f"callback={'yes' if callback_registered else 'no'} pending={len(self._pending)}"
+        )
+        try:
+            return await future
+        finally:
+            self._pending.pop(task_id, None)
+
+    def notify(self, task_id: str, record: Dict[str, Any]) -> bool:
+        """
+        Deliver a terminal callback payload for task_id.
+
+        Returns:
+            True if a waiter in this process picked it up
+        """
+        task = self._pending.get(task_id)
+        if task is None:
+            self._remember_early(task_id, record)
+            return False
+        task.callback_record = record
+        task.next_at = time.monotonic()
+        self._schedule(task)
+        self._wake()
+        logger.info(f"[COMPLETION] Callback received for waiting task_id={task_id}")
+        return True
+
+    def _remember_early(self, task_id: str, record: Dict[str, Any]) -> None:
+        self._early[task_id] = (time.monotonic(), record)
+        self._early.move_to_end(task_id)
+        while len(self._early) > self._early_limit:
+            self._early.popitem(last=False)
+        self.stats.early_callbacks += 1
+
+    async def _run(self) -> None:
+        semaphore = asyncio.Semaphore(self.max_concurrent_polls)
+        wakeup = self._wakeup
+        in_flight: set = set()
+        while True:
+            now = time.monotonic()
+            due: List[_PendingTask] = []
+            while self._heap and self._heap[0][0] <= now:
+                at, _, task_id = heapq.heappop(self._heap)
+                task = self._pending.get(task_id)
+                # Skip stale heap entries (rescheduled or finished tasks)
+                if task is None or task.future.done() or task.busy or at != task.next_at:
+                    continue
+                due.append(task)
+
+            for task in self._pending.values():
+                if not task.future.done() and now >= task.deadline and not task.busy:
+                    self.stats.timed_out += 1
+                    logger.warning(f"[COMPLETION] Timeout task_id={task.task_id} polls={task.polls}")
+                    task.future.set_result(None)
+
+            for task in due:
+                if task.future.done():
+                    continue
+                task.busy = True
+                step = asyncio.ensure_future(self._step(task, semaphore))
+                in_flight.add(step)
+                step.add_done_callback(in_flight.discard)
+
+            if not self._pending and not in_flight:
+                # Idle: exit, wait() restarts the scheduler on demand
+                self._scheduler = None
+                return
+
+            wake_times = []
+            for task in self._pending.values():
+                if task.future.done():
+                    continue
+                if task.busy and now >= task.deadline:
+                    # Overdue but its poll is still running: recheck after a poll
+                    # interval (_step wakes us as soon as it finishes)
+                    wake_times.append(now + task.interval)
+                else:
+                    wake_times.append(task.deadline)
+            if self._heap:
+                wake_times.append(self._heap[0][0])
+            next_deadline = min(wake_times, default=now + 1.0)
+            wakeup.clear()
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout=max(next_deadline - time.monotonic(), 0.0) or 0.01)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _step(self, task: _PendingTask, semaphore: asyncio.Semaphore) -> None:
+        record, task.callback_record = task.callback_record, None
+        try:
+            async with semaphore:
+                if record is None:
+                    task.polls += 1
+                    self.stats.api_polls += 1
+                result = await task.poll(record)
+        except Exception as exc:
+            if not task.future.done():
+                task.future.set_exception(exc)
+            return
+        finally:
+            task.busy = False
+
+        if task.future.done():
+            return
+        if result is not None:
+            if record is not None:
+                self.stats.completed_by_callback += 1
+            else:
+                self.stats.completed_by_poll += 1
+            task.future.set_result(result)
+            return
+
+        now = time.monotonic()
+        if task.callback_record is not None:
+            # Callback arrived while we were polling
+            task.next_at = now
+        else:
+            task.next_at = now + task.interval
+            task.interval = task.policy.next_interval(task.interval)
+        self._schedule(task)
+        self._wake()
+
+
+# Global engine instance
+_engine: Optional[CompletionEngine] = None
+
+
+def get_completion_engine() -> CompletionEngine:
+    """Get process-wide completion engine."""
+    global _engine
+    if _engine is None:
+        _engine = CompletionEngine()
+    return _engine
@@ -528,104 +528,106 @@ class KieGenerator:
             else:
                 logger.warning(f"⚠️ No user_id provided - job not created in storage (task_id: {task_id})")
             
-            # Set polling interval
-            poll_interval = 2  # Check every 2 seconds
+            # 🎯 CALLBACK-FIRST COMPLETION: callback resolves the wait directly,
+            # recordInfo polling (one shared scheduler) is only the fallback
+            from app.kie.completion import get_completion_engine, policy_category_for_model
+            from app.utils.correlation import correlation_tag
+            from aiohttp import ClientError
+            from app.delivery import normalize_state
             
-            logger.info(f"⏳ POLLING | TaskID: {task_id} | Timeout: {timeout}s | Interval: {poll_interval}s")
+            callback_registered = bool(
+                isinstance(payload, dict) and (payload.get('callBackUrl') or payload.get('callback_url'))
+            )
+            policy_category = policy_category_for_model(model_id)
+            
+            logger.info(
+                f"⏳ WAITING | TaskID: {task_id} | Timeout: {timeout}s | "
+                f"Policy: {policy_category} | Callback: {callback_registered}"
+            )
             
-            # Wait for completion with heartbeat
             start_time = datetime.now()
             last_heartbeat = datetime.now()
             poll_iteration = 0
+            network_errors = 0
             
-            while True:
-                poll_iteration += 1
-                # Check timeout
+            async def _poll_once(callback_record: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+                """One completion step: returns final result dict or None (still running)."""
+                nonlocal poll_iteration, network_errors, last_heartbeat
                 elapsed = (datetime.now() - start_time).total_seconds()
-                if elapsed > timeout:
-                    return {
-                        'success': False,
-                        'message': f'⏱️ Превышено время ожидания ({timeout} сек)',
-                        'result_urls': [],
-                        'result_object': None,
-                        'error_code': 'TIMEOUT',
-                        'error_message': f'Task timeout after {timeout} seconds',
-                        'task_id': task_id
-                    }
                 
-                # 🎯 STORAGE-FIRST CHECK (callback может уже обновить job)
-                if user_id is not None:
-                    try:
-                        from app.storage import get_storage
-                        storage = get_storage()
-                        current_job = await storage.find_job_by_task_id(task_id)
-                        
-                        if current_job:
-                            job_status = normalize_job_status(current_job.get('status', ''))
-                            delivered_at = current_job.get('delivered_at')
+                if callback_record is not None:
+                    record_info = callback_record
+                    logger.info(f"{correlation_tag()} [CALLBACK_COMPLETION] task_id={task_id}")
+                else:
+                    poll_iteration += 1
+                    
+                    # 🎯 STORAGE-FIRST CHECK (callback может уже обновить job на другом инстансе)
+                    if user_id is not None:
+                        try:
+                            from app.storage import get_storage
+                            from app.storage.status import normalize_job_status
+                            storage = get_storage()
+                            current_job = await storage.find_job_by_task_id(task_id)
                             
-                            if job_status == 'done':
-                                # Callback уже обновил job - используем данные из storage
-                                result_urls = current_job.get('result_urls') or []
-                                if isinstance(result_urls, str):
-                                    try:
-                                        result_urls = json.loads(result_urls)
-                                    except Exception:
-                                        result_urls = [result_urls]
+                            if current_job:
+                                job_status = normalize_job_status(current_job.get('status', ''))
+                                delivered_at = current_job.get('delivered_at')
                                 
-                                # 🎯 IDEMPOTENCY: If callback already delivered, don't send again
-                                if delivered_at:
-                                    logger.info(f"✅ STORAGE-FIRST | Already delivered via callback | TaskID: {task_id}")
-                                else:
-                                    logger.info(f"✅ STORAGE-FIRST | Job done (not yet delivered) | TaskID: {task_id}")
+                                if job_status == 'done':
+                                    # Callback уже обновил job - используем данные из storage
+                                    result_urls = current_job.get('result_urls') or []
+                                    if isinstance(result_urls, str):
+                                        try:
+                                            result_urls = json.loads(result_urls)
+                                        except Exception:
+                                            result_urls = [result_urls]
+                                    
+                                    # 🎯 IDEMPOTENCY: If callback already delivered, don't send again
+                                    if delivered_at:
+                                        logger.info(f"✅ STORAGE-FIRST | Already delivered via callback | TaskID: {task_id}")
+                                    else:
+                                        logger.info(f"✅ STORAGE-FIRST | Job done (not yet delivered) | TaskID: {task_id}")
+                                    
+                                    return {
+                                        'success': True,
+                                        'message': '✅ Генерация завершена',
+                                        'result_urls': result_urls,
+                                        'result_object': None,
+                                        'error_code': None,
+                                        'error_message': None,
+                                        'task_id': task_id,
+                                        'already_delivered': delivered_at is not None
+                                    }
                                 
-                                return {
-                                    'success': True,
-                                    'message': '✅ Генерация завершена',
-                                    'result_urls': result_urls,
-                                    'result_object': None,
-                                    'error_code': None,
-                                    'error_message': None,
-                                    'task_id': task_id,
-                                    'already_delivered': delivered_at is not None
-                                }
-                            
-                            elif job_status == 'failed':
-                                error_msg = current_job.get('error_message') or 'Unknown error'
-                                logger.info(f"❌ STORAGE-FIRST | Job failed via callback | TaskID: {task_id}")
-                                return {
-                                    'success': False,
-                                    'message': f'❌ {error_msg}',
-                                    'result_urls': [],
-                                    'result_object': None,
-                                    'error_code': 'GENERATION_FAILED',
-                                    'error_message': error_msg,
-                                    'task_id': task_id
-                                }
-                    except Exception as e:
-                        # Storage error - продолжаем с API polling
-                        logger.debug(f"Storage check failed (continuing with API): {e}")
-                
-                # Get record info from API (fallback)
-                # CRITICAL: Handle network errors gracefully
-                from app.utils.correlation import correlation_tag
-                from aiohttp import ClientError
-                import asyncio
-                
-                try:
-                    record_info = await api_client.get_record_info(task_id)
-                    logger.info(f"{correlation_tag()} [POLL_TICK] i={poll_iteration} task_id={task_id} http_ok={record_info is not None}")
-                except (ClientError, asyncio.TimeoutError, ConnectionError) as network_err:
-                    # Network error - retry with exponential backoff
-                    if poll_iteration < 5:  # Allow up to 5 network errors before giving up
-                        retry_delay = min(2 ** poll_iteration, 30)  # Max 30s
-                        logger.warning(
-                            f"{correlation_tag()} [POLL_NETWORK_ERROR] task_id={task_id} attempt={poll_iteration+1}/5: {network_err}. "
-                            f"Retrying in {retry_delay}s..."
-                        )
-                        await asyncio.sleep(retry_delay)
-                        continue  # Retry polling
-                    else:
+                                elif job_status == 'failed':
+                                    error_msg = current_job.get('error_message') or 'Unknown error'
+                                    logger.info(f"❌ STORAGE-FIRST | Job failed via callback | TaskID: {task_id}")
+                                    return {
+                                        'success': False,
+                                        'message': f'❌ {error_msg}',
+                                        'result_urls': [],
+                                        'result_object': None,
+                                        'error_code': 'GENERATION_FAILED',
+                                        'error_message': error_msg,
+                                        'task_id': task_id
+                                    }
+                        except Exception as e:
+                            # Storage error - продолжаем с API polling
+                            logger.debug(f"Storage check failed (continuing with API): {e}")
+                    
+                    # Get record info from API (fallback)
+                    # CRITICAL: Handle network errors gracefully
+                    try:
+                        record_info = await api_client.get_record_info(task_id)
+                        logger.info(f"{correlation_tag()} [POLL_TICK] i={poll_iteration} task_id={task_id} http_ok={record_info is not None}")
+                    except (ClientError, asyncio.TimeoutError, ConnectionError) as network_err:
+                        # Network error - the scheduler backs off before the next poll
+                        network_errors += 1
+                        if network_errors < 5:  # Allow up to 5 network errors before giving up
+                            logger.warning(
+                                f"{correlation_tag()} [POLL_NETWORK_ERROR] task_id={task_id} attempt={network_errors}/5: {network_err}"
+                            )
+                            return None
                         # Too many network errors - fail gracefully
                         logger.error(
                             f"{correlation_tag()} [POLL_NETWORK_FAIL] task_id={task_id} failed after 5 network errors"
@@ -639,10 +641,10 @@ class KieGenerator:
                             'error_message': f'Network error during polling: {network_err}',
                             'task_id': task_id
                         }
-                except Exception as api_err:
-                    # Other API errors - log and continue polling
-                    logger.warning(f"{correlation_tag()} [POLL_API_ERROR] task_id={task_id}: {api_err}")
-                    record_info = None
+                    except Exception as api_err:
+                        # Other API errors - log and continue polling
+                        logger.warning(f"{correlation_tag()} [POLL_API_ERROR] task_id={task_id}: {api_err}")
+                        record_info = None
                 
                 parsed = parse_record_info(record_info)
                 
@@ -650,8 +652,6 @@ class KieGenerator:
                 logger.info(f"{correlation_tag()} [POLL_STATE] i={poll_iteration} task_id={task_id} state={state}")
                 
                 # STATE NORMALIZATION: Treat done/completed as success
-                from app.delivery import normalize_state, SUCCESS_STATES, FAILURE_STATES
-                
                 normalized_state = normalize_state(state)
                 
                 if normalized_state != state:
@@ -784,15 +784,28 @@ class KieGenerator:
                                     f"Прошло: {int(elapsed)} сек"
                                 )
                         last_heartbeat = datetime.now()
-                    
-                    # Wait before next check
-                    await asyncio.sleep(poll_interval)
-                    continue
                 
-                else:
-                    # Unknown state
-                    await asyncio.sleep(2)
-                    continue
+                # Still running (or unknown state) - scheduler decides when to poll again
+                return None
+            
+            result = await get_completion_engine().wait(
+                task_id,
+                _poll_once,
+                category=policy_category,
+                timeout=timeout,
+                callback_registered=callback_registered,
+            )
+            if result is None:
+                return {
+                    'success': False,
+                    'message': f'⏱️ Превышено время ожидания ({timeout} сек)',
+                    'result_urls': [],
+                    'result_object': None,
+                    'error_code': 'TIMEOUT',
+                    'error_message': f'Task timeout after {timeout} seconds',
+                    'task_id': task_id
+                }
+            return result
         
         except (ValueError, ModelContractError) as e:
             # Payload building error
@@ -0,0 +1,193 @@
+"""
+Shared asyncio HTTP transport for Kie.ai API calls.
+
+One keep-alive aiohttp session per process (per event loop) with a bounded
+connector, so create_task/recordInfo reuse pooled TCP/TLS connections instead
+of paying a thread hop plus a fresh handshake on every call.
+
+Configuration (ENV):
+- KIE_HTTP_POOL_LIMIT: total open connections (default 100)
+- KIE_HTTP_POOL_LIMIT_PER_HOST: connections per host (default 30)
+- KIE_HTTP_KEEPALIVE_SECONDS: idle keep-alive timeout (default 30)
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+import aiohttp
+from yarl import URL
+
+from app.utils.metrics import track_api_call
+
+logger = logging.getLogger(__name__)
+
+
+class HttpStatusError(aiohttp.ClientError):
+    """HTTP 4xx/5xx response (raised by TransportResponse.raise_for_status)."""
+
+    def __init__(self, status: int, url: str, body: str = "") -> None:
+        super().__init__(f"HTTP {status} for {url}: {body[:200]}")
+        self.status = status
+        self.url = url
+        self.body = body
+
+
+@dataclass
+class TransportResponse:
+    """Fully-read HTTP response (body is small JSON for Kie.ai endpoints)."""
+    status: int
+    text: str
+    url: str
+    elapsed: float
+
+    def json(self) -> Any:
+        return json.loads(self.text)
+
+    def raise_for_status(self) -> None:
+        if self.status >= 400:
+            raise HttpStatusError(self.status, self.url, self.text)
+
+
+@dataclass
+class TransportStats:
+    """Request/latency counters for the shared transport."""
+    requests_total: int = 0
+    errors_total: int = 0
+    in_flight: int = 0
+    latency_sum: float = 0.0
+    latency_max: float = 0.0
+    by_status: Dict[str, int] = field(default_factory=dict)
+
+    def as_dict(self) -> Dict[str, Any]:
+        done = self.requests_total - self.in_flight
+        return {
+            "requests_total": self.requests_total,
+            "errors_total": self.errors_total,
+            "in_flight": self.in_flight,
+            "latency_avg_ms": round(self.latency_sum / done * 1000, 2) if done > 0 else 0.0,
+            "latency_max_ms": round(self.latency_max * 1000, 2),
+            "by_status": dict(self.by_status),
+        }
+
+
+class KieHttpTransport:
+    """Pooled keep-alive aiohttp transport shared by all Kie.ai clients."""
+
+    def __init__(
+        self,
+        limit: Optional[int] = None,
+        limit_per_host: Optional[int] = None,
+        keepalive_timeout: Optional[float] = None,
+    ) -> None:
+        self.limit = limit or int(os.getenv("KIE_HTTP_POOL_LIMIT", "100"))
+        self.limit_per_host = limit_per_host or int(os.getenv("KIE_HTTP_POOL_LIMIT_PER_HOST", "30"))
+        self.keepalive_timeout = keepalive_timeout or float(os.getenv("KIE_HTTP_KEEPALIVE_SECONDS", "30"))
+        self.stats = TransportStats()
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Get or create the shared session (re-created if closed or on a new loop)."""
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._loop = loop
+            logger.info(
+                f"[KIE_HTTP] Session created (limit={self.limit}, "
+                f"limit_per_host={self.limit_per_host}, keepalive={self.keepalive_timeout}s)"
+            )
+        return self._session
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        *,
+        headers: Optional[Dict[str, str]] = None,
+        json: Optional[Dict[str, Any]] = None,
+        params: Optional[Dict[str, Any]] = None,
+        timeout: float = 30,
+    ) -> TransportResponse:
+        """
+        Perform a request and read the body.
+
+        Raises:
+            aiohttp.ClientError / asyncio.TimeoutError on network failure
+            (HTTP error statuses are returned, not raised)
+        """
+        session = self._get_session()
+        self.stats.requests_total += 1
+        self.stats.in_flight += 1
+        started = time.monotonic()
+        status_key = "error"
+        try:
+            async with session.request(
+                method,
+                url,
+                headers=headers,
+                json=json,
+                params=params,
+                timeout=aiohttp.ClientTimeout(total=timeout),
+            ) as resp:
+                text = await resp.text()
+                status_key = str(resp.status)
+                return TransportResponse(
+                    status=resp.status,
+                    text=text,
+                    url=str(resp.url),
+                    elapsed=time.monotonic() - started,
+                )
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            self.stats.errors_total += 1
+            raise
+        finally:
+            elapsed = time.monotonic() - started
+            self.stats.in_flight -= 1
+            self.stats.latency_sum += elapsed
+            self.stats.latency_max = max(self.stats.latency_max, elapsed)
+            self.stats.by_status[status_key] = self.stats.by_status.get(status_key, 0) + 1
+            await track_api_call(
+                "kie", URL(url).path, elapsed, int(status_key) if status_key.isdigit() else 0
+            )
+
+    async def post_json(self, url: str, payload: Dict[str, Any], **kwargs: Any) -> TransportResponse:
+        return await self.request("POST", url, json=payload, **kwargs)
+
+    async def get(self, url: str, **kwargs: Any) -> TransportResponse:
+        return await self.request("GET", url, **kwargs)
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            logger.info("[KIE_HTTP] Session closed")
+        self._session = None
+        self._loop = None
+
+
+# Global transport instance
+_transport: Optional[KieHttpTransport] = None
+
+
+def get_kie_transport() -> KieHttpTransport:
+    """Get process-wide Kie.ai transport."""
+    global _transport
+    if _transport is None:
+        _transport = KieHttpTransport()
+    return _transport
+
+
+async def close_kie_transport() -> None:
+    """Close the shared session (call on shutdown)."""
+    if _transport is not None:
+        await _transport.close()
@@ -4,14 +4,13 @@ Registry loader для KIE_SOURCE_OF_TRUTH.json
 Предоставляет доступ к моделям из единого source of truth.
 """
 
-import json
-from pathlib import Path
 from typing import Dict, List, Optional
-from functools import lru_cache
+
+from app.kie.catalog import SOURCE_OF_TRUTH_PATH, ModelCatalog, get_catalog
 
 
 class KieRegistryLoader:
-    """Загрузчик и кэш для registry моделей"""
+    """Загрузчик registry моделей (поверх in-memory каталога app.kie.catalog)"""
     
     _instance = None
     _registry = None
@@ -26,18 +25,24 @@ class KieRegistryLoader:
             self._load_registry()
     
     def _load_registry(self):
-        """Загружает registry из JSON"""
-        registry_file = Path(__file__).parent.parent.parent / "models" / "KIE_SOURCE_OF_TRUTH.json"
-        
-        if not registry_file.exists():
-            raise FileNotFoundError(f"Registry not found: {registry_file}")
-        
-        with open(registry_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        """Проверяет наличие registry и прогревает каталог"""
+        if not SOURCE_OF_TRUTH_PATH.exists():
+            raise FileNotFoundError(f"Registry not found: {SOURCE_OF_TRUTH_PATH}")
         
-        self._registry = data
-        self._models = data.get('models', {})
-        self._pending = data.get('pending', [])
+        self._registry = get_catalog().raw
+    
+    @property
+    def _catalog(self) -> ModelCatalog:
+        # Всегда актуальный снимок: каталог сам перечитывает файл при смене mtime
+        return get_catalog()
+    
+    @property
+    def _models(self) -> Dict:
+        return self._catalog.raw.get('models', {})
+    
+    @property
+    def _pending(self) -> List:
+        return self._catalog.raw.get('pending', [])
     
     @property
     def all_models(self) -> Dict:
@@ -65,31 +70,19 @@ class KieRegistryLoader:
     @property
     def free_models(self) -> Dict:
         """Бесплатные модели"""
-        return {
-            model_id: data
-            for model_id, data in self._models.items()
-            if data.get('pricing', {}).get('is_free', False)
-        }
+        return {model['model_id']: model for model in self._catalog.free_models if model.get('model_id')}
     
     def get_model(self, model_id: str) -> Optional[Dict]:
         """Получить данные модели по ID"""
-        return self._models.get(model_id)
+        return self._catalog.get(model_id)
     
     def get_models_by_category(self, category: str) -> Dict:
         """Получить модели по категории"""
-        return {
-            model_id: data
-            for model_id, data in self._models.items()
-            if data.get('category') == category
-        }
+        return {model['model_id']: model for model in self._catalog.in_category(category) if model.get('model_id')}
     
     def get_models_by_provider(self, provider: str) -> Dict:
         """Получить модели по provider"""
-        return {
-            model_id: data
-            for model_id, data in self._models.items()
-            if data.get('provider') == provider
-        }
+        return {model['model_id']: model for model in self._catalog.from_provider(provider) if model.get('model_id')}
     
     def get_cheapest_models(self, limit: int = 5) -> List[Dict]:
         """Получить N самых дешевых моделей"""
@@ -0,0 +1,419 @@
+"""
+Precompiled per-model input validators.
+
+validate_model_inputs / validate_payload_before_create_task used to re-derive
+each model's field list from SOURCE_OF_TRUTH (examples -> types, required,
+system-field filtering, alias groups, cross-field classes) on every request.
+compile_model() does that derivation once per model and returns a
+CompiledModelValidator whose checks are a single walk over the model's fields
+with pre-resolved type checkers, enum sets and numeric ranges.
+
+Compiled validators are cached by model_id and invalidated when the catalog
+hands out a different schema object (hot reload of SOURCE_OF_TRUTH).
+Error messages are identical to the interpreted validator in app.kie.validator.
+"""
+
+import logging
+import re
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Tuple
+
+from app.kie.validator import TYPE_CHECKERS, ModelContractError
+
+logger = logging.getLogger(__name__)
+
+# СИСТЕМНЫЕ ПОЛЯ - добавляются автоматически builder'ом, НЕ требуются от юзера
+SYSTEM_FIELDS = frozenset({'model', 'callBackUrl', 'callback', 'callback_url', 'webhookUrl', 'webhook_url'})
+# DIRECT format (параметры на верхнем уровне payload)
+DIRECT_MODELS = frozenset({'veo3_fast', 'V4'})
+
+# Alias groups: a missing field is looked up under these user input keys (in order)
+TEXT_ALIASES = ('text', 'prompt', 'input')
+URL_ALIASES = ('url', 'link', 'image_url', 'video_url', 'audio_url')
+FILE_ALIASES = ('file', 'file_id', 'file_url')
+_ALIASES: Dict[str, Tuple[str, ...]] = {
+    **dict.fromkeys(['prompt', 'text', 'input', 'message'], TEXT_ALIASES),
+    **dict.fromkeys(['url', 'link', 'source_url', 'image_url', 'video_url', 'audio_url'], URL_ALIASES),
+    **dict.fromkeys(['file', 'file_id', 'file_url'], FILE_ALIASES),
+}
+
+_FILE_TYPES = frozenset({'file', 'file_id', 'file_url'})
+_TEXT_TYPES = frozenset({'text', 'string', 'prompt', 'input', 'message'})
+_URL_TYPES = frozenset({'url', 'link', 'source_url'})
+
+# Defense-in-depth SQL injection patterns (logged, never rejected)
+_SQL_INJECTION_RE = re.compile(
+    r"';.*--|';.*DROP|';.*DELETE|';.*UPDATE|UNION.*SELECT|';.*INSERT",
+    re.IGNORECASE,
+)
+
+_TEXT_CATEGORIES = frozenset({'t2i', 't2v', 'tts', 'music', 'sfx'})
+_MEDIA_CATEGORIES = frozenset({
+    'i2v', 'i2i', 'v2v', 'lip_sync', 'upscale', 'bg_remove', 'watermark_remove', 'stt', 'audio_isolation',
+})
+
+
+def _alias_value(user_inputs: Dict[str, Any], aliases: Tuple[str, ...]) -> Any:
+    """Same result as `inputs.get(a1) or inputs.get(a2) or ...`."""
+    value = None
+    for alias in aliases:
+        value = user_inputs.get(alias)
+        if value:
+            return value
+    return value
+
+
+def _example_type(field_value: Any) -> str:
+    # Порядок проверок как в исходном валидаторе (bool попадает в 'number')
+    if isinstance(field_value, str):
+        return 'string'
+    if isinstance(field_value, (int, float)):
+        return 'number'
+    if isinstance(field_value, bool):
+        return 'boolean'
+    if isinstance(field_value, dict):
+        return 'object'
+    if isinstance(field_value, list):
+        return 'array'
+    return 'string'
+
+
+def derive_schema(model_schema: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str], List[str]]:
+    """
+    Extract user-facing (properties, required_fields, optional_fields) from a
+    SOURCE_OF_TRUTH model entry (input.properties / input.examples / flat formats).
+    """
+    input_schema = model_schema.get('input_schema', {})
+
+    # Если schema имеет структуру {model, callBackUrl, input: {examples: [...]}},
+    # реальные user fields находятся внутри 'input'
+    if 'input' in input_schema and isinstance(input_schema['input'], dict):
+        input_field_spec = input_schema['input']
+        if 'properties' in input_field_spec:
+            input_schema = input_field_spec['properties']
+        elif 'examples' in input_field_spec and isinstance(input_field_spec['examples'], list):
+            examples = input_field_spec['examples']
+            if examples and isinstance(examples[0], dict):
+                example_structure = examples[0]
+                # Консервативно - все поля опциональные, кроме непустого prompt
+                input_schema = {
+                    name: {'type': _example_type(value), 'required': False}
+                    for name, value in example_structure.items()
+                }
+                if 'prompt' in input_schema:
+                    prompt_value = example_structure.get('prompt', '')
+                    if isinstance(prompt_value, str) and prompt_value.strip():
+                        input_schema['prompt']['required'] = True
+
+    if 'properties' in input_schema:
+        properties = input_schema.get('properties', {})
+        required_fields = list(input_schema.get('required', []))
+        optional_fields = list(input_schema.get('optional', []))
+    else:
+        properties = input_schema
+        required_fields = [k for k, v in properties.items() if v.get('required', False)]
+        optional_fields = [k for k in properties.keys() if k not in required_fields]
+    return properties, required_fields, optional_fields
+
+
+@dataclass(frozen=True)
+class CompiledField:
+    """One user input field with everything resolved at compile time."""
+    name: str
+    type_name: str
+    required: bool
+    checker: Optional[Callable[[Any, str, bool], None]]
+    aliases: Tuple[str, ...]
+    enum_values: Optional[List[Any]]
+    enum_set: Optional[FrozenSet[Any]]
+    minimum: Optional[float]
+    maximum: Optional[float]
+    check_sql: bool
+
+
+def _compile_field(name: str, spec: Dict[str, Any], required: bool) -> CompiledField:
+    type_name = spec.get('type', 'string')
+    enum_values = spec.get('enum')
+    enum_set = None
+    if enum_values is not None:
+        try:
+            enum_set = frozenset(enum_values)
+        except TypeError:
+            enum_set = None  # unhashable enum members: fall back to list scan
+    return CompiledField(
+        name=name,
+        type_name=type_name,
+        required=required,
+        checker=TYPE_CHECKERS.get(type_name),
+        aliases=_ALIASES.get(name, ()),
+        enum_values=enum_values,
+        enum_set=enum_set,
+        minimum=spec.get('minimum'),
+        maximum=spec.get('maximum'),
+        check_sql=type_name == 'string',
+    )
+
+
+class CompiledModelValidator:
+    """Validator for one model; validate_* are O(fields) dict walks."""
+
+    def __init__(self, model_id: str, model_schema: Dict[str, Any]) -> None:
+        self.model_id = model_id
+        self.source = model_schema
+        self.category = model_schema.get('category', '')
+        self.api_endpoint = model_schema.get('api_endpoint', model_id)
+        self.is_direct = model_id in DIRECT_MODELS
+
+        properties, required_fields, optional_fields = derive_schema(model_schema)
+
+        # --- user inputs contract ---
+        if self.is_direct:
+            # Для ПРЯМЫХ моделей: только prompt required, остальное заполнит builder
+            user_required = ['prompt']
+            user_optional = [f for f in properties if f != 'prompt']
+        else:
+            user_required = [f for f in required_fields if f not in SYSTEM_FIELDS]
+            user_optional = [f for f in optional_fields if f not in SYSTEM_FIELDS]
+        user_properties = {k: v for k, v in properties.items() if k not in SYSTEM_FIELDS}
+        self.has_properties = bool(user_properties)
+
+        required_set = set(user_required)
+        ordered = list(dict.fromkeys(user_required + user_optional))
+        self.fields: Tuple[CompiledField, ...] = tuple(
+            _compile_field(name, user_properties.get(name, {}), name in required_set) for name in ordered
+        )
+        self.required: Tuple[CompiledField, ...] = tuple(f for f in self.fields if f.required)
+
+        def names_of(types: FrozenSet[str]) -> Tuple[str, ...]:
+            return tuple(n for n in ordered if user_properties.get(n, {}).get('type') in types)
+
+        self.file_fields = names_of(_FILE_TYPES)
+        self.text_fields = names_of(_TEXT_TYPES)
+        self.url_fields = names_of(_URL_TYPES)
+        has_required = bool(user_required)
+        self.requires_file = has_required and any(n in required_set for n in self.file_fields)
+        self.requires_url = has_required and any(n in required_set for n in self.url_fields)
+        self.requires_text = has_required and any(n in required_set for n in self.text_fields)
+
+        # --- createTask payload contract ---
+        if self.is_direct:
+            payload_required = ['prompt']
+            payload_properties = properties
+        else:
+            payload_required = [f for f in required_fields if f not in SYSTEM_FIELDS]
+            payload_properties = user_properties
+        self.payload_required: Tuple[Tuple[str, Optional[Callable[[Any, str, bool], None]]], ...] = tuple(
+            (name, TYPE_CHECKERS.get(payload_properties.get(name, {}).get('type', 'string')))
+            for name in payload_required
+        )
+
+    def validate_inputs(self, user_inputs: Dict[str, Any]) -> None:
+        """
+        Strictly validate user inputs (see app.kie.validator.validate_model_inputs).
+
+        Raises:
+            ModelContractError: If contract is violated
+        """
+        model_id = self.model_id
+        if not self.has_properties:
+            self._validate_by_category(user_inputs)
+            return
+
+        for field in self.required:
+            if field.name not in user_inputs:
+                value = _alias_value(user_inputs, field.aliases) if field.aliases else None
+                if value is None:
+                    raise ModelContractError(
+                        f"Model {model_id} requires field '{field.name}' (type: {field.type_name}), "
+                        f"but it is missing from user inputs"
+                    )
+
+        for field in self.fields:
+            name = field.name
+            value = user_inputs.get(name)
+            if value is None:
+                if field.aliases:
+                    value = _alias_value(user_inputs, field.aliases)
+                if value is None:
+                    continue
+
+            if field.checker is not None:
+                field.checker(value, name, field.required)
+
+            if field.check_sql and isinstance(value, str) and _SQL_INJECTION_RE.search(value):
+                logger.warning(f"[VALIDATION] Potential SQL injection pattern detected in field '{name}': {value[:100]}...")
+
+            if field.enum_values is not None:
+                try:
+                    allowed = value in field.enum_set if field.enum_set is not None else value in field.enum_values
+                except TypeError:
+                    allowed = value in field.enum_values
+                if not allowed:
+                    raise ModelContractError(
+                        f"Field '{name}' must be one of {field.enum_values}, got '{value}'"
+                    )
+
+            if field.minimum is not None or field.maximum is not None:
+                try:
+                    num_value = float(value)
+                except (ValueError, TypeError):
+                    continue  # Type validation will catch this
+                if field.minimum is not None and num_value < field.minimum:
+                    raise ModelContractError(
+                        f"Field '{name}' must be >= {field.minimum}, got {num_value}"
+                    )
+                if field.maximum is not None and num_value > field.maximum:
+                    raise ModelContractError(
+                        f"Field '{name}' must be <= {field.maximum}, got {num_value}"
+                    )
+
+        if self.requires_file or self.requires_url or self.requires_text:
+            self._validate_input_kinds(user_inputs)
+
+    def _validate_input_kinds(self, user_inputs: Dict[str, Any]) -> None:
+        """Cross-field validation: file vs text vs URL."""
+        model_id = self.model_id
+        get = user_inputs.get
+        has_file_input = bool(self.file_fields) and (
+            any(get(f) for f in self.file_fields) or any(get(a) for a in FILE_ALIASES)
+        )
+        has_text_input = bool(self.text_fields) and (
+            any(get(f) for f in self.text_fields) or any(get(a) for a in TEXT_ALIASES)
+        )
+        has_url_input = bool(self.url_fields) and (
+            any(get(f) for f in self.url_fields) or bool(get('url') or get('link'))
+        )
+
+        if self.requires_file and not has_file_input:
+            if has_text_input:
+                raise ModelContractError(
+                    f"Model {model_id} requires file input, but text was provided. "
+                    f"Please provide a file instead."
+                )
+            if has_url_input:
+                raise ModelContractError(
+                    f"Model {model_id} requires file input, but URL was provided. "
+                    f"Please provide a file instead."
+                )
+
+        if self.requires_url and not has_url_input and has_file_input:
+            raise ModelContractError(
+                f"Model {model_id} requires URL input, but file was provided. "
+                f"Please provide a URL instead."
+            )
+
+        if self.requires_text and not has_text_input:
+            if has_file_input:
+                raise ModelContractError(
+                    f"Model {model_id} requires text input, but file was provided. "
+                    f"Please provide text instead."
+                )
+            if has_url_input:
+                raise ModelContractError(
+                    f"Model {model_id} requires text input, but URL was provided. "
+                    f"Please provide text instead."
+                )
+
+    def _validate_by_category(self, user_inputs: Dict[str, Any]) -> None:
+        """FALLBACK: no properties in schema - validate by category."""
+        model_id = self.model_id
+        category = self.category
+        has_prompt = bool(user_inputs.get('prompt') or user_inputs.get('text'))
+        has_url = bool(user_inputs.get('url') or user_inputs.get('image_url') or
+                       user_inputs.get('video_url') or user_inputs.get('audio_url'))
+        has_file = bool(user_inputs.get('file') or user_inputs.get('file_id'))
+
+        if category in _TEXT_CATEGORIES or 'text' in model_id.lower():
+            if not has_prompt:
+                raise ModelContractError(
+                    f"Text-based model {model_id} requires 'prompt' or 'text' field"
+                )
+        elif category in _MEDIA_CATEGORIES:
+            if not has_url and not has_file:
+                raise ModelContractError(
+                    f"Media model {model_id} requires URL or file input"
+                )
+        elif not user_inputs or all(v is None for v in user_inputs.values()):
+            raise ModelContractError(
+                f"Model {model_id} requires at least one input"
+            )
+
+    def validate_payload(self, payload: Dict[str, Any]) -> None:
+        """
+        Final createTask payload validation (see validate_payload_before_create_task).
+
+        Raises:
+            ModelContractError: If payload is invalid
+        """
+        if 'model' not in payload:
+            raise ModelContractError("Payload must contain 'model' field")
+        if payload['model'] != self.model_id and payload['model'] != self.api_endpoint:
+            raise ModelContractError(
+                f"Payload model '{payload['model']}' does not match requested model '{self.model_id}' "
+                f"or api_endpoint '{self.api_endpoint}'"
+            )
+
+        if self.is_direct:
+            input_data = payload
+            location = "payload"
+        else:
+            if 'input' not in payload:
+                raise ModelContractError("Payload must contain 'input' object")
+            input_data = payload['input']
+            if not isinstance(input_data, dict):
+                raise ModelContractError("Payload 'input' must be a dictionary")
+            location = "payload['input']"
+
+        for name, checker in self.payload_required:
+            if name not in input_data:
+                raise ModelContractError(
+                    f"Required field '{name}' is missing from {location}"
+                )
+            if checker is not None:
+                try:
+                    checker(input_data[name], name, True)
+                except ModelContractError as e:
+                    raise ModelContractError(
+                        f"Payload validation failed for field '{name}': {str(e)}"
+                    )
+
+
+def compile_model(model_id: str, model_schema: Dict[str, Any]) -> CompiledModelValidator:
+    """Compile one SOURCE_OF_TRUTH model entry."""
+    return CompiledModelValidator(model_id, model_schema)
+
+
+# model_id -> compiled validator (checked against the schema object it was built from)
+_compiled: Dict[str, CompiledModelValidator] = {}
+
+
+def get_compiled_validator(model_id: str, model_schema: Dict[str, Any]) -> CompiledModelValidator:
+    """Get cached validator; recompiles if the catalog returned a different schema object."""
+    validator = _compiled.get(model_id)
+    if validator is None or validator.source is not model_schema:
+        validator = compile_model(model_id, model_schema)
+        _compiled[model_id] = validator
+    return validator
+
+
+def precompile_all() -> int:
+    """Compile validators for every model in the catalog (call at startup)."""
+    from app.kie.catalog import get_catalog
+
+    models = get_catalog().raw.get('models', {})
+    items = models.items() if isinstance(models, dict) else ((m.get('model_id'), m) for m in models)
+    count = 0
+    for model_id, model_schema in items:
+        if not model_id or not isinstance(model_schema, dict):
+            continue
+        try:
+            get_compiled_validator(model_id, model_schema)
+            count += 1
+        except Exception as e:
+            logger.warning(f"[VALIDATOR_COMPILE] Failed to compile {model_id}: {e}")
+    return count
+
+
+def reset_compiled_validators() -> None:
+    """Drop compiled validators (tests / forced reload)."""
+    _compiled.clear()
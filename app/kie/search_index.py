@@ -0,0 +1,334 @@
+"""
+Ranked model search over the in-memory catalog (app.kie.catalog).
+
+The index is built once per catalog snapshot:
+- every text field is tokenized and folded to one Latin "search key", so
+  "клинг" finds Kling and "флюкс" finds Flux (Cyrillic→Latin transliteration
+  plus a light phonetic fold applied identically to documents and queries);
+- postings hold per-field weighted term frequencies for BM25F-style scoring;
+- a prefix map completes partially typed words ("kli" → kling);
+- a trigram map finds near-miss spellings ("imgen" → imagen).
+
+Ranking: for each query word the best of exact / prefix / fuzzy matches
+contributes its BM25 score; documents matching more query words always rank
+first, then score boosted by model popularity (set_model_popularity, loaded
+from the analytics rollups at startup).
+
+The index is swapped atomically when the catalog reloads; lookups never
+parse or lowercase the catalog.
+"""
+
+import logging
+import math
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, List, Mapping, Optional, Tuple
+
+from app.kie.catalog import ModelCatalog, get_catalog
+
+logger = logging.getLogger(__name__)
+
+# Field weights (BM25F): identity fields dominate, long prose counts least
+FIELD_WEIGHTS: Tuple[Tuple[str, float], ...] = (
+    ("model_id", 3.0),
+    ("display_name", 3.0),
+    ("name", 3.0),
+    ("provider", 2.0),
+    ("tags", 2.0),
+    ("category", 1.5),
+    ("description", 1.0),
+    ("use_case", 0.5),
+)
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+PREFIX_MIN_LEN = 2
+PREFIX_FACTOR = 0.8
+FUZZY_MIN_LEN = 3
+FUZZY_MIN_SIMILARITY = 0.45
+FUZZY_FACTOR = 0.6
+FUZZY_MAX_TERMS = 5
+
+# Score multiplier for the most popular model: 1 + POPULARITY_WEIGHT
+POPULARITY_WEIGHT = 0.3
+
+_CYR_TO_LAT = {
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "e",
+    "ж": "zh", "з": "z", "и": "i", "й": "i", "к": "k", "л": "l", "м": "m",
+    "н": "n", "о": "o", "п": "p", "р": "r", "с": "s", "т": "t", "у": "u",
+    "ф": "f", "х": "h", "ц": "ts", "ч": "ch", "ш": "sh", "щ": "sch", "ъ": "",
+    "ы": "y", "ь": "", "э": "e", "ю": "u", "я": "ya",
+}
+_TRANSLIT = str.maketrans(_CYR_TO_LAT)
+
+# Applied in order to transliterated text; brings brand spellings and their
+# Russian phonetic renderings to the same key (seedream ~ сидрим, google ~ гугл)
+_FOLDS: Tuple[Tuple["re.Pattern[str]", str], ...] = tuple(
+    (re.compile(pattern), replacement)
+    for pattern, replacement in (
+        (r"ph", "f"),
+        (r"ck", "k"),
+        (r"ks", "x"),
+        (r"w", "v"),
+        (r"q", "k"),
+        (r"c(?!h)", "k"),
+        (r"ee|ea", "i"),
+        (r"oo", "u"),
+        (r"y", "i"),
+        (r"([a-z])\1+", r"\1"),
+    )
+)
+
+_TOKEN_RE = re.compile(r"[^\W_]+", re.UNICODE)
+
+
+def search_key(word: str) -> str:
+    """Fold one lowercase word to its search key (transliterated + phonetic fold)."""
+    key = word.translate(_TRANSLIT)
+    for pattern, replacement in _FOLDS:
+        key = pattern.sub(replacement, key)
+    return key
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into search keys."""
+    keys = []
+    for word in _TOKEN_RE.findall(text.lower()):
+        key = search_key(word)
+        if key:
+            keys.append(key)
+    return keys
+
+
+def _trigrams(term: str) -> FrozenSet[str]:
+    padded = f"^{term}$"
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def _field_text(value: Any) -> str:
+    if isinstance(value, (list, tuple)):
+        return " ".join(str(item) for item in value if item)
+    return str(value) if value else ""
+
+
+@dataclass(frozen=True)
+class SearchHit:
+    """One ranked search result."""
+
+    model_id: str
+    score: float
+    matched_terms: int
+    model: Dict[str, Any] = field(repr=False, compare=False)
+
+
+@dataclass(frozen=True)
+class ModelSearchIndex:
+    """Immutable search index for one catalog snapshot."""
+
+    catalog_version: str
+    doc_ids: Tuple[str, ...]
+    docs: Tuple[Dict[str, Any], ...]
+    doc_lengths: Tuple[float, ...]
+    avg_doc_length: float
+    postings: Mapping[str, Mapping[int, float]]
+    idf: Mapping[str, float]
+    prefixes: Mapping[str, Tuple[str, ...]]
+    trigrams: Mapping[str, Tuple[str, ...]]
+    term_trigrams: Mapping[str, FrozenSet[str]]
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def _bm25(self, term: str, doc: int, tf: float) -> float:
+        norm = 1.0 - BM25_B + BM25_B * self.doc_lengths[doc] / self.avg_doc_length
+        return self.idf[term] * tf * (BM25_K1 + 1.0) / (tf + BM25_K1 * norm)
+
+    def expand(self, key: str) -> Dict[str, float]:
+        """Index terms a query key may refer to, with a match-quality factor."""
+        if key in self.postings:
+            expansions = {key: 1.0}
+        else:
+            expansions = {}
+        if len(key) >= PREFIX_MIN_LEN:
+            for term in self.prefixes.get(key, ()):
+                expansions.setdefault(term, PREFIX_FACTOR)
+        if expansions or len(key) < FUZZY_MIN_LEN:
+            return expansions
+
+        # Typo tolerance only when nothing matched exactly or by prefix
+        query_grams = _trigrams(key)
+        shared: Dict[str, int] = {}
+        for gram in query_grams:
+            for term in self.trigrams.get(gram, ()):
+                shared[term] = shared.get(term, 0) + 1
+        scored = []
+        for term, count in shared.items():
+            similarity = 2.0 * count / (len(query_grams) + len(self.term_trigrams[term]))
+            if similarity >= FUZZY_MIN_SIMILARITY:
+                scored.append((similarity, term))
+        scored.sort(reverse=True)
+        for similarity, term in scored[:FUZZY_MAX_TERMS]:
+            expansions[term] = FUZZY_FACTOR * similarity
+        return expansions
+
+    def search(
+        self,
+        query: str,
+        limit: int = 10,
+        popularity: Optional[Mapping[str, float]] = None,
+    ) -> List[SearchHit]:
+        """
+        Rank models for a free-text query.
+
+        Args:
+            query: user text (any case, Cyrillic or Latin)
+            limit: max hits
+            popularity: model_id -> boost factor in [0, 1] (default: global popularity)
+
+        Returns:
+            Hits ordered by matched query words, then score
+        """
+        keys = list(dict.fromkeys(tokenize(query)))
+        if not keys:
+            return []
+        if popularity is None:
+            popularity = _popularity
+
+        scores: Dict[int, float] = {}
+        matched: Dict[int, int] = {}
+        for key in keys:
+            best: Dict[int, float] = {}
+            for term, factor in self.expand(key).items():
+                for doc, tf in self.postings[term].items():
+                    score = factor * self._bm25(term, doc, tf)
+                    if score > best.get(doc, 0.0):
+                        best[doc] = score
+            for doc, score in best.items():
+                scores[doc] = scores.get(doc, 0.0) + score
+                matched[doc] = matched.get(doc, 0) + 1
+
+        ranked = []
+        for doc, score in scores.items():
+            boost = 1.0 + POPULARITY_WEIGHT * popularity.get(self.doc_ids[doc], 0.0)
+            ranked.append((matched[doc], score * boost, doc))
+        ranked.sort(key=lambda item: (-item[0], -item[1], self.doc_ids[item[2]]))
+
+        return [
+            SearchHit(model_id=self.doc_ids[doc], score=score, matched_terms=count, model=self.docs[doc])
+            for count, score, doc in ranked[:limit]
+        ]
+
+
+def build_search_index(catalog: ModelCatalog) -> ModelSearchIndex:
+    """Build the index for a catalog snapshot."""
+    doc_ids: List[str] = []
+    docs: List[Dict[str, Any]] = []
+    doc_lengths: List[float] = []
+    postings: Dict[str, Dict[int, float]] = {}
+
+    for model_id, model in catalog.by_id.items():
+        doc = len(doc_ids)
+        doc_ids.append(model_id)
+        docs.append(model)
+        length = 0.0
+        for field_name, weight in FIELD_WEIGHTS:
+            for key in tokenize(_field_text(model.get(field_name))):
+                postings.setdefault(key, {})
+                postings[key][doc] = postings[key].get(doc, 0.0) + weight
+                length += weight
+        doc_lengths.append(length)
+
+    total = len(doc_ids)
+    idf = {
+        term: math.log(1.0 + (total - len(docs_for) + 0.5) / (len(docs_for) + 0.5))
+        for term, docs_for in postings.items()
+    }
+
+    prefixes: Dict[str, List[str]] = {}
+    trigrams: Dict[str, List[str]] = {}
+    term_trigrams: Dict[str, FrozenSet[str]] = {}
+    for term in sorted(postings):
+        for end in range(PREFIX_MIN_LEN, len(term)):
+            prefixes.setdefault(term[:end], []).append(term)
+        grams = _trigrams(term)
+        term_trigrams[term] = grams
+        for gram in grams:
+            trigrams.setdefault(gram, []).append(term)
+
+    return ModelSearchIndex(
+        catalog_version=catalog.version,
+        doc_ids=tuple(doc_ids),
+        docs=tuple(docs),
+        doc_lengths=tuple(doc_lengths),
+        avg_doc_length=(sum(doc_lengths) / total) if total and sum(doc_lengths) else 1.0,
+        postings={term: dict(docs_for) for term, docs_for in postings.items()},
+        idf=idf,
+        prefixes={prefix: tuple(terms) for prefix, terms in prefixes.items()},
+        trigrams={gram: tuple(terms) for gram, terms in trigrams.items()},
+        term_trigrams=term_trigrams,
+    )
+
+
+_index: Optional[ModelSearchIndex] = None
+_index_catalog: Optional[ModelCatalog] = None
+_index_lock = threading.Lock()
+_popularity: Mapping[str, float] = {}
+
+
+def get_search_index() -> ModelSearchIndex:
+    """Index for the current catalog (rebuilt once per catalog reload)."""
+    global _index, _index_catalog
+    catalog = get_catalog()
+    index = _index
+    if index is not None and _index_catalog is catalog:
+        return index
+    with _index_lock:
+        if _index is None or _index_catalog is not catalog:
+            _index = build_search_index(catalog)
+            _index_catalog = catalog
+            logger.info(f"[SEARCH] Index built: models={len(_index)} terms={len(_index.postings)} catalog={catalog.version}")
+        return _index
+
+
+def search_models(query: str, limit: int = 10) -> List[SearchHit]:
+    """Ranked search over the current catalog."""
+    return get_search_index().search(query, limit=limit)
+
+
+def set_model_popularity(counts: Mapping[str, float]) -> None:
+    """
+    Set popularity boosts from raw usage counts (model_id -> count).
+
+    Counts are log-scaled to [0, 1] so a few very hot models do not bury
+    exact matches on others.
+    """
+    global _popularity
+    positive = {model_id: float(count) for model_id, count in counts.items() if count and count > 0}
+    if not positive:
+        _popularity = {}
+        return
+    top = math.log1p(max(positive.values()))
+    _popularity = {model_id: math.log1p(count) / top for model_id, count in positive.items()}
+
+
+async def load_popularity_from_db(db_service) -> bool:
+    """
+    Load popularity from analytics_jobs_hourly (fail-open: keeps current boosts).
+
+    Returns:
+        True if popularity was updated
+    """
+    try:
+        async with db_service.get_connection() as conn:
+            rows = await conn.fetch(
+                "SELECT model_id, SUM(success_count)::BIGINT AS success_count "
+                "FROM analytics_jobs_hourly GROUP BY model_id"
+            )
+        set_model_popularity({row["model_id"]: row["success_count"] for row in rows})
+        logger.info(f"[SEARCH] Popularity loaded for {len(rows)} models")
+        return True
+    except Exception as e:
+        logger.warning(f"[SEARCH] Popularity not loaded (search ranks by relevance only): {e}")
+        return False
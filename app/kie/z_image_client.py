@@ -66,6 +66,9 @@ class ZImageClient:
         max_retries: int = 3,
     ):
         self.api_key = api_key or os.getenv("KIE_API_KEY", "")
+        # KIE_API_URL overrides the host (staging, local fakes)
+        api_url = os.getenv("KIE_API_URL", "").rstrip("/")
+        self.base_url = f"{api_url}/api/v1/jobs" if api_url else self.BASE_URL
         self.timeout = timeout
         self.max_retries = max_retries
         
@@ -121,7 +124,7 @@ class ZImageClient:
             "Content-Type": "application/json",
         }
         
-        url = f"{self.BASE_URL}/createTask"
+        url = f"{self.base_url}/createTask"
         
         # Retry logic
         last_error = None
@@ -208,7 +211,7 @@ class ZImageClient:
             "Authorization": f"Bearer {self.api_key}",
         }
         
-        url = f"{self.BASE_URL}/recordInfo?taskId={task_id}"
+        url = f"{self.base_url}/recordInfo?taskId={task_id}"
         
         # Retry logic
         last_error = None
@@ -5,6 +5,7 @@ Ensures only ONE lock watcher and atomic PASSIVE/ACTIVE transitions.
 import asyncio
 import logging
 import os
+import time
 import uuid
 from dataclasses import dataclass, field
 from datetime import datetime, timedelta
@@ -43,20 +44,25 @@ class SingletonLockController:
     - Throttled user notifications (max 1 per 60s)
     - Auto-stops retry loop after ACTIVE
     - Callback on PASSIVE→ACTIVE transition
+    - Optional LISTEN/NOTIFY handover: watcher retries as soon as the
+      ACTIVE instance announces the release (app.locking.handover)
     """
     
-    def __init__(self, lock_wrapper, bot=None, on_active_callback=None, active_state=None):
+    def __init__(self, lock_wrapper, bot=None, on_active_callback=None, active_state=None, handover=None):
         """
         Args:
             lock_wrapper: SingletonLock instance with acquire()/release()
             bot: Telegram Bot instance for passive notifications
             on_active_callback: async callable to run when transitioning to ACTIVE
             active_state: ActiveState instance for synchronization with workers
+            handover: LockHandover instance (release notifications + update stash)
         """
         self.lock = lock_wrapper
         self.bot = bot
         self.on_active_callback = on_active_callback
         self.active_state = active_state  # NEW: unified state sync
+        self.handover = handover
+        self._adopt_task: Optional[asyncio.Task] = None
         self.state = ControllerState()
         self._stop_event = asyncio.Event()
         
@@ -188,8 +194,56 @@ class SingletonLockController:
             )
             return False
     
+    async def _on_acquired(self) -> None:
+        """
+        ACTIVE after acquire: sync state and take over updates stashed by the previous holder.
+        
+        Adoption starts as soon as active_state flips (before on_active_callback
+        finishes), so handed-over updates don't wait for service init.
+        """
+        if self.handover is None:
+            await self._set_state(LockState.ACTIVE)
+            return
+        if self.active_state is None:
+            await self._set_state(LockState.ACTIVE)
+            await self._adopt_handover()
+            return
+        self._adopt_task = asyncio.create_task(self._adopt_handover(wait_active=True))
+        await self._set_state(LockState.ACTIVE)
+    
+    async def _adopt_handover(self, wait_active: bool = False) -> None:
+        try:
+            if wait_active and not await self.active_state.wait_active(timeout=30):
+                return
+            await self.handover.adopt_pending()
+        except Exception as e:
+            logger.warning("[LOCK_CONTROLLER] Handover adopt failed: %s", e)
+    
+    async def _wait_retry(self, wait_time: float) -> Optional[str]:
+        """
+        Sleep until retry time, a release notification or stop.
+        
+        Returns:
+            "stop", "released" (handover notification) or None (timeout)
+        """
+        waiters = [asyncio.ensure_future(self._stop_event.wait())]
+        if self.handover is not None:
+            waiters.append(asyncio.ensure_future(self.handover.wait_released()))
+        try:
+            done, _ = await asyncio.wait(waiters, timeout=wait_time, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for waiter in waiters:
+                waiter.cancel()
+        if self._stop_event.is_set():
+            return "stop"
+        return "released" if done else None
+    
     async def _watcher_loop(self):
-        """Background watcher: attempt lock acquisition with exponential backoff"""
+        """
+        Background watcher: attempt lock acquisition with exponential backoff.
+        
+        A release notification (handover) cuts the wait short and resets the backoff.
+        """
         logger.info(
             "[LOCK_CONTROLLER] Watcher started | watcher=%s instance=%s",
             self.state.watcher_id,
@@ -202,13 +256,15 @@ class SingletonLockController:
         
         while not self._stop_event.is_set():
             attempt += 1
+            if self.handover is not None:
+                self.handover.reset()
             
             try:
                 # Fast non-blocking acquire attempt (0.5s timeout)
                 got_lock = await self.lock.acquire(timeout=0.5)
                 
                 if got_lock:
-                    await self._set_state(LockState.ACTIVE)
+                    await self._on_acquired()
                     logger.info(
                         "[LOCK_CONTROLLER] ✅ Lock acquired | attempt=%d instance=%s",
                         attempt,
@@ -239,14 +295,18 @@ class SingletonLockController:
                 self.state.instance_id
             )
             
-            try:
-                await asyncio.wait_for(
-                    self._stop_event.wait(),
-                    timeout=wait_time
-                )
+            started = time.monotonic()
+            woke = await self._wait_retry(wait_time)
+            if woke == "stop":
                 break  # Stop event set
-            except asyncio.TimeoutError:
-                continue  # Retry
+            if woke == "released":
+                # Woken by release notification: retry now, restart backoff
+                logger.info(
+                    "[LOCK_CONTROLLER] Handover notification after %.2fs, retrying | instance=%s",
+                    time.monotonic() - started,
+                    self.state.instance_id
+                )
+                attempt = 0
         
         logger.info(
             "[LOCK_CONTROLLER] Watcher stopped | watcher=%s instance=%s state=%s",
@@ -265,6 +325,10 @@ class SingletonLockController:
             )
             return
         
+        # Listen for release notifications before the first attempt (no gap to miss one)
+        if self.handover is not None:
+            await self.handover.start()
+        
         # Try immediate acquire first (fast path) - DON'T hold mutex during this
         logger.info("[LOCK_CONTROLLER] 🔍 Attempting immediate acquire (timeout=0.5s)...")
         try:
@@ -272,7 +336,7 @@ class SingletonLockController:
             logger.info(f"[LOCK_CONTROLLER] Immediate acquire returned: {got_lock}")
             if got_lock:
                 # SUCCESS: Call _set_state (which has its own mutex)
-                await self._set_state(LockState.ACTIVE)
+                await self._on_acquired()
                 logger.info(
                     "[LOCK_CONTROLLER] ✅ Lock acquired immediately | instance=%s",
                     self.state.instance_id
@@ -297,8 +361,14 @@ class SingletonLockController:
                 self.state.instance_id
             )
     
-    async def stop(self) -> None:
-        """Stop lock controller and release lock"""
+    async def stop(self, handover: bool = False) -> None:
+        """
+        Stop lock controller and release lock.
+        
+        Args:
+            handover: stash queued updates before the release and announce the
+                release via pg_notify, so a waiting instance takes over at once
+        """
         self._stop_event.set()
         
         async with self.state._mutex:
@@ -310,9 +380,19 @@ class SingletonLockController:
                     pass
                 self.state.watcher_task = None
         
-        if self.state.state == LockState.ACTIVE:
+        was_active = self.state.state == LockState.ACTIVE
+        handed_over = 0
+        if was_active and handover and self.handover is not None:
+            try:
+                handed_over = await self.handover.stash_pending()
+            except Exception as e:
+                logger.warning("[LOCK_CONTROLLER] Handover stash failed: %s", e)
+        
+        released = False
+        if was_active:
             try:
                 await self.lock.release()
+                released = True
                 logger.info(
                     "[LOCK_CONTROLLER] Lock released | instance=%s",
                     self.state.instance_id
@@ -324,6 +404,11 @@ class SingletonLockController:
                 )
         
         await self._set_state(LockState.PASSIVE)
+        
+        if self.handover is not None:
+            if released and handover:
+                await self.handover.publish_released(handed_over)
+            await self.handover.close()
         logger.info(
             "[LOCK_CONTROLLER] Stopped | instance=%s",
             self.state.instance_id
@@ -0,0 +1,232 @@
+"""
+ACTIVE → PASSIVE handover over Postgres LISTEN/NOTIFY.
+
+Without it a PASSIVE instance only noticed a released advisory lock on its
+next retry (10s backoff growing to 60s), so every deploy left the bot without
+an ACTIVE instance for up to a minute.
+
+Protocol (channel LOCK_HANDOVER_CHANNEL, payload JSON with lock_key):
+1. The releasing instance takes the updates still queued in UpdateQueueManager
+   (not yet dispatched) and stores them in update_handover (migration 018).
+2. It releases the advisory lock and sends pg_notify "released".
+3. Waiting instances LISTEN on a dedicated asyncpg connection; the
+   notification wakes SingletonLockController's watcher, which retries the lock
+   at once instead of sleeping out its backoff.
+4. The new ACTIVE instance claims the stashed updates and enqueues them.
+
+Fail-open: without asyncpg / DATABASE_URL, or when the listen connection is
+lost, the watcher falls back to its backoff polling; a missed notification
+only costs latency. Stashed updates are claimed on every PASSIVE → ACTIVE
+transition, so they survive a missed notification too.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, Optional
+
+try:
+    import asyncpg
+    ASYNCPG_AVAILABLE = True
+except ImportError:
+    ASYNCPG_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+LOCK_HANDOVER_CHANNEL = "singleton_lock_handover"
+
+# Handed-over updates older than this are discarded instead of processed
+HANDOVER_MAX_AGE_SECONDS = float(os.getenv("LOCK_HANDOVER_MAX_AGE_SECONDS", "600"))
+
+
+def supports_handover(storage: Any) -> bool:
+    return hasattr(storage, "stash_handover_updates") and hasattr(storage, "claim_handover_updates")
+
+
+class LockHandover:
+    """
+    LISTEN/NOTIFY side channel of the singleton lock plus update stash/adopt.
+
+    Args:
+        dsn: Postgres DSN for the dedicated LISTEN connection
+        lock_key: advisory lock key; notifications for other keys are ignored
+        instance_id: this instance (own notifications are ignored)
+        queue_manager: UpdateQueueManager whose pending updates are handed over
+        storage_getter: returns storage with stash/claim_handover_updates
+    """
+
+    def __init__(
+        self,
+        dsn: Optional[str],
+        lock_key: Optional[int],
+        instance_id: str,
+        queue_manager: Any = None,
+        storage_getter: Optional[Callable[[], Any]] = None,
+    ):
+        self.dsn = dsn
+        self.lock_key = lock_key
+        self.instance_id = instance_id
+        self.queue_manager = queue_manager
+        self.storage_getter = storage_getter
+        self._conn = None
+        self._released = asyncio.Event()
+        self.stats: Dict[str, Any] = {
+            "notifications": 0,
+            "stashed": 0,
+            "adopted": 0,
+            "last_release_seen_at": None,
+        }
+
+    @property
+    def listening(self) -> bool:
+        return self._conn is not None and not self._conn.is_closed()
+
+    async def start(self) -> bool:
+        """Open the LISTEN connection. Returns False if handover runs without notifications."""
+        if self.listening:
+            return True
+        if not ASYNCPG_AVAILABLE or not self.dsn or self.lock_key is None:
+            logger.info("[LOCK_HANDOVER] LISTEN disabled (no asyncpg/DATABASE_URL), watcher polls only")
+            return False
+        try:
+            self._conn = await asyncpg.connect(self.dsn, timeout=5)
+            await self._conn.add_listener(LOCK_HANDOVER_CHANNEL, self._on_notify)
+            self._conn.add_termination_listener(self._on_terminated)
+            logger.info(
+                "[LOCK_HANDOVER] Listening on %s | instance=%s", LOCK_HANDOVER_CHANNEL, self.instance_id
+            )
+            return True
+        except Exception as e:
+            logger.warning(f"[LOCK_HANDOVER] ⚠️ LISTEN failed, watcher polls only: {e}")
+            await self._close_conn()
+            return False
+
+    async def close(self) -> None:
+        await self._close_conn()
+
+    async def _close_conn(self) -> None:
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            try:
+                await conn.close()
+            except Exception:
+                pass
+
+    def _on_terminated(self, _conn) -> None:
+        logger.warning("[LOCK_HANDOVER] ⚠️ LISTEN connection lost, watcher polls only")
+        self._conn = None
+
+    def _on_notify(self, _conn, _pid, _channel, payload: str) -> None:
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            return
+        if message.get("lock_key") != self.lock_key or message.get("instance") == self.instance_id:
+            return
+        if message.get("event") == "released":
+            self.stats["notifications"] += 1
+            self.stats["last_release_seen_at"] = time.time()
+            logger.info(
+                "[LOCK_HANDOVER] 📣 Lock released by %s (handed_over=%s)",
+                message.get("instance"),
+                message.get("handed_over"),
+            )
+            self._released.set()
+
+    def reset(self) -> None:
+        """Forget notifications received so far (called before each acquire attempt)."""
+        self._released.clear()
+
+    async def wait_released(self) -> None:
+        """Block until another instance announces it released the lock."""
+        await self._released.wait()
+
+    async def publish_released(self, handed_over: int = 0) -> bool:
+        """Announce the lock release (after release, so listeners can take it at once)."""
+        if self.dsn is None or self.lock_key is None:
+            return False
+        payload = json.dumps({
+            "event": "released",
+            "lock_key": self.lock_key,
+            "instance": self.instance_id,
+            "handed_over": handed_over,
+        })
+        try:
+            if self.listening:
+                await self._conn.execute("SELECT pg_notify($1, $2)", LOCK_HANDOVER_CHANNEL, payload)
+            elif ASYNCPG_AVAILABLE:
+                conn = await asyncpg.connect(self.dsn, timeout=5)
+                try:
+                    await conn.execute("SELECT pg_notify($1, $2)", LOCK_HANDOVER_CHANNEL, payload)
+                finally:
+                    await conn.close()
+            else:
+                return False
+            logger.info("[LOCK_HANDOVER] 📣 Release announced | handed_over=%d", handed_over)
+            return True
+        except Exception as e:
+            logger.warning(f"[LOCK_HANDOVER] ⚠️ pg_notify failed (waiters fall back to polling): {e}")
+            return False
+
+    def _storage(self) -> Any:
+        if self.storage_getter is None:
+            return None
+        storage = self.storage_getter()
+        return storage if supports_handover(storage) else None
+
+    async def stash_pending(self) -> int:
+        """Move not-yet-dispatched updates to update_handover. Returns count stored."""
+        if self.queue_manager is None:
+            return 0
+        storage = self._storage()
+        if storage is None:
+            return 0
+        updates = self.queue_manager.detach_pending()
+        if not updates:
+            return 0
+        try:
+            stored = await storage.stash_handover_updates(self.instance_id, updates)
+        except Exception as e:
+            # Requeue locally: this instance still holds the lock and its workers process them
+            logger.warning(f"[LOCK_HANDOVER] ⚠️ Stash failed, keeping {len(updates)} updates: {e}")
+            self._requeue(updates)
+            return 0
+        self.stats["stashed"] += stored
+        logger.info("[LOCK_HANDOVER] 📦 Stashed %d queued updates for the next ACTIVE instance", stored)
+        return stored
+
+    async def adopt_pending(self) -> int:
+        """Enqueue updates stashed by the previous ACTIVE instance. Returns count enqueued."""
+        if self.queue_manager is None:
+            return 0
+        storage = self._storage()
+        if storage is None:
+            return 0
+        try:
+            updates = await storage.claim_handover_updates(HANDOVER_MAX_AGE_SECONDS)
+        except Exception as e:
+            logger.warning(f"[LOCK_HANDOVER] ⚠️ Claim of handed-over updates failed: {e}")
+            return 0
+        adopted = self._requeue(updates)
+        if adopted:
+            self.stats["adopted"] += adopted
+            logger.info("[LOCK_HANDOVER] ▶️ Adopted %d handed-over updates", adopted)
+        return adopted
+
+    def _requeue(self, updates) -> int:
+        from app.utils.webhook_ingress import BadPayload, parse_raw_update
+
+        enqueued = 0
+        for update_id, raw in updates:
+            try:
+                raw_update = parse_raw_update(raw)
+            except BadPayload:
+                continue
+            if self.queue_manager.enqueue(raw_update, update_id):
+                enqueued += 1
+        return enqueued
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"listening": self.listening, **self.stats}
@@ -0,0 +1,570 @@
+"""
+Active-active scale-out: replicas split chat shards through advisory locks.
+
+With the singleton lock only one replica processed updates; the others idled.
+With SCALEOUT_ENABLED=1 (webhook mode, Postgres) every replica processes updates:
+
+- Chat keys map to SCALEOUT_SHARDS shards (chat_key % num_shards). A replica
+  owns a shard while it holds pg_try_advisory_lock(<class>, shard) on its
+  dedicated session connection. A crashed replica's session ends, so its
+  shards free up without any cleanup.
+- Membership: every rebalance round (SCALEOUT_REBALANCE_SECONDS, and at once
+  on a join/leave notification) a replica refreshes its scaleout_members row
+  (migration 019) and reads the live members. Each shard's preferred owner is
+  chosen by rendezvous hashing over the live members, so a join/leave only
+  moves about 1/N of the shards. A replica releases owned shards that prefer
+  someone else, then locks free shards that prefer it.
+- Ingress: the webhook enqueues updates of owned shards locally. Other updates
+  go to a bounded in-memory buffer and the webhook acks at once; a background
+  forwarder INSERTs the buffer into update_forward in batches with
+  pg_notify(shard). The owner LISTENs, claims its rows (FOR UPDATE SKIP
+  LOCKED) and enqueues them. Updates whose forward fails are never processed
+  by a non-owner: they stay buffered and are retried with backoff (or
+  enqueued locally once their shard is acquired).
+- Shards given away: updates of those chats still queued locally are forwarded
+  to the new owner. A release task then waits for updates already being
+  processed (SCALEOUT_RELEASE_TIMEOUT), flushes FSM states and unlocks, while
+  the rebalance loop keeps heartbeating; a shard being released is not
+  locked again until its release finished.
+
+The singleton lock stays as leader election (migrations, webhook setup); the
+per-update PASSIVE gate is replaced by shard ownership. Duplicate processing
+after a move is caught by the processed_updates dedup claim.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+try:
+    import asyncpg
+    ASYNCPG_AVAILABLE = True
+except ImportError:
+    ASYNCPG_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+SCALEOUT_UPDATES_CHANNEL = "scaleout_updates"   # payload: shard number
+SCALEOUT_MEMBERS_CHANNEL = "scaleout_members"   # payload: instance id that joined/left
+SCALEOUT_MIGRATION = "019_scaleout_shards.sql"  # replicas start leasing once the leader applied it
+
+
+def is_scaleout_enabled() -> bool:
+    return os.getenv("SCALEOUT_ENABLED", "0").strip().lower() in ("1", "true", "yes")
+
+
+def shard_of(chat_key: int, num_shards: int) -> int:
+    """Shard of a chat key (stable across processes, unlike hash() of str)."""
+    return chat_key % num_shards
+
+
+def shard_lock_class(lock_key: int) -> int:
+    """int4 advisory lock class for the shard locks of this bot (objid = shard)."""
+    digest = hashlib.sha256(f"scaleout_shards:{lock_key}".encode()).digest()
+    return int.from_bytes(digest[:4], byteorder="big", signed=True)
+
+
+def _rendezvous_weight(member: str, shard: int) -> int:
+    return int.from_bytes(hashlib.sha256(f"{member}:{shard}".encode()).digest()[:8], "big")
+
+
+def preferred_owners(members: List[str], num_shards: int) -> List[str]:
+    """Preferred owner of every shard (highest rendezvous weight among live members)."""
+    return [max(members, key=lambda member: _rendezvous_weight(member, shard)) for shard in range(num_shards)]
+
+
+class ShardLeaseManager:
+    """
+    Shard ownership, rebalancing and update forwarding of one replica.
+
+    Args:
+        dsn: Postgres DSN for the session connection (shard locks + LISTEN)
+        lock_key: bot singleton lock key (namespaces the shard locks)
+        instance_id: this replica
+        queue_manager: local UpdateQueueManager
+        storage_getter: returns storage with the scale-out methods (migration 019)
+        num_shards: shard count (env SCALEOUT_SHARDS, same on all replicas)
+        rebalance_interval: heartbeat/rebalance period (env SCALEOUT_REBALANCE_SECONDS)
+        member_ttl: a replica without heartbeat for this long is considered gone
+        release_timeout: max wait for in-flight updates of shards given away
+            (env SCALEOUT_RELEASE_TIMEOUT, default: past the 30s dispatch timeout)
+        forward_retries: immediate retries of a failed forward batch before backing off
+        hold_limit: max updates waiting to be forwarded
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        lock_key: int,
+        instance_id: str,
+        queue_manager: Any,
+        storage_getter: Callable[[], Any],
+        *,
+        num_shards: Optional[int] = None,
+        rebalance_interval: Optional[float] = None,
+        member_ttl: Optional[float] = None,
+        forward_batch: int = 200,
+        fsm_storage: Any = None,
+        release_timeout: Optional[float] = None,
+        forward_retries: int = 2,
+        hold_limit: int = 1000,
+    ):
+        self.dsn = dsn
+        self.lock_key = lock_key
+        self.instance_id = instance_id
+        self.queue_manager = queue_manager
+        self.storage_getter = storage_getter
+        self.num_shards = num_shards or int(os.getenv("SCALEOUT_SHARDS", "64"))
+        self.rebalance_interval = rebalance_interval or float(os.getenv("SCALEOUT_REBALANCE_SECONDS", "5"))
+        self.member_ttl = member_ttl or self.rebalance_interval * 4
+        self.forward_batch = forward_batch
+        self.fsm_storage = fsm_storage
+        self.release_timeout = release_timeout or float(os.getenv("SCALEOUT_RELEASE_TIMEOUT", "35"))
+        self.forward_retries = forward_retries
+        self.hold_limit = hold_limit
+        self.lock_class = shard_lock_class(lock_key)
+        self.owned: Set[int] = set()
+        self.members: List[str] = []
+        self._conn = None
+        self._task: Optional[asyncio.Task] = None
+        self._rebalance_now = asyncio.Event()
+        self._pull_now = asyncio.Event()
+        self._running = False
+        # (shard, update_id, raw) not yet in update_forward, in arrival order
+        self._unforwarded: Deque[Tuple[int, int, bytes]] = deque()
+        self._forward_lock = asyncio.Lock()
+        self._forward_now = asyncio.Event()
+        self._forwarder: Optional[asyncio.Task] = None
+        # Shards given away whose release task has not unlocked them yet
+        self._releasing: Set[int] = set()
+        self._release_tasks: Set[asyncio.Task] = set()
+        self.stats: Dict[str, int] = {
+            "local": 0,
+            "forwarded": 0,
+            "forward_failed": 0,
+            "forward_dropped": 0,
+            "release_timeouts": 0,
+            "pulled": 0,
+            "acquired": 0,
+            "released": 0,
+        }
+
+    # ---------------- ingress ----------------
+
+    def owns(self, chat_key: int) -> bool:
+        return shard_of(chat_key, self.num_shards) in self.owned
+
+    async def route(self, raw_update: Any) -> bool:
+        """
+        Decide where a webhook update is processed. Does not wait for the
+        database: foreign updates are handed to the background forwarder.
+
+        Returns:
+            True: enqueue locally (owned shard)
+            False: buffered for the shard owner (another replica owns the
+                shard, so processing it here could race the owner)
+        """
+        shard = shard_of(raw_update.chat_key, self.num_shards)
+        if shard in self.owned:
+            self.stats["local"] += 1
+            return True
+        # Behind any held updates, so a chat's updates reach the owner in order
+        self._hold_unforwarded([(shard, raw_update.update_id, raw_update.raw)])
+        self._wake_forwarder()
+        return False
+
+    def _wake_forwarder(self) -> None:
+        self._forward_now.set()
+        if self._forwarder is None or self._forwarder.done():
+            # route() runs before start() at boot: the forwarder starts with the first foreign update
+            self._forwarder = asyncio.get_running_loop().create_task(self._forward_loop(), name="scaleout_forwarder")
+
+    async def _forward_loop(self) -> None:
+        """Forward the buffer in batches; back off while update_forward is unreachable."""
+        failures = 0
+        while True:
+            await self._forward_now.wait()
+            self._forward_now.clear()
+            failed_before = self.stats["forward_failed"]
+            try:
+                await self._flush_unforwarded(retries=self.forward_retries)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception(f"[SCALEOUT] Forwarder round failed: {e}")
+                self.stats["forward_failed"] += 1
+            if self.stats["forward_failed"] == failed_before:
+                failures = 0
+                continue
+            failures += 1
+            await asyncio.sleep(min(0.1 * 2 ** failures, self.rebalance_interval))
+            self._forward_now.set()
+
+    def _hold_unforwarded(self, rows: List[Tuple[int, int, bytes]]) -> None:
+        for row in rows:
+            if len(self._unforwarded) >= self.hold_limit:
+                self.stats["forward_dropped"] += 1
+                logger.warning(f"[SCALEOUT] ⚠️ Forward buffer full, dropped update_id={row[1]}")
+                continue
+            self._unforwarded.append(row)
+
+    async def _flush_unforwarded(self, retries: int = 0) -> int:
+        """Forward held updates (those of shards acquired meanwhile go to the local queue). Returns count forwarded."""
+        async with self._forward_lock:
+            rows = list(self._unforwarded)
+            if not rows:
+                return 0
+            local = [row for row in rows if row[0] in self.owned]
+            remote = [row for row in rows if row[0] not in self.owned]
+            forwarded: List[Tuple[int, int, bytes]] = []
+            # In order, batch by batch: a failed batch holds itself and everything after it
+            for start in range(0, len(remote), self.forward_batch):
+                batch = remote[start:start + self.forward_batch]
+                if not await self._forward_batch(batch, retries):
+                    break
+                forwarded += batch
+            # Only rows handled above leave the buffer (route() may append while we await)
+            handled = {id(row) for row in local + forwarded}
+            self._unforwarded = deque(row for row in self._unforwarded if id(row) not in handled)
+            if local:
+                self.stats["local"] += self._requeue([(update_id, raw) for _, update_id, raw in local])
+            self.stats["forwarded"] += len(forwarded)
+            return len(forwarded)
+
+    async def _forward_batch(self, batch: List[Tuple[int, int, bytes]], retries: int) -> bool:
+        for attempt in range(retries + 1):
+            try:
+                await self.storage_getter().forward_updates(batch, SCALEOUT_UPDATES_CHANNEL)
+                return True
+            except Exception as e:
+                if attempt < retries:
+                    await asyncio.sleep(0.05 * 2 ** attempt)
+                    continue
+                self.stats["forward_failed"] += 1
+                logger.warning(f"[SCALEOUT] ⚠️ Forward failed, holding {len(self._unforwarded)} updates for retry: {e}")
+        return False
+
+    # ---------------- lifecycle ----------------
+
+    async def start(self) -> None:
+        if self._running:
+            return
+        self._running = True
+        await self._connect()
+        self._task = asyncio.create_task(self._loop(), name="scaleout_rebalance")
+        logger.info(
+            "[SCALEOUT] Started | instance=%s shards=%d interval=%.1fs",
+            self.instance_id, self.num_shards, self.rebalance_interval
+        )
+
+    async def stop(self) -> None:
+        """Leave: forward queued updates of owned shards, release all shards, notify peers."""
+        if not self._running:
+            return
+        self._running = False
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._release_tasks:
+            await asyncio.gather(*self._release_tasks, return_exceptions=True)
+        await self._release(self._give_away(set(self.owned)), notify=False)
+        if self._forwarder is not None:
+            self._forwarder.cancel()
+            try:
+                await self._forwarder
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._forwarder = None
+        try:
+            await self._flush_unforwarded(retries=self.forward_retries)
+        except Exception as e:
+            logger.warning(f"[SCALEOUT] ⚠️ Final forward failed: {e}")
+        if self._unforwarded:
+            logger.error(f"[SCALEOUT] ❌ Leaving with {len(self._unforwarded)} updates not forwarded")
+        try:
+            await self.storage_getter().scaleout_leave(self.instance_id)
+        except Exception as e:
+            logger.debug(f"[SCALEOUT] Leave failed: {e}")
+        await self._notify(SCALEOUT_MEMBERS_CHANNEL, self.instance_id)
+        await self._close_conn()
+        logger.info("[SCALEOUT] Stopped | instance=%s", self.instance_id)
+
+    async def _connect(self) -> bool:
+        if self._conn is not None and not self._conn.is_closed():
+            return True
+        if not ASYNCPG_AVAILABLE:
+            return False
+        try:
+            self._conn = await asyncpg.connect(self.dsn, timeout=5)
+            self._conn.add_termination_listener(self._on_terminated)
+            await self._conn.add_listener(SCALEOUT_UPDATES_CHANNEL, self._on_update_notify)
+            await self._conn.add_listener(SCALEOUT_MEMBERS_CHANNEL, self._on_member_notify)
+            await self._notify(SCALEOUT_MEMBERS_CHANNEL, self.instance_id)
+            return True
+        except Exception as e:
+            logger.warning(f"[SCALEOUT] ⚠️ Session connection failed: {e}")
+            await self._close_conn()
+            return False
+
+    async def _close_conn(self) -> None:
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            try:
+                await conn.close()
+            except Exception:
+                pass
+
+    def _on_terminated(self, _conn) -> None:
+        # Session gone -> every shard lock is gone with it
+        if self.owned:
+            logger.warning("[SCALEOUT] ⚠️ Session lost, dropping %d shards", len(self.owned))
+        self.owned.clear()
+        self._conn = None
+        self._rebalance_now.set()
+
+    def _on_update_notify(self, _conn, _pid, _channel, payload: str) -> None:
+        try:
+            if int(payload) in self.owned:
+                self._pull_now.set()
+        except ValueError:
+            pass
+
+    def _on_member_notify(self, _conn, _pid, _channel, payload: str) -> None:
+        if payload != self.instance_id:
+            self._rebalance_now.set()
+
+    async def _notify(self, channel: str, payload: str) -> None:
+        if self._conn is None:
+            return
+        try:
+            await self._conn.execute("SELECT pg_notify($1, $2)", channel, payload)
+        except Exception as e:
+            logger.debug(f"[SCALEOUT] pg_notify {channel} failed: {e}")
+
+    async def _loop(self) -> None:
+        while self._running:
+            try:
+                if await self._connect():
+                    await self.rebalance()
+                if self._unforwarded:
+                    self._wake_forwarder()
+                await self.pull_forwarded()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception(f"[SCALEOUT] Rebalance round failed: {e}")
+            self._rebalance_now.clear()
+            await self._wait_round()
+
+    async def _wait_round(self) -> None:
+        """Wait for the next round; forwarded updates are pulled as soon as they are announced."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.rebalance_interval
+        while self._running and not self._rebalance_now.is_set():
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            waiters = [
+                asyncio.ensure_future(self._rebalance_now.wait()),
+                asyncio.ensure_future(self._pull_now.wait()),
+            ]
+            try:
+                await asyncio.wait(waiters, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for waiter in waiters:
+                    waiter.cancel()
+            if self._pull_now.is_set():
+                try:
+                    await self.pull_forwarded()
+                except Exception as e:
+                    logger.warning(f"[SCALEOUT] ⚠️ Pull of forwarded updates failed: {e}")
+
+    # ---------------- ownership ----------------
+
+    async def rebalance(self) -> None:
+        """Heartbeat, then release shards preferring another member and lock free shards preferring us."""
+        storage = self.storage_getter()
+        self.members = await storage.scaleout_heartbeat(self.instance_id, sorted(self.owned), self.member_ttl)
+        if self.instance_id not in self.members:
+            self.members = sorted(self.members + [self.instance_id])
+        owners = preferred_owners(self.members, self.num_shards)
+        wanted = {shard for shard, owner in enumerate(owners) if owner == self.instance_id}
+
+        give_away = self.owned - wanted
+        if give_away:
+            # Unlocked in the background: heartbeats and pulls go on while in-flight updates finish
+            task = asyncio.create_task(self._release(self._give_away(give_away)), name="scaleout_release")
+            self._release_tasks.add(task)
+            task.add_done_callback(self._release_tasks.discard)
+
+        acquired: Set[int] = set()
+        for shard in sorted(wanted - self.owned - self._releasing):
+            if await self._try_lock(shard):
+                self.owned.add(shard)
+                acquired.add(shard)
+        if acquired:
+            self.stats["acquired"] += len(acquired)
+            self._pull_now.set()
+            # FSM states of these chats were last written by the previous owner
+            if hasattr(self.fsm_storage, "invalidate"):
+                self.fsm_storage.invalidate(
+                    chat_filter=lambda chat_key: shard_of(chat_key, self.num_shards) in acquired
+                )
+        if give_away or acquired:
+            logger.info(
+                "[SCALEOUT] Rebalanced | members=%d owned=%d/%d (+%d -%d) instance=%s",
+                len(self.members), len(self.owned), len(wanted), len(acquired), len(give_away), self.instance_id
+            )
+
+    async def _try_lock(self, shard: int) -> bool:
+        if self._conn is None:
+            return False
+        try:
+            return bool(await self._conn.fetchval(
+                "SELECT pg_try_advisory_lock($1::int, $2::int)", self.lock_class, shard
+            ))
+        except Exception as e:
+            logger.debug(f"[SCALEOUT] Lock of shard {shard} failed: {e}")
+            return False
+
+    def _give_away(self, shards: Set[int]) -> Set[int]:
+        """
+        Stop owning shards: new updates of their chats are forwarded, and
+        those still queued locally go to the forward buffer ahead of them.
+        """
+        self.owned -= shards
+        self._releasing |= shards
+
+        pending = self.queue_manager.detach_pending(chat_filter=self._shard_filter(shards))
+        if pending:
+            from app.utils.webhook_ingress import parse_raw_update
+
+            # Ahead of newer updates of these chats that route() may be holding
+            self._unforwarded.extendleft(reversed([
+                (shard_of(parse_raw_update(raw).chat_key, self.num_shards), update_id, raw)
+                for update_id, raw in pending
+            ]))
+            self._wake_forwarder()
+        return shards
+
+    def _shard_filter(self, shards: Set[int]) -> Callable[[int], bool]:
+        return lambda chat_key: shard_of(chat_key, self.num_shards) in shards
+
+    async def _release(self, shards: Set[int], notify: bool = True) -> None:
+        """
+        Unlock shards given away (_give_away) once their in-flight updates
+        finished and FSM states are flushed.
+        """
+        if not shards:
+            return
+        try:
+            # The next owner must not start on a chat while we still process one of its updates
+            if not await self.queue_manager.wait_in_flight(self._shard_filter(shards), self.release_timeout):
+                self.stats["release_timeouts"] += 1
+                logger.warning(
+                    f"[SCALEOUT] ⚠️ Updates of released shards still running after {self.release_timeout:.0f}s, "
+                    f"unlocking anyway"
+                )
+            # Next owner must read this replica's latest FSM states
+            if hasattr(self.fsm_storage, "flush"):
+                try:
+                    await self.fsm_storage.flush()
+                except Exception as e:
+                    logger.warning(f"[SCALEOUT] ⚠️ FSM flush on release failed: {e}")
+            if self._conn is not None:
+                for shard in shards:
+                    try:
+                        await self._conn.fetchval(
+                            "SELECT pg_advisory_unlock($1::int, $2::int)", self.lock_class, shard
+                        )
+                    except Exception as e:
+                        logger.debug(f"[SCALEOUT] Unlock of shard {shard} failed: {e}")
+        finally:
+            self._releasing -= shards
+        self.stats["released"] += len(shards)
+        if notify:
+            # New owners retry now instead of on their next round
+            await self._notify(SCALEOUT_MEMBERS_CHANNEL, self.instance_id)
+
+    # ---------------- forwarded updates ----------------
+
+    async def pull_forwarded(self) -> int:
+        """Enqueue updates forwarded to our shards. Returns count enqueued."""
+        self._pull_now.clear()
+        if not self.owned:
+            return 0
+        total = 0
+        while True:
+            rows = await self.storage_getter().claim_forwarded_updates(sorted(self.owned), self.forward_batch)
+            total += self._requeue(rows)
+            if len(rows) < self.forward_batch:
+                break
+        self.stats["pulled"] += total
+        return total
+
+    def _requeue(self, updates) -> int:
+        from app.utils.webhook_ingress import BadPayload, parse_raw_update
+
+        enqueued = 0
+        for update_id, raw in updates:
+            try:
+                raw_update = parse_raw_update(raw)
+            except BadPayload:
+                continue
+            if self.queue_manager.enqueue(raw_update, update_id):
+                enqueued += 1
+        return enqueued
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "instance_id": self.instance_id,
+            "members": list(self.members),
+            "shards_total": self.num_shards,
+            "shards_owned": len(self.owned),
+            "session": self._conn is not None,
+            "unforwarded": len(self._unforwarded),
+            **self.stats,
+        }
+
+
+_manager: Optional[ShardLeaseManager] = None
+
+
+def get_shard_manager() -> Optional[ShardLeaseManager]:
+    return _manager
+
+
+def configure_shard_manager(
+    dsn: str,
+    lock_key: int,
+    instance_id: str,
+    queue_manager: Any,
+    storage_getter: Callable[[], Any],
+    fsm_storage: Any = None,
+) -> ShardLeaseManager:
+    """
+    Create the replica's shard manager (scale-out mode).
+
+    Created at boot so the webhook routes through it from the first update
+    (nothing owned yet -> everything is forwarded); start() begins leasing.
+    """
+    global _manager
+    if _manager is None:
+        _manager = ShardLeaseManager(
+            dsn, lock_key, instance_id, queue_manager, storage_getter, fsm_storage=fsm_storage
+        )
+    return _manager
+
+
+async def stop_shard_manager() -> None:
+    global _manager
+    if _manager is not None:
+        await _manager.stop()
+        _manager = None
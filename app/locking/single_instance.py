@@ -264,9 +264,37 @@ def acquire_single_instance_lock() -> bool:
     return True
 
 
+def try_acquire_single_instance_lock() -> bool:
+    """
+    Одна попытка получить lock, без ожидания LOCK_WAIT_SECONDS.
+
+    Используется lock controller'ом (watcher / handover по pg_notify): повторы
+    делает controller. Если lock уже получен предыдущей попыткой (например,
+    её поток завершился после таймаута вызывающего кода) - возвращает True.
+    """
+    global _lock_handle, _lock_type, _lock_connection, _is_active
+
+    if is_lock_held():
+        _is_active = True
+        return True
+
+    if not os.getenv('DATABASE_URL'):
+        return acquire_single_instance_lock()
+
+    lock_data = _acquire_postgres_lock()
+    if not lock_data:
+        return False
+    _lock_handle = lock_data
+    _lock_connection = lock_data['connection']
+    _lock_type = 'postgres'
+    _is_active = True
+    logger.info("[LOCK] ✅ ACTIVE MODE: PostgreSQL advisory lock acquired (single attempt)")
+    return True
+
+
 def release_single_instance_lock():
     """Освободить single instance lock"""
-    global _lock_handle, _lock_type, _lock_connection
+    global _lock_handle, _lock_type, _lock_connection, _is_active
     
     if _lock_handle is None:
         return
@@ -300,6 +328,7 @@ def release_single_instance_lock():
         _lock_handle = None
         _lock_connection = None
         _lock_type = None
+        _is_active = False
 
 
 def is_lock_held() -> bool:
@@ -522,6 +551,7 @@ def get_lock_debug_info() -> dict:
 __all__ = [
     "SingletonLock",
     "acquire_single_instance_lock",
+    "try_acquire_single_instance_lock",
     "release_single_instance_lock",
     "is_lock_held",
     "is_active_mode",
@@ -10,8 +10,9 @@ NO MAGIC DEFAULTS - пользователь выбирает все enum inputs
 """
 import json
 from pathlib import Path
-from typing import Dict, List, Set, Any, Optional, Tuple
+from typing import Dict, List, Set, Any, Collection, Optional, Tuple
 from dataclasses import dataclass, field
+from functools import cached_property
 from enum import Enum
 
 
@@ -74,6 +75,21 @@ class ModelInputSchema:
         """Поля-файлы"""
         return [f for f in self.all_fields if f.is_file]
     
+    @cached_property
+    def _checks(self) -> Tuple[Tuple[str, ...], Tuple[Tuple[str, bool, Collection[Any], str], ...]]:
+        """Precompiled (required names, enum checks) - built once per schema."""
+        required = tuple(f.name for f in self.required_fields)
+        enums = []
+        for f in self.enum_fields:
+            if not f.enum_values:
+                continue
+            try:
+                allowed = frozenset(f.enum_values)
+            except TypeError:
+                allowed = tuple(f.enum_values)  # unhashable enum members: linear scan
+            enums.append((f.name, f.name in required, allowed, ', '.join(map(str, f.enum_values))))
+        return required, tuple(enums)
+    
     def validate(self, inputs: Dict[str, Any]) -> Tuple[bool, List[str]]:
         """
         Валидация inputs против схемы
@@ -82,34 +98,32 @@ class ModelInputSchema:
             (is_valid, errors)
         """
         errors = []
+        required, enums = self._checks
         
         # Проверка required полей
-        for field in self.required_fields:
-            if field.name not in inputs:
-                errors.append(f"Missing required field: {field.name}")
-            elif inputs[field.name] is None:
-                errors.append(f"Required field cannot be None: {field.name}")
+        for name in required:
+            if name not in inputs:
+                errors.append(f"Missing required field: {name}")
+            elif inputs[name] is None:
+                errors.append(f"Required field cannot be None: {name}")
         
         # Проверка enum значений
-        for field in self.enum_fields:
-            value = inputs.get(field.name)
-            
-            # Skip validation for None/null/"none" on OPTIONAL fields
-            if value is None or (isinstance(value, str) and value.lower() in ["none", "null"]):
-                # Only skip if field is optional
-                if field not in self.required_fields:
-                    continue
-            
-            if value is not None and field.enum_values:
-                # Allow "none" for optional enum fields as fallback
-                if not field.required and isinstance(value, str) and value.lower() == "none":
-                    continue
-                
-                if value not in field.enum_values:
-                    errors.append(
-                        f"Invalid value for {field.name}: {value}. "
-                        f"Must be one of: {', '.join(map(str, field.enum_values))}"
-                    )
+        for name, is_required, allowed, allowed_str in enums:
+            value = inputs.get(name)
+            if value is None:
+                continue
+            # Skip "none"/"null" on OPTIONAL fields
+            if not is_required and isinstance(value, str) and value.lower() in ("none", "null"):
+                continue
+            try:
+                ok = value in allowed
+            except TypeError:
+                ok = False
+            if not ok:
+                errors.append(
+                    f"Invalid value for {name}: {value}. "
+                    f"Must be one of: {allowed_str}"
+                )
         
         return len(errors) == 0, errors
 
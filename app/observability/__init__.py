@@ -4,6 +4,8 @@ Observability module for structured event logging and diagnostics.
 
 from app.observability.events_db import (
     init_events_db,
+    shutdown_events_db,
+    get_event_buffer,
     log_event,
     log_update_received,
     log_callback_received,
@@ -18,6 +20,8 @@ from app.observability.events_db import (
 
 __all__ = [
     "init_events_db",
+    "shutdown_events_db",
+    "get_event_buffer",
     "log_event",
     "log_update_received",
     "log_callback_received",
@@ -2,19 +2,183 @@
 Database-driven event logging for observability.
 
 Best-effort, async, non-blocking: errors are swallowed to prevent breaking user flows.
+
+log_event() only appends the row to a bounded in-memory ring; a background
+flusher writes buffered rows to app_events in batches (COPY, one round trip
+per batch) every EVENTS_FLUSH_INTERVAL_MS or as soon as EVENTS_BATCH_SIZE rows
+are pending. When the ring is full the oldest row is dropped and counted.
+shutdown_events_db() flushes what is left.
 """
 
+import asyncio
 import logging
 import json
+import os
 import traceback
-from typing import Optional, Dict, Any
-from datetime import datetime
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional, Dict, Any, List, Tuple
+from datetime import datetime, timezone
 
 logger = logging.getLogger(__name__)
 
 # Global pool reference (set by init)
 _db_pool = None
 
+APP_EVENTS_COLUMNS = (
+    "ts", "level", "event", "cid", "user_id", "chat_id", "update_id",
+    "task_id", "model", "payload_json", "err_stack", "tags",
+)
+
+_INSERT_ONE = """
+    INSERT INTO app_events (
+        ts, level, event, cid, user_id, chat_id, update_id,
+        task_id, model, payload_json, err_stack, tags
+    ) VALUES (
+        $1, $2, $3, $4, $5, $6, $7, $8, $9, $10::jsonb, $11, $12::jsonb
+    )
+"""
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        logger.warning(f"[OBSERVABILITY] Invalid {name}, using {default}")
+        return default
+
+
+@dataclass
+class EventBufferStats:
+    """Counters for /diagnostics and tests."""
+    enqueued: int = 0
+    written: int = 0
+    dropped: int = 0
+    failed: int = 0
+    batches: int = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return dict(self.__dict__)
+
+
+class EventBuffer:
+    """Bounded ring of app_events rows + batch flusher."""
+
+    def __init__(
+        self,
+        capacity: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        flush_interval_ms: Optional[int] = None,
+    ) -> None:
+        self.capacity = capacity or _env_int("EVENTS_BUFFER_CAPACITY", 10000)
+        self.batch_size = batch_size or _env_int("EVENTS_BATCH_SIZE", 200)
+        self.flush_interval = (flush_interval_ms or _env_int("EVENTS_FLUSH_INTERVAL_MS", 500)) / 1000
+        self.stats = EventBufferStats()
+        self._rows: "deque[Tuple[Any, ...]]" = deque(maxlen=self.capacity)
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._rows)
+
+    def put(self, row: Tuple[Any, ...]) -> None:
+        if len(self._rows) >= self.capacity:
+            # deque(maxlen) evicts the oldest row
+            self.stats.dropped += 1
+        self._rows.append(row)
+        self.stats.enqueued += 1
+        self._ensure_flusher()
+        if len(self._rows) >= self.batch_size:
+            self._wakeup.set()
+
+    def _ensure_flusher(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # New event loop (tests / restart): drop state bound to the old loop
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            self._flusher = None
+        if self._flusher is None or self._flusher.done():
+            self._flusher = loop.create_task(self._run(), name="app-events-flusher")
+
+    async def _run(self) -> None:
+        while True:
+            # asyncio.wait (not wait_for): never swallows cancellation on shutdown
+            waiter = asyncio.ensure_future(self._wakeup.wait())
+            try:
+                await asyncio.wait({waiter}, timeout=self.flush_interval)
+            finally:
+                waiter.cancel()
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> int:
+        """Write all buffered rows; returns number of rows written."""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        written = 0
+        async with self._flush_lock:
+            while self._rows:
+                pool = _db_pool
+                if pool is None:
+                    return written
+                batch = [self._rows.popleft() for _ in range(min(self.batch_size, len(self._rows)))]
+                written += await self._write_batch(pool, batch)
+        return written
+
+    async def _write_batch(self, pool, batch: List[Tuple[Any, ...]]) -> int:
+        try:
+            async with pool.acquire() as conn:
+                try:
+                    await conn.copy_records_to_table(
+                        "app_events", records=batch, columns=APP_EVENTS_COLUMNS
+                    )
+                    written = len(batch)
+                except Exception as e:
+                    # One bad row (e.g. task_id FK) fails the whole COPY: fall back to per-row
+                    logger.debug(f"[OBSERVABILITY] COPY failed, falling back to INSERT: {e}")
+                    written = 0
+                    for row in batch:
+                        try:
+                            await conn.execute(_INSERT_ONE, *row)
+                            written += 1
+                        except Exception:
+                            self.stats.failed += 1
+        except Exception as e:
+            # Swallow errors to prevent breaking user flows
+            self.stats.failed += len(batch)
+            logger.warning(f"[OBSERVABILITY] Failed to flush {len(batch)} events: {e}", exc_info=False)
+            return 0
+        self.stats.batches += 1
+        self.stats.written += written
+        return written
+
+    async def close(self) -> None:
+        """Stop the flusher and write what is left."""
+        if self._flusher is not None and not self._flusher.done():
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._flusher = None
+        await self.flush()
+
+
+_buffer: Optional[EventBuffer] = None
+
+
+def get_event_buffer() -> EventBuffer:
+    """Get process-wide app_events buffer."""
+    global _buffer
+    if _buffer is None:
+        _buffer = EventBuffer()
+    return _buffer
+
 
 def init_events_db(pool):
     """Initialize events DB with connection pool."""
@@ -23,6 +187,16 @@ def init_events_db(pool):
     logger.info("[OBSERVABILITY] ✅ Events DB initialized")
 
 
+async def shutdown_events_db() -> None:
+    """Flush buffered events (call before the pool is closed)."""
+    if _buffer is None:
+        return
+    pending = _buffer.pending
+    await _buffer.close()
+    if pending:
+        logger.info(f"[OBSERVABILITY] Flushed {pending} buffered events on shutdown")
+
+
 async def log_event(
     level: str,
     event: str,
@@ -39,6 +213,8 @@ async def log_event(
     """
     Log event to app_events table (best-effort, non-blocking).
     
+    The row is buffered and written by the background flusher.
+    
     Args:
         level: 'DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'
         event: Event name (e.g., 'UPDATE_RECEIVED', 'DISPATCH_OK', 'KIE_JOB_CREATED')
@@ -53,7 +229,7 @@ async def log_event(
         tags: Additional tags for filtering
     
     Returns:
-        True if logged successfully, False otherwise (errors are swallowed)
+        True if the event was buffered, False otherwise (errors are swallowed)
     """
     if _db_pool is None:
         # Not initialized yet, skip silently
@@ -67,28 +243,20 @@ async def log_event(
         payload_json = json.dumps(payload) if payload else "{}"
         tags_json = json.dumps(tags) if tags else "{}"
         
-        async with _db_pool.acquire() as conn:
-            await conn.execute(
-                """
-                INSERT INTO app_events (
-                    ts, level, event, cid, user_id, chat_id, update_id,
-                    task_id, model, payload_json, err_stack, tags
-                ) VALUES (
-                    NOW(), $1, $2, $3, $4, $5, $6, $7, $8, $9::jsonb, $10, $11::jsonb
-                )
-                """,
-                level,
-                event,
-                cid,
-                user_id,
-                chat_id,
-                update_id,
-                task_id,
-                model,
-                payload_json,
-                err_stack,
-                tags_json,
-            )
+        get_event_buffer().put((
+            datetime.now(timezone.utc),
+            level,
+            event,
+            cid,
+            user_id,
+            chat_id,
+            update_id,
+            task_id,
+            model,
+            payload_json,
+            err_stack,
+            tags_json,
+        ))
         return True
     
     except Exception as e:
@@ -5,6 +5,7 @@ Handles FREE tier models (no charge).
 Includes user rate limiting to prevent spam/abuse.
 """
 import logging
+import os
 import time
 from typing import Dict, Any, Optional
 from uuid import uuid4
@@ -57,10 +58,12 @@ async def generate_with_payment(
     logger.info(f"{correlation_tag()} [PAYMENT]   - user_inputs keys: {list(user_inputs.keys())}")
     logger.info(f"{correlation_tag()} [PAYMENT]   - amount: {amount}")
     
-    # ✅ ITERATION 8: Check user rate limit BEFORE any payment/generation
+    # ✅ ITERATION 8: Admit against the user rate limit BEFORE any payment/generation
+    # (check + record in one atomic step: concurrent requests can't all pass).
+    # A failed generation gives its admission back, so errors don't use up the quota.
     is_free = is_free_model(model_id)
     rate_limiter = get_rate_limiter()
-    rate_check = rate_limiter.check_rate_limit(user_id, is_paid=not is_free)
+    rate_check = await rate_limiter.acquire(user_id, is_paid=not is_free)
     
     if not rate_check["allowed"]:
         logger.warning(
@@ -75,6 +78,33 @@ async def generate_with_payment(
             'rate_limit_info': rate_check
         }
     
+    try:
+        result = await _generate_admitted(
+            model_id, user_inputs, user_id, amount, progress_callback, timeout,
+            task_id, reserve_balance, charge_manager, chat_id, is_free
+        )
+    except Exception:
+        await rate_limiter.release(user_id, rate_check["admitted_at"], is_paid=not is_free)
+        raise
+    if not result.get('success'):
+        await rate_limiter.release(user_id, rate_check["admitted_at"], is_paid=not is_free)
+    return result
+
+
+async def _generate_admitted(
+    model_id: str,
+    user_inputs: Dict[str, Any],
+    user_id: int,
+    amount: float,
+    progress_callback: Optional[Any],
+    timeout: int,
+    task_id: Optional[str],
+    reserve_balance: bool,
+    charge_manager: Optional[ChargeManager],
+    chat_id: Optional[int],
+    is_free: bool
+) -> Dict[str, Any]:
+    """Body of generate_with_payment() once the rate limit admitted the generation."""
     # Check DRY_RUN mode
     dry_run = os.getenv("DRY_RUN", "0").lower() in ("true", "1", "yes")
     if dry_run:
@@ -187,17 +217,10 @@ async def generate_with_payment(
     # Determine task_id from generation (if available)
     # Commit or release charge based on generation result
     if gen_result.get('success'):
-        # SUCCESS: Commit charge + record generation for rate limit
+        # SUCCESS: Commit charge (the rate limit was recorded by acquire())
         logger.info(f"{correlation_tag()} Committing charge for {charge_task_id}")
         commit_result = await charge_manager.commit_charge(charge_task_id)
         
-        # ✅ ITERATION 8: Record successful generation for rate limiting
-        rate_limiter.record_generation(user_id, is_paid=not is_free)
-        logger.info(
-            f"{correlation_tag()} [RATE_LIMIT] ✅ Generation recorded: user={user_id}, "
-            f"paid={not is_free}, stats={rate_limiter.get_user_stats(user_id)}"
-        )
-        
         # Add to history
         result_urls = gen_result.get('result_urls', [])
         result_text = '\n'.join(result_urls) if result_urls else 'Success'
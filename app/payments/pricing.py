@@ -21,7 +21,9 @@ Pricing calculator: USER_PRICE_RUB = (PRICE_USD × 79) × 2
   - Наценка применяется только в calculate_user_price()
 """
 import logging
-from typing import Dict, Any, Optional
+from typing import Callable, Dict, Any, Optional
+
+from app.pricing.snapshot import get_price_snapshot
 
 logger = logging.getLogger(__name__)
 
@@ -67,6 +69,29 @@ def calculate_kie_cost(
     Returns:
         Cost in RUB (float)
     """
+    if not kie_response and not user_inputs:
+        # Menu render: base cost is precomputed in the price snapshot
+        cost_rub = _snapshot_kie_cost(model)
+        if cost_rub is not None:
+            return cost_rub
+    return _calculate_kie_cost(model, user_inputs, kie_response)
+
+
+def _snapshot_kie_cost(model: Dict[str, Any]) -> Optional[float]:
+    try:
+        return get_price_snapshot().kie_cost_rub_for(model)
+    except Exception as e:
+        logger.debug(f"Price snapshot unavailable, computing cost directly: {e}")
+        return None
+
+
+def _calculate_kie_cost(
+    model: Dict[str, Any],
+    user_inputs: Dict[str, Any],
+    kie_response: Optional[Dict[str, Any]] = None,
+    log: Callable[[str], None] = logger.info
+) -> float:
+    """calculate_kie_cost without the snapshot (used to build it). log: sink for per-call info lines."""
     model_id = model.get("model_id", "unknown")
     
     # Priority 1: Use Kie.ai response cost if available (assumed in RUB)
@@ -74,7 +99,7 @@ def calculate_kie_cost(
         for key in ["cost", "price", "usage_cost", "credits_used"]:
             if key in kie_response:
                 cost_rub = float(kie_response[key])
-                logger.info(f"Using Kie.ai response cost for {model_id}: {cost_rub} RUB")
+                log(f"Using Kie.ai response cost for {model_id}: {cost_rub} RUB")
                 return cost_rub
     
     # Priority 2: SOURCE_OF_TRUTH format (direct RUB price)
@@ -93,7 +118,7 @@ def calculate_kie_cost(
                     credits = resolution_map.get(str(resolution), resolution_map.get("1K", 18))
                     # Convert credits to RUB: 1 credit = $0.005 USD = 0.005 * 78 RUB = 0.39 RUB
                     cost_rub = credits * 0.005 * USD_TO_RUB
-                    logger.info(f"Using pricing_rules (by_resolution) for {model_id}: resolution={resolution} → {credits} credits → {cost_rub} RUB")
+                    log(f"Using pricing_rules (by_resolution) for {model_id}: resolution={resolution} → {credits} credits → {cost_rub} RUB")
                     return cost_rub
             
             # Duration-based pricing (future: for video models)
@@ -104,7 +129,7 @@ def calculate_kie_cost(
                     # Find matching duration tier
                     credits = duration_map.get(str(duration), duration_map.get("default", 10))
                     cost_rub = credits * 0.005 * USD_TO_RUB
-                    logger.info(f"Using pricing_rules (by_duration) for {model_id}: duration={duration} → {credits} credits → {cost_rub} RUB")
+                    log(f"Using pricing_rules (by_duration) for {model_id}: duration={duration} → {credits} credits → {cost_rub} RUB")
                     return cost_rub
         
         # Fallback to flat pricing
@@ -115,9 +140,9 @@ def calculate_kie_cost(
                 # Allow 0 for FREE models
                 if cost_rub >= 0:
                     if cost_rub == 0:
-                        logger.info(f"Using SOURCE_OF_TRUTH price for {model_id}: FREE (0 RUB)")
+                        log(f"Using SOURCE_OF_TRUTH price for {model_id}: FREE (0 RUB)")
                     else:
-                        logger.info(f"Using SOURCE_OF_TRUTH price for {model_id}: {cost_rub} RUB")
+                        log(f"Using SOURCE_OF_TRUTH price for {model_id}: {cost_rub} RUB")
                     return cost_rub
             except (TypeError, ValueError):
                 logger.warning(f"Invalid SOURCE_OF_TRUTH price for {model_id}: {rub_price}")
@@ -129,7 +154,7 @@ def calculate_kie_cost(
             price_usd = float(registry_price_usd)
             if price_usd > 0:
                 cost_rub = price_usd * USD_TO_RUB
-                logger.info(f"Using old registry price for {model_id}: ${price_usd} → {cost_rub} RUB")
+                log(f"Using old registry price for {model_id}: ${price_usd} → {cost_rub} RUB")
                 return cost_rub
         except (TypeError, ValueError):
             logger.warning(f"Invalid registry price for {model_id}: {registry_price_usd}")
@@ -139,7 +164,7 @@ def calculate_kie_cost(
     if model_id in FALLBACK_PRICES_USD:
         price_usd = FALLBACK_PRICES_USD[model_id]
         cost_rub = price_usd * USD_TO_RUB
-        logger.info(f"Using fallback price for {model_id}: ${price_usd} → {cost_rub} RUB")
+        log(f"Using fallback price for {model_id}: ${price_usd} → {cost_rub} RUB")
         return cost_rub
     
     # Priority 5: Default (in USD → convert to RUB)
@@ -27,29 +27,15 @@ def get_free_models() -> List[str]:
     Returns:
         List of model_ids (tech IDs)
     """
-    if not SOURCE_OF_TRUTH.exists():
+    # In-memory catalog index (reloaded on file change), no JSON parse per call
+    from app.kie.catalog import get_catalog
+    
+    catalog = get_catalog()
+    if not catalog.raw:
         logger.error(f"Source of truth not found: {SOURCE_OF_TRUTH}")
         return []
     
-    try:
-        with open(SOURCE_OF_TRUTH, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        models_dict = data.get("models", {})
-        
-        # Фильтруем модели с is_free=True
-        free_model_ids = [
-            model_id
-            for model_id, model in models_dict.items()
-            if model.get('pricing', {}).get('is_free', False)
-        ]
-        
-        logger.info(f"Loaded {len(free_model_ids)} free models from {SOURCE_OF_TRUTH}")
-        return free_model_ids
-        
-    except Exception as e:
-        logger.error(f"Failed to load free models: {e}")
-        return []
+    return [model["model_id"] for model in catalog.free_models if model.get("model_id")]
 
 
 def is_free_model(model_id: str) -> bool:
@@ -8,12 +8,16 @@ RULES:
 2. Primary source: external API (e.g., exchangerate-api.com, cbr.ru)
 3. Fallback: ENV variable FX_RUB_PER_USD
 4. Default fallback: 78.0 (conservative estimate)
+5. Inside a running event loop the rate is NEVER fetched synchronously:
+   get_usd_to_rub_rate() serves the (possibly stale) cache and the refresh is
+   done by the background task in app.pricing.snapshot
+   (fetch_usd_to_rub_rate_async)
 """
+import asyncio
 import logging
 import os
 import time
-from datetime import datetime, timedelta
-from typing import Optional
+from typing import Any, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +26,18 @@ _cached_rate: Optional[float] = None
 _cache_timestamp: Optional[float] = None
 _cache_duration = 12 * 3600  # 12 hours in seconds
 
+# CBR daily rates (free, official)
+CBR_URL = "https://www.cbr-xml-daily.ru/latest.js"
+FETCH_TIMEOUT = 5.0
+
+
+def _in_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
 
 def get_usd_to_rub_rate(force_refresh: bool = False) -> float:
     """
@@ -42,13 +58,18 @@ def get_usd_to_rub_rate(force_refresh: bool = False) -> float:
             logger.debug(f"Using cached FX rate: {_cached_rate} (age: {age/3600:.1f}h)")
             return _cached_rate
     
+    if _in_event_loop():
+        # Sync HTTP here would block every handler on this loop: serve what we
+        # have, the background refresher (app.pricing.snapshot) updates the cache
+        rate, source = get_cached_rate()
+        logger.debug(f"FX rate is stale inside event loop, serving {source} rate: {rate}")
+        return rate
+    
     # Try to fetch fresh rate
     fresh_rate = _fetch_fresh_rate()
     
     if fresh_rate:
-        _cached_rate = fresh_rate
-        _cache_timestamp = time.time()
-        logger.info(f"Updated FX rate: {fresh_rate} RUB/USD")
+        store_rate(fresh_rate)
         return fresh_rate
     
     # Fallback to cached rate if available
@@ -62,6 +83,83 @@ def get_usd_to_rub_rate(force_refresh: bool = False) -> float:
     return fallback
 
 
+def get_cached_rate() -> Tuple[float, str]:
+    """
+    Get the current rate without any network I/O.
+    
+    Returns:
+        (rate, source): source is "cbr" (fresh), "stale" or "fallback"
+    """
+    global _cached_rate
+    if _cached_rate and _cache_timestamp:
+        age = time.time() - _cache_timestamp
+        return _cached_rate, "cbr" if age < _cache_duration else "stale"
+    if _cached_rate:
+        return _cached_rate, "fallback"
+    # Remember the fallback (without timestamp, so it still counts as stale)
+    _cached_rate = _get_fallback_rate()
+    return _cached_rate, "fallback"
+
+
+def store_rate(rate: float) -> None:
+    """Put a freshly fetched rate into the cache."""
+    global _cached_rate, _cache_timestamp
+    _cached_rate = float(rate)
+    _cache_timestamp = time.time()
+    logger.info(f"Updated FX rate: {rate} RUB/USD")
+
+
+def _parse_cbr_rate(data: Any) -> Optional[float]:
+    """
+    Extract RUB per USD from cbr-xml-daily latest.js payload.
+    
+    CBR returns rates as "1 RUB = X CURRENCY"; a value below 1 is inverted.
+    """
+    if not isinstance(data, dict):
+        return None
+    rate = data.get("rates", {}).get("USD")
+    if rate and isinstance(rate, (int, float)):
+        if rate < 1:
+            # Invert: 1 / rate gives us USD/RUB
+            rate = 1.0 / rate
+        return float(rate)
+    return None
+
+
+async def fetch_usd_to_rub_rate_async() -> Optional[float]:
+    """
+    Fetch fresh CBR rate without blocking the event loop.
+    
+    Returns:
+        Exchange rate or None if the request failed
+    """
+    try:
+        import aiohttp
+    except ImportError:
+        logger.warning("aiohttp not installed, cannot fetch FX rate from API")
+        return None
+    
+    try:
+        timeout = aiohttp.ClientTimeout(total=FETCH_TIMEOUT)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            async with session.get(CBR_URL) as response:
+                if response.status != 200:
+                    logger.warning(f"CBR rate request failed: HTTP {response.status}")
+                    return None
+                # latest.js is served as application/javascript
+                data = await response.json(content_type=None)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.warning(f"Failed to fetch CBR rate: {e}")
+        return None
+    
+    rate = _parse_cbr_rate(data)
+    if rate:
+        logger.info(f"Fetched CBR rate: {rate} RUB/USD")
+    return rate
+
+
 def _fetch_fresh_rate() -> Optional[float]:
     """
     Fetch fresh exchange rate from external API.
@@ -77,27 +175,14 @@ def _fetch_fresh_rate() -> Optional[float]:
     try:
         import httpx
         
-        # CBR daily rates (free, official)
-        url = "https://www.cbr-xml-daily.ru/latest.js"
-        
-        with httpx.Client(timeout=5.0) as client:
-            response = client.get(url)
+        with httpx.Client(timeout=FETCH_TIMEOUT) as client:
+            response = client.get(CBR_URL)
             
             if response.status_code == 200:
-                data = response.json()
-                
-                # CBR returns rates as "1 CURRENCY = X RUB"
-                # For USD, we need to invert: if response shows USD rate,
-                # it's actually RUB per USD
-                rate = data.get("rates", {}).get("USD")
-                
-                # If rate is less than 1, it's inverted (RUB/USD instead of USD/RUB)
-                if rate and isinstance(rate, (int, float)):
-                    if rate < 1:
-                        # Invert: 1 / rate gives us USD/RUB
-                        rate = 1.0 / rate
+                rate = _parse_cbr_rate(response.json())
+                if rate:
                     logger.info(f"Fetched CBR rate: {rate} RUB/USD")
-                    return float(rate)
+                    return rate
     
     except ImportError:
         logger.warning("httpx not installed, cannot fetch FX rate from API")
@@ -166,11 +251,3 @@ def credits_to_rub(
     """
     usd_amount = credits * credits_to_usd_rate
     return usd_to_rub(usd_amount, markup)
-
-
-# Initialize on import
-try:
-    _initial_rate = get_usd_to_rub_rate()
-    logger.info(f"FX module initialized: {_initial_rate} RUB/USD")
-except Exception as e:
-    logger.error(f"FX initialization failed: {e}")
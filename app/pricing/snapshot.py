@@ -0,0 +1,384 @@
+"""
+Pricing snapshot: precomputed RUB price tables + background FX refresh.
+
+Menu rendering used to price every model on every call: calc_model_price_rub
+re-parsed pricing/config.yaml, calculate_kie_cost re-walked the
+SOURCE_OF_TRUTH pricing rules, and app.pricing.fx fetched the CBR rate with a
+synchronous HTTP client right inside the handler that found the cache expired.
+
+Now all of that is computed once into an immutable PriceSnapshot:
+
+- engine table: every (model, axis values) cell of pricing/config.yaml,
+  admin and user price (per_second models are one multiplication at read time)
+- kie table: base Kie.ai cost in RUB of every catalog model (no user inputs),
+  i.e. what calculate_kie_cost(model, {}, None) returns
+- the current USD/RUB rate and where it came from
+
+Readers get the current snapshot via get_price_snapshot() and do dict lookups.
+A background task (PricingSnapshotService.start) refreshes the FX rate with
+aiohttp and polls the config mtime; whenever the rate, config.yaml or the
+SOURCE_OF_TRUTH catalog changes, a new snapshot with version + 1 is built and
+swapped in atomically, so a reader never sees a half-built table.
+
+ENV:
+    PRICING_FX_REFRESH_SECONDS    - FX refresh period (default: 43200 = 12h)
+    PRICING_CONFIG_CHECK_SECONDS  - config.yaml mtime poll period (default: 30)
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from app.kie.catalog import get_catalog
+
+logger = logging.getLogger(__name__)
+
+# (admin price, user price) in RUB
+_PricePair = Tuple[float, float]
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    if not value:
+        return default
+    try:
+        parsed = float(value)
+        if parsed > 0:
+            return parsed
+    except ValueError:
+        pass
+    logger.warning(f"[PRICING] Invalid {name}={value!r}, using {default}")
+    return default
+
+
+@dataclass(frozen=True)
+class PriceSnapshot:
+    """Immutable precomputed prices; replaced as a whole, never mutated."""
+
+    version: int
+    fx_rate: float
+    fx_source: str
+    config_path: Optional[str]
+    config_mtime: Optional[float]
+    catalog_version: str
+    built_at: float
+    engine_config: Mapping[str, Any]
+    # model_id -> axis names used as the lookup key (() for fixed prices)
+    engine_axes: Mapping[str, Tuple[str, ...]]
+    # model_id -> {axis values: (admin, user)}
+    engine_prices: Mapping[str, Mapping[Tuple[str, ...], _PricePair]]
+    # catalog.by_id this table was built from (identity check on read)
+    kie_models: Mapping[str, Dict[str, Any]]
+    kie_cost_rub: Mapping[str, float]
+
+    def engine_price_rub(self, model_id: str, params: Dict[str, Any], is_admin: bool = False) -> float:
+        """
+        Same contract as pricing.engine.calc_model_price_rub.
+
+        Raises:
+            ValueError: model/params not priced (message from the engine)
+        """
+        axes = self.engine_axes.get(model_id)
+        if axes is not None:
+            key = tuple(str(params.get(axis, "")) for axis in axes)
+            pair = self.engine_prices[model_id].get(key)
+            if pair is not None:
+                return pair[0] if is_admin else pair[1]
+        # per_second models and invalid params: compute (and raise) from the parsed config
+        from pricing.engine import compute_model_price_rub
+        return compute_model_price_rub(self.engine_config, model_id, params, is_admin)
+
+    def kie_cost_rub_for(self, model: Dict[str, Any]) -> Optional[float]:
+        """Base Kie.ai cost of a catalog model; None if the dict is not from this catalog."""
+        model_id = model.get("model_id")
+        if model_id is None or self.kie_models.get(model_id) is not model:
+            return None
+        return self.kie_cost_rub.get(model_id)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "fx_rate": self.fx_rate,
+            "fx_source": self.fx_source,
+            "config_path": self.config_path,
+            "config_mtime": self.config_mtime,
+            "catalog_version": self.catalog_version,
+            "engine_models": len(self.engine_axes),
+            "kie_models": len(self.kie_cost_rub),
+            "age_seconds": round(time.time() - self.built_at, 1),
+        }
+
+
+def _build_engine_table(
+    config: Mapping[str, Any]
+) -> Tuple[Dict[str, Tuple[str, ...]], Dict[str, Mapping[Tuple[str, ...], _PricePair]]]:
+    from pricing.engine import compute_model_price_rub
+
+    axes_by_model: Dict[str, Tuple[str, ...]] = {}
+    prices: Dict[str, Mapping[Tuple[str, ...], _PricePair]] = {}
+    for model_id, model_cfg in (config.get("models") or {}).items():
+        if not isinstance(model_cfg, dict):
+            continue
+        mtype = model_cfg.get("type", "fixed")
+        if mtype == "matrix":
+            axes = tuple(model_cfg.get("axes") or ())[:2]
+            table = model_cfg.get("table") or {}
+            cells = [
+                (str(key1), str(key2))
+                for key1, row in table.items() if isinstance(row, dict)
+                for key2 in row
+            ]
+        elif mtype == "fixed":
+            axes = ()
+            cells = [()]
+        else:
+            # per_second: depends on an open-ended duration, computed on read
+            continue
+
+        table_prices: Dict[Tuple[str, ...], _PricePair] = {}
+        for cell in cells:
+            params = dict(zip(axes, cell))
+            try:
+                table_prices[cell] = (
+                    compute_model_price_rub(config, model_id, params, is_admin=True),
+                    compute_model_price_rub(config, model_id, params, is_admin=False),
+                )
+            except (TypeError, ValueError) as e:
+                # Left out of the table: a read recomputes and raises the engine error
+                logger.warning(f"[PRICING] Cannot precompute {model_id} {params}: {e}")
+        axes_by_model[model_id] = axes
+        prices[model_id] = MappingProxyType(table_prices)
+    return axes_by_model, prices
+
+
+def _build_kie_table(by_id: Mapping[str, Dict[str, Any]]) -> Dict[str, float]:
+    from app.payments.pricing import _calculate_kie_cost
+
+    costs: Dict[str, float] = {}
+    for model_id, model in by_id.items():
+        try:
+            costs[model_id] = _calculate_kie_cost(model, {}, None, log=logger.debug)
+        except Exception as e:
+            logger.warning(f"[PRICING] Cannot precompute Kie cost for {model_id}: {e}")
+    return costs
+
+
+def build_price_snapshot(
+    version: int,
+    fx_rate: float,
+    fx_source: str,
+    config_path: Optional[Path] = None,
+    previous: Optional[PriceSnapshot] = None,
+) -> PriceSnapshot:
+    """
+    Build a new snapshot. Tables whose inputs did not change are reused from previous.
+
+    Args:
+        config_path: pricing config (default: pricing/config.yaml, see engine.resolve_config_path)
+    """
+    from pricing.engine import load_config, resolve_config_path
+
+    path = config_path if config_path is not None else resolve_config_path()
+    try:
+        config_mtime: Optional[float] = os.stat(path).st_mtime if path is not None else None
+    except OSError:
+        config_mtime = None
+
+    if (
+        previous is not None
+        and previous.config_path == (str(path) if path is not None else None)
+        and previous.config_mtime == config_mtime
+    ):
+        engine_config = previous.engine_config
+        engine_axes, engine_prices = previous.engine_axes, previous.engine_prices
+    else:
+        engine_config = load_config(path) if path is not None else {"models": {}, "settings": {}}
+        axes, prices = _build_engine_table(engine_config)
+        engine_axes, engine_prices = MappingProxyType(axes), MappingProxyType(prices)
+
+    catalog = get_catalog()
+    if previous is not None and previous.kie_models is catalog.by_id:
+        kie_cost = previous.kie_cost_rub
+    else:
+        kie_cost = MappingProxyType(_build_kie_table(catalog.by_id))
+
+    return PriceSnapshot(
+        version=version,
+        fx_rate=fx_rate,
+        fx_source=fx_source,
+        config_path=str(path) if path is not None else None,
+        config_mtime=config_mtime,
+        catalog_version=catalog.version,
+        built_at=time.time(),
+        engine_config=engine_config,
+        engine_axes=engine_axes,
+        engine_prices=engine_prices,
+        kie_models=catalog.by_id,
+        kie_cost_rub=kie_cost,
+    )
+
+
+@dataclass
+class PricingStats:
+    """Counters for /diagnostics and tests."""
+    rebuilds: int = 0
+    fx_refreshes: int = 0
+    fx_failures: int = 0
+    last_fx_refresh: Optional[float] = field(default=None)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return dict(self.__dict__)
+
+
+class PricingSnapshotService:
+    """Owns the current PriceSnapshot and the background refresher."""
+
+    def __init__(
+        self,
+        config_path: Optional[Path] = None,
+        fx_refresh_seconds: Optional[float] = None,
+        config_check_seconds: Optional[float] = None,
+    ) -> None:
+        from app.pricing import fx
+
+        self.config_path = config_path
+        self.fx_refresh_seconds = fx_refresh_seconds or _env_float(
+            "PRICING_FX_REFRESH_SECONDS", float(fx._cache_duration)
+        )
+        self.config_check_seconds = config_check_seconds or _env_float("PRICING_CONFIG_CHECK_SECONDS", 30.0)
+        self.stats = PricingStats()
+        self._snapshot: Optional[PriceSnapshot] = None
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._next_fx_refresh = 0.0
+
+    def current(self) -> PriceSnapshot:
+        """Hot path: current snapshot (rebuilt first if the catalog was reloaded)."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return self.refresh()
+        if get_catalog().by_id is not snapshot.kie_models:
+            return self.refresh()
+        return snapshot
+
+    def refresh(self, force: bool = False) -> PriceSnapshot:
+        """
+        Rebuild the snapshot if the rate, config file or catalog changed (no network I/O).
+
+        Returns:
+            Current snapshot (new one if anything changed)
+        """
+        from app.pricing import fx
+        from pricing.engine import resolve_config_path
+
+        with self._lock:
+            previous = self._snapshot
+            rate, source = fx.get_cached_rate()
+            if previous is not None and not force:
+                path = self.config_path if self.config_path is not None else resolve_config_path()
+                try:
+                    config_mtime = os.stat(path).st_mtime if path is not None else None
+                except OSError:
+                    config_mtime = None
+                if (
+                    previous.fx_rate == rate
+                    and previous.fx_source == source
+                    and previous.config_path == (str(path) if path is not None else None)
+                    and previous.config_mtime == config_mtime
+                    and previous.kie_models is get_catalog().by_id
+                ):
+                    return previous
+
+            snapshot = build_price_snapshot(
+                version=previous.version + 1 if previous is not None else 1,
+                fx_rate=rate,
+                fx_source=source,
+                config_path=self.config_path,
+                previous=previous,
+            )
+            self._snapshot = snapshot
+            self.stats.rebuilds += 1
+        logger.info(
+            f"[PRICING] ✅ Price snapshot v{snapshot.version}: fx={snapshot.fx_rate} ({snapshot.fx_source}) "
+            f"engine_models={len(snapshot.engine_axes)} kie_models={len(snapshot.kie_cost_rub)}"
+        )
+        return snapshot
+
+    async def refresh_fx(self) -> Optional[float]:
+        """Fetch the CBR rate without blocking the loop; swaps the snapshot if it changed."""
+        from app.pricing import fx
+
+        rate = await fx.fetch_usd_to_rub_rate_async()
+        if rate:
+            fx.store_rate(rate)
+            self.stats.fx_refreshes += 1
+            self.stats.last_fx_refresh = time.time()
+        else:
+            self.stats.fx_failures += 1
+        self.refresh()
+        return rate
+
+    async def start(self) -> None:
+        """Build the first snapshot and start the background refresher."""
+        self.current()
+        if self._task is None or self._task.done():
+            self._next_fx_refresh = 0.0
+            self._task = asyncio.get_running_loop().create_task(self._run(), name="pricing-snapshot-refresher")
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                if time.monotonic() >= self._next_fx_refresh:
+                    rate = await self.refresh_fx()
+                    # Failed fetch: retry sooner than the full period
+                    delay = self.fx_refresh_seconds if rate else min(self.fx_refresh_seconds, 300.0)
+                    self._next_fx_refresh = time.monotonic() + delay
+                else:
+                    self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"[PRICING] Snapshot refresh failed: {e}")
+            await asyncio.sleep(self.config_check_seconds)
+
+    async def stop(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._task = None
+
+
+_service: Optional[PricingSnapshotService] = None
+
+
+def get_pricing_service() -> PricingSnapshotService:
+    """Get process-wide pricing snapshot service."""
+    global _service
+    if _service is None:
+        _service = PricingSnapshotService()
+    return _service
+
+
+def get_price_snapshot() -> PriceSnapshot:
+    """Current price snapshot (O(1) reads for handlers)."""
+    service = _service
+    if service is None:
+        service = get_pricing_service()
+    return service.current()
+
+
+async def close_pricing_service() -> None:
+    """Stop the background refresher (shutdown)."""
+    global _service
+    if _service is not None:
+        await _service.stop()
+        _service = None
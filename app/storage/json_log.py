@@ -0,0 +1,308 @@
+"""
+Append-only log store backing JsonStorage.
+
+State of every table (one table == one <name>.json file in data_dir) lives in
+memory. A mutation is applied in memory and appended as one JSON line to
+<data_dir>/storage.wal before the storage call returns, so a write costs one
+small append instead of re-serializing the whole file.
+
+Compaction runs in the background once the log grows past compact_every
+records (and on close()): dirty tables are rewritten atomically
+(temp + fsync + rename) and the covered log segment is dropped.
+
+Recovery: load snapshots, then replay storage.wal.old (segment of an
+interrupted compaction) and storage.wal. Every log record carries a sequence
+number and every snapshot stores the last sequence it contains
+("__wal_seq__"), so records already in a snapshot are skipped on replay.
+Replay stops at a torn last line (crash mid-append) or a corrupt line, and
+the log is truncated there (dropped bytes go to storage.wal.corrupt) before
+new records are appended.
+
+Single writer per data_dir is assumed (the bot runs under the single-instance
+lock); the state is not re-read from disk after startup.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Union
+
+try:
+    from filelock import FileLock
+
+    FILELOCK_AVAILABLE = True
+except ImportError:
+    FILELOCK_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+SEQ_KEY = "__wal_seq__"
+WAL_NAME = "storage.wal"
+WAL_OLD_NAME = "storage.wal.old"
+
+Key = Union[str, List[str]]
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        logger.warning(f"Invalid {name}, using {default}")
+        return default
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+class JsonLogStore:
+    """In-memory tables + write-ahead log + background compaction."""
+
+    def __init__(
+        self,
+        data_dir: Path,
+        tables: Iterable[str],
+        compact_every: Optional[int] = None,
+        fsync: Optional[bool] = None,
+    ) -> None:
+        self.data_dir = Path(data_dir)
+        self.wal_path = self.data_dir / WAL_NAME
+        self.wal_old_path = self.data_dir / WAL_OLD_NAME
+        self.compact_every = compact_every or _env_int("JSON_STORAGE_COMPACT_EVERY", 2000)
+        self.fsync = fsync if fsync is not None else os.getenv("JSON_STORAGE_FSYNC", "0") == "1"
+
+        self._tables: Dict[str, Dict[str, Any]] = {}
+        self._table_seq: Dict[str, int] = {}
+        self._dirty: Set[str] = set()
+        self._seq = 0
+        self._wal_records = 0
+        self._wal_fd: Optional[int] = None
+        self._compaction: Optional[asyncio.Task] = None
+        self.compactions = 0
+
+        for name in tables:
+            self._load_snapshot(name)
+        replayed = self._replay(self.wal_old_path) + self._replay(self.wal_path)
+        self._wal_records = replayed
+        self._open_wal()
+        if replayed:
+            logger.info(f"[JSON_STORAGE] Replayed {replayed} WAL records (seq={self._seq})")
+
+    # ==================== LOAD / REPLAY ====================
+
+    def _snapshot_path(self, name: str) -> Path:
+        return self.data_dir / f"{name}.json"
+
+    def _load_snapshot(self, name: str) -> None:
+        path = self._snapshot_path(name)
+        data: Dict[str, Any] = {}
+        try:
+            content = path.read_text(encoding="utf-8")
+            if content.strip():
+                data = json.loads(content)
+        except FileNotFoundError:
+            pass
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            logger.error(f"Invalid JSON in {path}, starting with empty table")
+        if not isinstance(data, dict):
+            data = {}
+        seq = data.pop(SEQ_KEY, 0)
+        self._tables[name] = data
+        self._table_seq[name] = seq if isinstance(seq, int) else 0
+        self._seq = max(self._seq, self._table_seq[name])
+
+    def _replay(self, path: Path) -> int:
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return 0
+        applied = 0
+        offset = 0
+        lineno = 0
+        while offset < len(data):
+            end = data.find(b"\n", offset)
+            lineno += 1
+            if end < 0:
+                # Torn tail after a crash mid-append: never acknowledged
+                self._truncate(path, offset, data[offset:], f"torn line {lineno}")
+                break
+            line = data[offset:end]
+            if line.strip():
+                try:
+                    record = json.loads(line.decode("utf-8"))
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    # Later records can't be trusted to follow it in order: stop here
+                    self._truncate(path, offset, data[offset:], f"corrupt line {lineno}")
+                    break
+                seq = record.get("s", 0)
+                self._seq = max(self._seq, seq)
+                table = record.get("t")
+                if table not in self._tables:
+                    self._tables[table] = {}
+                    self._table_seq[table] = 0
+                if seq > self._table_seq[table]:
+                    self._apply(table, record)
+                    self._dirty.add(table)
+                    applied += 1
+            offset = end + 1
+        return applied
+
+    def _truncate(self, path: Path, size: int, dropped: bytes, reason: str) -> None:
+        """
+        Cut the log back to its last good record, so the next append starts
+        on a fresh line instead of being glued to the fragment (and lost with
+        it on the following replay). The dropped bytes are kept aside.
+        """
+        logger.error(
+            f"[JSON_STORAGE] {path.name}: {reason}, dropping {len(dropped)} bytes "
+            f"(kept in {path.name}.corrupt)"
+        )
+        with open(path.with_name(path.name + ".corrupt"), "ab") as f:
+            f.write(dropped + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+        with open(path, "r+b") as f:
+            f.truncate(size)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _open_wal(self) -> None:
+        self._wal_fd = os.open(self.wal_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    # ==================== READ ====================
+
+    def table(self, name: str) -> Dict[str, Any]:
+        """Live table dict. Do not mutate it directly - use set()/delete()/add()."""
+        return self._tables.setdefault(name, {})
+
+    # ==================== WRITE ====================
+
+    def set(self, table: str, key: Key, value: Any) -> None:
+        self._log({"t": table, "op": "set", "k": key, "v": value})
+
+    def delete(self, table: str, key: Key) -> None:
+        self._log({"t": table, "op": "del", "k": key})
+
+    def add(self, table: str, key: Key, item: Any, cap: Optional[int] = None, unique: bool = False) -> None:
+        """Append item to the list at key (keeping the last `cap` items)."""
+        self._log({"t": table, "op": "add", "k": key, "v": item, "cap": cap, "u": unique})
+
+    def _log(self, record: Dict[str, Any]) -> None:
+        if self._wal_fd is None:
+            self._open_wal()
+        self._seq += 1
+        record["s"] = self._seq
+        line = _dumps(record)
+        os.write(self._wal_fd, (line + "\n").encode("utf-8"))
+        if self.fsync:
+            os.fsync(self._wal_fd)
+        # Apply the decoded copy: memory matches what a replay would produce
+        # and callers can't mutate stored state through the objects they passed in.
+        table = record["t"]
+        self._apply(table, json.loads(line))
+        self._dirty.add(table)
+        self._wal_records += 1
+        if self._wal_records >= self.compact_every:
+            self._schedule_compaction()
+
+    def _apply(self, table: str, record: Dict[str, Any]) -> None:
+        key = record["k"]
+        path = key if isinstance(key, list) else [key]
+        target = self.table(table)
+        for part in path[:-1]:
+            nxt = target.get(part)
+            if not isinstance(nxt, dict):
+                nxt = target[part] = {}
+            target = nxt
+        last = path[-1]
+        op = record.get("op")
+        if op == "set":
+            target[last] = record["v"]
+        elif op == "del":
+            target.pop(last, None)
+        elif op == "add":
+            items = target.get(last)
+            if not isinstance(items, list):
+                items = target[last] = []
+            item = record["v"]
+            if not (record.get("u") and item in items):
+                items.append(item)
+            cap = record.get("cap")
+            if cap and len(items) > cap:
+                del items[:-cap]
+
+    # ==================== COMPACTION ====================
+
+    def _schedule_compaction(self) -> None:
+        if self._compaction is not None and not self._compaction.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._compaction = loop.create_task(self.compact())
+
+    async def compact(self) -> None:
+        """Rewrite dirty tables and drop the log segment they cover."""
+        if not self._dirty:
+            return
+        # Serialize + rotate synchronously: no mutation can interleave
+        snapshots = {
+            name: _dumps({SEQ_KEY: self._seq, **self._tables[name]})
+            for name in self._dirty
+        }
+        dirty, self._dirty = self._dirty, set()
+        self._rotate_wal()
+
+        try:
+            await asyncio.to_thread(self._write_snapshots, snapshots)
+        except Exception as e:
+            self._dirty |= dirty
+            logger.error(f"[JSON_STORAGE] Compaction failed, WAL kept: {e}")
+            return
+        self.compactions += 1
+        logger.debug(f"[JSON_STORAGE] Compacted {len(snapshots)} tables (seq={self._seq})")
+
+    def _rotate_wal(self) -> None:
+        os.close(self._wal_fd)
+        self._wal_fd = None
+        if self.wal_old_path.exists():
+            # Previous compaction did not finish: keep its segment, append ours
+            with open(self.wal_path, "rb") as src, open(self.wal_old_path, "ab") as dst:
+                dst.write(src.read())
+                dst.flush()
+                os.fsync(dst.fileno())
+            self.wal_path.unlink()
+        else:
+            os.replace(self.wal_path, self.wal_old_path)
+        self._open_wal()
+        self._wal_records = 0
+
+    def _write_snapshots(self, snapshots: Dict[str, str]) -> None:
+        lock = FileLock(self.data_dir / f".{WAL_NAME}.lock", timeout=5) if FILELOCK_AVAILABLE else None
+        if lock is not None:
+            lock.acquire()
+        try:
+            for name, content in snapshots.items():
+                path = self._snapshot_path(name)
+                temp_file = path.with_suffix(".tmp")
+                with open(temp_file, "w", encoding="utf-8") as f:
+                    f.write(content)
+                    f.flush()
+                    os.fsync(f.fileno())
+                temp_file.replace(path)
+            self.wal_old_path.unlink(missing_ok=True)
+        finally:
+            if lock is not None:
+                lock.release()
+
+    async def close(self) -> None:
+        if self._compaction is not None and not self._compaction.done():
+            await self._compaction
+        await self.compact()
+        if self._wal_fd is not None:
+            os.close(self._wal_fd)
+            self._wal_fd = None
@@ -1,30 +1,20 @@
 """
 JSON storage implementation - хранение данных в JSON файлах
-Атомарная запись (temp+rename), filelock для безопасности
+Состояние в памяти, изменения пишутся в append-only WAL (см. app.storage.json_log),
+файлы <table>.json переписываются фоновой компакцией (атомарно, temp+rename)
 """
 
-import os
-import json
-import asyncio
+import copy
 import logging
 from pathlib import Path
 from typing import Dict, Any, Optional, List
 from datetime import datetime
 import uuid
-import aiofiles
 
 from app.storage.base import BaseStorage
+from app.storage.json_log import JsonLogStore
 from app.storage.status import is_terminal_status, normalize_job_status
 
-# Опциональный импорт filelock (мягкая деградация)
-try:
-    from filelock import FileLock, Timeout
-
-    FILELOCK_AVAILABLE = True
-except ImportError:
-    FILELOCK_AVAILABLE = False
-    pass
-
 logger = logging.getLogger(__name__)
 
 
@@ -46,13 +36,14 @@ class JsonStorage(BaseStorage):
         self.referrals_file = self.data_dir / "referrals.json"
         self.jobs_file = self.data_dir / "generation_jobs.json"
         self.processed_transactions_file = self.data_dir / "processed_transactions.json"
+        self.reserves_file = self.data_dir / "balance_reserves.json"
 
         # Инициализируем файлы если их нет
         self._init_files()
+        self._store = JsonLogStore(self.data_dir, [f.stem for f in self._files()])
 
-    def _init_files(self):
-        """Инициализирует JSON файлы если их нет"""
-        files = [
+    def _files(self) -> List[Path]:
+        return [
             self.balances_file,
             self.languages_file,
             self.gift_claimed_file,
@@ -63,62 +54,27 @@ class JsonStorage(BaseStorage):
             self.referrals_file,
             self.jobs_file,
             self.processed_transactions_file,
+            self.reserves_file,
         ]
-        for file in files:
+
+    def _init_files(self):
+        """Инициализирует JSON файлы если их нет"""
+        for file in self._files():
+            # Reserves snapshot appears with the first reserve (compaction writes it)
+            if file == self.reserves_file:
+                continue
             if not file.exists():
                 try:
                     file.write_text("{}", encoding="utf-8")
                 except Exception as e:
                     logger.error(f"Failed to create {file}: {e}")
 
-    def _get_lock_file(self, file_path: Path) -> Path:
-        """Получает путь к lock файлу"""
-        return file_path.parent / f".{file_path.name}.lock"
+    def _table(self, file_path: Path) -> Dict[str, Any]:
+        """In-memory table for a data file (read-only view, mutate via _store)."""
+        return self._store.table(file_path.stem)
 
-    async def _load_json(self, file_path: Path) -> Dict[str, Any]:
-        """Загружает JSON файл"""
-        try:
-            async with aiofiles.open(file_path, "r", encoding="utf-8") as f:
-                content = await f.read()
-                if not content.strip():
-                    return {}
-                return json.loads(content)
-        except FileNotFoundError:
-            return {}
-        except json.JSONDecodeError:
-            logger.error(f"Invalid JSON in {file_path}, returning empty dict")
-            return {}
-        except Exception as e:
-            logger.error(f"Error loading {file_path}: {e}")
-            return {}
-
-    async def _save_json(self, file_path: Path, data: Dict[str, Any]) -> None:
-        """Сохраняет JSON файл атомарно (temp file + rename)"""
-        if FILELOCK_AVAILABLE:
-            lock_file = self._get_lock_file(file_path)
-            lock = FileLock(lock_file, timeout=5)
-
-            try:
-                with lock:
-                    # Создаем временный файл
-                    temp_file = file_path.with_suffix(".tmp")
-                    async with aiofiles.open(temp_file, "w", encoding="utf-8") as f:
-                        await f.write(json.dumps(data, ensure_ascii=False, indent=2))
-
-                    # Атомарно переименовываем
-                    temp_file.replace(file_path)
-            except Timeout:
-                logger.error(f"Timeout acquiring lock for {file_path}")
-                raise
-            except Exception as e:
-                logger.error(f"Error saving {file_path}: {e}")
-                raise
-        else:
-            # Без filelock - просто сохраняем (риск race conditions, но работает)
-            temp_file = file_path.with_suffix(".tmp")
-            async with aiofiles.open(temp_file, "w", encoding="utf-8") as f:
-                await f.write(json.dumps(data, ensure_ascii=False, indent=2))
-            temp_file.replace(file_path)
+    def _set(self, file_path: Path, key, value: Any) -> None:
+        self._store.set(file_path.stem, key, value)
 
     # ==================== USER OPERATIONS ====================
     
@@ -156,14 +112,11 @@ class JsonStorage(BaseStorage):
 
     async def get_user_balance(self, user_id: int) -> float:
         """Получить баланс пользователя"""
-        data = await self._load_json(self.balances_file)
-        return float(data.get(str(user_id), 0.0))
+        return float(self._table(self.balances_file).get(str(user_id), 0.0))
 
     async def set_user_balance(self, user_id: int, amount: float) -> None:
         """Установить баланс пользователя"""
-        data = await self._load_json(self.balances_file)
-        data[str(user_id)] = amount
-        await self._save_json(self.balances_file, data)
+        self._set(self.balances_file, str(user_id), amount)
 
     async def add_user_balance(self, user_id: int, amount: float) -> float:
         """Добавить к балансу"""
@@ -182,29 +135,23 @@ class JsonStorage(BaseStorage):
 
     async def get_user_language(self, user_id: int) -> str:
         """Получить язык пользователя"""
-        data = await self._load_json(self.languages_file)
-        return data.get(str(user_id), "ru")
+        return self._table(self.languages_file).get(str(user_id), "ru")
 
     async def set_user_language(self, user_id: int, language: str) -> None:
         """Установить язык пользователя"""
-        data = await self._load_json(self.languages_file)
-        data[str(user_id)] = language
-        await self._save_json(self.languages_file, data)
+        self._set(self.languages_file, str(user_id), language)
 
     async def has_claimed_gift(self, user_id: int) -> bool:
         """Проверить получение подарка"""
-        data = await self._load_json(self.gift_claimed_file)
-        return data.get(str(user_id), False)
+        return self._table(self.gift_claimed_file).get(str(user_id), False)
 
     async def set_gift_claimed(self, user_id: int) -> None:
         """Отметить получение подарка"""
-        data = await self._load_json(self.gift_claimed_file)
-        data[str(user_id)] = True
-        await self._save_json(self.gift_claimed_file, data)
+        self._set(self.gift_claimed_file, str(user_id), True)
 
     async def get_user_free_generations_today(self, user_id: int) -> int:
         """Получить количество бесплатных генераций сегодня"""
-        data = await self._load_json(self.free_generations_file)
+        data = self._table(self.free_generations_file)
         user_key = str(user_id)
         today = datetime.now().strftime("%Y-%m-%d")
 
@@ -224,7 +171,7 @@ class JsonStorage(BaseStorage):
         free_per_day = 5  # TODO: добавить в settings
 
         used = await self.get_user_free_generations_today(user_id)
-        data = await self._load_json(self.free_generations_file)
+        data = self._table(self.free_generations_file)
         user_key = str(user_id)
         bonus = data.get(user_key, {}).get("bonus", 0)
         total_available = free_per_day + bonus
@@ -232,20 +179,17 @@ class JsonStorage(BaseStorage):
 
     async def increment_free_generations(self, user_id: int) -> None:
         """Увеличить счетчик бесплатных генераций"""
-        data = await self._load_json(self.free_generations_file)
+        data = self._table(self.free_generations_file)
         user_key = str(user_id)
         today = datetime.now().strftime("%Y-%m-%d")
 
-        if user_key not in data:
-            data[user_key] = {"date": today, "count": 0, "bonus": 0}
-
-        user_data = data[user_key]
+        user_data = dict(data.get(user_key) or {"date": today, "count": 0, "bonus": 0})
         if user_data.get("date") != today:
             user_data["date"] = today
             user_data["count"] = 0
 
         user_data["count"] = user_data.get("count", 0) + 1
-        await self._save_json(self.free_generations_file, data)
+        self._set(self.free_generations_file, user_key, user_data)
 
     async def get_admin_limit(self, user_id: int) -> float:
         """Получить лимит админа"""
@@ -256,14 +200,12 @@ class JsonStorage(BaseStorage):
         if user_id == settings.admin_id:
             return float("inf")
 
-        data = await self._load_json(self.admin_limits_file)
-        admin_data = data.get(str(user_id), {})
+        admin_data = self._table(self.admin_limits_file).get(str(user_id), {})
         return float(admin_data.get("limit", 100.0))
 
     async def get_admin_spent(self, user_id: int) -> float:
         """Получить потраченную сумму админа"""
-        data = await self._load_json(self.admin_limits_file)
-        admin_data = data.get(str(user_id), {})
+        admin_data = self._table(self.admin_limits_file).get(str(user_id), {})
         return float(admin_data.get("spent", 0.0))
 
     async def get_admin_remaining(self, user_id: int) -> float:
@@ -288,7 +230,6 @@ class JsonStorage(BaseStorage):
     ) -> str:
         """Добавить задачу генерации"""
         job_id = task_id or str(uuid.uuid4())
-        data = await self._load_json(self.jobs_file)
         normalized_status = normalize_job_status(status)
 
         job = {
@@ -308,8 +249,7 @@ class JsonStorage(BaseStorage):
             "error_message": None,
         }
 
-        data[job_id] = job
-        await self._save_json(self.jobs_file, data)
+        self._set(self.jobs_file, job_id, job)
         return job_id
 
     async def update_job_status(
@@ -320,11 +260,11 @@ class JsonStorage(BaseStorage):
         error_message: Optional[str] = None,
     ) -> None:
         """Обновить статус задачи"""
-        data = await self._load_json(self.jobs_file)
+        data = self._table(self.jobs_file)
         if job_id not in data:
             raise ValueError(f"Job {job_id} not found")
 
-        job = data[job_id]
+        job = dict(data[job_id])
         normalized_status = normalize_job_status(status)
         job["status"] = normalized_status
         job["updated_at"] = datetime.now().isoformat()
@@ -336,24 +276,26 @@ class JsonStorage(BaseStorage):
         if error_message is not None:
             job["error_message"] = error_message
 
-        await self._save_json(self.jobs_file, data)
+        self._set(self.jobs_file, job_id, job)
 
     async def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
         """Получить задачу по ID"""
-        data = await self._load_json(self.jobs_file)
-        return data.get(job_id)
+        return copy.deepcopy(self._table(self.jobs_file).get(job_id))
 
     async def find_job_by_task_id(self, task_id: str) -> Optional[Dict[str, Any]]:
         """Найти задачу по внешнему task_id или совпадающему job_id."""
-        data = await self._load_json(self.jobs_file)
+        data = self._table(self.jobs_file)
+        job = data.get(task_id)
+        if job is not None and job.get("job_id") == task_id:
+            return copy.deepcopy(job)
         for job in data.values():
             if job.get("task_id") == task_id or job.get("external_task_id") == task_id or job.get("job_id") == task_id:
-                return job
+                return copy.deepcopy(job)
         return None
 
     async def get_undelivered_jobs(self, limit: int = 100) -> List[Dict[str, Any]]:
         """Get jobs that are done but not delivered (for retry)."""
-        data = await self._load_json(self.jobs_file)
+        data = self._table(self.jobs_file)
         undelivered = [
             job for job in data.values()
             if job.get('status') == 'done'
@@ -362,14 +304,13 @@ class JsonStorage(BaseStorage):
         ]
         # Sort by created_at
         undelivered.sort(key=lambda j: j.get('created_at', ''))
-        return undelivered[:limit]
+        return copy.deepcopy(undelivered[:limit])
 
     async def list_jobs(
         self, user_id: Optional[int] = None, status: Optional[str] = None, limit: int = 100
     ) -> List[Dict[str, Any]]:
         """Получить список задач"""
-        data = await self._load_json(self.jobs_file)
-        jobs = list(data.values())
+        jobs = list(self._table(self.jobs_file).values())
 
         if user_id is not None:
             jobs = [j for j in jobs if j.get("user_id") == user_id]
@@ -378,7 +319,7 @@ class JsonStorage(BaseStorage):
 
         # Сортируем по created_at (новые первыми)
         jobs.sort(key=lambda x: x.get("created_at", ""), reverse=True)
-        return jobs[:limit]
+        return copy.deepcopy(jobs[:limit])
     
     # ==================== ORPHAN CALLBACKS (PHASE 4 - JSON STUB) ====================
     
@@ -409,12 +350,6 @@ class JsonStorage(BaseStorage):
     ) -> str:
         """Добавить генерацию в историю"""
         gen_id = operation_id or str(uuid.uuid4())
-        data = await self._load_json(self.generations_history_file)
-        user_key = str(user_id)
-
-        if user_key not in data:
-            data[user_key] = []
-
         generation = {
             "id": gen_id,
             "model_id": model_id,
@@ -425,21 +360,16 @@ class JsonStorage(BaseStorage):
             "timestamp": datetime.now().isoformat(),
         }
 
-        data[user_key].append(generation)
         # Ограничиваем историю последними 100 генерациями
-        data[user_key] = data[user_key][-100:]
-
-        await self._save_json(self.generations_history_file, data)
+        self._store.add(self.generations_history_file.stem, str(user_id), generation, cap=100)
         return gen_id
 
     async def get_user_generations_history(
         self, user_id: int, limit: int = 10
     ) -> List[Dict[str, Any]]:
         """Получить историю генераций"""
-        data = await self._load_json(self.generations_history_file)
-        user_key = str(user_id)
-        history = data.get(user_key, [])
-        return history[-limit:]
+        history = self._table(self.generations_history_file).get(str(user_id), [])
+        return copy.deepcopy(history[-limit:])
 
     # ==================== PAYMENTS ====================
 
@@ -455,7 +385,7 @@ class JsonStorage(BaseStorage):
     ) -> str:
         """Добавить платеж с поддержкой idempotency"""
         pay_id = payment_id or str(uuid.uuid4())
-        data = await self._load_json(self.payments_file)
+        data = self._table(self.payments_file)
 
         # Если передан idempotency_key, проверяем существующий платеж
         if idempotency_key:
@@ -477,8 +407,7 @@ class JsonStorage(BaseStorage):
             "notes": None,
         }
 
-        data[pay_id] = payment
-        await self._save_json(self.payments_file, data)
+        self._set(self.payments_file, pay_id, payment)
         return pay_id
 
     async def mark_payment_status(
@@ -489,11 +418,11 @@ class JsonStorage(BaseStorage):
         notes: Optional[str] = None,
     ) -> None:
         """Обновить статус платежа с автоматическим rollback при cancel/failed"""
-        data = await self._load_json(self.payments_file)
+        data = self._table(self.payments_file)
         if payment_id not in data:
             raise ValueError(f"Payment {payment_id} not found")
 
-        payment = data[payment_id]
+        payment = dict(data[payment_id])
         old_status = payment.get("status")
         payment["status"] = status
         payment["updated_at"] = datetime.now().isoformat()
@@ -502,6 +431,7 @@ class JsonStorage(BaseStorage):
             payment["admin_id"] = admin_id
         if notes is not None:
             payment["notes"] = notes
+        self._set(self.payments_file, payment_id, payment)
 
         # Если платеж одобрен, добавляем баланс
         if status == "approved" and old_status != "approved":
@@ -509,27 +439,22 @@ class JsonStorage(BaseStorage):
 
         # Если платеж отменен или провалился, освобождаем резервы (если были)
         if status in ("cancelled", "failed", "rejected"):
-            reserves_data = await self._load_json(self.data_dir / "balance_reserves.json")
+            reserves_data = self._table(self.reserves_file)
             user_id = payment["user_id"]
             for reserve_id, reserve in list(reserves_data.items()):
                 if reserve.get("user_id") == user_id and reserve.get("status") == "reserved":
-                    reserve["status"] = "released"
-                    reserve["updated_at"] = datetime.now().isoformat()
+                    reserve = dict(reserve, status="released", updated_at=datetime.now().isoformat())
+                    self._set(self.reserves_file, reserve_id, reserve)
                     # Возвращаем баланс
                     await self.add_user_balance(user_id, reserve["amount"])
-            await self._save_json(self.data_dir / "balance_reserves.json", reserves_data)
-
-        await self._save_json(self.payments_file, data)
 
     async def get_payment(self, payment_id: str) -> Optional[Dict[str, Any]]:
         """Получить платеж по ID"""
-        data = await self._load_json(self.payments_file)
-        return data.get(payment_id)
+        return copy.deepcopy(self._table(self.payments_file).get(payment_id))
 
     async def is_transaction_processed(self, transaction_id: str) -> bool:
         """Проверить, обработана ли транзакция (идемпотентность webhook)."""
-        data = await self._load_json(self.processed_transactions_file)
-        return bool(data.get(transaction_id))
+        return bool(self._table(self.processed_transactions_file).get(transaction_id))
 
     async def mark_transaction_processed(
         self,
@@ -541,24 +466,21 @@ class JsonStorage(BaseStorage):
         """Отметить транзакцию как обработанную. Возвращает True если новая запись.
         False если транзакция уже была отмечена ранее.
         """
-        data = await self._load_json(self.processed_transactions_file)
-        if transaction_id in data:
+        if transaction_id in self._table(self.processed_transactions_file):
             return False
-        data[transaction_id] = {
+        self._set(self.processed_transactions_file, transaction_id, {
             "user_id": user_id,
             "amount": amount,
             "meta": meta or {},
             "processed_at": datetime.now().isoformat(),
-        }
-        await self._save_json(self.processed_transactions_file, data)
+        })
         return True
 
     async def list_payments(
         self, user_id: Optional[int] = None, status: Optional[str] = None, limit: int = 100
     ) -> List[Dict[str, Any]]:
         """Получить список платежей"""
-        data = await self._load_json(self.payments_file)
-        payments = list(data.values())
+        payments = list(self._table(self.payments_file).values())
 
         if user_id is not None:
             payments = [p for p in payments if p.get("user_id") == user_id]
@@ -566,7 +488,7 @@ class JsonStorage(BaseStorage):
             payments = [p for p in payments if p.get("status") == status]
 
         payments.sort(key=lambda x: x.get("created_at", ""), reverse=True)
-        return payments[:limit]
+        return copy.deepcopy(payments[:limit])
 
     # ==================== BALANCE RESERVES (IDEMPOTENCY) ====================
 
@@ -579,8 +501,7 @@ class JsonStorage(BaseStorage):
         idempotency_key: Optional[str] = None,
     ) -> bool:
         """Резервирует баланс для генерации (idempotent)"""
-        reserves_file = self.data_dir / "balance_reserves.json"
-        reserves_data = await self._load_json(reserves_file)
+        reserves_data = self._table(self.reserves_file)
 
         # Проверяем баланс
         balance = await self.get_user_balance(user_id)
@@ -619,18 +540,15 @@ class JsonStorage(BaseStorage):
             "updated_at": datetime.now().isoformat(),
         }
 
-        reserves_data[reserve_id] = reserve
+        self._set(self.reserves_file, reserve_id, reserve)
 
         # Резервируем баланс (вычитаем из доступного)
         await self.subtract_user_balance(user_id, amount)
-
-        await self._save_json(reserves_file, reserves_data)
         return True
 
     async def release_balance_reserve(self, user_id: int, task_id: str, model_id: str) -> bool:
         """Освобождает зарезервированный баланс (при отмене/ошибке)"""
-        reserves_file = self.data_dir / "balance_reserves.json"
-        reserves_data = await self._load_json(reserves_file)
+        reserves_data = self._table(self.reserves_file)
 
         # Находим резерв
         for reserve_id, reserve in list(reserves_data.items()):
@@ -640,22 +558,20 @@ class JsonStorage(BaseStorage):
                 and reserve.get("model_id") == model_id
                 and reserve.get("status") == "reserved"
             ):
-                # Освобождаем баланс (возвращаем обратно)
-                await self.add_user_balance(user_id, reserve["amount"])
-
                 # Обновляем статус резерва
-                reserve["status"] = "released"
-                reserve["updated_at"] = datetime.now().isoformat()
+                self._set(self.reserves_file, reserve_id, dict(
+                    reserve, status="released", updated_at=datetime.now().isoformat()
+                ))
 
-                await self._save_json(reserves_file, reserves_data)
+                # Освобождаем баланс (возвращаем обратно)
+                await self.add_user_balance(user_id, reserve["amount"])
                 return True
 
         return False  # Резерва не было
 
     async def commit_balance_reserve(self, user_id: int, task_id: str, model_id: str) -> bool:
         """Подтверждает резерв баланса (списывает при успешной генерации)"""
-        reserves_file = self.data_dir / "balance_reserves.json"
-        reserves_data = await self._load_json(reserves_file)
+        reserves_data = self._table(self.reserves_file)
 
         # Находим резерв
         for reserve_id, reserve in list(reserves_data.items()):
@@ -666,10 +582,9 @@ class JsonStorage(BaseStorage):
                 and reserve.get("status") == "reserved"
             ):
                 # Обновляем статус резерва (баланс уже списан при резервировании)
-                reserve["status"] = "committed"
-                reserve["updated_at"] = datetime.now().isoformat()
-
-                await self._save_json(reserves_file, reserves_data)
+                self._set(self.reserves_file, reserve_id, dict(
+                    reserve, status="committed", updated_at=datetime.now().isoformat()
+                ))
                 return True
 
         return False  # Резерва не было
@@ -678,43 +593,31 @@ class JsonStorage(BaseStorage):
 
     async def set_referrer(self, user_id: int, referrer_id: int) -> None:
         """Установить реферера"""
-        data = await self._load_json(self.referrals_file)
-        data[str(user_id)] = referrer_id
+        self._set(self.referrals_file, str(user_id), referrer_id)
 
         # Добавляем в список рефералов реферера
-        if "referrals" not in data:
-            data["referrals"] = {}
-        if str(referrer_id) not in data["referrals"]:
-            data["referrals"][str(referrer_id)] = []
-
-        if user_id not in data["referrals"][str(referrer_id)]:
-            data["referrals"][str(referrer_id)].append(user_id)
-
-        await self._save_json(self.referrals_file, data)
+        self._store.add(self.referrals_file.stem, ["referrals", str(referrer_id)], user_id, unique=True)
 
     async def get_referrer(self, user_id: int) -> Optional[int]:
         """Получить ID реферера"""
-        data = await self._load_json(self.referrals_file)
-        referrer_id = data.get(str(user_id))
+        referrer_id = self._table(self.referrals_file).get(str(user_id))
         return int(referrer_id) if referrer_id else None
 
     async def get_referrals(self, referrer_id: int) -> List[int]:
         """Получить список рефералов"""
-        data = await self._load_json(self.referrals_file)
+        data = self._table(self.referrals_file)
         if "referrals" not in data:
             return []
-        return data["referrals"].get(str(referrer_id), [])
+        return list(data["referrals"].get(str(referrer_id), []))
 
     async def add_referral_bonus(self, referrer_id: int, bonus_generations: int = 5) -> None:
         """Добавить бонусные генерации рефереру"""
-        data = await self._load_json(self.free_generations_file)
+        data = self._table(self.free_generations_file)
         user_key = str(referrer_id)
 
-        if user_key not in data:
-            data[user_key] = {"date": datetime.now().strftime("%Y-%m-%d"), "count": 0, "bonus": 0}
-
-        data[user_key]["bonus"] = data[user_key].get("bonus", 0) + bonus_generations
-        await self._save_json(self.free_generations_file, data)
+        user_data = dict(data.get(user_key) or {"date": datetime.now().strftime("%Y-%m-%d"), "count": 0, "bonus": 0})
+        user_data["bonus"] = user_data.get("bonus", 0) + bonus_generations
+        self._set(self.free_generations_file, user_key, user_data)
 
     # ==================== UTILITY ====================
 
@@ -730,5 +633,5 @@ class JsonStorage(BaseStorage):
             return False
 
     async def close(self) -> None:
-        """Закрыть соединения (для JSON ничего не нужно)"""
-        pass
+        """Закрыть хранилище: финальная компакция WAL в JSON файлы"""
+        await self._store.close()
@@ -0,0 +1,291 @@
+"""
+asyncpg pool manager for PostgresStorage.
+
+Hot path is a plain attribute read: the pool is NOT health-checked on every
+operation. Broken pools are detected passively instead:
+
+- connection-class errors raised inside pool.acquire() blocks mark the pool broken
+- a background probe runs SELECT 1 every probe_interval seconds
+
+A broken pool is replaced on the next _get_pool() call; the old one is
+closed in the background (close() waits for checked-out connections, and
+is cut short by terminate() after retire_grace seconds).
+Pool sizes come from Settings (DB_POOL_MIN_SIZE / DB_POOL_MAX_SIZE).
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Set
+
+try:
+    import asyncpg
+    ASYNCPG_AVAILABLE = True
+except ImportError:
+    ASYNCPG_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+if ASYNCPG_AVAILABLE:
+    CONNECTION_ERRORS = (
+        asyncpg.InterfaceError,
+        asyncpg.PostgresConnectionError,
+        ConnectionError,
+        OSError,
+    )
+else:  # pragma: no cover - asyncpg is a hard dependency of PostgresStorage
+    CONNECTION_ERRORS = (ConnectionError, OSError)
+
+
+def is_connection_error(exc: BaseException) -> bool:
+    """True for errors that mean the connection/pool is unusable (not query timeouts)."""
+    return isinstance(exc, CONNECTION_ERRORS) and not isinstance(exc, asyncio.TimeoutError)
+
+
+@dataclass
+class PoolStats:
+    """Pool usage counters (exposed via PgPoolManager.metrics())."""
+    acquires: int = 0
+    acquire_wait_total: float = 0.0
+    acquire_wait_max: float = 0.0
+    waiting: int = 0
+    in_use: int = 0
+    broken_detected: int = 0
+    recreated: int = 0
+    probe_failures: int = 0
+
+
+class _AcquireContext:
+    """pool.acquire() wrapper that reports connection errors to the manager."""
+
+    __slots__ = ("_manager", "_pool", "_ctx", "_started")
+
+    def __init__(self, manager: "PgPoolManager", pool: Any, timeout: Optional[float]) -> None:
+        self._manager = manager
+        self._pool = pool
+        self._ctx = pool.acquire(timeout=timeout) if timeout is not None else pool.acquire()
+        self._started = 0.0
+
+    async def __aenter__(self):
+        stats = self._manager.stats
+        stats.waiting += 1
+        self._started = time.monotonic()
+        try:
+            conn = await self._ctx.__aenter__()
+        except Exception as exc:
+            if is_connection_error(exc):
+                self._manager.mark_broken(self._pool, exc)
+            raise
+        finally:
+            stats.waiting -= 1
+        waited = time.monotonic() - self._started
+        stats.acquires += 1
+        stats.acquire_wait_total += waited
+        if waited > stats.acquire_wait_max:
+            stats.acquire_wait_max = waited
+        stats.in_use += 1
+        return conn
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._manager.stats.in_use -= 1
+        if exc is not None and is_connection_error(exc):
+            self._manager.mark_broken(self._pool, exc)
+        return await self._ctx.__aexit__(exc_type, exc, tb)
+
+
+class ManagedPool:
+    """
+    Thin proxy over asyncpg.Pool.
+
+    acquire() feeds the manager's passive health detection; everything else
+    (fetch, execute, close, get_size...) is delegated to the real pool.
+    """
+
+    __slots__ = ("_manager", "_pool")
+
+    def __init__(self, manager: "PgPoolManager", pool: Any) -> None:
+        self._manager = manager
+        self._pool = pool
+
+    @property
+    def raw(self) -> Any:
+        return self._pool
+
+    def acquire(self, *, timeout: Optional[float] = None) -> _AcquireContext:
+        return _AcquireContext(self._manager, self._pool, timeout)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._pool, name)
+
+
+class PgPoolManager:
+    """Lazily creates, passively health-checks and recreates an asyncpg pool."""
+
+    def __init__(
+        self,
+        database_url: str,
+        *,
+        min_size: int = 1,
+        max_size: int = 10,
+        command_timeout: float = 60,
+        max_inactive_connection_lifetime: float = 300,
+        probe_interval: float = 30.0,
+        retire_grace: float = 10.0,
+    ) -> None:
+        self.database_url = database_url
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size)
+        self.command_timeout = command_timeout
+        self.max_inactive_connection_lifetime = max_inactive_connection_lifetime
+        self.probe_interval = probe_interval
+        self.retire_grace = retire_grace
+        self.stats = PoolStats()
+        self._pool: Optional[Any] = None
+        self._managed: Optional[ManagedPool] = None
+        self._broken = False
+        self._lock: Optional[asyncio.Lock] = None
+        self._probe_task: Optional[asyncio.Task] = None
+        self._retiring: Set[asyncio.Task] = set()
+
+    @property
+    def pool(self) -> Optional[Any]:
+        """Raw asyncpg pool (None until first use)."""
+        return self._pool
+
+    async def get(self) -> ManagedPool:
+        """Return a healthy pool; no round trip unless the pool must be (re)created."""
+        managed = self._managed
+        if managed is not None and not self._broken:
+            return managed
+
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            # Double-check after acquiring lock
+            if self._managed is not None and not self._broken:
+                return self._managed
+
+            if self._pool is not None:
+                # Never close under the lock: close() waits for connections still
+                # checked out, and their holders may be calling get() right now
+                old_pool, self._pool, self._managed = self._pool, None, None
+                self._retire(old_pool)
+                self.stats.recreated += 1
+
+            self._pool = await asyncpg.create_pool(
+                self.database_url,
+                min_size=self.min_size,
+                max_size=self.max_size,
+                command_timeout=self.command_timeout,
+                # CRITICAL: Close idle connections to prevent leaks
+                max_inactive_connection_lifetime=self.max_inactive_connection_lifetime,
+            )
+            self._managed = ManagedPool(self, self._pool)
+            self._broken = False
+            logger.info(
+                f"[PG_POOL] ✅ Connection pool initialized "
+                f"(min={self.min_size}, max={self.max_size}, "
+                f"max_lifetime={self.max_inactive_connection_lifetime}s)"
+            )
+            self._start_probe()
+            return self._managed
+
+    def _retire(self, pool: Any) -> None:
+        task = asyncio.get_running_loop().create_task(self._close_retired(pool))
+        self._retiring.add(task)
+        task.add_done_callback(self._retiring.discard)
+
+    async def _close_retired(self, pool: Any) -> None:
+        """Close a replaced pool; terminate it if connections are not returned within retire_grace."""
+        try:
+            await asyncio.wait_for(pool.close(), timeout=self.retire_grace)
+        except asyncio.TimeoutError:
+            logger.warning(f"[PG_POOL] Old pool not closed within {self.retire_grace}s, terminating")
+            try:
+                pool.terminate()
+            except Exception:
+                pass
+        except Exception:
+            pass
+
+    def mark_broken(self, pool: Any, exc: BaseException) -> None:
+        """Flag the pool for recreation (ignored if it was already replaced)."""
+        if pool is not self._pool or self._broken:
+            return
+        self._broken = True
+        self.stats.broken_detected += 1
+        from app.utils.correlation import correlation_tag
+        logger.warning(f"{correlation_tag()} [PG_POOL] Pool marked broken, will recreate: {exc}")
+
+    def _start_probe(self) -> None:
+        if self.probe_interval <= 0:
+            return
+        if self._probe_task is not None and not self._probe_task.done():
+            return
+        try:
+            self._probe_task = asyncio.get_running_loop().create_task(self._probe_loop())
+        except RuntimeError:
+            self._probe_task = None
+
+    async def _probe_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.probe_interval)
+            await self.probe()
+
+    async def probe(self) -> bool:
+        """Run SELECT 1 on the current pool; marks it broken on failure."""
+        pool = self._pool
+        if pool is None or self._broken:
+            return False
+        try:
+            async with pool.acquire(timeout=self.probe_interval or None) as conn:
+                await conn.fetchval("SELECT 1")
+            return True
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            self.stats.probe_failures += 1
+            self.mark_broken(pool, exc)
+            return False
+
+    def metrics(self) -> Dict[str, Any]:
+        """Pool saturation snapshot."""
+        pool = self._pool
+        size = pool.get_size() if pool is not None else 0
+        idle = pool.get_idle_size() if pool is not None else 0
+        stats = self.stats
+        return {
+            "initialized": pool is not None,
+            "broken": self._broken,
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "size": size,
+            "idle": idle,
+            "in_use": stats.in_use,
+            "waiting": stats.waiting,
+            "saturation": round(stats.in_use / self.max_size, 3) if self.max_size else 0.0,
+            "acquires": stats.acquires,
+            "acquire_wait_avg_ms": round(stats.acquire_wait_total / stats.acquires * 1000, 2) if stats.acquires else 0.0,
+            "acquire_wait_max_ms": round(stats.acquire_wait_max * 1000, 2),
+            "broken_detected": stats.broken_detected,
+            "recreated": stats.recreated,
+            "probe_failures": stats.probe_failures,
+        }
+
+    async def close(self) -> None:
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            try:
+                await self._probe_task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._probe_task = None
+        if self._retiring:
+            await asyncio.gather(*self._retiring, return_exceptions=True)
+        if self._pool is not None:
+            await self._pool.close()
+        self._pool = None
+        self._managed = None
+        self._broken = False
@@ -4,7 +4,7 @@ PostgreSQL storage implementation - хранение данных в PostgreSQL
 """
 
 import logging
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
 from datetime import datetime
 import uuid
 import json
@@ -17,10 +17,14 @@ except ImportError:
     ASYNCPG_AVAILABLE = False
 
 from app.storage.base import BaseStorage
+from app.storage.pg_pool import CONNECTION_ERRORS, ManagedPool, PgPoolManager, is_connection_error
 from app.storage.status import normalize_job_status
 
 logger = logging.getLogger(__name__)
 
+# Database clock in unix seconds (user_rate_limits times); NOW() is fixed within a statement
+_DB_NOW = "EXTRACT(EPOCH FROM NOW())::float8"
+
 
 class PostgresStorage(BaseStorage):
     """PostgreSQL storage implementation с asyncpg"""
@@ -30,55 +34,39 @@ class PostgresStorage(BaseStorage):
             raise ImportError("asyncpg is required for PostgreSQL storage")
         
         self.database_url = database_url
-        self._pool: Optional[asyncpg.Pool] = None
-        self._pool_lock = None  # Will be initialized on first async call
+        from app.config import get_settings
+        settings = get_settings()
+        self._pool_manager = PgPoolManager(
+            database_url,
+            min_size=settings.db_pool_min_size,
+            max_size=settings.db_pool_max_size,
+            command_timeout=60,
+            max_inactive_connection_lifetime=300,  # CRITICAL: Close idle connections after 5min to prevent leaks
+            probe_interval=settings.db_pool_probe_interval,
+        )
     
     @property
     def pool(self) -> Optional[asyncpg.Pool]:
         """Public access to connection pool for workers/queue."""
-        return self._pool
+        return self._pool_manager.pool
     
-    async def _get_pool(self) -> asyncpg.Pool:
+    @property
+    def _pool(self) -> Optional[asyncpg.Pool]:
+        return self._pool_manager.pool
+    
+    async def _get_pool(self) -> ManagedPool:
         """
         Получить или создать connection pool (thread-safe).
         
-        CRITICAL: Automatically recreates pool if it's closed or broken.
+        Hot path has no DB round trip: pool health is tracked passively
+        (connection errors in acquire() blocks + background SELECT 1 probe),
+        a broken pool is recreated here on the next call.
         """
-        # Check if pool exists and is healthy
-        if self._pool is not None:
-            try:
-                # Quick health check: try to acquire a connection
-                async with self._pool.acquire() as conn:
-                    await conn.fetchval("SELECT 1")
-                return self._pool
-            except (asyncpg.InterfaceError, asyncpg.PostgresConnectionError, asyncpg.OperationalError) as e:
-                # Pool is broken - close and recreate
-                from app.utils.correlation import correlation_tag
-                cid = correlation_tag()
-                logger.warning(f"{cid} [PG_STORAGE] Pool is broken, recreating due to: {e}")
-                try:
-                    await self._pool.close()
-                except Exception:
-                    pass
-                self._pool = None
-        
-        # Initialize lock on first call
-        if self._pool_lock is None:
-            import asyncio
-            self._pool_lock = asyncio.Lock()
-        
-        async with self._pool_lock:
-            # Double-check after acquiring lock
-            if self._pool is None:
-                self._pool = await asyncpg.create_pool(
-                    self.database_url,
-                    min_size=1,
-                    max_size=10,
-                    command_timeout=60,
-                    max_inactive_connection_lifetime=300  # CRITICAL: Close idle connections after 5min to prevent leaks
-                )
-                logger.info("[PG_STORAGE] ✅ Connection pool initialized (max_lifetime=300s)")
-        return self._pool
+        return await self._pool_manager.get()
+    
+    def pool_metrics(self) -> Dict[str, Any]:
+        """Pool saturation metrics for diagnostics."""
+        return self._pool_manager.metrics()
     
     async def _execute_with_retry(
         self,
@@ -90,14 +78,19 @@ class PostgresStorage(BaseStorage):
         """
         Execute database operation with retry for transient connection errors.
         
-        Retries on: InterfaceError, PostgresConnectionError, OperationalError
+        Retries on connection-class errors (InterfaceError, PostgresConnectionError,
+        ConnectionError/OSError); the pool is marked broken so the next attempt
+        gets a recreated one.
         """
         last_error = None
         for attempt in range(max_retries):
             try:
                 return await func()
-            except (asyncpg.InterfaceError, asyncpg.PostgresConnectionError, asyncpg.OperationalError) as e:
+            except CONNECTION_ERRORS as e:
+                if not is_connection_error(e):
+                    raise
                 last_error = e
+                self._pool_manager.mark_broken(self._pool_manager.pool, e)
                 # CRITICAL: Include correlation ID in error logs for traceability
                 from app.utils.correlation import correlation_tag
                 cid = correlation_tag()
@@ -137,63 +130,232 @@ class PostgresStorage(BaseStorage):
         
         return await self._execute_with_retry("is_update_processed", _check)
     
+    async def claim_update(self, update_id: int, worker_id: str = "unknown", update_type: str = "unknown") -> bool:
+        """
+        Atomically claim update_id for processing (one round trip).
+        
+        INSERT ... ON CONFLICT DO NOTHING RETURNING: the row is returned only
+        to the worker whose insert won, so two workers racing on the same
+        update_id cannot both get True (no advisory lock / pre-SELECT needed).
+        
+        Returns:
+            True if this worker claimed the update, False if already processed
+        """
+        async def _claim():
+            pool = await self._get_pool()
+            async with pool.acquire() as conn:
+                claimed = await conn.fetchval(
+                    """
+                    INSERT INTO processed_updates (update_id, worker_instance_id, update_type)
+                    VALUES ($1, $2, $3)
+                    ON CONFLICT (update_id) DO NOTHING
+                    RETURNING update_id
+                    """,
+                    update_id, worker_id, update_type
+                )
+                return claimed is not None
+        
+        return await self._execute_with_retry("claim_update", _claim)
+    
     async def mark_update_processed(self, update_id: int, worker_id: str = "unknown", update_type: str = "unknown") -> bool:
         """
         Mark update_id as processed (dedup insert).
         
-        CRITICAL: Uses advisory lock to prevent race condition when two workers
-        simultaneously try to process the same update_id.
-        
         Returns:
             True if successfully marked (this worker won the race), False if already existed
         """
-        pool = await self._get_pool()
-        async with pool.acquire() as conn:
-            try:
-                # Use advisory lock based on update_id to prevent race condition
-                # Lock key: use update_id as lock (PostgreSQL advisory locks are per-connection)
-                lock_key = abs(hash(f"update_{update_id}")) % (2**31)  # PostgreSQL int4 range
-                
-                # Try to acquire advisory lock (non-blocking)
-                lock_acquired = await conn.fetchval("SELECT pg_try_advisory_lock($1)", lock_key)
-                
-                if not lock_acquired:
-                    # Another worker is processing this update_id
-                    logger.debug(f"[DEDUP] Lock not acquired for update_id={update_id}, another worker processing")
-                    return False
-                
-                try:
-                    # Check if already processed (within lock)
-                    already_exists = await conn.fetchval(
-                        "SELECT 1 FROM processed_updates WHERE update_id = $1",
-                        update_id
-                    )
-                    
-                    if already_exists:
-                        logger.debug(f"[DEDUP] Update {update_id} already processed by another worker")
-                        return False
-                    
-                    # Insert (within lock)
-                    await conn.execute(
-                        """
-                        INSERT INTO processed_updates (update_id, worker_instance_id, update_type)
-                        VALUES ($1, $2, $3)
-                        """,
-                        update_id, worker_id, update_type
-                    )
-                    
-                    logger.debug(f"[DEDUP] Successfully marked update_id={update_id} as processed by {worker_id}")
-                    return True
-                    
-                finally:
-                    # Always release advisory lock
-                    await conn.execute("SELECT pg_advisory_unlock($1)", lock_key)
-                    
-            except Exception as e:
+        try:
+            claimed = await self.claim_update(update_id, worker_id=worker_id, update_type=update_type)
+        except Exception as e:
+            from app.utils.correlation import correlation_tag
+            cid = correlation_tag()
+            logger.warning(f"{cid} [DEDUP] Failed to mark update_id={update_id} as processed: {e}")
+            return False
+        if claimed:
+            logger.debug(f"[DEDUP] Successfully marked update_id={update_id} as processed by {worker_id}")
+        else:
+            logger.debug(f"[DEDUP] Update {update_id} already processed by another worker")
+        return claimed
+    
+    async def _execute_once(self, operation_name: str, func):
+        """
+        Execute a non-idempotent database operation without retry.
+        
+        A connection error after the statement was sent leaves it unknown
+        whether it committed, so it is not re-run; the pool is still marked
+        broken and the error propagates to the caller.
+        """
+        try:
+            return await func()
+        except CONNECTION_ERRORS as e:
+            if is_connection_error(e):
+                self._pool_manager.mark_broken(self._pool_manager.pool, e)
                 from app.utils.correlation import correlation_tag
-                cid = correlation_tag()
-                logger.warning(f"{cid} [DEDUP] Failed to mark update_id={update_id} as processed: {e}")
-                return False
+                logger.warning(f"{correlation_tag()} [DB] {operation_name} failed (not retried): {e}")
+            raise
+    
+    async def get_rate_limit_state(self, user_id: int) -> Optional[Tuple[float, float, float]]:
+        """
+        Read GCRA state for user_rate_limiter (migration 016).
+        
+        Returns:
+            (tat_minute, tat_hour, last_paid_at) or None if the user has no state
+        """
+        async def _get():
+            pool = await self._get_pool()
+            async with pool.acquire() as conn:
+                row = await conn.fetchrow(
+                    "SELECT tat_minute, tat_hour, last_paid_at FROM user_rate_limits WHERE user_id = $1",
+                    user_id
+                )
+                return (row["tat_minute"], row["tat_hour"], row["last_paid_at"]) if row else None
+        
+        return await self._execute_with_retry("get_rate_limit_state", _get)
+    
+    async def acquire_rate_limit(
+        self,
+        user_id: int,
+        minute_interval: float,
+        hour_interval: float,
+        minute_tolerance: float,
+        hour_tolerance: float,
+        cooldown_seconds: float,
+        is_paid: bool,
+    ) -> Tuple[bool, Tuple[float, float, float], float]:
+        """
+        Admit and record one generation in a single conditional upsert.
+        
+        The arrival times are advanced only when both are within their burst
+        tolerance (and the paid cooldown has passed), measured against the
+        database clock, so instances with skewed clocks or racing requests
+        can't admit more than the limit. Not retried: a retry after a lost
+        reply could advance the state twice.
+        
+        Returns:
+            (allowed, (tat_minute, tat_hour, last_paid_at), db_now); the state
+            is the advanced one when allowed, the current one when denied
+        """
+        async def _acquire():
+            pool = await self._get_pool()
+            async with pool.acquire() as conn:
+                row = await conn.fetchrow(
+                    f"""
+                    WITH advanced AS (
+                        INSERT INTO user_rate_limits AS r (user_id, tat_minute, tat_hour, last_paid_at, updated_at)
+                        VALUES ($1, {_DB_NOW} + $2::float8, {_DB_NOW} + $3::float8,
+                                CASE WHEN $6::boolean THEN {_DB_NOW} ELSE 0 END, NOW())
+                        ON CONFLICT (user_id) DO UPDATE SET
+                            tat_minute = GREATEST(r.tat_minute, {_DB_NOW}) + $2::float8,
+                            tat_hour = GREATEST(r.tat_hour, {_DB_NOW}) + $3::float8,
+                            last_paid_at = CASE WHEN $6::boolean THEN {_DB_NOW} ELSE r.last_paid_at END,
+                            updated_at = NOW()
+                        WHERE r.tat_minute - {_DB_NOW} <= $4::float8
+                          AND r.tat_hour - {_DB_NOW} <= $5::float8
+                          AND (NOT $6::boolean OR r.last_paid_at <= {_DB_NOW} - $7::float8)
+                        RETURNING tat_minute, tat_hour, last_paid_at
+                    )
+                    SELECT TRUE AS allowed, tat_minute, tat_hour, last_paid_at, {_DB_NOW} AS now
+                    FROM advanced
+                    UNION ALL
+                    SELECT FALSE, tat_minute, tat_hour, last_paid_at, {_DB_NOW}
+                    FROM user_rate_limits
+                    WHERE user_id = $1 AND NOT EXISTS (SELECT 1 FROM advanced)
+                    """,
+                    user_id, minute_interval, hour_interval, minute_tolerance, hour_tolerance, is_paid,
+                    cooldown_seconds
+                )
+                if row is None:
+                    # Denied row deleted by a concurrent eviction: report as denied, caller may retry
+                    now = await conn.fetchval(f"SELECT {_DB_NOW}")
+                    return False, (0.0, 0.0, 0.0), now
+                return row["allowed"], (row["tat_minute"], row["tat_hour"], row["last_paid_at"]), row["now"]
+        
+        return await self._execute_once("acquire_rate_limit", _acquire)
+    
+    async def advance_rate_limit(
+        self,
+        user_id: int,
+        now: float,
+        minute_interval: float,
+        hour_interval: float,
+        is_paid: bool,
+    ) -> Tuple[float, float, float]:
+        """
+        Record one generation unconditionally in the GCRA state (single atomic upsert).
+        
+        Concurrent generations of one user (several instances) serialize on
+        the row, so each advances the arrival times exactly once. Not retried
+        (see acquire_rate_limit).
+        
+        Returns:
+            New (tat_minute, tat_hour, last_paid_at)
+        """
+        async def _advance():
+            pool = await self._get_pool()
+            async with pool.acquire() as conn:
+                row = await conn.fetchrow(
+                    """
+                    INSERT INTO user_rate_limits AS r (user_id, tat_minute, tat_hour, last_paid_at, updated_at)
+                    VALUES ($1, $2::float8 + $3::float8, $2::float8 + $4::float8,
+                            CASE WHEN $5::boolean THEN $2::float8 ELSE 0 END, NOW())
+                    ON CONFLICT (user_id) DO UPDATE SET
+                        tat_minute = GREATEST(r.tat_minute, $2::float8) + $3::float8,
+                        tat_hour = GREATEST(r.tat_hour, $2::float8) + $4::float8,
+                        last_paid_at = CASE WHEN $5::boolean THEN $2::float8 ELSE r.last_paid_at END,
+                        updated_at = NOW()
+                    RETURNING tat_minute, tat_hour, last_paid_at
+                    """,
+                    user_id, now, minute_interval, hour_interval, is_paid
+                )
+                return (row["tat_minute"], row["tat_hour"], row["last_paid_at"])
+        
+        return await self._execute_once("advance_rate_limit", _advance)
+    
+    async def release_rate_limit(
+        self,
+        user_id: int,
+        minute_interval: float,
+        hour_interval: float,
+        is_paid: bool,
+        admitted_at: float,
+    ) -> None:
+        """
+        Give back one admitted generation (failed generation) in a single update.
+        
+        Both arrival times move back one interval; the paid cooldown is cleared
+        only while last_paid_at is still the one set by this admission. Not
+        retried (see acquire_rate_limit): a repeat would give back twice.
+        """
+        async def _release():
+            pool = await self._get_pool()
+            async with pool.acquire() as conn:
+                await conn.execute(
+                    """
+                    UPDATE user_rate_limits SET
+                        tat_minute = tat_minute - $2::float8,
+                        tat_hour = tat_hour - $3::float8,
+                        last_paid_at = CASE WHEN $4::boolean AND last_paid_at = $5::float8
+                                            THEN 0 ELSE last_paid_at END,
+                        updated_at = NOW()
+                    WHERE user_id = $1
+                    """,
+                    user_id, minute_interval, hour_interval, is_paid, admitted_at
+                )
+        
+        await self._execute_once("release_rate_limit", _release)
+    
+    async def evict_rate_limits(self, now: float, cooldown_seconds: float) -> int:
+        """Delete rate limit rows that no longer constrain anything. Returns rows deleted."""
+        async def _evict():
+            pool = await self._get_pool()
+            async with pool.acquire() as conn:
+                result = await conn.execute(
+                    "DELETE FROM user_rate_limits WHERE tat_hour <= $1::float8 AND last_paid_at <= $1::float8 - $2::float8",
+                    now, cooldown_seconds
+                )
+                return int(result.split()[-1]) if result else 0
+        
+        return await self._execute_with_retry("evict_rate_limits", _evict)
     
     async def async_test_connection(self) -> bool:
         """
@@ -841,7 +1003,248 @@ class PostgresStorage(BaseStorage):
                 """,
                 task_id, error
             )
-    
+
+    # ==================== KIE CALLBACK INBOX (migration 017) ====================
+
+    async def enqueue_kie_callback(self, task_id: str, payload: Any) -> int:
+        """Durably store a KIE callback for the inbox workers. Returns inbox row id."""
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            return await conn.fetchval(
+                "INSERT INTO kie_callback_inbox (task_id, payload) VALUES ($1, $2::jsonb) RETURNING id",
+                task_id, json.dumps(payload)
+            )
+
+    async def claim_kie_callbacks(self, worker_id: str, limit: int, lease_seconds: float) -> List[Dict[str, Any]]:
+        """
+        Claim ready inbox rows (FOR UPDATE SKIP LOCKED).
+
+        A row is ready when it is pending and due, or its processing lease
+        expired. Rows are skipped while an older row of the same task is still
+        pending/processing, so callbacks of one task apply in arrival order.
+        """
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            rows = await conn.fetch(
+                """
+                UPDATE kie_callback_inbox AS i
+                SET status = 'processing',
+                    attempts = i.attempts + 1,
+                    locked_by = $1,
+                    locked_until = NOW() + $3::float8 * INTERVAL '1 second'
+                WHERE i.id IN (
+                    SELECT c.id
+                    FROM kie_callback_inbox c
+                    WHERE (
+                            (c.status = 'pending' AND c.next_attempt_at <= NOW())
+                            OR (c.status = 'processing' AND c.locked_until < NOW())
+                          )
+                      AND NOT EXISTS (
+                            SELECT 1 FROM kie_callback_inbox e
+                            WHERE e.task_id = c.task_id
+                              AND e.id < c.id
+                              AND e.status IN ('pending', 'processing')
+                          )
+                    ORDER BY c.id
+                    LIMIT $2
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING i.id, i.task_id, i.payload, i.received_at, i.attempts
+                """,
+                worker_id, limit, lease_seconds
+            )
+            return [dict(row) for row in rows]
+
+    async def retry_kie_callback(
+        self, item_id: int, error: str, delay_seconds: float, *, worker_id: str, attempts: int
+    ) -> bool:
+        """
+        Release a claimed inbox row for another attempt after delay_seconds.
+
+        Only applies while this claim (worker_id, attempts) still holds the
+        row: after a lease expiry another worker may have re-claimed it.
+
+        Returns:
+            False if the claim was lost (row left untouched)
+        """
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            result = await conn.execute(
+                """
+                UPDATE kie_callback_inbox
+                SET status = 'pending',
+                    next_attempt_at = NOW() + $3::float8 * INTERVAL '1 second',
+                    locked_by = NULL,
+                    locked_until = NULL,
+                    last_error = $2
+                WHERE id = $1 AND status = 'processing' AND locked_by = $4 AND attempts = $5
+                """,
+                item_id, error, delay_seconds, worker_id, attempts
+            )
+            return result == "UPDATE 1"
+
+    async def finish_kie_callback(
+        self, item_id: int, status: str, error: Optional[str] = None, *, worker_id: str, attempts: int
+    ) -> bool:
+        """
+        Mark a claimed inbox row as done or failed (same claim check as retry_kie_callback).
+
+        Returns:
+            False if the claim was lost (row left untouched)
+        """
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            result = await conn.execute(
+                """
+                UPDATE kie_callback_inbox
+                SET status = $2, processed_at = NOW(), locked_by = NULL, locked_until = NULL,
+                    last_error = COALESCE($3, last_error)
+                WHERE id = $1 AND status = 'processing' AND locked_by = $4 AND attempts = $5
+                """,
+                item_id, status, error, worker_id, attempts
+            )
+            return result == "UPDATE 1"
+
+    async def cleanup_kie_callback_inbox(self, keep_days: int = 7) -> int:
+        """Delete finished inbox rows older than keep_days. Returns rows deleted."""
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            result = await conn.execute(
+                """
+                DELETE FROM kie_callback_inbox
+                WHERE status IN ('done', 'failed')
+                  AND processed_at < NOW() - $1::int * INTERVAL '1 day'
+                """,
+                keep_days
+            )
+            return int(result.split()[-1]) if result else 0
+
+    # ==================== UPDATE HANDOVER (migration 018) ====================
+
+    async def stash_handover_updates(self, instance_id: str, updates: List[Tuple[int, bytes]]) -> int:
+        """Store queued (update_id, raw body) pairs for the next ACTIVE instance. One round trip."""
+        if not updates:
+            return 0
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            await conn.execute(
+                """
+                INSERT INTO update_handover (update_id, payload, from_instance)
+                SELECT u.update_id, u.payload, $3
+                FROM unnest($1::bigint[], $2::bytea[]) AS u(update_id, payload)
+                """,
+                [update_id for update_id, _ in updates],
+                [payload for _, payload in updates],
+                instance_id
+            )
+        return len(updates)
+
+    async def claim_handover_updates(self, max_age_seconds: float) -> List[Tuple[int, bytes]]:
+        """
+        Take all handed-over updates (DELETE ... RETURNING, oldest first).
+
+        Rows older than max_age_seconds are deleted without being returned.
+        """
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            rows = await conn.fetch(
+                """
+                DELETE FROM update_handover
+                RETURNING id, update_id, payload,
+                          created_at >= NOW() - $1::float8 * INTERVAL '1 second' AS fresh
+                """,
+                max_age_seconds
+            )
+        rows = sorted(rows, key=lambda row: row["id"])
+        return [(row["update_id"], bytes(row["payload"])) for row in rows if row["fresh"]]
+
+    # ==================== SCALE-OUT SHARDS (migration 019) ====================
+
+    async def forward_updates(self, updates: List[Tuple[int, int, bytes]], channel: str) -> int:
+        """
+        Queue (shard, update_id, raw body) for the replica owning the shard.
+
+        One statement: INSERT plus pg_notify(channel, shard) per distinct shard
+        (sent on commit, so the owner never sees the notification before the rows).
+        """
+        if not updates:
+            return 0
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            await conn.execute(
+                """
+                WITH ins AS (
+                    INSERT INTO update_forward (shard, update_id, payload)
+                    SELECT u.shard, u.update_id, u.payload
+                    FROM unnest($1::int[], $2::bigint[], $3::bytea[]) AS u(shard, update_id, payload)
+                    RETURNING shard
+                )
+                SELECT pg_notify($4, s.shard::text) FROM (SELECT DISTINCT shard FROM ins) AS s
+                """,
+                [shard for shard, _, _ in updates],
+                [update_id for _, update_id, _ in updates],
+                [payload for _, _, payload in updates],
+                channel
+            )
+        return len(updates)
+
+    async def claim_forwarded_updates(self, shards: List[int], limit: int) -> List[Tuple[int, bytes]]:
+        """Take forwarded updates of the given shards, oldest first (FOR UPDATE SKIP LOCKED)."""
+        if not shards:
+            return []
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            rows = await conn.fetch(
+                """
+                DELETE FROM update_forward
+                WHERE id IN (
+                    SELECT id FROM update_forward
+                    WHERE shard = ANY($1::int[])
+                    ORDER BY id
+                    LIMIT $2
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, update_id, payload
+                """,
+                shards, limit
+            )
+        rows = sorted(rows, key=lambda row: row["id"])
+        return [(row["update_id"], bytes(row["payload"])) for row in rows]
+
+    async def scaleout_heartbeat(self, instance_id: str, shards: List[int], ttl_seconds: float) -> List[str]:
+        """Refresh this replica's membership row; returns live replica ids (sorted)."""
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    """
+                    INSERT INTO scaleout_members (instance_id, shards, heartbeat_at)
+                    VALUES ($1, $2::int[], NOW())
+                    ON CONFLICT (instance_id) DO UPDATE
+                    SET shards = EXCLUDED.shards, heartbeat_at = NOW()
+                    """,
+                    instance_id, shards
+                )
+                await conn.execute(
+                    "DELETE FROM scaleout_members WHERE heartbeat_at < NOW() - $1::float8 * INTERVAL '1 second'",
+                    ttl_seconds * 3
+                )
+                rows = await conn.fetch(
+                    """
+                    SELECT instance_id FROM scaleout_members
+                    WHERE heartbeat_at >= NOW() - $1::float8 * INTERVAL '1 second'
+                    ORDER BY instance_id
+                    """,
+                    ttl_seconds
+                )
+        return [row["instance_id"] for row in rows]
+
+    async def scaleout_leave(self, instance_id: str) -> None:
+        """Remove this replica from scale-out membership."""
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            await conn.execute("DELETE FROM scaleout_members WHERE instance_id = $1", instance_id)
+
     async def list_jobs(
         self,
         user_id: Optional[int] = None,
@@ -1511,9 +1914,7 @@ class PostgresStorage(BaseStorage):
     
     async def close(self) -> None:
         """Закрыть соединения"""
-        if self._pool:
-            await self._pool.close()
-            self._pool = None
+        await self._pool_manager.close()
 
 
 # Алиасы для обратной совместимости
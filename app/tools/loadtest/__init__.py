@@ -0,0 +1,20 @@
+"""
+End-to-end load-test harness: webhook → update queue → handlers →
+KIE createTask → callback → delivery, against local fake Telegram/KIE
+servers.
+
+    python -m app.tools.loadtest --rate 50 --duration 60 --mix menu=70,generation=20,callback=10
+"""
+
+from app.tools.loadtest.fakes import FakeKieServer, FakeTelegramServer, TelegramCall
+from app.tools.loadtest.runner import LatencySamples, LoadConfig, parse_mix, run_load_test
+
+__all__ = [
+    "FakeKieServer",
+    "FakeTelegramServer",
+    "TelegramCall",
+    "LatencySamples",
+    "LoadConfig",
+    "parse_mix",
+    "run_load_test",
+]
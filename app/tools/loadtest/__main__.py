@@ -0,0 +1,110 @@
+"""
+CLI for the load-test harness.
+
+    python -m app.tools.loadtest --rate 50 --duration 60
+    python -m app.tools.loadtest --database-url postgresql://... --json report.json --max-ack-p99-ms 50
+
+Exit code 1 when a --max-* threshold is exceeded (for pre-deploy runs).
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+from typing import Any, Dict, List
+
+from app.tools.loadtest.runner import DEFAULT_MENU_CALLBACKS, LoadConfig, parse_mix, run_load_test
+
+
+def _print_report(report: Dict[str, Any]) -> None:
+    print("=" * 72)
+    print(f"LOAD TEST  rate={report['config']['rate']}/s  duration={report['config']['duration']}s  "
+          f"storage={report['config']['storage']}  model={report['config']['model_id']}")
+    print(f"achieved session rate: {report['achieved_session_rate']}/s  elapsed: {report['elapsed_seconds']}s")
+    print("-" * 72)
+    print(f"{'latency (ms)':<28}{'count':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for name, row in report["latency_ms"].items():
+        print(f"{name:<28}{row['count']:>8}{row.get('p50', '-'):>10}{row.get('p95', '-'):>10}"
+              f"{row.get('p99', '-'):>10}{row.get('max', '-'):>10}")
+    for name, row in report["delivery_seconds"].items():
+        print(f"{name + ' (s)':<28}{row['count']:>8}{row.get('p50', '-'):>10}{row.get('p95', '-'):>10}"
+              f"{row.get('p99', '-'):>10}{row.get('max', '-'):>10}")
+    print("-" * 72)
+    queue = report["queue"]
+    depth = queue["depth"]
+    print(f"queue depth: p95={depth.get('p95', 0)} max={depth.get('max', 0)}  enqueued={queue['updates_enqueued']}  "
+          f"not_enqueued={queue['updates_not_enqueued']}  dropped={queue['dropped']}  errors={queue['errors']}")
+    if "db" in report:
+        db = report["db"]
+        print(f"db round trips: {db['round_trips']} ({db['round_trips_per_update']}/update, {db['source']})")
+    print(f"counts: {report['counts']}")
+    print(f"telegram calls: {report['telegram_calls']}")
+    print(f"kie: {report['kie']}")
+    print("=" * 72)
+
+
+def _check_thresholds(report: Dict[str, Any], args: argparse.Namespace) -> List[str]:
+    failures = []
+    ack = report["latency_ms"].get("webhook_ack", {})
+    if args.max_ack_p99_ms is not None and ack.get("p99", 0) > args.max_ack_p99_ms:
+        failures.append(f"webhook_ack p99 {ack['p99']}ms > {args.max_ack_p99_ms}ms")
+    delivery = report["delivery_seconds"].get("delivery", {})
+    if args.max_delivery_p95_s is not None and delivery.get("p95", 0) > args.max_delivery_p95_s:
+        failures.append(f"delivery p95 {delivery['p95']}s > {args.max_delivery_p95_s}s")
+    timeouts = sum(v for k, v in report["counts"].items() if k.endswith("timeouts"))
+    if args.max_timeouts is not None and timeouts > args.max_timeouts:
+        failures.append(f"{timeouts} timeouts > {args.max_timeouts}")
+    return failures
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description="Webhook → generation → delivery load test")
+    parser.add_argument("--rate", type=float, default=20.0, help="Sessions per second (Poisson arrivals)")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of arrivals")
+    parser.add_argument("--mix", default="menu=70,generation=20,callback=10",
+                        help="Session weights: start, menu, generation, callback")
+    parser.add_argument("--database-url", default="", help="Postgres to run against (default: JSON storage in a temp dir)")
+    parser.add_argument("--model", default="", help="Model for generation sessions (default: first free model)")
+    parser.add_argument("--menu-callbacks", default=",".join(DEFAULT_MENU_CALLBACKS))
+    parser.add_argument("--telegram-latency", type=float, default=0.0, help="Fake Bot API latency, seconds")
+    parser.add_argument("--kie-latency", type=float, default=0.0, help="Fake KIE createTask latency, seconds")
+    parser.add_argument("--kie-seconds", type=float, default=1.0, help="Fake KIE task duration, seconds")
+    parser.add_argument("--source-ips", type=int, default=64,
+                        help="X-Forwarded-For addresses to spread webhooks over (the webhook limits 5 req/s per IP)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", dest="json_path", default="", help="Write the report as JSON to this path")
+    parser.add_argument("--max-ack-p99-ms", type=float, default=None)
+    parser.add_argument("--max-delivery-p95-s", type=float, default=None)
+    parser.add_argument("--max-timeouts", type=int, default=None)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    config = LoadConfig(
+        rate=args.rate,
+        duration=args.duration,
+        mix=parse_mix(args.mix),
+        database_url=args.database_url,
+        model_id=args.model,
+        menu_callbacks=tuple(c for c in args.menu_callbacks.split(",") if c),
+        telegram_latency=args.telegram_latency,
+        kie_latency=args.kie_latency,
+        kie_task_seconds=args.kie_seconds,
+        source_ips=args.source_ips,
+        seed=args.seed,
+    )
+    report = await run_load_test(config)
+    _print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    failures = _check_thresholds(report, args)
+    for failure in failures:
+        print(f"❌ {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,235 @@
+"""
+Local fake Telegram Bot API and KIE servers for load tests.
+
+Both are plain aiohttp apps on 127.0.0.1 with an optional artificial
+latency; they answer with the smallest payloads aiogram / KieApiClientV4
+accept and report every call to a listener, so the harness can measure
+time-to-response and time-to-delivery per chat.
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+from aiohttp import ClientSession, ClientTimeout, web
+
+logger = logging.getLogger(__name__)
+
+# Result URLs produced by the fake KIE; deliveries are detected by this marker
+RESULT_URL_MARKER = "loadtest-result"
+
+
+@dataclass
+class TelegramCall:
+    method: str
+    chat_id: Optional[int]
+    text: str
+    callback_data: List[str]
+    at: float
+
+
+async def _start_site(app: web.Application, host: str, port: int):
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host=host, port=port)
+    await site.start()
+    bound_port = runner.addresses[0][1]
+    return runner, f"http://{host}:{bound_port}"
+
+
+def _callback_data(reply_markup: Any) -> List[str]:
+    if isinstance(reply_markup, str):
+        try:
+            reply_markup = json.loads(reply_markup)
+        except ValueError:
+            return []
+    if not isinstance(reply_markup, dict):
+        return []
+    return [
+        button["callback_data"]
+        for row in reply_markup.get("inline_keyboard") or []
+        for button in row
+        if isinstance(button, dict) and button.get("callback_data")
+    ]
+
+
+class FakeTelegramServer:
+    """Bot API stand-in: /bot{token}/{method}."""
+
+    def __init__(self, latency: float = 0.0, on_call: Optional[Callable[[TelegramCall], None]] = None):
+        self.latency = latency
+        self.on_call = on_call
+        self.calls_by_method: Dict[str, int] = {}
+        self._message_ids = itertools.count(1000)
+        self._runner: Optional[web.AppRunner] = None
+        self.base_url = ""
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_route("*", "/bot{token}/{method}", self._handle)
+        self._runner, self.base_url = await _start_site(app, host, port)
+        return self.base_url
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _fields(self, request: web.Request) -> Dict[str, Any]:
+        if request.content_type == "application/json":
+            try:
+                return await request.json()
+            except ValueError:
+                return {}
+        form = await request.post()
+        return {key: value for key, value in form.items() if isinstance(value, str)}
+
+    def _message(self, chat_id: Optional[int], text: str) -> Dict[str, Any]:
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id or 0, "type": "private"},
+            "text": text[:4096] or "ok",
+        }
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        fields = await self._fields(request)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        chat_id: Optional[int] = None
+        try:
+            chat_id = int(fields["chat_id"]) if fields.get("chat_id") is not None else None
+        except (TypeError, ValueError):
+            pass
+        text = " ".join(
+            str(fields.get(key) or "") for key in ("text", "caption", "photo", "video", "audio", "document", "media")
+        ).strip()
+
+        self.calls_by_method[method] = self.calls_by_method.get(method, 0) + 1
+        if self.on_call is not None:
+            self.on_call(TelegramCall(method, chat_id, text, _callback_data(fields.get("reply_markup")), time.monotonic()))
+
+        lowered = method.lower()
+        if lowered == "getme":
+            result: Any = {"id": 1, "is_bot": True, "first_name": "LoadTest", "username": "loadtest_bot"}
+        elif lowered == "getwebhookinfo":
+            result = {"url": "", "has_custom_certificate": False, "pending_update_count": 0}
+        elif lowered == "sendmediagroup":
+            result = [self._message(chat_id, text)]
+        elif lowered.startswith(("send", "edit", "copy", "forward")) and chat_id is not None:
+            result = self._message(chat_id, text)
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+
+class FakeKieServer:
+    """
+    KIE API stand-in.
+
+    Any POST creates a task and, when the body has callBackUrl, posts a
+    success callback after task_seconds; recordInfo reports waiting/success
+    on the same schedule (polling fallback).
+
+    callback_origin replaces scheme://host:port of callBackUrl: the bot
+    advertises a public-looking base URL (local URLs are rejected by the
+    callback URL validation) and the fake delivers to the local app.
+    """
+
+    def __init__(self, latency: float = 0.0, task_seconds: float = 1.0, send_callbacks: bool = True,
+                 callback_origin: str = ""):
+        self.latency = latency
+        self.task_seconds = task_seconds
+        self.send_callbacks = send_callbacks
+        self.callback_origin = callback_origin.rstrip("/")
+        self.tasks: Dict[str, float] = {}  # task_id -> ready_at (monotonic)
+        self.created = 0
+        self.callbacks_sent = 0
+        self.callback_errors = 0
+        self._ids = itertools.count(1)
+        self._runner: Optional[web.AppRunner] = None
+        self._session: Optional[ClientSession] = None
+        self._pending: set = set()
+        self.base_url = ""
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application()
+        app.router.add_get("/api/v1/jobs/recordInfo", self._record_info)
+        app.router.add_post("/{tail:.*}", self._create_task)
+        self._session = ClientSession(timeout=ClientTimeout(total=30))
+        self._runner, self.base_url = await _start_site(app, host, port)
+        return self.base_url
+
+    async def stop(self) -> None:
+        for task in list(self._pending):
+            task.cancel()
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def result_url(self, task_id: str) -> str:
+        return f"https://example.com/{RESULT_URL_MARKER}/{task_id}.png"
+
+    def record(self, task_id: str) -> Dict[str, Any]:
+        ready_at = self.tasks.get(task_id)
+        if ready_at is None or time.monotonic() < ready_at:
+            return {"taskId": task_id, "state": "waiting", "status": "PENDING"}
+        # state/resultJson for the jobs API, status/output for ZImageClient
+        return {
+            "taskId": task_id,
+            "state": "success",
+            "resultJson": json.dumps({"resultUrls": [self.result_url(task_id)]}),
+            "status": "SUCCESS",
+            "output": {"image_url": self.result_url(task_id)},
+        }
+
+    async def _create_task(self, request: web.Request) -> web.Response:
+        try:
+            body = await request.json()
+        except ValueError:
+            body = {}
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        task_id = f"lt_{next(self._ids)}"
+        self.tasks[task_id] = time.monotonic() + self.task_seconds
+        self.created += 1
+        callback_url = body.get("callBackUrl") if isinstance(body, dict) else None
+        if self.send_callbacks and callback_url:
+            task = asyncio.create_task(self._send_callback(task_id, callback_url))
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+        return web.json_response({"code": 200, "msg": "success", "data": {"taskId": task_id}})
+
+    async def _record_info(self, request: web.Request) -> web.Response:
+        task_id = request.query.get("taskId", "")
+        return web.json_response({"code": 200, "msg": "success", "data": self.record(task_id)})
+
+    def _callback_target(self, url: str) -> str:
+        if not self.callback_origin:
+            return url
+        parsed = urlsplit(url)
+        return urlunsplit(urlsplit(self.callback_origin)[:2] + parsed[2:])
+
+    async def _send_callback(self, task_id: str, url: str) -> None:
+        url = self._callback_target(url)
+        await asyncio.sleep(self.task_seconds)
+        try:
+            async with self._session.post(url, json={"code": 200, "data": self.record(task_id)}) as resp:
+                await resp.read()
+            self.callbacks_sent += 1
+        except Exception as e:
+            self.callback_errors += 1
+            logger.debug(f"[LOADTEST] Callback for {task_id} failed: {e}")
+
+    def recent_task_ids(self, limit: int = 100) -> List[str]:
+        return list(self.tasks)[-limit:]
@@ -0,0 +1,580 @@
+"""
+Load-test runner: boots the main_render web app against fake Telegram/KIE
+servers and replays a mix of user sessions at a target rate.
+
+Sessions (open-loop Poisson arrivals, one fresh user each):
+- start:      /start, wait for the bot's reply
+- menu:       one menu button click, wait for the reply
+- generation: gen:<model> → prompt → (skip optional) → confirm, wait for
+              the result URL to be sent (fake KIE completes the task and
+              posts the callback)
+- callback:   a KIE progress callback for a recent task (ack only)
+
+Reported: p50/p95/p99 webhook and callback ack latency, reply latency per
+session kind, time-to-delivery, queue depth samples and DB round trips per
+update (pg_stat_statements calls, else pg_stat_database transactions).
+"""
+
+import asyncio
+import itertools
+import logging
+import math
+import os
+import random
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+
+from app.tools.loadtest.fakes import RESULT_URL_MARKER, FakeKieServer, FakeTelegramServer, TelegramCall
+from app.tools.mock_updates import MockUpdateBuilder
+
+logger = logging.getLogger(__name__)
+
+SESSION_KINDS = ("start", "menu", "generation", "callback")
+
+DEFAULT_MENU_CALLBACKS: Tuple[str, ...] = (
+    "main_menu",
+    "menu:generate",
+    "menu:all_categories",
+    "menu:free",
+    "menu:top",
+    "menu:help",
+    "menu:balance",
+)
+
+PUBLIC_BASE_URL = "https://bot.loadtest.invalid"
+
+# Telegram webhook egress range; requests are spread over source_ips addresses
+_TELEGRAM_IP_PREFIX = "149.154.167."
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    """'menu=70,generation=20,callback=10' -> normalized weights."""
+    weights: Dict[str, float] = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        name, _, value = part.partition("=")
+        name = name.strip()
+        if name not in SESSION_KINDS:
+            raise ValueError(f"Unknown session kind {name!r} (expected one of {', '.join(SESSION_KINDS)})")
+        weights[name] = float(value or 1)
+    total = sum(weights.values())
+    if total <= 0:
+        raise ValueError("Mix weights must be positive")
+    return {name: weight / total for name, weight in weights.items()}
+
+
+class LatencySamples:
+    """Raw samples (seconds) with nearest-rank percentiles."""
+
+    def __init__(self) -> None:
+        self.values: List[float] = []
+
+    def add(self, value: float) -> None:
+        self.values.append(value)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.values:
+            return None
+        ordered = sorted(self.values)
+        rank = max(0, min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1))
+        return ordered[rank]
+
+    def summary(self, scale: float = 1000.0) -> Dict[str, Any]:
+        """Count and p50/p95/p99/max (milliseconds by default)."""
+        if not self.values:
+            return {"count": 0}
+        return {
+            "count": len(self.values),
+            "p50": round(self.percentile(0.50) * scale, 2),
+            "p95": round(self.percentile(0.95) * scale, 2),
+            "p99": round(self.percentile(0.99) * scale, 2),
+            "max": round(max(self.values) * scale, 2),
+        }
+
+
+@dataclass
+class LoadConfig:
+    rate: float = 20.0  # sessions per second
+    duration: float = 30.0  # seconds of arrivals
+    mix: Dict[str, float] = field(default_factory=lambda: {"menu": 0.7, "generation": 0.2, "callback": 0.1})
+    database_url: str = ""  # empty: JSON storage in a temp dir
+    model_id: str = ""  # generation model (default: first free prompt-only model)
+    menu_callbacks: Tuple[str, ...] = DEFAULT_MENU_CALLBACKS
+    telegram_latency: float = 0.0
+    kie_latency: float = 0.0
+    kie_task_seconds: float = 1.0
+    reply_timeout: float = 10.0
+    delivery_timeout: float = 60.0
+    max_inflight: int = 2000
+    source_ips: int = 64
+    seed: int = 1
+    drain_timeout: float = 60.0
+
+
+class ChatTracker:
+    """Matches outbound Telegram calls to waiting sessions (per chat)."""
+
+    def __init__(self) -> None:
+        self._waiters: Dict[int, List[Tuple[Callable[[TelegramCall], bool], asyncio.Future]]] = {}
+        self.last_buttons: Dict[int, List[str]] = {}
+
+    def on_call(self, call: TelegramCall) -> None:
+        if call.chat_id is None:
+            return
+        if call.method.startswith(("send", "edit")) and call.method != "sendChatAction":
+            self.last_buttons[call.chat_id] = call.callback_data
+        waiters = self._waiters.get(call.chat_id)
+        if not waiters:
+            return
+        for entry in list(waiters):
+            predicate, future = entry
+            if not future.done() and predicate(call):
+                future.set_result(call.at)
+                waiters.remove(entry)
+
+    def expect(self, chat_id: int, predicate: Callable[[TelegramCall], bool]) -> asyncio.Future:
+        """Register before sending the update so a fast reply is not missed."""
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(chat_id, []).append((predicate, future))
+        return future
+
+    async def wait(self, chat_id: int, future: asyncio.Future, timeout: float) -> Optional[float]:
+        try:
+            return await asyncio.wait_for(future, timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            waiters = self._waiters.get(chat_id)
+            if waiters is not None:
+                self._waiters[chat_id] = [entry for entry in waiters if entry[1] is not future]
+                if not self._waiters[chat_id]:
+                    del self._waiters[chat_id]
+
+    def forget(self, chat_id: int) -> None:
+        self.last_buttons.pop(chat_id, None)
+
+
+def _is_reply(call: TelegramCall) -> bool:
+    return True
+
+
+def _is_delivery(call: TelegramCall) -> bool:
+    return RESULT_URL_MARKER in call.text
+
+
+def pick_generation_model() -> Optional[str]:
+    """z-image when it is free (the main free entry point), else the first free model."""
+    from app.kie.catalog import get_catalog
+
+    model_ids = [model.get("model_id") for model in get_catalog().free_models if model.get("model_id")]
+    for model_id in model_ids:
+        if model_id.lower().replace("-", "").replace("_", "") == "zimage":
+            return model_id
+    return model_ids[0] if model_ids else None
+
+
+def _submit_button(buttons: List[str]) -> Optional[str]:
+    """Button that starts the generation: flow confirm or the z-image ratio choice."""
+    for data in buttons:
+        if data == "confirm" or data.startswith("zimage:ratio:"):
+            return data
+    return None
+
+
+class PipelineStack:
+    """main_render web app + update queue wired to fake Telegram/KIE servers."""
+
+    def __init__(self, config: LoadConfig, tracker: ChatTracker):
+        self.config = config
+        self.tracker = tracker
+        self.telegram = FakeTelegramServer(latency=config.telegram_latency, on_call=tracker.on_call)
+        self.kie = FakeKieServer(latency=config.kie_latency, task_seconds=config.kie_task_seconds)
+        self.app_url = ""
+        self.webhook_url = ""
+        self.callback_url = ""
+        self.webhook_headers: Dict[str, str] = {}
+        self._runner = None
+        self._bot = None
+        self._data_dir: Optional[tempfile.TemporaryDirectory] = None
+
+    async def start(self) -> None:
+        app_port = _free_port()
+        self.app_url = f"http://127.0.0.1:{app_port}"
+        self.kie.callback_origin = self.app_url
+        telegram_url = await self.telegram.start()
+        kie_url = await self.kie.start()
+
+        # Environment must be in place before main_render (and its config helpers) are imported
+        os.environ.update({
+            "TELEGRAM_BOT_TOKEN": os.getenv("LOADTEST_BOT_TOKEN", "123456789:LOADTEST-loadtest-loadtest-loadtest"),
+            "BOT_MODE": "webhook",
+            # Public-looking base: local callback URLs are rejected, FakeKieServer maps it back
+            "WEBHOOK_BASE_URL": PUBLIC_BASE_URL,
+            "KIE_API_URL": kie_url,
+            "KIE_API_KEY": "loadtest",
+            "KIE_CALLBACK_TOKEN": "",
+            "DRY_RUN": "0",
+            "TEST_MODE": "false",
+            "KIE_STUB": "false",
+        })
+        if self.config.database_url:
+            os.environ["DATABASE_URL"] = self.config.database_url
+            os.environ["STORAGE_MODE"] = "postgres"
+        else:
+            self._data_dir = tempfile.TemporaryDirectory(prefix="loadtest_")
+            os.environ.pop("DATABASE_URL", None)
+            os.environ["STORAGE_MODE"] = "json"
+            os.environ["DATA_DIR"] = self._data_dir.name
+
+        import main_render
+        from aiogram.client.telegram import TelegramAPIServer
+        from app.locking.active_state import ActiveState
+        from app.utils.runtime_state import runtime_state
+        from app.utils.update_queue import get_queue_manager
+
+        cfg = main_render._load_runtime_config()
+        dp, bot = main_render.create_bot_application()
+        bot.session.api = TelegramAPIServer.from_base(telegram_url)
+        self._bot = bot
+
+        if self.config.database_url:
+            from app.storage.migrations import apply_migrations_safe
+            runtime_state.db_schema_ready = await apply_migrations_safe(self.config.database_url)
+            from app.kie.callback_inbox import start_callback_inbox
+            from app.storage import get_storage
+            await start_callback_inbox(get_storage(), bot)
+        else:
+            runtime_state.db_schema_ready = True
+
+        active_state = ActiveState(active=True)
+        queue_manager = get_queue_manager()
+        queue_manager.configure(dp, bot, active_state)
+        await queue_manager.start()
+
+        app = main_render._make_web_app(dp=dp, bot=bot, cfg=cfg, active_state=active_state)
+        self._runner = await main_render._start_web_server(app, app_port)
+
+        self.webhook_url = f"{self.app_url}/webhook/{cfg.webhook_secret_path}"
+        self.callback_url = f"{self.app_url}/{cfg.kie_callback_path.lstrip('/')}"
+        if cfg.webhook_secret_token:
+            self.webhook_headers["X-Telegram-Bot-Api-Secret-Token"] = cfg.webhook_secret_token
+
+    async def stop(self) -> None:
+        from app.utils.update_queue import get_queue_manager
+
+        try:
+            from app.kie.callback_inbox import stop_callback_inbox
+            await stop_callback_inbox()
+        except Exception as e:
+            logger.debug(f"[LOADTEST] Callback inbox stop failed: {e}")
+        await get_queue_manager().stop()
+        if self._runner is not None:
+            await self._runner.cleanup()
+        if self._bot is not None:
+            await self._bot.session.close()
+        try:
+            from app.kie.http_transport import close_kie_transport
+            await close_kie_transport()
+        except Exception:
+            pass
+        await self.kie.stop()
+        await self.telegram.stop()
+        if self._data_dir is not None:
+            self._data_dir.cleanup()
+
+
+def _free_port() -> int:
+    import socket
+
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class DbRoundTripCounter:
+    """Server-side statement (or transaction) counter for the test database."""
+
+    def __init__(self, database_url: str):
+        self.database_url = database_url
+        self.source = ""
+        self._start: Optional[float] = None
+
+    async def _read(self) -> Optional[float]:
+        import asyncpg
+
+        conn = await asyncpg.connect(self.database_url)
+        try:
+            try:
+                value = await conn.fetchval("SELECT COALESCE(sum(calls), 0) FROM pg_stat_statements")
+                self.source = "pg_stat_statements.calls"
+            except Exception:
+                value = await conn.fetchval(
+                    "SELECT xact_commit + xact_rollback FROM pg_stat_database WHERE datname = current_database()"
+                )
+                self.source = "pg_stat_database.xact"
+            return float(value or 0)
+        finally:
+            await conn.close()
+
+    async def begin(self) -> None:
+        try:
+            self._start = await self._read()
+        except Exception as e:
+            logger.warning(f"[LOADTEST] DB counters unavailable: {e}")
+            self._start = None
+
+    async def end(self) -> Optional[float]:
+        if self._start is None:
+            return None
+        # Backends report statistics asynchronously (~1s)
+        await asyncio.sleep(1.5)
+        try:
+            # Minus this counter's own probe
+            return max(0.0, await self._read() - self._start - 1)
+        except Exception as e:
+            logger.warning(f"[LOADTEST] DB counters unavailable: {e}")
+            return None
+
+
+class LoadRunner:
+    """Replays sessions against a started PipelineStack and collects results."""
+
+    def __init__(self, config: LoadConfig, stack: PipelineStack, tracker: ChatTracker):
+        self.config = config
+        self.stack = stack
+        self.tracker = tracker
+        self.random = random.Random(config.seed)
+        self.latencies: Dict[str, LatencySamples] = {}
+        self.counts: Dict[str, int] = {}
+        self.queue_depths: List[int] = []
+        self._user_ids = itertools.count(700_000_000)
+        self._update_ids = itertools.count(1)
+        self._session: Optional[ClientSession] = None
+        self._inflight = 0
+        self.model_id = config.model_id
+
+    MAX_INPUT_STEPS = 8
+
+    def _sample(self, name: str, value: float) -> None:
+        self.latencies.setdefault(name, LatencySamples()).add(value)
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        self.counts[name] = self.counts.get(name, 0) + amount
+
+    async def _post_update(self, user_id: int, update: Dict[str, Any]) -> None:
+        headers = dict(self.stack.webhook_headers)
+        headers["X-Forwarded-For"] = f"{_TELEGRAM_IP_PREFIX}{user_id % max(1, self.config.source_ips) + 1}"
+        started = time.monotonic()
+        async with self._session.post(self.stack.webhook_url, json=update, headers=headers) as resp:
+            await resp.read()
+            status = resp.status
+        self._sample("webhook_ack", time.monotonic() - started)
+        self._count("updates_sent")
+        if status != 200:
+            self._count(f"webhook_http_{status}")
+
+    async def _step(self, kind: str, user_id: int, update: Dict[str, Any], predicate=_is_reply,
+                    timeout: Optional[float] = None) -> Optional[float]:
+        """Send one update and wait for the matching Telegram call; returns its latency."""
+        future = self.tracker.expect(user_id, predicate)
+        started = time.monotonic()
+        await self._post_update(user_id, update)
+        replied_at = await self.tracker.wait(user_id, future, timeout or self.config.reply_timeout)
+        if replied_at is None:
+            self._count(f"{kind}_timeouts")
+            return None
+        latency = replied_at - started
+        self._sample(f"reply:{kind}", latency)
+        return latency
+
+    def _message(self, user_id: int, text: str) -> Dict[str, Any]:
+        return MockUpdateBuilder.text_message(user_id, text, update_id=next(self._update_ids)).to_dict()
+
+    def _click(self, user_id: int, data: str) -> Dict[str, Any]:
+        return MockUpdateBuilder.callback_query(user_id, data, update_id=next(self._update_ids)).to_dict()
+
+    async def _start_session(self, user_id: int) -> None:
+        await self._step("start", user_id, self._message(user_id, "/start"))
+
+    async def _menu_session(self, user_id: int) -> None:
+        data = self.random.choice(self.config.menu_callbacks)
+        await self._step("menu", user_id, self._click(user_id, data))
+
+    async def _generation_session(self, user_id: int) -> None:
+        if not self.model_id:
+            self._count("generation_skipped_no_model")
+            return
+        started = time.monotonic()
+        if await self._step("generation", user_id, self._click(user_id, f"gen:{self.model_id}")) is None:
+            return
+        # Answer whatever the flow asks until the submit button shows up
+        for _ in range(self.MAX_INPUT_STEPS):
+            buttons = self.tracker.last_buttons.get(user_id, [])
+            submit = _submit_button(buttons)
+            if submit:
+                break
+            if "opt_skip_all" in buttons:
+                update = self._click(user_id, "opt_skip_all")
+            else:
+                update = self._message(user_id, "load test: a red fox in the snow")
+            if await self._step("generation", user_id, update) is None:
+                return
+        else:
+            self._count("generation_no_submit")
+            return
+        confirm_at = time.monotonic()
+        future = self.tracker.expect(user_id, _is_delivery)
+        await self._post_update(user_id, self._click(user_id, submit))
+        delivered_at = await self.tracker.wait(user_id, future, self.config.delivery_timeout)
+        if delivered_at is None:
+            self._count("delivery_timeouts")
+            return
+        self._count("deliveries")
+        self._sample("delivery", delivered_at - confirm_at)
+        self._sample("generation_total", delivered_at - started)
+
+    async def _callback_session(self, user_id: int) -> None:
+        task_ids = self.stack.kie.recent_task_ids()
+        task_id = self.random.choice(task_ids) if task_ids else f"lt_orphan_{user_id}"
+        payload = {"code": 200, "data": {"taskId": task_id, "state": "generating"}}
+        started = time.monotonic()
+        async with self._session.post(self.stack.callback_url, json=payload) as resp:
+            await resp.read()
+        self._sample("kie_callback_ack", time.monotonic() - started)
+        self._count("callbacks_sent")
+
+    async def _run_session(self, kind: str) -> None:
+        user_id = next(self._user_ids)
+        self._inflight += 1
+        self._count(f"sessions:{kind}")
+        try:
+            await getattr(self, f"_{kind}_session")(user_id)
+        except Exception as e:
+            self._count("session_errors")
+            logger.debug(f"[LOADTEST] {kind} session failed: {e}")
+        finally:
+            self._inflight -= 1
+            self.tracker.forget(user_id)
+
+    async def _sample_queue(self, stop: asyncio.Event) -> None:
+        from app.utils.update_queue import get_queue_manager
+
+        queue_manager = get_queue_manager()
+        while not stop.is_set():
+            self.queue_depths.append(int(queue_manager.get_metrics().get("queue_depth", 0)))
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=0.1)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run(self) -> Dict[str, Any]:
+        from app.utils.update_queue import get_queue_manager
+
+        if "generation" in self.config.mix and not self.model_id:
+            self.model_id = pick_generation_model() or ""
+
+        kinds = list(self.config.mix)
+        weights = [self.config.mix[kind] for kind in kinds]
+        db_counter = DbRoundTripCounter(self.config.database_url) if self.config.database_url else None
+        if db_counter:
+            await db_counter.begin()
+        queue_before = get_queue_manager().get_metrics()
+
+        connector = TCPConnector(limit=0)
+        self._session = ClientSession(connector=connector, timeout=ClientTimeout(total=60))
+        stop_sampling = asyncio.Event()
+        sampler = asyncio.create_task(self._sample_queue(stop_sampling))
+        sessions: List[asyncio.Task] = []
+        started = time.monotonic()
+        try:
+            next_at = started
+            while True:
+                next_at += self.random.expovariate(self.config.rate)
+                if next_at - started > self.config.duration:
+                    break
+                delay = next_at - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                if self._inflight >= self.config.max_inflight:
+                    self._count("sessions_skipped_inflight")
+                    continue
+                kind = self.random.choices(kinds, weights)[0]
+                sessions.append(asyncio.create_task(self._run_session(kind)))
+            arrivals_done = time.monotonic()
+            if sessions:
+                await asyncio.wait(sessions, timeout=self.config.drain_timeout)
+            elapsed = time.monotonic() - started
+        finally:
+            stop_sampling.set()
+            await sampler
+            for task in sessions:
+                task.cancel()
+            await self._session.close()
+
+        db_round_trips = await db_counter.end() if db_counter else None
+        queue_after = get_queue_manager().get_metrics()
+        return self._report(elapsed, arrivals_done - started, queue_before, queue_after, db_round_trips,
+                            db_counter.source if db_counter else "")
+
+    def _report(self, elapsed: float, arrival_window: float, queue_before: Dict[str, Any],
+                queue_after: Dict[str, Any], db_round_trips: Optional[float], db_source: str) -> Dict[str, Any]:
+        updates = self.counts.get("updates_sent", 0) + self.counts.get("callbacks_sent", 0)
+        enqueued = queue_after.get("total_received", 0) - queue_before.get("total_received", 0)
+        depth = LatencySamples()
+        for value in self.queue_depths:
+            depth.add(value)
+        report: Dict[str, Any] = {
+            "config": {
+                "rate": self.config.rate,
+                "duration": self.config.duration,
+                "mix": self.config.mix,
+                "storage": "postgres" if self.config.database_url else "json",
+                "model_id": self.model_id or None,
+                "telegram_latency_ms": self.config.telegram_latency * 1000,
+                "kie_task_seconds": self.config.kie_task_seconds,
+            },
+            "elapsed_seconds": round(elapsed, 2),
+            "achieved_session_rate": round(sum(v for k, v in self.counts.items() if k.startswith("sessions:")) / max(arrival_window, 1e-9), 2),
+            "counts": dict(sorted(self.counts.items())),
+            "latency_ms": {name: samples.summary() for name, samples in sorted(self.latencies.items())
+                           if name not in ("delivery", "generation_total")},
+            "delivery_seconds": {name: self.latencies[name].summary(scale=1.0)
+                                 for name in ("delivery", "generation_total") if name in self.latencies},
+            "queue": {
+                "depth": depth.summary(scale=1.0),
+                "updates_enqueued": enqueued,
+                # Acked with 200 but never enqueued (per-IP webhook limiter, dedup, queue full)
+                "updates_not_enqueued": max(0, self.counts.get("updates_sent", 0) - enqueued),
+                "dropped": queue_after.get("total_dropped", 0) - queue_before.get("total_dropped", 0),
+                "errors": queue_after.get("total_errors", 0) - queue_before.get("total_errors", 0),
+            },
+            "telegram_calls": dict(sorted(self.stack.telegram.calls_by_method.items())),
+            "kie": {
+                "tasks_created": self.stack.kie.created,
+                "callbacks_sent": self.stack.kie.callbacks_sent,
+                "callback_errors": self.stack.kie.callback_errors,
+            },
+        }
+        if db_round_trips is not None:
+            report["db"] = {
+                "source": db_source,
+                "round_trips": int(db_round_trips),
+                "round_trips_per_update": round(db_round_trips / max(updates, 1), 2),
+            }
+        return report
+
+
+async def run_load_test(config: LoadConfig) -> Dict[str, Any]:
+    """Start the stack, replay the configured load, stop everything; returns the report."""
+    tracker = ChatTracker()
+    stack = PipelineStack(config, tracker)
+    await stack.start()
+    try:
+        return await LoadRunner(config, stack, tracker).run()
+    finally:
+        await stack.stop()
@@ -54,16 +54,24 @@ class MockCallbackQuery:
     
     def to_dict(self) -> Dict:
         """Convert to dict."""
-        return {
+        d = {
             'id': self.id,
             'from': {
                 'id': self.from_user.id,
                 'is_bot': self.from_user.is_bot,
                 'first_name': self.from_user.first_name,
             },
-            'chat_instance': self.chat_instance,
+            'chat_instance': str(self.chat_instance),
             'data': self.data,
         }
+        if self.message:
+            d['message'] = {
+                'message_id': self.message.message_id,
+                'date': self.message.date,
+                'chat': {'id': self.message.chat.id, 'type': self.message.chat.type},
+                'text': self.message.text or '',
+            }
+        return d
 
 
 @dataclass
@@ -4,6 +4,7 @@ Healthcheck endpoint для Render
 """
 
 import json
+import os
 import time
 from typing import Optional, Dict, List
 
@@ -12,6 +13,7 @@ from telegram import Update
 
 from app.utils.logging_config import get_logger
 from app.utils.correlation import ensure_correlation_id, correlation_tag
+from app.utils.update_dedup import RecentIdWindow
 
 logger = get_logger(__name__)
 
@@ -20,7 +22,7 @@ _health_runner: Optional[web.AppRunner] = None
 _start_time: Optional[float] = None
 
 # Webhook resilience state (in-memory; single instance on Render)
-_recent_update_ids: set[int] = set()
+_recent_update_ids = RecentIdWindow(int(os.getenv("WEBHOOK_DEDUP_WINDOW", "10000")))
 _rate_map: Dict[str, List[float]] = {}
 
 
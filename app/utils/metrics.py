@@ -6,13 +6,43 @@ MASTER PROMPT compliance:
 - Monitor system health
 - Detect issues early
 - Enable data-driven decisions
+
+Hot-path design:
+- Metric families (Counter / Gauge / Histogram) are declared once in a
+  MetricsRegistry; label children are bound once and cached, so an update is
+  one attribute add (no lock, no key formatting).
+- Histograms use fixed buckets: observe() is a bisect + two adds, no
+  per-sample storage; quantiles are estimated from the buckets
+  (same interpolation as Prometheus histogram_quantile).
+- render_prometheus() produces the text exposition format served on /metrics.
+
+Updates are not guarded by a lock: all writers run on the event loop thread,
+and a lost increment from a stray thread is acceptable for monitoring data.
+
+Usage on a hot path:
+    _DISPATCH = get_registry().histogram("update_dispatch_seconds", "...", ("status",))
+    _DISPATCH_OK = _DISPATCH.labels("ok")      # bind once
+    _DISPATCH_OK.observe(elapsed)              # O(1)
 """
 
+import bisect
+import logging
+import math
 import time
-from typing import Dict, Optional
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
 from dataclasses import dataclass, field
 from datetime import datetime
-import asyncio
+
+logger = logging.getLogger(__name__)
+
+# Prometheus client defaults (seconds)
+DEFAULT_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Long operations (generation, KIE polling): seconds
+SLOW_BUCKETS: Tuple[float, ...] = (1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1200.0)
+# Money amounts: RUB
+RUB_BUCKETS: Tuple[float, ...] = (1.0, 5.0, 10.0, 25.0, 50.0, 100.0, 250.0, 500.0, 1000.0, 2500.0, 5000.0, 10000.0)
+
+QUANTILES: Tuple[float, ...] = (0.5, 0.95, 0.99)
 
 
 @dataclass
@@ -23,92 +53,411 @@ class MetricValue:
     labels: Dict[str, str] = field(default_factory=dict)
 
 
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_str(pairs: Iterable[Tuple[str, str]]) -> str:
+    body = ",".join(f'{name}="{_escape_label(value)}"' for name, value in pairs)
+    return f"{{{body}}}" if body else ""
+
+
+class CounterChild:
+    """Monotonic counter bound to one label set."""
+
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+
+class GaugeChild:
+    """Gauge bound to one label set."""
+
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+
+class HistogramChild:
+    """Fixed-bucket histogram bound to one label set."""
+
+    __slots__ = ("bounds", "counts", "sum", "count", "min", "max")
+
+    def __init__(self, bounds: Tuple[float, ...]) -> None:
+        self.bounds = bounds
+        # Last slot is the +Inf bucket
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def observe(self, value: float) -> None:
+        # le semantics: first bucket whose upper bound >= value
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def time(self) -> "_HistogramTimer":
+        """Context manager observing elapsed seconds (sync or async with)."""
+        return _HistogramTimer(self)
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimate the q-quantile from buckets (linear interpolation inside the bucket).
+
+        The estimate is clamped to the observed min/max, so it is exact for
+        single-valued series and never outside the seen range.
+        """
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            if bucket_count and cumulative + bucket_count >= rank:
+                if index == len(self.bounds):
+                    # +Inf bucket: the best we know is the max
+                    return self.max
+                upper = self.bounds[index]
+                lower = self.bounds[index - 1] if index > 0 else min(0.0, self.min)
+                estimate = lower + (upper - lower) * (rank - cumulative) / bucket_count
+                return min(max(estimate, self.min), self.max)
+            cumulative += bucket_count
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        if not self.count:
+            return {"count": 0, "sum": 0, "avg": 0, "min": 0, "max": 0, "p50": 0, "p95": 0, "p99": 0}
+        result = {
+            "count": self.count,
+            "sum": self.sum,
+            "avg": self.sum / self.count,
+            "min": self.min,
+            "max": self.max,
+        }
+        for q in QUANTILES:
+            result[f"p{int(q * 100)}"] = self.quantile(q)
+        return result
+
+
+class _HistogramTimer:
+    __slots__ = ("_child", "_start")
+
+    def __init__(self, child: HistogramChild) -> None:
+        self._child = child
+        self._start = 0.0
+
+    def __enter__(self) -> "_HistogramTimer":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self._child.observe(time.perf_counter() - self._start)
+
+    async def __aenter__(self) -> "_HistogramTimer":
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.__exit__(exc_type, exc_val, exc_tb)
+
+
+class MetricFamily:
+    """Named metric with a fixed label schema; children are created once per label set."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str = "", labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation or name
+        self.labelnames: Tuple[str, ...] = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: object, **kwargs: object):
+        """
+        Get (create once) the child for a label set.
+
+        Either positional values in labelnames order or keyword labels.
+        Bind the result once and keep it for hot paths.
+        """
+        if kwargs:
+            try:
+                values = tuple(kwargs[name] for name in self.labelnames)
+            except KeyError as e:
+                raise ValueError(f"{self.name}: missing label {e}") from None
+            if len(kwargs) != len(self.labelnames):
+                raise ValueError(f"{self.name}: expected labels {self.labelnames}, got {tuple(kwargs)}")
+        elif len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name}: expected labels {self.labelnames}, got {values}")
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def children(self) -> List[Tuple[Tuple[Tuple[str, str], ...], object]]:
+        return [(tuple(zip(self.labelnames, key)), child) for key, child in list(self._children.items())]
+
+    def clear(self) -> None:
+        self._children.clear()
+
+
+class Counter(MetricFamily):
+    kind = "counter"
+
+    def _new_child(self) -> CounterChild:
+        return CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        """Unlabelled counter shortcut."""
+        self.labels().inc(amount)
+
+
+class Gauge(MetricFamily):
+    kind = "gauge"
+
+    def _new_child(self) -> GaugeChild:
+        return GaugeChild()
+
+    def set(self, value: float) -> None:
+        """Unlabelled gauge shortcut."""
+        self.labels().set(value)
+
+
+class Histogram(MetricFamily):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str = "",
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        bounds = tuple(sorted(float(b) for b in buckets if not math.isinf(b)))
+        if not bounds:
+            raise ValueError(f"{name}: histogram needs at least one finite bucket")
+        self.buckets = bounds
+
+    def _new_child(self) -> HistogramChild:
+        return HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        """Unlabelled histogram shortcut."""
+        self.labels().observe(value)
+
+
+class MetricsRegistry:
+    """Process-wide set of metric families + Prometheus text exporter."""
+
+    def __init__(self) -> None:
+        self._families: Dict[str, MetricFamily] = {}
+        self._collectors: List[Callable[[], None]] = []
+
+    def _register(self, family: MetricFamily) -> MetricFamily:
+        existing = self._families.get(family.name)
+        if existing is not None:
+            if type(existing) is not type(family) or existing.labelnames != family.labelnames:
+                raise ValueError(
+                    f"Metric {family.name} already registered as {existing.kind}{existing.labelnames}"
+                )
+            return existing
+        return self._families.setdefault(family.name, family)
+
+    def counter(self, name: str, documentation: str = "", labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str = "", labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str = "",
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def get(self, name: str) -> Optional[MetricFamily]:
+        return self._families.get(name)
+
+    def add_collector(self, collector: Callable[[], None]) -> None:
+        """Callback run before each export (e.g. copy queue depth into a gauge)."""
+        if collector not in self._collectors:
+            self._collectors.append(collector)
+
+    def remove_collector(self, collector: Callable[[], None]) -> None:
+        if collector in self._collectors:
+            self._collectors.remove(collector)
+
+    def collect(self) -> None:
+        for collector in list(self._collectors):
+            try:
+                collector()
+            except Exception as e:
+                logger.debug(f"[METRICS] Collector {collector!r} failed: {e}")
+
+    def families(self) -> List[MetricFamily]:
+        return list(self._families.values())
+
+    def render_prometheus(self) -> str:
+        """Text exposition format 0.0.4."""
+        self.collect()
+        lines: List[str] = []
+        for family in sorted(self.families(), key=lambda f: f.name):
+            children = family.children()
+            if not children:
+                continue
+            doc = family.documentation.replace("\\", "\\\\").replace("\n", "\\n")
+            lines.append(f"# HELP {family.name} {doc}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            for pairs, child in children:
+                if isinstance(child, HistogramChild):
+                    cumulative = 0
+                    for bound, bucket_count in zip(child.bounds + (math.inf,), child.counts):
+                        cumulative += bucket_count
+                        le = pairs + (("le", _format_value(bound)),)
+                        lines.append(f"{family.name}_bucket{_label_str(le)} {cumulative}")
+                    lines.append(f"{family.name}_sum{_label_str(pairs)} {_format_value(child.sum)}")
+                    lines.append(f"{family.name}_count{_label_str(pairs)} {child.count}")
+                else:
+                    lines.append(f"{family.name}{_label_str(pairs)} {_format_value(child.value)}")
+        return "\n".join(lines) + "\n"
+
+    def clear(self) -> None:
+        """Reset all values (keeps family definitions and bound children valid for new values)."""
+        for family in self.families():
+            family.clear()
+
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_registry = MetricsRegistry()
+
+
+def get_registry() -> MetricsRegistry:
+    """Get process-wide metrics registry."""
+    return _registry
+
+
+def _buckets_for(name: str) -> Tuple[float, ...]:
+    if name.endswith("_rub"):
+        return RUB_BUCKETS
+    if name.startswith("generation_"):
+        return SLOW_BUCKETS
+    return DEFAULT_BUCKETS
+
+
 class MetricsCollector:
     """
     Collect and track application metrics.
-    
-    Thread-safe metrics collection for async environments.
+
+    Compatibility facade over MetricsRegistry for call sites that pass labels
+    as dicts. The label schema of a metric is fixed by its first use; children
+    are cached per label set, so repeated calls do not format keys.
     """
-    
-    def __init__(self):
-        self._counters: Dict[str, float] = {}
-        self._gauges: Dict[str, float] = {}
-        self._histograms: Dict[str, list] = {}
-        self._lock = asyncio.Lock()
-    
+
+    def __init__(self, registry: Optional[MetricsRegistry] = None):
+        self.registry = registry if registry is not None else MetricsRegistry()
+
+    def _child(self, factory, name: str, labels: Optional[Dict[str, str]]):
+        family = self.registry.get(name)
+        if family is None:
+            family = factory(name, labelnames=tuple(sorted(labels)) if labels else ())
+        if not labels:
+            return family.labels(*([""] * len(family.labelnames)))
+        if len(labels) != len(family.labelnames):
+            logger.debug(f"[METRICS] {name}: labels {sorted(labels)} != schema {family.labelnames}")
+        return family.labels(*(labels.get(label, "") for label in family.labelnames))
+
     async def increment(self, name: str, value: float = 1.0, labels: Optional[Dict[str, str]] = None) -> None:
         """Increment a counter metric."""
-        async with self._lock:
-            key = self._make_key(name, labels)
-            self._counters[key] = self._counters.get(key, 0) + value
-    
+        self._child(self.registry.counter, name, labels).inc(value)
+
     async def set_gauge(self, name: str, value: float, labels: Optional[Dict[str, str]] = None) -> None:
         """Set a gauge metric."""
-        async with self._lock:
-            key = self._make_key(name, labels)
-            self._gauges[key] = value
-    
+        self._child(self.registry.gauge, name, labels).set(value)
+
     async def observe(self, name: str, value: float, labels: Optional[Dict[str, str]] = None) -> None:
         """Observe a value for histogram metric."""
-        async with self._lock:
-            key = self._make_key(name, labels)
-            if key not in self._histograms:
-                self._histograms[key] = []
-            self._histograms[key].append(value)
-            
-            # Keep only last 1000 values
-            if len(self._histograms[key]) > 1000:
-                self._histograms[key] = self._histograms[key][-1000:]
-    
+        def factory(metric_name, labelnames):
+            return self.registry.histogram(metric_name, labelnames=labelnames, buckets=_buckets_for(metric_name))
+        self._child(factory, name, labels).observe(value)
+
     async def get_metrics(self) -> Dict[str, Dict]:
         """Get all metrics snapshot."""
-        async with self._lock:
-            return {
-                "counters": dict(self._counters),
-                "gauges": dict(self._gauges),
-                "histograms": {
-                    k: {
-                        "count": len(v),
-                        "sum": sum(v),
-                        "avg": sum(v) / len(v) if v else 0,
-                        "min": min(v) if v else 0,
-                        "max": max(v) if v else 0,
-                    }
-                    for k, v in self._histograms.items()
-                }
-            }
-    
-    def _make_key(self, name: str, labels: Optional[Dict[str, str]]) -> str:
-        """Create metric key with labels."""
-        if not labels:
+        result: Dict[str, Dict] = {"counters": {}, "gauges": {}, "histograms": {}}
+        section = {"counter": "counters", "gauge": "gauges", "histogram": "histograms"}
+        for family in self.registry.families():
+            for pairs, child in family.children():
+                key = self._make_key(family.name, pairs)
+                if isinstance(child, HistogramChild):
+                    result["histograms"][key] = child.summary()
+                else:
+                    result[section[family.kind]][key] = child.value
+        return result
+
+    def _make_key(self, name: str, pairs: Tuple[Tuple[str, str], ...]) -> str:
+        """Create metric key with labels (snapshot only, not on the update path)."""
+        if not pairs:
             return name
-        
-        label_str = ",".join(f"{k}={v}" for k, v in sorted(labels.items()))
+
+        label_str = ",".join(f"{k}={v}" for k, v in sorted(pairs))
         return f"{name}{{{label_str}}}"
 
 
 class Timer:
     """Context manager for timing operations."""
-    
+
     def __init__(self, collector: MetricsCollector, metric_name: str, labels: Optional[Dict[str, str]] = None):
         self.collector = collector
         self.metric_name = metric_name
         self.labels = labels
         self.start_time: Optional[float] = None
-    
+
     async def __aenter__(self):
-        self.start_time = time.time()
+        self.start_time = time.perf_counter()
         return self
-    
+
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         if self.start_time is not None:
-            duration = time.time() - self.start_time
+            duration = time.perf_counter() - self.start_time
             await self.collector.observe(
                 f"{self.metric_name}_duration_seconds",
                 duration,
                 self.labels
             )
-            
+
             # Also track success/failure
             status = "error" if exc_type else "success"
             labels_with_status = {**(self.labels or {}), "status": status}
@@ -119,7 +468,7 @@ class Timer:
 
 
 # Global metrics collector
-_metrics = MetricsCollector()
+_metrics = MetricsCollector(_registry)
 
 
 def get_metrics_collector() -> MetricsCollector:
@@ -127,75 +476,76 @@ def get_metrics_collector() -> MetricsCollector:
     return _metrics
 
 
-# Standard metrics that should be tracked
+# Standard metrics that should be tracked (declared up front: fixed label schemas)
+_GENERATIONS = _registry.counter("generations_total", "Generations by model and status", ("model_id", "status"))
+_GENERATION_SECONDS = _registry.histogram(
+    "generation_duration_seconds", "Generation wall time", ("model_id",), SLOW_BUCKETS
+)
+_GENERATION_PRICE = _registry.histogram("generation_price_rub", "Price of successful generations", ("model_id",), RUB_BUCKETS)
+_PAYMENTS = _registry.counter("payments_total", "Payments by type", ("payment_type",))
+_PAYMENT_AMOUNT = _registry.histogram("payment_amount_rub", "Payment amounts", ("payment_type",), RUB_BUCKETS)
+_REFUNDS = _registry.counter("refunds_total", "Refunds by reason", ("reason",))
+_REFUND_AMOUNT = _registry.histogram("refund_amount_rub", "Refund amounts", ("reason",), RUB_BUCKETS)
+_ERRORS = _registry.counter("errors_total", "Handled errors", ("error_type", "handler"))
+_USER_ACTIONS = _registry.counter("user_actions_total", "User actions", ("action",))
+_DB_QUERIES = _registry.counter("db_queries_total", "Database queries", ("query_type", "status"))
+_DB_QUERY_SECONDS = _registry.histogram("db_query_duration_seconds", "Database query latency", ("query_type",))
+_API_CALLS = _registry.counter("api_calls_total", "External API calls", ("api", "endpoint", "status_code"))
+_API_CALL_SECONDS = _registry.histogram("api_call_duration_seconds", "External API call latency", ("api", "endpoint"))
+_ACTIVE_USERS = _registry.gauge("active_users", "Active users")
+_DB_POOL_AVAILABLE = _registry.gauge("db_pool_available", "Idle database pool connections")
+_DB_POOL_USED = _registry.gauge("db_pool_used", "Busy database pool connections")
+
 
 async def track_generation(model_id: str, success: bool, duration: float, price_rub: float):
     """Track generation metrics."""
-    labels = {"model_id": model_id, "status": "success" if success else "error"}
-    
-    await _metrics.increment("generations_total", labels=labels)
-    await _metrics.observe("generation_duration_seconds", duration, {"model_id": model_id})
-    
+    _GENERATIONS.labels(model_id, "success" if success else "error").inc()
+    _GENERATION_SECONDS.labels(model_id).observe(duration)
+
     if success:
-        await _metrics.observe("generation_price_rub", price_rub, {"model_id": model_id})
+        _GENERATION_PRICE.labels(model_id).observe(price_rub)
 
 
 async def track_payment(user_id: int, amount_rub: float, payment_type: str):
     """Track payment metrics."""
-    labels = {"payment_type": payment_type}
-    
-    await _metrics.increment("payments_total", labels=labels)
-    await _metrics.observe("payment_amount_rub", amount_rub, labels=labels)
+    _PAYMENTS.labels(payment_type).inc()
+    _PAYMENT_AMOUNT.labels(payment_type).observe(amount_rub)
 
 
 async def track_refund(user_id: int, amount_rub: float, reason: str):
     """Track refund metrics."""
-    labels = {"reason": reason}
-    
-    await _metrics.increment("refunds_total", labels=labels)
-    await _metrics.observe("refund_amount_rub", amount_rub, labels=labels)
+    _REFUNDS.labels(reason).inc()
+    _REFUND_AMOUNT.labels(reason).observe(amount_rub)
 
 
 async def track_error(error_type: str, handler: str):
     """Track error metrics."""
-    labels = {"error_type": error_type, "handler": handler}
-    
-    await _metrics.increment("errors_total", labels=labels)
+    _ERRORS.labels(error_type, handler).inc()
 
 
 async def track_user_activity(user_id: int, action: str):
     """Track user activity."""
-    labels = {"action": action}
-    
-    await _metrics.increment("user_actions_total", labels=labels)
+    _USER_ACTIONS.labels(action).inc()
 
 
 async def track_database_query(query_type: str, duration: float, success: bool):
     """Track database query metrics."""
-    labels = {"query_type": query_type, "status": "success" if success else "error"}
-    
-    await _metrics.increment("db_queries_total", labels=labels)
-    await _metrics.observe("db_query_duration_seconds", duration, {"query_type": query_type})
+    _DB_QUERIES.labels(query_type, "success" if success else "error").inc()
+    _DB_QUERY_SECONDS.labels(query_type).observe(duration)
 
 
 async def track_api_call(api: str, endpoint: str, duration: float, status_code: int):
     """Track external API call metrics."""
-    labels = {
-        "api": api,
-        "endpoint": endpoint,
-        "status_code": str(status_code)
-    }
-    
-    await _metrics.increment("api_calls_total", labels=labels)
-    await _metrics.observe("api_call_duration_seconds", duration, {"api": api, "endpoint": endpoint})
+    _API_CALLS.labels(api, endpoint, status_code).inc()
+    _API_CALL_SECONDS.labels(api, endpoint).observe(duration)
 
 
 async def set_active_users(count: int):
     """Set active users gauge."""
-    await _metrics.set_gauge("active_users", count)
+    _ACTIVE_USERS.set(count)
 
 
 async def set_pool_connections(available: int, used: int):
     """Set database pool connection metrics."""
-    await _metrics.set_gauge("db_pool_available", available)
-    await _metrics.set_gauge("db_pool_used", used)
+    _DB_POOL_AVAILABLE.set(available)
+    _DB_POOL_USED.set(used)
@@ -0,0 +1,129 @@
+"""
+Telegram update_id deduplication in front of storage.
+
+Workers used to call storage.is_update_processed() and then
+storage.mark_update_processed() for every update: two sequential round trips
+(plus advisory lock calls) before dispatch. UpdateDedup.claim() instead:
+
+1. checks a bounded window of update_ids claimed by this process - Telegram
+   retries of an update we already took cost zero round trips
+2. otherwise claims the id with ONE atomic storage call
+   (PostgresStorage.claim_update: INSERT ... ON CONFLICT DO NOTHING RETURNING)
+
+Fail-open: if storage is unavailable the update is processed (and still
+remembered locally), same as the previous worker behaviour.
+"""
+
+import logging
+import os
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Set
+
+logger = logging.getLogger(__name__)
+
+
+class RecentIdWindow:
+    """Bounded set of recent ids (oldest evicted first)."""
+
+    __slots__ = ("maxlen", "_ids", "_order")
+
+    def __init__(self, maxlen: int = 10000) -> None:
+        self.maxlen = max(1, maxlen)
+        self._ids: Set[int] = set()
+        self._order: Deque[int] = deque()
+
+    def __contains__(self, item: int) -> bool:
+        return item in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add(self, item: int) -> bool:
+        """Remember item; returns False if it was already present."""
+        if item in self._ids:
+            return False
+        self._ids.add(item)
+        self._order.append(item)
+        if len(self._order) > self.maxlen:
+            self._ids.discard(self._order.popleft())
+        return True
+
+    def discard(self, item: int) -> None:
+        # Left in _order; evicting a missing id later is a no-op
+        self._ids.discard(item)
+
+
+@dataclass
+class DedupStats:
+    """Counters for /diagnostics and tests."""
+    claimed: int = 0
+    local_duplicates: int = 0
+    storage_duplicates: int = 0
+    storage_calls: int = 0
+    fail_open: int = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return dict(self.__dict__)
+
+
+class UpdateDedup:
+    """Process-local window + single atomic storage claim."""
+
+    def __init__(self, window: int = 10000) -> None:
+        self._window = RecentIdWindow(window)
+        self.stats = DedupStats()
+
+    async def claim(self, storage: Any, update_id: int, worker_id: str = "unknown", update_type: str = "unknown") -> bool:
+        """
+        Claim update_id for processing.
+
+        Returns:
+            True if this worker should process the update, False for a duplicate
+        """
+        if not self._window.add(update_id):
+            self.stats.local_duplicates += 1
+            return False
+
+        try:
+            claimed = await self._claim_in_storage(storage, update_id, worker_id, update_type)
+        except Exception as e:
+            # FAIL-OPEN: process without persistent dedup (prevents worker deadlock when DB is down)
+            self.stats.fail_open += 1
+            logger.warning(f"[DEDUP] Storage claim failed for update_id={update_id}: {e} - continuing without dedup")
+            return True
+
+        if claimed:
+            self.stats.claimed += 1
+        else:
+            self.stats.storage_duplicates += 1
+        return claimed
+
+    async def _claim_in_storage(self, storage: Any, update_id: int, worker_id: str, update_type: str) -> bool:
+        claim_update = getattr(storage, "claim_update", None)
+        if claim_update is not None:
+            self.stats.storage_calls += 1
+            return await claim_update(update_id, worker_id=worker_id, update_type=update_type)
+
+        # Storage without atomic claim (e.g. JsonStorage): legacy check+mark if available
+        is_processed = getattr(storage, "is_update_processed", None)
+        mark_processed = getattr(storage, "mark_update_processed", None)
+        if is_processed is None or mark_processed is None:
+            return True
+        self.stats.storage_calls += 2
+        if await is_processed(update_id):
+            return False
+        await mark_processed(update_id, worker_id=worker_id, update_type=update_type)
+        return True
+
+
+# Global dedup instance
+_dedup: "UpdateDedup | None" = None
+
+
+def get_update_dedup() -> UpdateDedup:
+    """Get process-wide update dedup."""
+    global _dedup
+    if _dedup is None:
+        _dedup = UpdateDedup(window=int(os.getenv("UPDATE_DEDUP_WINDOW", "10000")))
+    return _dedup
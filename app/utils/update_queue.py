@@ -7,19 +7,36 @@ while processing updates asynchronously in background workers.
 Key features:
 - Instant 200 OK response (< 200ms target)
 - Bounded queue to prevent memory overflow
-- Multiple concurrent workers for throughput
+- Sharded by chat_id: updates of one chat are processed strictly in order,
+  different chats run concurrently
+- Worker pool grows with backlog (num_workers..max_workers) and shrinks when idle
+- PASSIVE-held updates wait in a separate buffer (no requeue/sleep spinning);
+  their shard is frozen until release, so later updates of the chat wait too
 - Graceful degradation (drop updates when overloaded, but still ack)
 - Metrics for monitoring
 """
 
 import asyncio
 import logging
+import os
 import time
+from collections import deque
 from dataclasses import dataclass, field
-from typing import Optional
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from app.utils.metrics import get_registry
+from app.utils.webhook_ingress import RawUpdate
 
 logger = logging.getLogger(__name__)
 
+# Dispatch latency by outcome (children bound once, observed per update)
+_DISPATCH_SECONDS = get_registry().histogram(
+    "update_dispatch_seconds", "dp.feed_update latency per update", ("status",)
+)
+_DISPATCH_OK = _DISPATCH_SECONDS.labels("ok")
+_DISPATCH_TIMEOUT = _DISPATCH_SECONDS.labels("timeout")
+_DISPATCH_ERROR = _DISPATCH_SECONDS.labels("error")
+
 
 def _is_allowed_in_passive(update) -> bool:
     """
@@ -62,6 +79,39 @@ def _is_allowed_in_passive(update) -> bool:
     return False
 
 
+def _shard_key(update, update_id: int) -> int:
+    """
+    Ordering key for an update: chat id, falling back to user id, then update_id.
+
+    Works for aiogram Update objects and plain dicts (tests/raw payloads).
+    """
+    def _get(obj, name):
+        if obj is None:
+            return None
+        if isinstance(obj, dict):
+            return obj.get(name)
+        return getattr(obj, name, None)
+
+    for kind in ("message", "edited_message", "channel_post", "callback_query",
+                 "my_chat_member", "chat_member", "chat_join_request"):
+        event = _get(update, kind)
+        if event is None:
+            continue
+        chat = _get(event, "chat") or _get(_get(event, "message"), "chat")
+        chat_id = _get(chat, "id")
+        if isinstance(chat_id, int):
+            return chat_id
+        user_id = _get(_get(event, "from_user") or _get(event, "from"), "id")
+        if isinstance(user_id, int):
+            return user_id
+    for kind in ("inline_query", "chosen_inline_result", "pre_checkout_query", "shipping_query"):
+        event = _get(update, kind)
+        user_id = _get(_get(event, "from_user") or _get(event, "from"), "id")
+        if isinstance(user_id, int):
+            return user_id
+    return update_id or 0
+
+
 @dataclass
 class QueueMetrics:
     """Metrics for monitoring queue health."""
@@ -70,7 +120,7 @@ class QueueMetrics:
     total_dropped: int = 0
     total_errors: int = 0
     total_held: int = 0  # Held in PASSIVE mode
-    total_requeued: int = 0  # Put back to queue
+    total_requeued: int = 0  # Released from PASSIVE hold back to shards
     total_processed_degraded: int = 0  # Processed despite PASSIVE (degraded mode)
     workers_active: int = 0
     queue_depth_current: int = 0
@@ -84,22 +134,46 @@ class UpdateQueueManager:
     
     Architecture:
     - Webhook handler calls enqueue() and immediately returns 200 OK
-    - N worker tasks read from queue and call dp.feed_update()
+    - Updates go to one of num_shards FIFO shards by chat_id
+    - A shard is served by at most one worker at a time (per-chat ordering);
+      workers pick the next ready shard, so chats don't block each other
+    - Pool size follows backlog between num_workers and max_workers
     - If queue full: drop update, log warning, but still ack HTTP 200
     - Metrics exposed for /health endpoint
     """
     
     max_size: int = 100  # Max queued updates before dropping
-    num_workers: int = 3  # Concurrent worker tasks
+    num_workers: int = 3  # Minimum (always running) worker tasks
+    max_workers: int = 0  # Upper bound for the pool (0 -> num_workers * 4)
+    num_shards: int = 32  # Ordering shards (hash of chat_id)
+    worker_idle_timeout: float = 30.0  # Extra workers exit after this idle time
     
-    _queue: asyncio.Queue = field(default_factory=lambda: asyncio.Queue())
+    _shards: List[Deque[Dict[str, Any]]] = field(default_factory=list)
+    _scheduled: Set[int] = field(default_factory=set)  # Shards ready or being served
+    _ready: asyncio.Queue = field(default_factory=lambda: asyncio.Queue())
+    _held: Deque[Dict[str, Any]] = field(default_factory=deque)
+    _held_shards: Set[int] = field(default_factory=set)  # Frozen until their held item is released
+    _in_flight: Dict[int, Dict[str, Any]] = field(default_factory=dict)  # Shard -> item a worker is processing
+    _size: int = 0
     _workers: list = field(default_factory=list)
+    _live_workers: int = 0  # Workers not yet retiring (scale up/down target)
+    _idle_workers: int = 0
+    _next_worker_id: int = 0
+    _release_task: Optional[asyncio.Task] = None
     _metrics: QueueMetrics = field(default_factory=QueueMetrics)
     _running: bool = False
+    _paused: bool = False  # quiesce(): workers finish in-flight updates but start no new ones
+    _last_passive_log: float = 0.0  # Rate-limit PASSIVE_WAIT logging
+    _active_enter_logged: bool = False  # Track first ACTIVE enter
     _dp = None  # Dispatcher instance
     _bot = None  # Bot instance
     _active_state = None  # Active state for lock checking
     
+    def __post_init__(self):
+        self.num_shards = max(1, self.num_shards)
+        self.max_workers = max(self.max_workers or self.num_workers * 4, self.num_workers)
+        self._shards = [deque() for _ in range(self.num_shards)]
+    
     def configure(self, dp, bot, active_state=None):
         """Configure dispatcher, bot, and active state."""
         self._dp = dp
@@ -122,18 +196,20 @@ class UpdateQueueManager:
             raise RuntimeError("Must call configure() before start()")
         
         self._running = True
-        self._queue = asyncio.Queue(maxsize=self.max_size)
+        # Fresh ready-queue bound to the running loop; keep shards enqueued before start()
+        self._ready = asyncio.Queue()
+        self._scheduled.clear()
+        for idx, shard in enumerate(self._shards):
+            if shard and idx not in self._held_shards:
+                self._scheduled.add(idx)
+                self._ready.put_nowait(idx)
         
         # Spawn worker tasks
-        for i in range(self.num_workers):
-            worker = asyncio.create_task(
-                self._worker_loop(worker_id=i),
-                name=f"update_worker_{i}"
-            )
-            self._workers.append(worker)
+        for _ in range(self.num_workers):
+            self._spawn_worker()
         
-        logger.info("[QUEUE] Started %d workers (queue_max=%d)", 
-                   self.num_workers, self.max_size)
+        logger.info("[QUEUE] Started %d workers (max=%d shards=%d queue_max=%d)", 
+                   self.num_workers, self.max_workers, self.num_shards, self.max_size)
     
     async def stop(self):
         """Stop workers gracefully."""
@@ -143,15 +219,62 @@ class UpdateQueueManager:
         self._running = False
         
         # Cancel all workers
-        for worker in self._workers:
+        tasks = list(self._workers)
+        if self._release_task is not None:
+            tasks.append(self._release_task)
+            self._release_task = None
+        for worker in tasks:
             worker.cancel()
         
         # Wait for cancellation
-        await asyncio.gather(*self._workers, return_exceptions=True)
+        await asyncio.gather(*tasks, return_exceptions=True)
         self._workers.clear()
+        self._idle_workers = 0
         
         logger.info("[QUEUE] Stopped workers")
     
+    def _spawn_worker(self) -> None:
+        worker_id = self._next_worker_id
+        self._next_worker_id += 1
+        worker = asyncio.create_task(
+            self._worker_loop(worker_id=worker_id),
+            name=f"update_worker_{worker_id}"
+        )
+        self._workers.append(worker)
+        self._live_workers += 1
+        worker.add_done_callback(self._on_worker_done)
+    
+    def _on_worker_done(self, worker: asyncio.Task) -> None:
+        try:
+            self._workers.remove(worker)
+        except ValueError:
+            pass
+    
+    def _maybe_scale_up(self) -> None:
+        if not self._running or self._paused:
+            return
+        if self._idle_workers < self._ready.qsize() and self._live_workers < self.max_workers:
+            self._spawn_worker()
+    
+    def _push(self, item: Dict[str, Any]) -> None:
+        """Append item to its shard and schedule the shard if nobody serves it."""
+        idx = item["shard"]
+        self._shards[idx].append(item)
+        self._size += 1
+        self._metrics.queue_depth_current = self._size
+        if idx not in self._scheduled and idx not in self._held_shards:
+            self._scheduled.add(idx)
+            self._ready.put_nowait(idx)
+            self._maybe_scale_up()
+    
+    def _release_shard(self, idx: int) -> None:
+        """A worker is done with shard idx: hand it to the next worker, or mark it idle."""
+        if self._shards[idx] and idx not in self._held_shards:
+            self._ready.put_nowait(idx)
+            self._maybe_scale_up()
+        else:
+            self._scheduled.discard(idx)
+    
     def enqueue(self, update, update_id: int = 0) -> bool:
         """
         Enqueue update for background processing.
@@ -164,28 +287,169 @@ class UpdateQueueManager:
         """
         self._metrics.total_received += 1
         
+        if self._size >= self.max_size:
+            # Queue overloaded - drop update but log
+            self._metrics.total_dropped += 1
+            self._metrics.last_drop_time = time.time()
+            logger.warning(
+                "[QUEUE] DROPPED update_id=%s (queue full: %d/%d)",
+                update_id, self._size, self.max_size
+            )
+            return False
+        
         # Wrap update with metadata for PASSIVE handling
-        item = {
+        self._push({
             "update": update,
             "update_id": update_id,
             "attempt": 0,
             "first_seen": time.time(),
-        }
-        
-        try:
-            # Try to put without blocking
-            self._queue.put_nowait(item)
-            self._metrics.queue_depth_current = self._queue.qsize()
-            return True
-        except asyncio.QueueFull:
-            # Queue overloaded - drop update but log
+            "shard": hash(
+                update.chat_key if isinstance(update, RawUpdate) else _shard_key(update, update_id)
+            ) % self.num_shards,
+        })
+        return True
+    
+    def _hold(self, item: Dict[str, Any], worker_id: int) -> None:
+        """Park a PASSIVE-held update and freeze its shard until the instance becomes ACTIVE."""
+        self._metrics.total_held += 1
+        if len(self._held) >= self.max_size:
             self._metrics.total_dropped += 1
             self._metrics.last_drop_time = time.time()
             logger.warning(
-                "[QUEUE] DROPPED update_id=%s (queue full: %d/%d)",
-                update_id, self._queue.qsize(), self.max_size
+                "[WORKER_%d] ⚠️ PASSIVE_DROP update_id=%s (hold buffer full)",
+                worker_id, item["update_id"]
             )
-            return False
+            return
+        item["attempt"] += 1
+        self._held.append(item)
+        self._held_shards.add(item["shard"])
+        if self._release_task is None or self._release_task.done():
+            self._release_task = asyncio.create_task(self._release_held(), name="update_queue_release")
+    
+    def _passive_hold_active(self) -> bool:
+        force_active = os.getenv("SINGLETON_LOCK_FORCE_ACTIVE", "0") in ("1", "true", "True")
+        return bool(self._active_state and not self._active_state.active and not force_active)
+    
+    async def _release_held(self):
+        """Put held updates back at the head of their shards and unfreeze them once ACTIVE."""
+        while self._running and self._held:
+            if self._passive_hold_active():
+                wait_active = getattr(self._active_state, "wait_active", None)
+                if wait_active is not None:
+                    await wait_active(timeout=0.5)
+                else:
+                    await asyncio.sleep(0.25)
+                continue
+            released = 0
+            while self._held:
+                item = self._held.pop()  # newest first: appendleft restores arrival order
+                self._shards[item["shard"]].appendleft(item)
+                self._size += 1
+                released += 1
+            self._metrics.queue_depth_current = self._size
+            self._unfreeze_shards()
+            self._metrics.total_requeued += released
+            logger.info("[QUEUE] ▶️ Released %d held updates after PASSIVE→ACTIVE", released)
+
+    def _unfreeze_shards(self) -> None:
+        """Schedule shards that no longer have a held update."""
+        still_held = {item["shard"] for item in self._held}
+        for idx in self._held_shards - still_held:
+            if self._shards[idx] and idx not in self._scheduled:
+                self._scheduled.add(idx)
+                self._ready.put_nowait(idx)
+        self._held_shards = still_held
+        self._maybe_scale_up()
+
+    def detach_pending(self, chat_filter: Optional[Callable[[int], bool]] = None) -> List[Tuple[int, bytes]]:
+        """
+        Take queued and PASSIVE-held updates that no worker has started.
+
+        Used by the lock handover (all updates) and by scale-out rebalancing
+        (chat_filter selects chat keys of shards given away). Returns
+        (update_id, raw webhook body) in arrival order; in-flight updates stay
+        with their workers.
+        """
+        def _take(item: Dict[str, Any]) -> bool:
+            return chat_filter is None or self._chat_matches(item, chat_filter)
+        
+        items: List[Dict[str, Any]] = []
+        for buffer in (self._held, *self._shards):
+            taken = [item for item in buffer if _take(item)]
+            if not taken:
+                continue
+            kept = [item for item in buffer if not _take(item)]
+            buffer.clear()
+            buffer.extend(kept)  # in place: workers keep references to their shard deque
+            items.extend(taken)
+            if buffer is not self._held:
+                self._size -= len(taken)
+        self._metrics.queue_depth_current = self._size
+        self._unfreeze_shards()
+        items.sort(key=lambda item: item["first_seen"])
+        
+        detached = []
+        for item in items:
+            raw = item.get("raw", item["update"])
+            if isinstance(raw, RawUpdate):
+                detached.append((item["update_id"], raw.raw))
+            else:
+                self._metrics.total_dropped += 1
+                logger.warning("[QUEUE] Cannot hand over update_id=%s (no raw body)", item["update_id"])
+        return detached
+
+    @staticmethod
+    def _chat_matches(item: Dict[str, Any], chat_filter: Callable[[int], bool]) -> bool:
+        raw = item.get("raw", item["update"])
+        return isinstance(raw, RawUpdate) and chat_filter(raw.chat_key)
+
+    async def wait_in_flight(self, chat_filter: Callable[[int], bool], timeout: float) -> bool:
+        """
+        Wait until no worker is processing an update of the chat keys chat_filter selects.
+
+        Used by scale-out rebalancing before it gives the chats' shards away
+        (after detach_pending took their queued updates). Returns False on timeout.
+        """
+        deadline = time.monotonic() + timeout
+        while any(self._chat_matches(item, chat_filter) for item in self._in_flight.values()):
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(0.05)
+        return True
+
+    async def quiesce(self, timeout: float) -> bool:
+        """
+        Stop starting queued updates and wait until in-flight ones are done.
+
+        Used before the lock handover: queued updates stay for detach_pending,
+        and nothing of this instance runs once the next one is ACTIVE.
+        Returns False on timeout.
+        """
+        self._paused = True
+        deadline = time.monotonic() + timeout
+        while self._in_flight:
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(0.05)
+        return True
+
+    def resume(self) -> None:
+        """Undo quiesce(): schedule the shards left queued."""
+        self._paused = False
+        for idx, shard in enumerate(self._shards):
+            if shard and idx not in self._scheduled and idx not in self._held_shards:
+                self._scheduled.add(idx)
+                self._ready.put_nowait(idx)
+        self._maybe_scale_up()
+
+    async def drain(self, timeout: float) -> bool:
+        """Wait until queued and in-flight updates are done. Returns False on timeout."""
+        deadline = time.monotonic() + timeout
+        while self._size or self._metrics.workers_active:
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(0.05)
+        return True
 
     @staticmethod
     def _is_passive_allowed(update) -> bool:
@@ -209,326 +473,378 @@ class UpdateQueueManager:
 
         return False
     
+    async def _next_shard(self, timeout: float) -> Optional[int]:
+        """Next ready shard idx, or None on timeout. Never loses an idx to cancellation."""
+        getter = asyncio.ensure_future(self._ready.get())
+        try:
+            done, _ = await asyncio.wait((getter,), timeout=timeout)
+        except asyncio.CancelledError:
+            if getter.done() and not getter.cancelled():
+                self._release_shard(getter.result())
+            else:
+                getter.cancel()
+            raise
+        if not done:
+            getter.cancel()  # Queue.get leaves the item queued when cancelled
+            return None
+        return getter.result()
+    
     async def _worker_loop(self, worker_id: int):
-        """Background worker that processes updates from queue."""
-        import os
-        import time
-        
+        """Background worker: serves one ready shard item at a time."""
         logger.info("[WORKER_%d] Started", worker_id)
         
-        last_passive_log = 0.0  # Rate-limit PASSIVE_WAIT logging
-        active_enter_logged = False  # Track first ACTIVE enter
+        retired = False
+        idle_since = time.monotonic()
+        try:
+            while self._running:
+                self._idle_workers += 1
+                try:
+                    # Wake up regularly to check idle scale-down
+                    idx = await self._next_shard(timeout=1.0)
+                except asyncio.CancelledError:
+                    logger.info("[WORKER_%d] Cancelled", worker_id)
+                    break
+                finally:
+                    self._idle_workers -= 1
+                
+                if idx is None:
+                    if (
+                        self._live_workers > self.num_workers
+                        and time.monotonic() - idle_since > self.worker_idle_timeout
+                    ):
+                        # Claim the scale-down now: other idle workers checking in the
+                        # same tick must already see the smaller pool
+                        self._live_workers -= 1
+                        retired = True
+                        logger.info("[WORKER_%d] Idle, scaling down (workers=%d)", worker_id, self._live_workers)
+                        break
+                    continue
+                
+                if self._paused:
+                    # Leave the shard queued for detach_pending; resume() schedules it again
+                    self._scheduled.discard(idx)
+                    continue
+                
+                shard = self._shards[idx]
+                try:
+                    if shard:
+                        item = shard.popleft()
+                        self._size -= 1
+                        self._metrics.queue_depth_current = self._size
+                        self._in_flight[idx] = item
+                        await self._process_item(item, worker_id)
+                except asyncio.CancelledError:
+                    logger.info("[WORKER_%d] Cancelled", worker_id)
+                    break
+                except Exception as exc:
+                    logger.exception("[WORKER_%d] Unexpected error: %s", worker_id, exc)
+                finally:
+                    self._in_flight.pop(idx, None)
+                    # Next item of the same shard only after this one is done (per-chat order)
+                    self._release_shard(idx)
+                    idle_since = time.monotonic()
+        finally:
+            if not retired:
+                self._live_workers -= 1
+        
+        logger.info("[WORKER_%d] Stopped", worker_id)
+    
+    async def _process_item(self, item: Dict[str, Any], worker_id: int):
+        """Process one queued update (PASSIVE checks, dedup, dispatch)."""
+        # Extract item metadata
+        update = item["update"]
+        update_id = item["update_id"]
         
-        while self._running:
+        # Deferred validation: webhook enqueues raw bytes (app.utils.webhook_ingress)
+        if isinstance(update, RawUpdate):
             try:
-                # Pull update from queue (with timeout to check active state regularly)
-                item = await asyncio.wait_for(
-                    self._queue.get(),
-                    timeout=1.0
+                update = update.parse(self._bot)
+            except Exception as e:
+                logger.warning(
+                    "[WORKER_%d] ⚠️ INVALID_UPDATE update_id=%s dropped: %s",
+                    worker_id, update_id, str(e)[:200]
                 )
-                
-                # Extract item metadata
-                update = item["update"]
-                update_id = item["update_id"]
-                
-                # 🔒 PASSIVE CHECK: Reject forbidden updates immediately with user feedback
-                if self._active_state and not self._active_state.active:
-                    if not _is_allowed_in_passive(update):
-                        # Запрещенный update в PASSIVE режиме - отвечаем пользователю
+                self._metrics.total_dropped += 1
+                return
+            item["raw"] = item["update"]  # kept for lock handover (detach_pending)
+            item["update"] = update
+        
+        # 🔒 PASSIVE CHECK: Reject forbidden updates immediately with user feedback
+        if self._active_state and not self._active_state.active:
+            if not _is_allowed_in_passive(update):
+                # Запрещенный update в PASSIVE режиме - отвечаем пользователю
+                try:
+                    passive_toast = "⏳ Сервис обновляется, повтори через пару секунд"
+                    passive_message = (
+                        "⏳ <b>Сервис обновляется</b>\n\n"
+                        "Идёт перезапуск. Повторите через 10–30 секунд.\n\n"
+                        "Нажмите 'Обновить' для повторной попытки."
+                    )
+                    
+                    # callback_query - answer немедленно + кнопка "Обновить"
+                    if hasattr(update, 'callback_query') and update.callback_query:
+                        callback = update.callback_query
+                        
+                        # CRITICAL: Always answer callback first (no infinite spinner)
+                        from app.telemetry.telemetry_helpers import safe_answer_callback
+                        await safe_answer_callback(
+                            callback,
+                            text=passive_toast,
+                            show_alert=False,
+                            logger_instance=logger
+                        )
+                        
+                        # Send/edit message with refresh button
                         try:
-                            passive_toast = "⏳ Сервис обновляется, повтори через пару секунд"
-                            passive_message = (
-                                "⏳ <b>Сервис обновляется</b>\n\n"
-                                "Идёт перезапуск. Повторите через 10–30 секунд.\n\n"
-                                "Нажмите 'Обновить' для повторной попытки."
-                            )
+                            from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+                            refresh_keyboard = InlineKeyboardMarkup(inline_keyboard=[
+                                [InlineKeyboardButton(text="🔄 Обновить", callback_data="main_menu")]
+                            ])
                             
-                            # callback_query - answer немедленно + кнопка "Обновить"
-                            if hasattr(update, 'callback_query') and update.callback_query:
-                                callback = update.callback_query
-                                
-                                # CRITICAL: Always answer callback first (no infinite spinner)
-                                from app.telemetry.telemetry_helpers import safe_answer_callback
-                                await safe_answer_callback(
-                                    callback,
-                                    text=passive_toast,
-                                    show_alert=False,
-                                    logger_instance=logger
-                                )
-                                
-                                # Send/edit message with refresh button
+                            if callback.message:
                                 try:
-                                    from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-                                    refresh_keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                                        [InlineKeyboardButton(text="🔄 Обновить", callback_data="main_menu")]
-                                    ])
-                                    
-                                    if callback.message:
-                                        try:
-                                            await callback.message.edit_text(
-                                                passive_message,
-                                                reply_markup=refresh_keyboard,
-                                                parse_mode="HTML"
-                                            )
-                                        except Exception:
-                                            # If edit fails, send new message
-                                            await callback.message.answer(
-                                                passive_message,
-                                                reply_markup=refresh_keyboard,
-                                                parse_mode="HTML"
-                                            )
-                                except Exception as msg_err:
-                                    logger.warning(
-                                        "[WORKER_%d] ⚠️ PASSIVE_REJECT message edit/send failed: %s",
-                                        worker_id, msg_err
-                                    )
-                                
-                                logger.info(
-                                    "[WORKER_%d] ⏸️ PASSIVE_REJECT callback_query data=%s (answered + message sent)",
-                                    worker_id, callback.data
-                                )
-                                
-                                # Log to DB (best-effort, non-blocking)
-                                try:
-                                    from app.observability.events_db import log_passive_reject
-                                    from app.telemetry.telemetry_helpers import get_event_ids
-                                    event_ids = get_event_ids(update, {})
-                                    await log_passive_reject(
-                                        cid=event_ids.get("cid", ""),
-                                        update_id=event_ids.get("update_id"),
-                                        update_type="callback_query"
+                                    await callback.message.edit_text(
+                                        passive_message,
+                                        reply_markup=refresh_keyboard,
+                                        parse_mode="HTML"
                                     )
                                 except Exception:
-                                    pass  # Swallow errors
-                            
-                            # message - отправляем сообщение
-                            elif hasattr(update, 'message') and update.message:
-                                try:
-                                    await self._bot.send_message(
-                                        chat_id=update.message.chat.id,
-                                        text=passive_message,
+                                    # If edit fails, send new message
+                                    await callback.message.answer(
+                                        passive_message,
+                                        reply_markup=refresh_keyboard,
                                         parse_mode="HTML"
                                     )
-                                except Exception as msg_err:
-                                    logger.warning(
-                                        "[WORKER_%d] ⚠️ PASSIVE_REJECT send_message failed: %s",
-                                        worker_id, msg_err
-                                    )
-                                logger.info(
-                                    "[WORKER_%d] ⏸️ PASSIVE_REJECT message text=%s (message sent)",
-                                    worker_id, update.message.text[:50] if update.message.text else "(no text)"
-                                )
-                            
-                            self._metrics.total_held += 1
-                        except Exception as notify_err:
-                            # Ultimate fail-safe: at least log the error
-                            logger.error(
-                                "[WORKER_%d] ❌ PASSIVE_REJECT failed to notify user: %s",
-                                worker_id, notify_err,
-                                exc_info=True
+                        except Exception as msg_err:
+                            logger.warning(
+                                "[WORKER_%d] ⚠️ PASSIVE_REJECT message edit/send failed: %s",
+                                worker_id, msg_err
                             )
-                        finally:
-                            # Помечаем как обработанный (не оставляем в очереди)
-                            self._queue.task_done()
-                        continue  # Переходим к следующему update
-                    else:
-                        # Разрешенный update (menu/start) - обрабатываем
+                        
                         logger.info(
-                            "[WORKER_%d] ✅ PASSIVE_MENU_OK processing allowed update",
-                            worker_id
+                            "[WORKER_%d] ⏸️ PASSIVE_REJECT callback_query data=%s (answered + message sent)",
+                            worker_id, callback.data
                         )
-                
-                self._metrics.workers_active += 1
-                self._metrics.queue_depth_current = self._queue.qsize()
-                
-                try:
-                    force_active = os.getenv("SINGLETON_LOCK_FORCE_ACTIVE", "0") in ("1", "true", "True")
-                    is_passive = self._active_state and not self._active_state.active and not force_active
-                    if is_passive and not self._is_passive_allowed(update):
-                        now = time.time()
-                        if now - last_passive_log > 5.0:
-                            logger.info(
-                                "[WORKER_%d] ⏸️ PASSIVE_HOLD update_id=%s queue_depth=%d",
-                                worker_id, update_id, self._queue.qsize()
-                            )
-                            last_passive_log = now
-                        self._metrics.total_held += 1
-                        item["attempt"] += 1
+                        
+                        # Log to DB (best-effort, non-blocking)
                         try:
-                            self._queue.put_nowait(item)
-                        except asyncio.QueueFull:
-                            self._metrics.total_dropped += 1
-                            logger.warning(
-                                "[WORKER_%d] ⚠️ PASSIVE_DROP update_id=%s (queue full)",
-                                worker_id, update_id
+                            from app.observability.events_db import log_passive_reject
+                            from app.telemetry.telemetry_helpers import get_event_ids
+                            event_ids = get_event_ids(update, {})
+                            await log_passive_reject(
+                                cid=event_ids.get("cid", ""),
+                                update_id=event_ids.get("update_id"),
+                                update_type="callback_query"
                             )
-                        await asyncio.sleep(0.5)
-                        continue
-
-                    # Don't count PASSIVE-allowed updates as "degraded" - they're normal
-                    # (degraded only applies to forced ACTIVE mode processing without lock)
-                    # ACTIVE: Log first entry
-                    if not active_enter_logged and not is_passive:
-                        logger.info("[WORKER_%d] ✅ ACTIVE_ENTER active=True", worker_id)
-                        active_enter_logged = True
-
-                    # OBSERVABILITY V2: WORKER_PICK
-                    from app.observability.v2 import log_worker_pick
-                    from app.utils.correlation import get_correlation_id
-                    cid = get_correlation_id() or "unknown"
-                    log_worker_pick(cid=cid, update_id=update_id, worker_id=worker_id)
+                        except Exception:
+                            pass  # Swallow errors
                     
-                    # 🔐 STEP 1: Check persistent dedup BEFORE processing (FAIL-OPEN)
-                    if update_id:
-                        from app.storage.factory import get_storage
-                        storage = get_storage()
-                        
+                    # message - отправляем сообщение
+                    elif hasattr(update, 'message') and update.message:
                         try:
-                            # Check if already processed using storage method
-                            if await storage.is_update_processed(update_id):
-                                logger.warning(
-                                    "[WORKER_%d] ⏭️ DEDUP_SKIP update_id=%s (already processed)",
-                                    worker_id, update_id
-                                )
-                                self._metrics.total_dropped += 1
-                                # Skip processing - task_done() in finally
-                                continue
-                            
-                            # Mark as processing
-                            await storage.mark_update_processed(
-                                update_id,
-                                worker_id=f"worker_{worker_id}",
-                                update_type="message" if getattr(update, "message", None) else "callback_query"
+                            await self._bot.send_message(
+                                chat_id=update.message.chat.id,
+                                text=passive_message,
+                                parse_mode="HTML"
                             )
-                            logger.debug("[WORKER_%d] ✅ DEDUP_OK update_id=%s marked as processing", worker_id, update_id)
-                            
-                        except Exception as e:
-                            # FAIL-OPEN: Log and continue processing without dedup
-                            # This prevents worker deadlock when DB is unavailable
+                        except Exception as msg_err:
                             logger.warning(
-                                "[WORKER_%d] ⚠️ DEDUP_FAIL_OPEN update_id=%s: %s - continuing without dedup",
-                                worker_id, update_id, str(e)
+                                "[WORKER_%d] ⚠️ PASSIVE_REJECT send_message failed: %s",
+                                worker_id, msg_err
                             )
+                        logger.info(
+                            "[WORKER_%d] ⏸️ PASSIVE_REJECT message text=%s (message sent)",
+                            worker_id, update.message.text[:50] if update.message.text else "(no text)"
+                        )
                     
-                    # STEP 2: Process update (feed to dispatcher)
-                    # OBSERVABILITY V2: DISPATCH_START
-                    from app.observability.v2 import log_dispatch_start
-                    from app.utils.correlation import get_correlation_id
-                    cid = get_correlation_id() or "unknown"
-                    handler_name = None  # Will be determined by dispatcher
-                    log_dispatch_start(cid=cid, update_id=update_id, handler_name=handler_name)
-                    
-                    force_degraded = os.getenv("SINGLETON_LOCK_FORCE_ACTIVE", "0") in ("1", "true", "True")
-                    if force_degraded and self._active_state and not self._active_state.active:
-                        self._metrics.total_processed_degraded += 1
-                    elif not is_passive:
-                        self._metrics.total_processed += 1
-                    
-                    start_time = time.monotonic()
-                    await asyncio.wait_for(
-                        self._dp.feed_update(self._bot, update),
-                        timeout=30.0
-                    )
-                    elapsed = time.monotonic() - start_time
-                    duration_ms = elapsed * 1000
-                    
-                    # OBSERVABILITY V2: DISPATCH_OK
-                    from app.observability.v2 import log_dispatch_ok
-                    log_dispatch_ok(
-                        cid=cid,
-                        update_id=update_id,
-                        handler_name=handler_name,
-                        duration_ms=duration_ms,
+                    self._metrics.total_held += 1
+                except Exception as notify_err:
+                    # Ultimate fail-safe: at least log the error
+                    logger.error(
+                        "[WORKER_%d] ❌ PASSIVE_REJECT failed to notify user: %s",
+                        worker_id, notify_err,
+                        exc_info=True
                     )
-                    
-                    # Log to DB (best-effort, non-blocking)
-                    try:
-                        from app.observability.events_db import log_dispatch_ok
-                        from app.telemetry.telemetry_helpers import get_event_ids
-                        event_ids = get_event_ids(update, {})
-                        await log_dispatch_ok(
-                            cid=event_ids.get("cid", ""),
-                            handler="update_queue_worker",
-                            user_id=event_ids.get("user_id")
-                        )
-                    except Exception:
-                        pass  # Swallow errors
-                
-                except asyncio.TimeoutError:
-                    # OBSERVABILITY V2: DISPATCH_FAIL (timeout)
-                    from app.observability.v2 import log_dispatch_fail
-                    from app.utils.correlation import get_correlation_id
-                    cid = get_correlation_id() or "unknown"
-                    elapsed = time.monotonic() - start_time if 'start_time' in locals() else 0
-                    log_dispatch_fail(
-                        cid=cid,
-                        update_id=update_id,
-                        handler_name=handler_name,
-                        error_type="TimeoutError",
-                        safe_message="Handler execution timeout (30s exceeded)",
-                        file_line=f"update_queue._worker_loop:worker_{worker_id}",
-                        duration_ms=elapsed * 1000,
-                        next_step="Check handler performance or increase timeout",
+                return  # Переходим к следующему update
+            else:
+                # Разрешенный update (menu/start) - обрабатываем
+                logger.info(
+                    "[WORKER_%d] ✅ PASSIVE_MENU_OK processing allowed update",
+                    worker_id
+                )
+        
+        self._metrics.workers_active += 1
+        self._metrics.queue_depth_current = self._size
+        
+        try:
+            force_active = os.getenv("SINGLETON_LOCK_FORCE_ACTIVE", "0") in ("1", "true", "True")
+            is_passive = self._active_state and not self._active_state.active and not force_active
+            if is_passive and not self._is_passive_allowed(update):
+                now = time.time()
+                if now - self._last_passive_log > 5.0:
+                    logger.info(
+                        "[WORKER_%d] ⏸️ PASSIVE_HOLD update_id=%s held=%d",
+                        worker_id, update_id, len(self._held)
                     )
-                    self._metrics.total_errors += 1
-                
-                except Exception as exc:
-                    # OBSERVABILITY V2: DISPATCH_FAIL (exception)
-                    from app.observability.v2 import log_dispatch_fail
-                    from app.utils.correlation import get_correlation_id
-                    cid = get_correlation_id() or "unknown"
-                    elapsed = time.monotonic() - start_time if 'start_time' in locals() else 0
-                    error_type = type(exc).__name__
-                    safe_message = str(exc)[:200]  # Truncate long messages
-                    log_dispatch_fail(
-                        cid=cid,
-                        update_id=update_id,
-                        handler_name=handler_name,
-                        error_type=error_type,
-                        safe_message=safe_message,
-                        file_line=f"update_queue._worker_loop:worker_{worker_id}",
-                        duration_ms=elapsed * 1000,
-                        next_step="Check handler code and dependencies",
+                    self._last_passive_log = now
+                # Park in the delayed buffer; released in order on PASSIVE→ACTIVE
+                self._hold(item, worker_id)
+                return
+
+            # Don't count PASSIVE-allowed updates as "degraded" - they're normal
+            # (degraded only applies to forced ACTIVE mode processing without lock)
+            # ACTIVE: Log first entry
+            if not self._active_enter_logged and not is_passive:
+                logger.info("[WORKER_%d] ✅ ACTIVE_ENTER active=True", worker_id)
+                self._active_enter_logged = True
+
+            # OBSERVABILITY V2: WORKER_PICK
+            from app.observability.v2 import log_worker_pick
+            from app.utils.correlation import get_correlation_id
+            cid = get_correlation_id() or "unknown"
+            log_worker_pick(cid=cid, update_id=update_id, worker_id=worker_id)
+            
+            # 🔐 STEP 1: Claim update_id BEFORE processing (FAIL-OPEN)
+            # Local window first (0 round trips for retries), then one atomic storage claim
+            if update_id:
+                try:
+                    from app.storage.factory import get_storage
+                    from app.utils.update_dedup import get_update_dedup
+                    claimed = await get_update_dedup().claim(
+                        get_storage(),
+                        update_id,
+                        worker_id=f"worker_{worker_id}",
+                        update_type="message" if getattr(update, "message", None) else "callback_query",
                     )
-                    logger.exception(
-                        "[WORKER_%d] Error processing update_id=%s: %s",
-                        worker_id, update_id, exc
+                except Exception as e:
+                    # FAIL-OPEN: Log and continue processing without dedup
+                    # This prevents worker deadlock when DB is unavailable
+                    logger.warning(
+                        "[WORKER_%d] ⚠️ DEDUP_FAIL_OPEN update_id=%s: %s - continuing without dedup",
+                        worker_id, update_id, str(e)
                     )
-                    self._metrics.total_errors += 1
-                    
-                    # Log to DB (best-effort, non-blocking)
-                    try:
-                        from app.observability.events_db import log_dispatch_fail
-                        from app.telemetry.telemetry_helpers import get_event_ids
-                        event_ids = get_event_ids(update, {})
-                        await log_dispatch_fail(
-                            cid=event_ids.get("cid", ""),
-                            handler="update_queue_worker",
-                            error=exc,
-                            user_id=event_ids.get("user_id")
-                        )
-                    except Exception:
-                        pass  # Swallow errors
+                    claimed = True
                 
-                finally:
-                    self._metrics.workers_active -= 1
-                    self._queue.task_done()
+                if not claimed:
+                    logger.warning(
+                        "[WORKER_%d] ⏭️ DEDUP_SKIP update_id=%s (already processed)",
+                        worker_id, update_id
+                    )
+                    self._metrics.total_dropped += 1
+                    # Skip processing
+                    return
+                logger.debug("[WORKER_%d] ✅ DEDUP_OK update_id=%s claimed", worker_id, update_id)
             
-            except asyncio.TimeoutError:
-                # No updates available, continue loop
-                continue
+            # STEP 2: Process update (feed to dispatcher)
+            # OBSERVABILITY V2: DISPATCH_START
+            from app.observability.v2 import log_dispatch_start
+            from app.utils.correlation import get_correlation_id
+            cid = get_correlation_id() or "unknown"
+            handler_name = None  # Will be determined by dispatcher
+            log_dispatch_start(cid=cid, update_id=update_id, handler_name=handler_name)
             
-            except asyncio.CancelledError:
-                logger.info("[WORKER_%d] Cancelled", worker_id)
-                break
+            force_degraded = os.getenv("SINGLETON_LOCK_FORCE_ACTIVE", "0") in ("1", "true", "True")
+            if force_degraded and self._active_state and not self._active_state.active:
+                self._metrics.total_processed_degraded += 1
+            elif not is_passive:
+                self._metrics.total_processed += 1
             
-            except Exception as exc:
-                logger.exception("[WORKER_%d] Unexpected error: %s", worker_id, exc)
+            start_time = time.monotonic()
+            await asyncio.wait_for(
+                self._dp.feed_update(self._bot, update),
+                timeout=30.0
+            )
+            elapsed = time.monotonic() - start_time
+            _DISPATCH_OK.observe(elapsed)
+            duration_ms = elapsed * 1000
+            
+            # OBSERVABILITY V2: DISPATCH_OK
+            from app.observability.v2 import log_dispatch_ok
+            log_dispatch_ok(
+                cid=cid,
+                update_id=update_id,
+                handler_name=handler_name,
+                duration_ms=duration_ms,
+            )
+            
+            # Log to DB (best-effort, non-blocking)
+            try:
+                from app.observability.events_db import log_dispatch_ok
+                from app.telemetry.telemetry_helpers import get_event_ids
+                event_ids = get_event_ids(update, {})
+                await log_dispatch_ok(
+                    cid=event_ids.get("cid", ""),
+                    handler="update_queue_worker",
+                    user_id=event_ids.get("user_id")
+                )
+            except Exception:
+                pass  # Swallow errors
         
-        logger.info("[WORKER_%d] Stopped", worker_id)
+        except asyncio.TimeoutError:
+            # OBSERVABILITY V2: DISPATCH_FAIL (timeout)
+            from app.observability.v2 import log_dispatch_fail
+            from app.utils.correlation import get_correlation_id
+            cid = get_correlation_id() or "unknown"
+            elapsed = time.monotonic() - start_time if 'start_time' in locals() else 0
+            _DISPATCH_TIMEOUT.observe(elapsed)
+            log_dispatch_fail(
+                cid=cid,
+                update_id=update_id,
+                handler_name=handler_name,
+                error_type="TimeoutError",
+                safe_message="Handler execution timeout (30s exceeded)",
+                file_line=f"update_queue._worker_loop:worker_{worker_id}",
+                duration_ms=elapsed * 1000,
+                next_step="Check handler performance or increase timeout",
+            )
+            self._metrics.total_errors += 1
+        
+        except Exception as exc:
+            # OBSERVABILITY V2: DISPATCH_FAIL (exception)
+            from app.observability.v2 import log_dispatch_fail
+            from app.utils.correlation import get_correlation_id
+            cid = get_correlation_id() or "unknown"
+            elapsed = time.monotonic() - start_time if 'start_time' in locals() else 0
+            if elapsed:
+                _DISPATCH_ERROR.observe(elapsed)
+            error_type = type(exc).__name__
+            safe_message = str(exc)[:200]  # Truncate long messages
+            log_dispatch_fail(
+                cid=cid,
+                update_id=update_id,
+                handler_name=handler_name,
+                error_type=error_type,
+                safe_message=safe_message,
+                file_line=f"update_queue._worker_loop:worker_{worker_id}",
+                duration_ms=elapsed * 1000,
+                next_step="Check handler code and dependencies",
+            )
+            logger.exception(
+                "[WORKER_%d] Error processing update_id=%s: %s",
+                worker_id, update_id, exc
+            )
+            self._metrics.total_errors += 1
+            
+            # Log to DB (best-effort, non-blocking)
+            try:
+                from app.observability.events_db import log_dispatch_fail
+                from app.telemetry.telemetry_helpers import get_event_ids
+                event_ids = get_event_ids(update, {})
+                await log_dispatch_fail(
+                    cid=event_ids.get("cid", ""),
+                    handler="update_queue_worker",
+                    error=exc,
+                    user_id=event_ids.get("user_id")
+                )
+            except Exception:
+                pass  # Swallow errors
+        
+        finally:
+            self._metrics.workers_active -= 1
     
     def get_metrics(self) -> dict:
         """Get current metrics for /health endpoint."""
+        from app.utils.update_dedup import get_update_dedup
         queue_utilization = (self._metrics.queue_depth_current / max(self.max_size, 1)) * 100
         return {
             "total_received": self._metrics.total_received,
@@ -539,8 +855,13 @@ class UpdateQueueManager:
             "total_dropped": self._metrics.total_dropped,
             "total_errors": self._metrics.total_errors,
             "workers_active": self._metrics.workers_active,
+            "workers_total": len(self._workers),
+            "workers_max": self.max_workers,
             "queue_depth": self._metrics.queue_depth_current,
             "queue_max": self.max_size,
+            "shards": self.num_shards,
+            "shards_busy": len(self._scheduled),
+            "held_depth": len(self._held),
             "queue_utilization_percent": round(queue_utilization, 2),
             "drop_rate_percent": round(
                 (self._metrics.total_dropped / max(self._metrics.total_received, 1)) * 100,
@@ -548,6 +869,7 @@ class UpdateQueueManager:
             ),
             "last_drop_time": self._metrics.last_drop_time,
             "backpressure_active": queue_utilization > 80.0,
+            "dedup": get_update_dedup().stats.as_dict(),
         }
     
     def should_reject_for_backpressure(self) -> bool:
@@ -569,8 +891,14 @@ def get_queue_manager() -> UpdateQueueManager:
     """Get or create global queue manager."""
     global _queue_manager
     if _queue_manager is None:
-        import os
         max_size = int(os.getenv("UPDATE_QUEUE_SIZE", "100"))
         num_workers = int(os.getenv("UPDATE_QUEUE_WORKERS", "3"))
-        _queue_manager = UpdateQueueManager(max_size=max_size, num_workers=num_workers)
+        max_workers = int(os.getenv("UPDATE_QUEUE_MAX_WORKERS", str(max(num_workers, (os.cpu_count() or 1) * 4))))
+        num_shards = int(os.getenv("UPDATE_QUEUE_SHARDS", "32"))
+        _queue_manager = UpdateQueueManager(
+            max_size=max_size,
+            num_workers=num_workers,
+            max_workers=max_workers,
+            num_shards=num_shards,
+        )
     return _queue_manager
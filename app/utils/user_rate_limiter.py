@@ -12,117 +12,296 @@ LIMITS:
 - Cooldown: 10 seconds between paid generations
 
 This is SEPARATE from free tier limits (which are in FreeModelManager).
+
+ALGORITHM (GCRA):
+Each window keeps one "theoretical arrival time" (TAT) instead of a list of
+timestamps. With limit N per window W the emission interval is T = W / N and
+a generation is allowed while TAT - now <= (N - 1) * T, i.e. bursts of N,
+then one per T. Per-user state is three floats regardless of history, and a
+user whose TATs and cooldown are in the past is dropped (state equals fresh).
+
+acquire() admits and records a generation in one step, so concurrent
+requests of one user can't all pass a check before any of them is recorded.
+release() gives a failed generation back: both TATs move back one interval
+and the paid cooldown it started is cleared.
+
+BACKENDS:
+- InMemoryRateLimitBackend: per process
+- StorageRateLimitBackend: Postgres (migration 016) through the storage,
+  one conditional upsert per admitted generation, timed by the database
+  clock; limits survive ACTIVE/PASSIVE handover and hold across instances.
+  USER_RATE_LIMIT_BACKEND=memory|storage (default storage, which falls back
+  to memory when the storage has no rate limit table support).
+Backend errors fail open to the in-process state.
 """
 import logging
+import math
+import os
 import time
-from typing import Dict, Optional
-from dataclasses import dataclass, field
-from collections import defaultdict
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+# (tat_minute, tat_hour, last_paid_at), unix seconds
+RateState = Tuple[float, float, float]
+
+_FRESH: RateState = (0.0, 0.0, 0.0)
+
+
+class RateLimitBackend:
+    """Storage for per-user GCRA state."""
+
+    name = "base"
+
+    async def load(self, user_id: int) -> Optional[RateState]:
+        raise NotImplementedError
+
+    async def advance(
+        self, user_id: int, now: float, minute_interval: float, hour_interval: float, is_paid: bool
+    ) -> RateState:
+        """Atomically record one generation; returns the new state."""
+        raise NotImplementedError
+
+    async def acquire(self, user_id: int, limits: "GcraLimits", is_paid: bool) -> Tuple[bool, RateState, float]:
+        """
+        Atomically admit and record one generation if the limits allow it.
+
+        Returns:
+            (allowed, state, now): the advanced state when allowed, the
+            current one when denied; now is the backend's clock
+        """
+        raise NotImplementedError
+
+    async def release(
+        self, user_id: int, minute_interval: float, hour_interval: float, is_paid: bool, admitted_at: float
+    ) -> None:
+        """Atomically give back one admitted generation (see _released)."""
+        raise NotImplementedError
+
+    async def evict(self, now: float, cooldown_seconds: float) -> int:
+        """Drop states that no longer constrain anything; returns number dropped."""
+        raise NotImplementedError
 
-@dataclass
-class UserRateLimit:
-    """Per-user rate limit tracking."""
-    user_id: int
-    last_gen_time: float = 0.0
-    minute_gens: list = field(default_factory=list)  # timestamps in last minute
-    hour_gens: list = field(default_factory=list)    # timestamps in last hour
+
+class GcraLimits(NamedTuple):
+    """Emission intervals, burst tolerances and paid cooldown, in seconds."""
+    minute_interval: float
+    hour_interval: float
+    minute_tolerance: float
+    hour_tolerance: float
+    cooldown_seconds: float
+
+
+def _admits(state: RateState, now: float, limits: GcraLimits, is_paid: bool) -> bool:
+    tat_minute, tat_hour, last_paid_at = state
+    return (
+        tat_minute - now <= limits.minute_tolerance
+        and tat_hour - now <= limits.hour_tolerance
+        and (not is_paid or last_paid_at <= now - limits.cooldown_seconds)
+    )
+
+
+def _advanced(state: RateState, now: float, minute_interval: float, hour_interval: float, is_paid: bool) -> RateState:
+    tat_minute, tat_hour, last_paid_at = state
+    return (
+        max(tat_minute, now) + minute_interval,
+        max(tat_hour, now) + hour_interval,
+        now if is_paid else last_paid_at,
+    )
+
+
+def _released(
+    state: RateState, minute_interval: float, hour_interval: float, is_paid: bool, admitted_at: float
+) -> RateState:
+    # The cooldown is only cleared if no later paid generation has restarted it
+    tat_minute, tat_hour, last_paid_at = state
+    return (
+        tat_minute - minute_interval,
+        tat_hour - hour_interval,
+        0.0 if is_paid and last_paid_at == admitted_at else last_paid_at,
+    )
+
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    """Per-process state: user_id -> (tat_minute, tat_hour, last_paid_at)."""
+
+    name = "memory"
+
+    def __init__(self) -> None:
+        self._states: Dict[int, RateState] = {}
+
+    async def load(self, user_id: int) -> Optional[RateState]:
+        return self._states.get(user_id)
+
+    async def advance(
+        self, user_id: int, now: float, minute_interval: float, hour_interval: float, is_paid: bool
+    ) -> RateState:
+        state = _advanced(self._states.get(user_id, _FRESH), now, minute_interval, hour_interval, is_paid)
+        self._states[user_id] = state
+        return state
+
+    async def acquire(self, user_id: int, limits: GcraLimits, is_paid: bool) -> Tuple[bool, RateState, float]:
+        now = time.time()
+        state = self._states.get(user_id, _FRESH)
+        if not _admits(state, now, limits, is_paid):
+            return False, state, now
+        state = _advanced(state, now, limits.minute_interval, limits.hour_interval, is_paid)
+        self._states[user_id] = state
+        return True, state, now
+
+    async def release(
+        self, user_id: int, minute_interval: float, hour_interval: float, is_paid: bool, admitted_at: float
+    ) -> None:
+        state = self._states.get(user_id)
+        if state is not None:
+            self._states[user_id] = _released(state, minute_interval, hour_interval, is_paid, admitted_at)
+
+    async def evict(self, now: float, cooldown_seconds: float) -> int:
+        stale = [
+            user_id
+            for user_id, (_tat_minute, tat_hour, last_paid_at) in self._states.items()
+            if tat_hour <= now and last_paid_at <= now - cooldown_seconds
+        ]
+        for user_id in stale:
+            del self._states[user_id]
+        return len(stale)
+
+    def clear(self) -> None:
+        self._states.clear()
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+
+class StorageRateLimitBackend(RateLimitBackend):
+    """Shared state via storage.get_rate_limit_state / acquire_rate_limit (PostgresStorage)."""
+
+    name = "storage"
+
+    def __init__(self, storage_getter: Optional[Callable[[], Any]] = None) -> None:
+        if storage_getter is None:
+            from app.storage import get_storage
+            storage_getter = get_storage
+        self._storage_getter = storage_getter
+
+    def _method(self, name: str):
+        method = getattr(self._storage_getter(), name, None)
+        if method is None:
+            raise NotImplementedError(f"storage has no {name}()")
+        return method
+
+    def supported(self) -> bool:
+        try:
+            return hasattr(self._storage_getter(), "acquire_rate_limit")
+        except Exception:
+            return False
+
+    async def load(self, user_id: int) -> Optional[RateState]:
+        return await self._method("get_rate_limit_state")(user_id)
+
+    async def advance(
+        self, user_id: int, now: float, minute_interval: float, hour_interval: float, is_paid: bool
+    ) -> RateState:
+        return await self._method("advance_rate_limit")(user_id, now, minute_interval, hour_interval, is_paid)
+
+    async def acquire(self, user_id: int, limits: GcraLimits, is_paid: bool) -> Tuple[bool, RateState, float]:
+        return await self._method("acquire_rate_limit")(user_id, *limits, is_paid)
+
+    async def release(
+        self, user_id: int, minute_interval: float, hour_interval: float, is_paid: bool, admitted_at: float
+    ) -> None:
+        await self._method("release_rate_limit")(user_id, minute_interval, hour_interval, is_paid, admitted_at)
+
+    async def evict(self, now: float, cooldown_seconds: float) -> int:
+        return await self._method("evict_rate_limits")(now, cooldown_seconds)
 
 
 class UserRateLimiter:
     """Rate limiter for user generations (paid + free)."""
-    
+
     # Limits
     MAX_GENS_PER_MINUTE = 5
     MAX_GENS_PER_HOUR = 20
     COOLDOWN_SECONDS = 10  # между платными генерациями
-    
-    def __init__(self):
-        self._user_limits: Dict[int, UserRateLimit] = {}
-    
-    def _get_user_limit(self, user_id: int) -> UserRateLimit:
-        """Get or create user limit tracker."""
-        if user_id not in self._user_limits:
-            self._user_limits[user_id] = UserRateLimit(user_id=user_id)
-        return self._user_limits[user_id]
-    
-    def _cleanup_old_timestamps(self, timestamps: list, window_seconds: float) -> list:
-        """Remove timestamps older than window."""
-        now = time.time()
-        cutoff = now - window_seconds
-        return [ts for ts in timestamps if ts > cutoff]
-    
-    def check_rate_limit(self, user_id: int, is_paid: bool = True) -> Dict[str, any]:
-        """
-        Check if user can generate.
-        
-        Args:
-            user_id: Telegram user ID
-            is_paid: True for paid models, False for free models
-        
-        Returns:
-            {
-                "allowed": bool,
-                "reason": str,  # "ok", "cooldown", "minute_limit", "hour_limit"
-                "wait_seconds": int,  # seconds to wait before next gen
-                "minute_used": int,
-                "hour_used": int
-            }
-        """
-        now = time.time()
-        user_limit = self._get_user_limit(user_id)
-        
-        # Cleanup old timestamps
-        user_limit.minute_gens = self._cleanup_old_timestamps(user_limit.minute_gens, 60)
-        user_limit.hour_gens = self._cleanup_old_timestamps(user_limit.hour_gens, 3600)
-        
-        minute_count = len(user_limit.minute_gens)
-        hour_count = len(user_limit.hour_gens)
-        
-        # Check cooldown (only for paid)
-        if is_paid and user_limit.last_gen_time > 0:
-            time_since_last = now - user_limit.last_gen_time
-            if time_since_last < self.COOLDOWN_SECONDS:
-                wait_seconds = int(self.COOLDOWN_SECONDS - time_since_last) + 1
-                logger.warning(f"User {user_id} rate limited: cooldown ({wait_seconds}s)")
-                return {
-                    "allowed": False,
-                    "reason": "cooldown",
-                    "wait_seconds": wait_seconds,
-                    "minute_used": minute_count,
-                    "hour_used": hour_count
-                }
-        
-        # Check minute limit
-        if minute_count >= self.MAX_GENS_PER_MINUTE:
-            # Calculate wait time until oldest gen expires
-            oldest_ts = min(user_limit.minute_gens)
-            wait_seconds = int(60 - (now - oldest_ts)) + 1
-            logger.warning(f"User {user_id} rate limited: {minute_count}/min")
+
+    # How often stale user states are dropped
+    EVICT_INTERVAL_SECONDS = 300
+
+    def __init__(self, backend: Optional[RateLimitBackend] = None):
+        self.backend = backend if backend is not None else InMemoryRateLimitBackend()
+        # Used when the backend is unavailable (fail-open, still limits per process)
+        self._local = self.backend if isinstance(self.backend, InMemoryRateLimitBackend) else InMemoryRateLimitBackend()
+        self._next_evict = time.time() + self.EVICT_INTERVAL_SECONDS
+
+    @property
+    def minute_interval(self) -> float:
+        return 60.0 / self.MAX_GENS_PER_MINUTE
+
+    @property
+    def hour_interval(self) -> float:
+        return 3600.0 / self.MAX_GENS_PER_HOUR
+
+    @property
+    def limits(self) -> GcraLimits:
+        return GcraLimits(
+            minute_interval=self.minute_interval,
+            hour_interval=self.hour_interval,
+            minute_tolerance=(self.MAX_GENS_PER_MINUTE - 1) * self.minute_interval,
+            hour_tolerance=(self.MAX_GENS_PER_HOUR - 1) * self.hour_interval,
+            cooldown_seconds=float(self.COOLDOWN_SECONDS),
+        )
+
+    def _backend_for_call(self) -> RateLimitBackend:
+        backend = self.backend
+        if isinstance(backend, StorageRateLimitBackend) and not backend.supported():
+            return self._local
+        return backend
+
+    async def _load(self, user_id: int) -> RateState:
+        backend = self._backend_for_call()
+        try:
+            return await backend.load(user_id) or _FRESH
+        except Exception as e:
+            logger.warning(f"[RATE_LIMIT] {backend.name} backend unavailable, using local state: {e}")
+            return await self._local.load(user_id) or _FRESH
+
+    @staticmethod
+    def _used(tat: float, now: float, interval: float, limit: int) -> int:
+        """Generations currently counted against a window."""
+        if tat <= now:
+            return 0
+        return min(limit, max(0, math.ceil((tat - now) / interval - 1e-9)))
+
+    def _evaluate(self, state: RateState, now: float, is_paid: bool) -> Dict[str, Any]:
+        tat_minute, tat_hour, last_paid_at = state
+        minute_count = self._used(tat_minute, now, self.minute_interval, self.MAX_GENS_PER_MINUTE)
+        hour_count = self._used(tat_hour, now, self.hour_interval, self.MAX_GENS_PER_HOUR)
+
+        def _denied(reason: str, wait: float) -> Dict[str, Any]:
             return {
                 "allowed": False,
-                "reason": "minute_limit",
-                "wait_seconds": wait_seconds,
+                "reason": reason,
+                "wait_seconds": int(wait) + 1,
                 "minute_used": minute_count,
                 "hour_used": hour_count
             }
-        
+
+        # Check cooldown (only for paid)
+        if is_paid and last_paid_at > 0:
+            time_since_last = now - last_paid_at
+            if time_since_last < self.COOLDOWN_SECONDS:
+                return _denied("cooldown", self.COOLDOWN_SECONDS - time_since_last)
+
+        # Check minute limit: next arrival must not exceed the burst tolerance
+        minute_excess = tat_minute - now - (self.MAX_GENS_PER_MINUTE - 1) * self.minute_interval
+        if minute_excess > 0:
+            return _denied("minute_limit", minute_excess)
+
         # Check hour limit
-        if hour_count >= self.MAX_GENS_PER_HOUR:
-            # Calculate wait time until oldest gen expires
-            oldest_ts = min(user_limit.hour_gens)
-            wait_seconds = int(3600 - (now - oldest_ts)) + 1
-            logger.warning(f"User {user_id} rate limited: {hour_count}/hour")
-            return {
-                "allowed": False,
-                "reason": "hour_limit",
-                "wait_seconds": wait_seconds,
-                "minute_used": minute_count,
-                "hour_used": hour_count
-            }
-        
+        hour_excess = tat_hour - now - (self.MAX_GENS_PER_HOUR - 1) * self.hour_interval
+        if hour_excess > 0:
+            return _denied("hour_limit", hour_excess)
+
         # All checks passed
         return {
             "allowed": True,
@@ -131,42 +310,128 @@ class UserRateLimiter:
             "minute_used": minute_count,
             "hour_used": hour_count
         }
-    
-    def record_generation(self, user_id: int, is_paid: bool = True):
-        """Record a generation (call after successful gen)."""
+
+    async def acquire(self, user_id: int, is_paid: bool = True) -> Dict[str, Any]:
+        """
+        Admit and record one generation if the user is within limits.
+
+        Check and record are one atomic backend operation. A generation
+        that then fails should be given back with release().
+
+        Returns:
+            Same dict as check_rate_limit(); minute_used / hour_used include
+            this generation when allowed, and "admitted_at" identifies the
+            admission for release()
+        """
+        backend = self._backend_for_call()
+        limits = self.limits
+        try:
+            allowed, state, now = await backend.acquire(user_id, limits, is_paid)
+        except Exception as e:
+            logger.warning(f"[RATE_LIMIT] {backend.name} backend unavailable, admitting locally: {e}")
+            allowed, state, now = await self._local.acquire(user_id, limits, is_paid)
+
+        result = self._evaluate(state, now, is_paid)
+        if allowed:
+            result.update(allowed=True, reason="ok", wait_seconds=0, admitted_at=state[2] if is_paid else now)
+            logger.info(
+                f"Rate limit acquired: user={user_id}, paid={is_paid}, "
+                f"minute={result['minute_used']}/{self.MAX_GENS_PER_MINUTE}, "
+                f"hour={result['hour_used']}/{self.MAX_GENS_PER_HOUR}"
+            )
+            await self._maybe_evict(now)
+            return result
+
+        if result["allowed"]:
+            # State changed between the backend's decision and this read: retry shortly
+            result.update(allowed=False, reason="minute_limit", wait_seconds=1)
+        logger.warning(f"User {user_id} rate limited: {result['reason']} ({result['wait_seconds']}s)")
+        return result
+
+    async def release(self, user_id: int, admitted_at: float, is_paid: bool = True) -> None:
+        """
+        Give back a generation admitted by acquire() that failed.
+
+        Its slots in the minute and hour windows are returned and, for paid
+        generations, the cooldown it started is cleared, so a failure
+        (insufficient balance, KIE error, timeout) doesn't use up the quota.
+        """
+        backend = self._backend_for_call()
+        try:
+            await backend.release(user_id, self.minute_interval, self.hour_interval, is_paid, admitted_at)
+        except Exception as e:
+            logger.warning(f"[RATE_LIMIT] {backend.name} backend unavailable, releasing locally: {e}")
+            await self._local.release(user_id, self.minute_interval, self.hour_interval, is_paid, admitted_at)
+        logger.info(f"Rate limit released: user={user_id}, paid={is_paid}")
+
+    async def check_rate_limit(self, user_id: int, is_paid: bool = True) -> Dict[str, Any]:
+        """
+        Check if user can generate, without recording anything.
+
+        Use acquire() to admit a generation: a check followed by
+        record_generation() lets concurrent requests pass together.
+
+        Args:
+            user_id: Telegram user ID
+            is_paid: True for paid models, False for free models
+
+        Returns:
+            {
+                "allowed": bool,
+                "reason": str,  # "ok", "cooldown", "minute_limit", "hour_limit"
+                "wait_seconds": int,  # seconds to wait before next gen
+                "minute_used": int,
+                "hour_used": int
+            }
+        """
         now = time.time()
-        user_limit = self._get_user_limit(user_id)
-        
-        # Update last gen time (for cooldown)
-        if is_paid:
-            user_limit.last_gen_time = now
-        
-        # Add to minute/hour trackers
-        user_limit.minute_gens.append(now)
-        user_limit.hour_gens.append(now)
-        
+        result = self._evaluate(await self._load(user_id), now, is_paid)
+        if not result["allowed"]:
+            logger.warning(f"User {user_id} rate limited: {result['reason']} ({result['wait_seconds']}s)")
+        return result
+
+    async def record_generation(self, user_id: int, is_paid: bool = True):
+        """Record a generation unconditionally (acquire() already records what it admits)."""
+        now = time.time()
+        backend = self._backend_for_call()
+        try:
+            state = await backend.advance(user_id, now, self.minute_interval, self.hour_interval, is_paid)
+        except Exception as e:
+            logger.warning(f"[RATE_LIMIT] {backend.name} backend unavailable, recording locally: {e}")
+            state = await self._local.advance(user_id, now, self.minute_interval, self.hour_interval, is_paid)
+
         logger.info(
             f"Rate limit recorded: user={user_id}, paid={is_paid}, "
-            f"minute={len(user_limit.minute_gens)}/{self.MAX_GENS_PER_MINUTE}, "
-            f"hour={len(user_limit.hour_gens)}/{self.MAX_GENS_PER_HOUR}"
+            f"minute={self._used(state[0], now, self.minute_interval, self.MAX_GENS_PER_MINUTE)}/{self.MAX_GENS_PER_MINUTE}, "
+            f"hour={self._used(state[1], now, self.hour_interval, self.MAX_GENS_PER_HOUR)}/{self.MAX_GENS_PER_HOUR}"
         )
-    
-    def get_user_stats(self, user_id: int) -> Dict[str, int]:
+        await self._maybe_evict(now)
+
+    async def get_user_stats(self, user_id: int) -> Dict[str, int]:
         """Get user rate limit stats."""
-        user_limit = self._get_user_limit(user_id)
-        
-        # Cleanup old timestamps
-        user_limit.minute_gens = self._cleanup_old_timestamps(user_limit.minute_gens, 60)
-        user_limit.hour_gens = self._cleanup_old_timestamps(user_limit.hour_gens, 3600)
-        
+        now = time.time()
+        tat_minute, tat_hour, _last_paid_at = await self._load(user_id)
+
         return {
-            "minute_used": len(user_limit.minute_gens),
+            "minute_used": self._used(tat_minute, now, self.minute_interval, self.MAX_GENS_PER_MINUTE),
             "minute_limit": self.MAX_GENS_PER_MINUTE,
-            "hour_used": len(user_limit.hour_gens),
+            "hour_used": self._used(tat_hour, now, self.hour_interval, self.MAX_GENS_PER_HOUR),
             "hour_limit": self.MAX_GENS_PER_HOUR,
             "cooldown_seconds": self.COOLDOWN_SECONDS
         }
 
+    async def _maybe_evict(self, now: float) -> None:
+        if now < self._next_evict:
+            return
+        self._next_evict = now + self.EVICT_INTERVAL_SECONDS
+        for backend in {id(b): b for b in (self._backend_for_call(), self._local)}.values():
+            try:
+                evicted = await backend.evict(now, self.COOLDOWN_SECONDS)
+                if evicted:
+                    logger.debug(f"[RATE_LIMIT] Evicted {evicted} idle users from {backend.name} backend")
+            except Exception as e:
+                logger.warning(f"[RATE_LIMIT] Eviction failed on {backend.name} backend: {e}")
+
 
 # Global instance
 _rate_limiter: Optional[UserRateLimiter] = None
@@ -176,5 +441,12 @@ def get_rate_limiter() -> UserRateLimiter:
     """Get or create global rate limiter."""
     global _rate_limiter
     if _rate_limiter is None:
-        _rate_limiter = UserRateLimiter()
+        backend_name = os.getenv("USER_RATE_LIMIT_BACKEND", "storage").strip().lower()
+        if backend_name == "memory":
+            backend: RateLimitBackend = InMemoryRateLimitBackend()
+        else:
+            if backend_name != "storage":
+                logger.warning(f"[RATE_LIMIT] Unknown USER_RATE_LIMIT_BACKEND={backend_name}, using storage")
+            backend = StorageRateLimitBackend()
+        _rate_limiter = UserRateLimiter(backend)
     return _rate_limiter
@@ -0,0 +1,103 @@
+"""
+Webhook ingress fast path: raw bytes in, lazily validated Update out.
+
+The webhook handler used to run request.json() + Update.model_validate() for
+every POST before answering 200. Now it only:
+
+1. reads the raw body (bytes, no decode)
+2. pulls update_id / update type / chat key out with a byte regex over the
+   head of the payload (Telegram always serializes update_id first);
+   falls back to json.loads when the layout is unexpected
+3. enqueues a RawUpdate; pydantic validation happens in the worker via
+   RawUpdate.parse() (Update.model_validate_json straight from bytes)
+
+Duplicates are filtered with a fixed-size window (RecentIdWindow), so memory
+stays flat during Telegram retry storms.
+"""
+
+import json
+import logging
+import re
+from typing import Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_HEAD_RE = re.compile(rb'^\s*\{\s*"update_id"\s*:\s*(\d+)\s*,\s*"([a-z_]+)"\s*:')
+_CHAT_ID_RE = re.compile(rb'"chat"\s*:\s*\{\s*"id"\s*:\s*(-?\d+)')
+_FROM_ID_RE = re.compile(rb'"from"\s*:\s*\{\s*"id"\s*:\s*(\d+)')
+
+# Update types whose ordering key is the chat (else: sender)
+_CHAT_TYPES = frozenset({
+    "message", "edited_message", "channel_post", "edited_channel_post", "callback_query",
+    "my_chat_member", "chat_member", "chat_join_request", "business_message", "edited_business_message",
+})
+
+
+class BadPayload(ValueError):
+    """Body is not a Telegram update (not JSON / no update_id)."""
+
+
+class RawUpdate:
+    """Queued webhook payload; validated into aiogram Update on first parse()."""
+
+    __slots__ = ("raw", "update_id", "update_type", "chat_key", "_update")
+
+    def __init__(self, raw: bytes, update_id: int, update_type: str, chat_key: int) -> None:
+        self.raw = raw
+        self.update_id = update_id
+        self.update_type = update_type
+        self.chat_key = chat_key
+        self._update = None
+
+    def parse(self, bot: Any = None) -> Any:
+        """Validate into aiogram Update (cached). Raises pydantic ValidationError."""
+        if self._update is None:
+            from aiogram.types import Update
+            context = {"bot": bot} if bot is not None else None
+            self._update = Update.model_validate_json(self.raw, context=context)
+        return self._update
+
+    def __repr__(self) -> str:
+        return f"RawUpdate(update_id={self.update_id}, type={self.update_type}, {len(self.raw)} bytes)"
+
+
+def _scan(raw: bytes) -> Optional[Tuple[int, str, int]]:
+    head = _HEAD_RE.match(raw)
+    if head is None:
+        return None
+    update_id = int(head.group(1))
+    update_type = head.group(2).decode()
+    key = None
+    if update_type in _CHAT_TYPES:
+        match = _CHAT_ID_RE.search(raw)
+        if match is not None:
+            key = int(match.group(1))
+    if key is None:
+        match = _FROM_ID_RE.search(raw)
+        if match is not None:
+            key = int(match.group(1))
+    return update_id, update_type, key if key is not None else update_id
+
+
+def _scan_json(raw: bytes) -> Tuple[int, str, int]:
+    try:
+        payload = json.loads(raw)
+        update_id = int(payload["update_id"])
+    except (ValueError, TypeError, KeyError) as e:
+        raise BadPayload(str(e)) from e
+    from app.utils.update_queue import _shard_key
+    update_type = next((k for k in payload if k != "update_id"), "unknown")
+    return update_id, update_type, _shard_key(payload, update_id)
+
+
+def parse_raw_update(raw: bytes) -> RawUpdate:
+    """
+    Extract routing fields from a webhook body without full validation.
+
+    Raises:
+        BadPayload: body is not JSON or has no update_id
+    """
+    fields = _scan(raw)
+    if fields is None:
+        fields = _scan_json(raw)
+    return RawUpdate(raw, *fields)
@@ -0,0 +1,138 @@
+"""
+Pre-rendered menu screens (inline keyboards and static texts).
+
+Screens are keyed by (screen, category, page, lang, version). The version is
+derived from the catalog version and the price snapshot version, so a
+catalog reload or a price change (FX rate, pricing config) invalidates every
+screen at once; nothing is ever served for a stale catalog. Menu callbacks
+read prebuilt objects and do no catalog work on a hit.
+
+Cached values (InlineKeyboardMarkup, str, tuples of model dicts) are shared
+between all users and must be treated as read-only.
+"""
+
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LANG = "ru"
+
+
+class ScreenKey(NamedTuple):
+    screen: str
+    category: str  # category or model_id, "" when not applicable
+    page: int
+    lang: str
+    version: str
+
+
+@dataclass
+class ScreenCacheStats:
+    hits: int = 0
+    misses: int = 0
+    invalidations: int = 0
+    warmups: int = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "warmups": self.warmups,
+        }
+
+
+def content_version() -> str:
+    """Catalog version + price snapshot version (changes when menus must be re-rendered)."""
+    from app.pricing.snapshot import get_price_snapshot
+
+    snapshot = get_price_snapshot()
+    return f"{snapshot.catalog_version}#p{snapshot.version}"
+
+
+class ScreenCache:
+    """Versioned cache of rendered screens."""
+
+    def __init__(self, version_fn: Callable[[], str] = content_version) -> None:
+        self._version_fn = version_fn
+        self._version: Optional[str] = None
+        self._screens: Dict[ScreenKey, Any] = {}
+        self._lock = threading.Lock()
+        self.stats = ScreenCacheStats()
+
+    def version(self) -> str:
+        """Current content version; drops all screens when it changed."""
+        version = self._version_fn()
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    if self._version is not None:
+                        self.stats.invalidations += 1
+                        logger.info(f"[SCREEN_CACHE] Content changed ({self._version} -> {version}), {len(self._screens)} screens dropped")
+                    self._screens = {}
+                    self._version = version
+        return version
+
+    def get(
+        self,
+        screen: str,
+        builder: Callable[[], Any],
+        category: str = "",
+        page: int = 0,
+        lang: str = DEFAULT_LANG,
+    ) -> Any:
+        """
+        Get a rendered screen, building it on miss.
+
+        Args:
+            screen: screen name ("main_menu", "category_page", "model_detail", ...)
+            builder: renders the screen (called only on miss)
+            category: category or model_id the screen is for
+            page: page number for paginated screens
+            lang: UI language
+        """
+        key = ScreenKey(screen, category, page, lang, self.version())
+        screens = self._screens
+        value = screens.get(key)
+        if value is not None:
+            self.stats.hits += 1
+            return value
+        self.stats.misses += 1
+        value = builder()
+        # Keys carry the version: a value built across an invalidation is never served for the new one
+        screens[key] = value
+        return value
+
+    def warm(self, warmer: Callable[["ScreenCache"], int]) -> int:
+        """Render screens ahead of time; returns number of screens built."""
+        self.version()
+        built = warmer(self)
+        self.stats.warmups += 1
+        logger.info(f"[SCREEN_CACHE] ✅ Warmed {built} screens (version={self._version})")
+        return built
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._screens = {}
+            self._version = None
+            self.stats.invalidations += 1
+
+    def __len__(self) -> int:
+        return len(self._screens)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"version": self._version, "screens": len(self._screens), **self.stats.as_dict()}
+
+
+_screen_cache: Optional[ScreenCache] = None
+
+
+def get_screen_cache() -> ScreenCache:
+    """Get global screen cache."""
+    global _screen_cache
+    if _screen_cache is None:
+        _screen_cache = ScreenCache()
+    return _screen_cache
@@ -1,32 +1,118 @@
 """Universal adapter for normalizing different payload structures"""
-from typing import Dict, Any, List, Optional
+import re
+from datetime import datetime
+from typing import Dict, Any, Callable, FrozenSet, List, Optional, Tuple
 from loguru import logger
 
+# Alternative keys per field, in probing order
+ID_KEYS = ('id', 'matchId', 'match_id', 'eventId', 'event_id')
+LEAGUE_KEYS = ('league', 'tournament', 'competition', 'category')
+SET_INDEX_KEYS = ('currentSetIndex', 'current_set_index', 'setNumber', 'set_number')
+UPDATE_TS_KEYS = ('lastUpdate', 'last_update', 'updatedAt', 'updated_at', 'timestamp')
+
+Plan = Callable[[Dict[str, Any]], Dict[str, Any]]
+
+_URL_NUMBERS = re.compile(r'\d+')
+
+
+def url_pattern(url: Optional[str]) -> str:
+    """Endpoint pattern of a payload URL: query dropped, ids/timestamps collapsed to '#'"""
+    if not url:
+        return ''
+    return _URL_NUMBERS.sub('#', url.split('?', 1)[0])
+
+
+def _first_key(keys: FrozenSet[str], candidates: Tuple[str, ...]) -> Optional[str]:
+    for key in candidates:
+        if key in keys:
+            return key
+    return None
+
+
+class ShapePlanCache:
+    """
+    Compiled extraction plans per endpoint URL pattern and event key set.
+
+    The key set of an event decides which alternative key every field is
+    read from, so a plan is compiled once per shape and then reads fixed
+    keys. Each pattern keeps its last plan: the hot path is one key-set
+    comparison per event. Another key set (shape change) looks up or
+    compiles the plan for that shape.
+    """
+
+    def __init__(self, compile_plan: Callable[[FrozenSet[str]], Plan], max_shapes: int = 32, max_patterns: int = 256):
+        self.compile_plan = compile_plan
+        self.max_shapes = max_shapes
+        self.max_patterns = max_patterns
+        self.stats = {'hits': 0, 'shape_changes': 0, 'compiles': 0}
+        self._last: Dict[str, Tuple[FrozenSet[str], Plan]] = {}
+        self._plans: Dict[str, Dict[FrozenSet[str], Plan]] = {}
+
+    def plan_for(self, pattern: str, event: Dict[str, Any]) -> Plan:
+        last = self._last.get(pattern)
+        if last is not None and event.keys() == last[0]:
+            self.stats['hits'] += 1
+            return last[1]
+
+        keys = frozenset(event)
+        plans = self._plans.get(pattern)
+        if plans is None:
+            if len(self._plans) >= self.max_patterns:
+                self.clear()
+            plans = self._plans[pattern] = {}
+
+        plan = plans.get(keys)
+        if plan is None:
+            if len(plans) >= self.max_shapes:
+                plans.clear()  # Shapes churn on this endpoint: start over
+            plan = plans[keys] = self.compile_plan(keys)
+            self.stats['compiles'] += 1
+            logger.debug(f"Payload shape compiled for '{pattern}': {sorted(keys)}")
+        else:
+            self.stats['shape_changes'] += 1
+
+        self._last[pattern] = (keys, plan)
+        return plan
+
+    def clear(self):
+        self._last.clear()
+        self._plans.clear()
+
 
 class EventNormalizer:
-    """Adaptive parser that extracts event data from various payload structures"""
-    
+    """
+    Adaptive parser that extracts event data from various payload structures.
+
+    Which of the alternative keys a field is read from is resolved once per
+    payload shape (see ShapePlanCache); pass the payload URL so that every
+    endpoint keeps its own plan.
+    """
+
     @staticmethod
-    def normalize_event(payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    def normalize_event(payload: Dict[str, Any], url: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """
         Extract normalized event from payload.
         Returns None if event cannot be extracted.
         """
+        return EventNormalizer._normalize_event(payload, url_pattern(url))
+
+    @staticmethod
+    def _normalize_event(payload: Dict[str, Any], pattern: str) -> Optional[Dict[str, Any]]:
         try:
             # Try different common structures
             event = None
-            
+
             # Structure 1: direct event object
             if isinstance(payload, dict) and 'id' in payload:
                 event = payload
-            
+
             # Structure 2: events array
             elif isinstance(payload, dict) and 'events' in payload:
                 # Process first event or return None (will be called per event)
                 events = payload.get('events', [])
                 if events and isinstance(events, list):
                     event = events[0]
-            
+
             # Structure 3: data.events
             elif isinstance(payload, dict) and 'data' in payload:
                 data = payload.get('data', {})
@@ -34,91 +120,122 @@ class EventNormalizer:
                     events = data.get('events', [])
                     if events and isinstance(events, list):
                         event = events[0]
-            
+
             if not event or not isinstance(event, dict):
                 return None
-            
-            # Extract normalized fields
-            normalized = {
-                'match_id': EventNormalizer._extract_match_id(event),
-                'players': EventNormalizer._extract_players(event),
-                'league': EventNormalizer._extract_league(event),
-                'tour': EventNormalizer._extract_tour(event),
-                'status': EventNormalizer._extract_status(event),
-                'score_sets': EventNormalizer._extract_score_sets(event),
-                'score_points_current_set': EventNormalizer._extract_score_points_current_set(event),
-                'current_set_index': EventNormalizer._extract_current_set_index(event),
-                'odds': EventNormalizer._extract_odds(event),
-                'last_update_ts': EventNormalizer._extract_last_update_ts(event),
-            }
-            
-            return normalized
-            
+
+            # Extract normalized fields with the plan compiled for this shape
+            return _plans.plan_for(pattern, event)(event)
+
         except Exception as e:
             logger.debug(f"Normalization error: {e}")
             return None
-    
+
+    @staticmethod
+    def plan_stats() -> Dict[str, int]:
+        """Shape plan cache counters (hits / shape_changes / compiles)"""
+        return dict(_plans.stats)
+
+    @staticmethod
+    def _compile_plan(keys: FrozenSet[str]) -> Plan:
+        """Build the extractor of an event shape: every field bound to the key it is read from"""
+        match_id = EventNormalizer._match_id_getter(keys)
+        players = EventNormalizer._players_getter(keys)
+        league = EventNormalizer._league_getter(keys)
+        tour = EventNormalizer._tour_getter(keys)
+        status = EventNormalizer._status_getter(keys)
+        score_sets = EventNormalizer._score_sets_getter(keys)
+        score_points = EventNormalizer._score_points_getter(keys)
+        set_index = EventNormalizer._current_set_index_getter(keys)
+        odds = EventNormalizer._odds_getter(keys)
+        last_update_ts = EventNormalizer._last_update_ts_getter(keys)
+
+        def plan(event: Dict[str, Any]) -> Dict[str, Any]:
+            return {
+                'match_id': match_id(event),
+                'players': players(event),
+                'league': league(event),
+                'tour': tour(event),
+                'status': status(event),
+                'score_sets': score_sets(event),
+                'score_points_current_set': score_points(event),
+                'current_set_index': set_index(event),
+                'odds': odds(event),
+                'last_update_ts': last_update_ts(event),
+            }
+
+        return plan
+
+    @staticmethod
+    def _none(event: Dict[str, Any]) -> None:
+        return None
+
     @staticmethod
-    def _extract_match_id(event: Dict[str, Any]) -> str:
+    def _match_id_getter(keys: FrozenSet[str]) -> Callable[[Dict[str, Any]], str]:
         """Extract match ID"""
-        for key in ['id', 'matchId', 'match_id', 'eventId', 'event_id']:
-            if key in event:
-                return str(event[key])
-        return str(event.get('_id', 'unknown'))
-    
+        key = _first_key(keys, ID_KEYS)
+        if key is not None:
+            return lambda event: str(event[key])
+        return lambda event: str(event.get('_id', 'unknown'))
+
     @staticmethod
-    def _extract_players(event: Dict[str, Any]) -> Dict[str, str]:
+    def _players_getter(keys: FrozenSet[str]) -> Callable[[Dict[str, Any]], Dict[str, str]]:
         """Extract player names"""
-        p1, p2 = None, None
-        
-        # Try different structures
-        if 'players' in event and isinstance(event['players'], list):
-            players = event['players']
-            if len(players) >= 2:
-                p1 = str(players[0].get('name', players[0].get('title', '')))
-                p2 = str(players[1].get('name', players[1].get('title', '')))
-        
-        if 'competitors' in event and isinstance(event['competitors'], list):
-            competitors = event['competitors']
-            if len(competitors) >= 2:
-                p1 = str(competitors[0].get('name', competitors[0].get('title', '')))
-                p2 = str(competitors[1].get('name', competitors[1].get('title', '')))
-        
-        if 'home' in event and 'away' in event:
-            p1 = str(event['home'].get('name', event['home'].get('title', '')))
-            p2 = str(event['away'].get('name', event['away'].get('title', '')))
-        
-        if 'p1' in event:
-            p1 = str(event['p1'])
-        if 'p2' in event:
-            p2 = str(event['p2'])
-        
-        return {'p1': p1 or 'Player 1', 'p2': p2 or 'Player 2'}
-    
+        list_keys = [key for key in ('players', 'competitors') if key in keys]
+        home_away = 'home' in keys and 'away' in keys
+        has_p1 = 'p1' in keys
+        has_p2 = 'p2' in keys
+
+        def players(event: Dict[str, Any]) -> Dict[str, str]:
+            p1, p2 = None, None
+
+            # Later structures win, as in the payloads that carry several
+            for key in list_keys:
+                value = event[key]
+                if isinstance(value, list) and len(value) >= 2:
+                    p1 = str(value[0].get('name', value[0].get('title', '')))
+                    p2 = str(value[1].get('name', value[1].get('title', '')))
+
+            if home_away:
+                home, away = event['home'], event['away']
+                p1 = str(home.get('name', home.get('title', '')))
+                p2 = str(away.get('name', away.get('title', '')))
+
+            if has_p1:
+                p1 = str(event['p1'])
+            if has_p2:
+                p2 = str(event['p2'])
+
+            return {'p1': p1 or 'Player 1', 'p2': p2 or 'Player 2'}
+
+        return players
+
     @staticmethod
-    def _extract_league(event: Dict[str, Any]) -> Optional[str]:
+    def _league_getter(keys: FrozenSet[str]) -> Callable[[Dict[str, Any]], Optional[str]]:
         """Extract league/tournament name"""
-        for key in ['league', 'tournament', 'competition', 'category']:
-            if key in event:
-                league = event[key]
-                if isinstance(league, dict):
-                    return league.get('name', league.get('title'))
-                return str(league)
-        return None
-    
+        key = _first_key(keys, LEAGUE_KEYS)
+        if key is None:
+            return EventNormalizer._none
+
+        def league(event: Dict[str, Any]) -> Optional[str]:
+            value = event[key]
+            if isinstance(value, dict):
+                return value.get('name', value.get('title'))
+            return str(value)
+
+        return league
+
     @staticmethod
-    def _extract_tour(event: Dict[str, Any]) -> Optional[str]:
+    def _tour_getter(keys: FrozenSet[str]) -> Callable[[Dict[str, Any]], Optional[str]]:
         """Extract tour name"""
-        if 'tour' in event:
-            return str(event['tour'])
-        return None
-    
+        if 'tour' in keys:
+            return lambda event: str(event['tour'])
+        return EventNormalizer._none
+
     @staticmethod
-    def _extract_status(event: Dict[str, Any]) -> str:
-        """Extract match status"""
-        status = event.get('status', event.get('state', 'unknown'))
+    def _status_value(status: Any) -> str:
         status_str = str(status).lower()
-        
+
         if 'live' in status_str or status_str == '1':
             return 'live'
         elif 'paused' in status_str or status_str == '2':
@@ -126,66 +243,103 @@ class EventNormalizer:
         elif 'finished' in status_str or status_str == '3':
             return 'finished'
         return 'unknown'
-    
+
     @staticmethod
-    def _extract_score_sets(event: Dict[str, Any]) -> Optional[str]:
+    def _status_getter(keys: FrozenSet[str]) -> Callable[[Dict[str, Any]], str]:
+        """Extract match status"""
+        key = _first_key(keys, ('status', 'state'))
+        if key is None:
+            return lambda event: 'unknown'
+        status_value = EventNormalizer._status_value
+        return lambda event: status_value(event[key])
+
+    @staticmethod
+    def _score_sets_getter(keys: FrozenSet[str]) -> Callable[[Dict[str, Any]], Optional[str]]:
         """Extract sets score (e.g., '1:0')"""
-        # Try different structures
-        if 'score' in event:
-            score = event['score']
-            if isinstance(score, dict):
-                sets_p1 = score.get('sets1', score.get('sets_p1', 0))
-                sets_p2 = score.get('sets2', score.get('sets_p2', 0))
-                return f"{sets_p1}:{sets_p2}"
-            elif isinstance(score, str):
-                return score
-        
-        if 'sets' in event:
-            sets = event['sets']
-            if isinstance(sets, dict):
-                return f"{sets.get('p1', 0)}:{sets.get('p2', 0)}"
-        
-        return None
-    
+        has_score = 'score' in keys
+        has_sets = 'sets' in keys
+        if not (has_score or has_sets):
+            return EventNormalizer._none
+
+        def score_sets(event: Dict[str, Any]) -> Optional[str]:
+            if has_score:
+                score = event['score']
+                if isinstance(score, dict):
+                    sets_p1 = score.get('sets1', score.get('sets_p1', 0))
+                    sets_p2 = score.get('sets2', score.get('sets_p2', 0))
+                    return f"{sets_p1}:{sets_p2}"
+                elif isinstance(score, str):
+                    return score
+
+            if has_sets:
+                sets = event['sets']
+                if isinstance(sets, dict):
+                    return f"{sets.get('p1', 0)}:{sets.get('p2', 0)}"
+
+            return None
+
+        return score_sets
+
     @staticmethod
-    def _extract_score_points_current_set(event: Dict[str, Any]) -> Optional[str]:
+    def _score_points_getter(keys: FrozenSet[str]) -> Callable[[Dict[str, Any]], Optional[str]]:
         """Extract current set points (e.g., '6:4')"""
-        if 'currentSet' in event:
-            cs = event['currentSet']
-            if isinstance(cs, dict):
-                return f"{cs.get('p1', 0)}:{cs.get('p2', 0)}"
-        
-        if 'current_set' in event:
-            cs = event['current_set']
-            if isinstance(cs, dict):
-                return f"{cs.get('points1', cs.get('p1', 0))}:{cs.get('points2', cs.get('p2', 0))}"
-        
-        if 'score' in event:
-            score = event['score']
-            if isinstance(score, dict) and 'current' in score:
-                curr = score['current']
-                if isinstance(curr, dict):
-                    return f"{curr.get('p1', 0)}:{curr.get('p2', 0)}"
-        
-        return None
-    
+        has_camel = 'currentSet' in keys
+        has_snake = 'current_set' in keys
+        has_score = 'score' in keys
+        if not (has_camel or has_snake or has_score):
+            return EventNormalizer._none
+
+        def score_points(event: Dict[str, Any]) -> Optional[str]:
+            if has_camel:
+                cs = event['currentSet']
+                if isinstance(cs, dict):
+                    return f"{cs.get('p1', 0)}:{cs.get('p2', 0)}"
+
+            if has_snake:
+                cs = event['current_set']
+                if isinstance(cs, dict):
+                    return f"{cs.get('points1', cs.get('p1', 0))}:{cs.get('points2', cs.get('p2', 0))}"
+
+            if has_score:
+                score = event['score']
+                if isinstance(score, dict) and 'current' in score:
+                    curr = score['current']
+                    if isinstance(curr, dict):
+                        return f"{curr.get('p1', 0)}:{curr.get('p2', 0)}"
+
+            return None
+
+        return score_points
+
     @staticmethod
-    def _extract_current_set_index(event: Dict[str, Any]) -> Optional[int]:
+    def _current_set_index_getter(keys: FrozenSet[str]) -> Callable[[Dict[str, Any]], Optional[int]]:
         """Extract current set number (1-based)"""
-        for key in ['currentSetIndex', 'current_set_index', 'setNumber', 'set_number']:
-            if key in event:
+        present = [key for key in SET_INDEX_KEYS if key in keys]
+        if not present:
+            return EventNormalizer._none
+
+        def set_index(event: Dict[str, Any]) -> Optional[int]:
+            for key in present:
                 val = event[key]
                 if isinstance(val, (int, float)):
                     return int(val)
-        return None
-    
+            return None
+
+        return set_index
+
     @staticmethod
-    def _extract_odds(event: Dict[str, Any]) -> Dict[str, Any]:
+    def _odds_getter(keys: FrozenSet[str]) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
         """Extract odds for various markets"""
+        key = _first_key(keys, ('markets', 'odds'))
+        if key is None:
+            return lambda event: {}
+        odds_value = EventNormalizer._odds_value
+        return lambda event: odds_value(event[key])
+
+    @staticmethod
+    def _odds_value(markets: Any) -> Dict[str, Any]:
         odds = {}
-        
-        # Try to find markets/odds structure
-        markets = event.get('markets', event.get('odds', {}))
+
         if not isinstance(markets, dict) and isinstance(markets, list):
             # Convert list to dict by market type
             markets_dict = {}
@@ -195,7 +349,7 @@ class EventNormalizer:
                     if mtype:
                         markets_dict[mtype] = m
             markets = markets_dict
-        
+
         if isinstance(markets, dict):
             # Match winner
             if 'match_winner' in markets:
@@ -205,7 +359,7 @@ class EventNormalizer:
                         'p1': mw.get('p1', mw.get('home')),
                         'p2': mw.get('p2', mw.get('away'))
                     }
-            
+
             # Set winner
             if 'set_winner' in markets or 'current_set_winner' in markets:
                 sw = markets.get('set_winner') or markets.get('current_set_winner')
@@ -214,46 +368,50 @@ class EventNormalizer:
                         'p1': sw.get('p1', sw.get('home')),
                         'p2': sw.get('p2', sw.get('away'))
                     }
-            
+
             # Handicap current set
             if 'handicap_current_set' in markets:
                 hcs = markets['handicap_current_set']
                 if isinstance(hcs, dict):
                     odds['handicap_current_set'] = hcs
-            
+
             # Total points current set
             if 'total_points_current_set' in markets or 'total_current_set' in markets:
                 tcs = markets.get('total_points_current_set') or markets.get('total_current_set')
                 if isinstance(tcs, dict):
                     odds['total_points_current_set'] = tcs
-        
+
         return odds
-    
+
     @staticmethod
-    def _extract_last_update_ts(event: Dict[str, Any]) -> Optional[float]:
+    def _last_update_ts_getter(keys: FrozenSet[str]) -> Callable[[Dict[str, Any]], Optional[float]]:
         """Extract last update timestamp"""
-        for key in ['lastUpdate', 'last_update', 'updatedAt', 'updated_at', 'timestamp']:
-            if key in event:
+        present = [key for key in UPDATE_TS_KEYS if key in keys]
+        if not present:
+            return EventNormalizer._none
+
+        def last_update_ts(event: Dict[str, Any]) -> Optional[float]:
+            for key in present:
                 val = event[key]
                 if isinstance(val, (int, float)):
                     return float(val)
                 elif isinstance(val, str):
                     try:
-                        from datetime import datetime
-                        dt = datetime.fromisoformat(val.replace('Z', '+00:00'))
-                        return dt.timestamp()
-                    except:
+                        return datetime.fromisoformat(val.replace('Z', '+00:00')).timestamp()
+                    except ValueError:
                         pass
-        return None
-    
+            return None
+
+        return last_update_ts
+
     @staticmethod
-    def normalize_events_list(payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+    def normalize_events_list(payload: Dict[str, Any], url: Optional[str] = None) -> List[Dict[str, Any]]:
         """Extract list of normalized events from payload"""
         events = []
-        
+
         # Try to find events array
         events_list = None
-        
+
         if isinstance(payload, list):
             events_list = payload
         elif isinstance(payload, dict):
@@ -262,14 +420,29 @@ class EventNormalizer:
             elif 'data' in payload and isinstance(payload['data'], dict):
                 if 'events' in payload['data']:
                     events_list = payload['data']['events']
-        
+
         if events_list and isinstance(events_list, list):
+            pattern = url_pattern(url)
             for event in events_list:
-                normalized = EventNormalizer.normalize_event(event)
+                normalized = EventNormalizer._normalize_event(event, pattern)
                 if normalized:
                     events.append(normalized)
-        
+
         return events
 
+    @staticmethod
+    def normalize_payload(payload: Any, url: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Extract events from an intercepted payload: events list first, then single event"""
+        if not payload:
+            return []
+
+        events = EventNormalizer.normalize_events_list(payload, url)
+        if not events:
+            event = EventNormalizer.normalize_event(payload, url)
+            if event:
+                events = [event]
+        return events
 
 
+# Process-wide: the live scanner and every sweep worker learn shapes once
+_plans = ShapePlanCache(EventNormalizer._compile_plan)
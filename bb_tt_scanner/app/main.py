@@ -1,4 +1,5 @@
 """Main entry point for BB TT Scanner"""
+import os
 import sys
 import asyncio
 from pathlib import Path
@@ -10,6 +11,8 @@ import qasync
 from app.scanner.scanner import Scanner
 from app.gui.main_window import MainWindow
 from app.storage.database import Database
+from app.replay.capture import PayloadRecorder
+from app.replay.engine import ReplayEngine
 
 
 def setup_logging():
@@ -29,6 +32,27 @@ def setup_logging():
     )
 
 
+def create_scanner() -> Scanner:
+    """
+    Scanner in live, capture or replay mode:
+    BB_TT_CAPTURE_DIR=captures  - record every intercepted payload (live)
+    BB_TT_REPLAY=captures       - feed captured payloads instead of the browser
+    BB_TT_REPLAY_SPEED=10       - replay at 10x real time (0 = as fast as possible)
+    """
+    replay_path = os.getenv("BB_TT_REPLAY")
+    if replay_path:
+        speed = float(os.getenv("BB_TT_REPLAY_SPEED", "1"))
+        logger.info(f"Replay mode: {replay_path}")
+        return Scanner(replay=ReplayEngine(replay_path, speed=speed))
+    
+    capture_dir = os.getenv("BB_TT_CAPTURE_DIR")
+    if capture_dir:
+        logger.info(f"Capture mode: {capture_dir}")
+        return Scanner(recorder=PayloadRecorder(capture_dir))
+    
+    return Scanner()
+
+
 async def run_scanner(scanner: Scanner, window: MainWindow):
     """Run scanner with auto-start"""
     try:
@@ -61,7 +85,7 @@ def main():
     db = Database()
     
     # Create scanner
-    scanner = Scanner()
+    scanner = create_scanner()
     
     # Create main window
     window = MainWindow()
@@ -0,0 +1 @@
+"""Replay module: payload capture, replay engine and backtesting"""
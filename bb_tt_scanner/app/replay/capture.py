@@ -0,0 +1,127 @@
+"""Capture of intercepted network payloads to compressed JSONL segments"""
+import gzip
+import json
+import re
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+from loguru import logger
+
+SEGMENT_GLOB = "tt-*.jsonl.gz"
+
+# tt-YYYYmmdd-HHMMSS[-N].jsonl.gz (-N: further segments opened in the same second)
+_SEGMENT_NAME = re.compile(r'^tt-(\d{8}-\d{6})(?:-(\d+))?\.jsonl\.gz$')
+
+
+class PayloadRecorder:
+    """
+    Writes every intercepted payload as one JSON line {"ts", "url", "data"}
+    into gzip segments named tt-YYYYmmdd-HHMMSS.jsonl.gz.
+
+    A segment is closed after segment_seconds or segment_max_bytes
+    (uncompressed). The stream is sync-flushed every flush_seconds, so a
+    crash loses at most that much data.
+    """
+
+    def __init__(
+        self,
+        capture_dir: Union[str, Path],
+        segment_seconds: float = 3600.0,
+        segment_max_bytes: int = 256 * 1024 * 1024,
+        flush_seconds: float = 5.0
+    ):
+        self.capture_dir = Path(capture_dir)
+        self.capture_dir.mkdir(parents=True, exist_ok=True)
+        self.segment_seconds = segment_seconds
+        self.segment_max_bytes = segment_max_bytes
+        self.flush_seconds = flush_seconds
+        self.records = 0
+        self._file = None
+        self._path: Optional[Path] = None
+        self._opened_at = 0.0
+        self._flushed_at = 0.0
+        self._bytes = 0
+
+    def write(self, data: Dict[str, Any], ts: Optional[float] = None):
+        """Append one intercepted payload (the dict passed to the network callback)"""
+        ts = ts if ts is not None else time.time()
+        try:
+            line = json.dumps(
+                {"ts": ts, "url": data.get('url'), "data": data.get('data')},
+                ensure_ascii=False,
+                separators=(',', ':')
+            ) + "\n"
+        except (TypeError, ValueError) as e:
+            logger.debug(f"Capture skipped (not serializable): {e}")
+            return
+
+        if self._file is None or ts - self._opened_at >= self.segment_seconds or self._bytes >= self.segment_max_bytes:
+            self._rotate(ts)
+
+        self._file.write(line)
+        self._bytes += len(line)
+        self.records += 1
+
+        if ts - self._flushed_at >= self.flush_seconds:
+            self._file.flush()
+            self._flushed_at = ts
+
+    def _rotate(self, ts: float):
+        self.close()
+        name = f"tt-{datetime.fromtimestamp(ts).strftime('%Y%m%d-%H%M%S')}.jsonl.gz"
+        path = self.capture_dir / name
+        suffix = 1
+        while path.exists():
+            path = self.capture_dir / name.replace(".jsonl.gz", f"-{suffix}.jsonl.gz")
+            suffix += 1
+        self._file = gzip.open(path, 'wt', encoding='utf-8')
+        self._path = path
+        self._opened_at = ts
+        self._flushed_at = ts
+        self._bytes = 0
+        logger.info(f"Capture segment opened: {path}")
+
+    def close(self):
+        """Close current segment"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            logger.info(f"Capture segment closed: {self._path}")
+
+
+def find_segments(paths: Union[str, Path, Iterable[Union[str, Path]]]) -> List[Path]:
+    """Expand directories/files into capture segments in chronological (name) order"""
+    if isinstance(paths, (str, Path)):
+        paths = [paths]
+
+    segments: List[Path] = []
+    for item in paths:
+        path = Path(item)
+        if path.is_dir():
+            segments.extend(path.glob(SEGMENT_GLOB))
+        elif path.exists():
+            segments.append(path)
+    return sorted(set(segments), key=_segment_order)
+
+
+def _segment_order(path: Path):
+    """Chronological sort key: by open time, then same-second suffix (plain name order puts -1 first)"""
+    match = _SEGMENT_NAME.match(path.name)
+    if match is None:
+        return path.name, 0
+    return match.group(1), int(match.group(2) or 0)
+
+
+def iter_records(paths: Union[str, Path, Iterable[Union[str, Path]]]) -> Iterator[Dict[str, Any]]:
+    """Yield captured records from segments in order; a truncated tail (crash) ends its segment"""
+    for segment in find_segments(paths):
+        try:
+            with gzip.open(segment, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        logger.warning(f"Skipping corrupt line in {segment.name}")
+        except (EOFError, gzip.BadGzipFile, OSError) as e:
+            logger.warning(f"Segment {segment.name} truncated: {e}")
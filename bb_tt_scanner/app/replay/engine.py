@@ -0,0 +1,331 @@
+"""Replay of captured payloads through EventNormalizer and TT_LIVE_V1 (backtesting)"""
+import asyncio
+import re
+import time
+from array import array
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from loguru import logger
+
+from app.engine.normalizer import EventNormalizer
+from app.engine.strategy import Signal, StrategyConfig, TT_LIVE_V1_Strategy
+from app.replay.capture import iter_records
+
+# Bet outcomes (BetLedger.outcome column)
+OPEN = -1
+LOSS = 0
+WIN = 1
+PUSH = 2
+
+MAIN_LEG = 0
+HEDGE_LEG = 1
+
+_NUMBER = re.compile(r'([+-]?\d+(?:[.,]\d+)?)')
+
+
+def payload_of(record: Dict[str, Any]) -> Any:
+    """Unwrap a captured record the same way Scanner._handle_network_data does"""
+    return record.get('data') or record.get('payload') or record
+
+
+def _pair(score: Optional[str]) -> Optional[Tuple[int, int]]:
+    """Parse "6:4" -> (6, 4)"""
+    if not score:
+        return None
+    try:
+        p1_str, p2_str = score.split(':')
+        return int(p1_str.strip()), int(p2_str.strip())
+    except (ValueError, AttributeError):
+        return None
+
+
+def _line(text: str) -> Optional[float]:
+    match = _NUMBER.search(text or '')
+    return float(match.group(1).replace(',', '.')) if match else None
+
+
+class ReplayEngine:
+    """Feeds captured records in capture order, at N x real time or as fast as possible (speed=None)"""
+
+    def __init__(self, paths: Union[str, Path, Iterable[Union[str, Path]]], speed: Optional[float] = None):
+        self.paths = paths
+        self.speed = speed if speed and speed > 0 else None
+
+    def records(self) -> Iterator[Dict[str, Any]]:
+        return iter_records(self.paths)
+
+    def events(self) -> Iterator[Tuple[float, Dict[str, Any]]]:
+        """Normalized events with their capture timestamp"""
+        for record in self.records():
+            ts = float(record.get('ts') or 0.0)
+            for event in EventNormalizer.normalize_payload(payload_of(record), record.get('url')):
+                yield ts, event
+
+    async def play(self, callback: Callable[[Dict[str, Any]], None], should_stop: Optional[Callable[[], bool]] = None) -> int:
+        """Call callback(record) for every record, keeping the captured pacing divided by speed"""
+        first_ts = None
+        started = time.monotonic()
+        played = 0
+        for record in self.records():
+            if should_stop and should_stop():
+                break
+            ts = record.get('ts')
+            if self.speed and isinstance(ts, (int, float)):
+                if first_ts is None:
+                    first_ts = ts
+                delay = (ts - first_ts) / self.speed - (time.monotonic() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            else:
+                await asyncio.sleep(0)  # Let the UI breathe
+            callback(record)
+            played += 1
+        logger.info(f"Replay finished: {played} records")
+        return played
+
+
+class BetLedger:
+    """Columnar bet journal: one typed array per field, aggregated without per-row objects"""
+
+    def __init__(self):
+        self.ts = array('d')
+        self.match = array('l')
+        self.leg = array('b')
+        self.stake = array('d')
+        self.odds = array('d')
+        self.outcome = array('b')
+        self.pnl = array('d')
+        self.match_ids: List[str] = []
+        self._match_index: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    def add(self, ts: float, match_id: str, leg: int, stake: float, odds: float) -> int:
+        """Open a bet; returns its row"""
+        index = self._match_index.get(match_id)
+        if index is None:
+            index = self._match_index[match_id] = len(self.match_ids)
+            self.match_ids.append(match_id)
+        self.ts.append(ts)
+        self.match.append(index)
+        self.leg.append(leg)
+        self.stake.append(stake)
+        self.odds.append(odds)
+        self.outcome.append(OPEN)
+        self.pnl.append(0.0)
+        return len(self.ts) - 1
+
+    def settle(self, row: int, outcome: int):
+        self.outcome[row] = outcome
+        if outcome == WIN:
+            self.pnl[row] = self.stake[row] * (self.odds[row] - 1)
+        elif outcome == LOSS:
+            self.pnl[row] = -self.stake[row]
+        else:
+            self.pnl[row] = 0.0
+
+    def columns(self) -> Dict[str, Any]:
+        """Picklable columns (process pool transport)"""
+        return {
+            'ts': self.ts, 'match': self.match, 'leg': self.leg, 'stake': self.stake,
+            'odds': self.odds, 'outcome': self.outcome, 'pnl': self.pnl,
+        }
+
+    @staticmethod
+    def summarize(columns: Dict[str, Any]) -> Dict[str, Any]:
+        """Aggregate ledger columns into PnL metrics"""
+        outcome, stake, pnl, leg = columns['outcome'], columns['stake'], columns['pnl'], columns['leg']
+        settled = [i for i, o in enumerate(outcome) if o != OPEN]
+        staked = sum(stake[i] for i in settled)
+        total = sum(pnl[i] for i in settled)
+
+        # Equity curve in bet order
+        equity = peak = drawdown = 0.0
+        for i in settled:
+            equity += pnl[i]
+            peak = max(peak, equity)
+            drawdown = max(drawdown, peak - equity)
+
+        main_settled = [i for i in settled if leg[i] == MAIN_LEG]
+        return {
+            'signals': sum(1 for leg_kind in leg if leg_kind == MAIN_LEG),
+            'bets': len(outcome),
+            'settled': len(settled),
+            'open': len(outcome) - len(settled),
+            'main_hit_rate': (
+                round(sum(1 for i in main_settled if outcome[i] == WIN) / len(main_settled), 4)
+                if main_settled else None
+            ),
+            'staked': round(staked, 2),
+            'pnl': round(total, 2),
+            'roi': round(total / staked, 4) if staked else None,
+            'max_drawdown': round(drawdown, 2),
+        }
+
+    def summary(self) -> Dict[str, Any]:
+        return self.summarize(self.columns())
+
+
+@dataclass
+class _Bet:
+    row: int
+    kind: str  # set | match | handicap | total
+    player: str  # p1 | p2 (bet side)
+    set_no: int  # sets completed when the bet was placed
+    line: Optional[float] = None
+
+
+class _MatchTrack:
+    __slots__ = ('sets', 'points', 'bets', 'last_signal_ts', 'last_reason', 'units')
+
+    def __init__(self):
+        self.sets: Optional[Tuple[int, int]] = None
+        self.points: Optional[Tuple[int, int]] = None
+        self.bets: List[_Bet] = []
+        self.last_signal_ts: Optional[float] = None
+        self.last_reason: Optional[str] = None
+        self.units = 0.0
+
+
+class Backtester:
+    """
+    Runs TT_LIVE_V1 over a normalized event stream and settles its bets
+    from the same stream (later set / match scores).
+
+    Uses the live Scanner's per-match cooldown (on capture time instead of
+    wall clock) and caps stakes at StrategyConfig.max_units_per_match. Set-level markets
+    settle when the sets score moves on; the final points of that set are
+    the last points seen, with the set winner completed to 11 / +2.
+    Bets that cannot be settled from the capture stay OPEN.
+    """
+
+    def __init__(self, config: Optional[StrategyConfig] = None, cooldown_seconds: float = 180):
+        self.config = config or StrategyConfig()
+        self.strategy = TT_LIVE_V1_Strategy(self.config)
+        self.cooldown_seconds = cooldown_seconds
+        self.ledger = BetLedger()
+        self._matches: Dict[str, _MatchTrack] = {}
+
+    def run(self, events: Iterable[Tuple[float, Dict[str, Any]]]) -> BetLedger:
+        for ts, event in events:
+            self.feed(ts, event)
+        return self.ledger
+
+    def feed(self, ts: float, event: Dict[str, Any]):
+        match_id = event.get('match_id')
+        if not match_id:
+            return
+        track = self._matches.get(match_id)
+        if track is None:
+            track = self._matches[match_id] = _MatchTrack()
+
+        sets = _pair(event.get('score_sets'))
+        if sets and track.sets and sum(sets) > sum(track.sets):
+            self._settle_set(track, sets)
+            track.points = None
+        if sets:
+            track.sets = sets
+
+        points = _pair(event.get('score_points_current_set'))
+        if points:
+            track.points = points
+
+        if event.get('status') == 'finished' and track.sets:
+            self._settle_match(track)
+
+        signal = self.strategy.check_signal(event)
+        if signal:
+            self._open(ts, match_id, track, signal)
+
+    def _open(self, ts: float, match_id: str, track: _MatchTrack, signal: Signal):
+        # Same cooldown rule as Scanner._check_cooldown
+        if (
+            track.last_signal_ts is not None
+            and ts - track.last_signal_ts < self.cooldown_seconds
+            and signal.reason == track.last_reason
+        ):
+            return
+        units = (signal.main_sum + (signal.hedge_sum or 0)) / self.config.unit
+        if track.units + units > self.config.max_units_per_match:
+            return
+        track.units += units
+        track.last_signal_ts = ts
+        track.last_reason = signal.reason
+
+        # Bets are on the trailing player
+        _, leading = self.strategy.get_current_diff(signal.raw_event)
+        player = 'p2' if leading == 'p1' else 'p1'
+        set_no = sum(track.sets) if track.sets else 0
+        main_kind = 'match' if signal.main_market == "Победа в матче" else 'set'
+        row = self.ledger.add(ts, match_id, MAIN_LEG, signal.main_sum, signal.main_odds)
+        track.bets.append(_Bet(row, main_kind, player, set_no))
+
+        if signal.hedge_market and signal.hedge_odds and signal.hedge_sum:
+            row = self.ledger.add(ts, match_id, HEDGE_LEG, signal.hedge_sum, signal.hedge_odds)
+            if signal.hedge_market.startswith("Тотал"):
+                track.bets.append(_Bet(row, 'total', player, set_no, self._total_line(signal)))
+            else:
+                track.bets.append(_Bet(row, 'handicap', player, set_no, _line(signal.hedge_market)))
+
+    @staticmethod
+    def _total_line(signal: Signal) -> Optional[float]:
+        """find_hedge_market drops the total key; recover it from the odds the signal saw"""
+        market = signal.raw_event.get('odds', {}).get('total_points_current_set', {})
+        for key, value in market.items():
+            lowered = key.lower()
+            if value == signal.hedge_odds and ('больше' in lowered or 'over' in lowered or '>' in key):
+                return _line(key)
+        return None
+
+    def _settle_set(self, track: _MatchTrack, sets: Tuple[int, int]):
+        finished_set = sum(track.sets)
+        jumped = sum(sets) - finished_set > 1  # Missed a whole set: its result is unknown
+        winner = 'p1' if sets[0] > track.sets[0] else 'p2'
+        final = self._final_points(track.points, winner)
+
+        remaining = []
+        for bet in track.bets:
+            if bet.kind == 'match' or bet.set_no > finished_set:
+                remaining.append(bet)
+                continue
+            if jumped or bet.set_no < finished_set:
+                continue  # Result of its set is unknown: stays OPEN
+            if bet.kind == 'set':
+                self.ledger.settle(bet.row, WIN if bet.player == winner else LOSS)
+            elif final is None or bet.line is None:
+                continue
+            elif bet.kind == 'handicap':
+                own, other = (final[0], final[1]) if bet.player == 'p1' else (final[1], final[0])
+                self.ledger.settle(bet.row, self._compare(own + bet.line, other))
+            elif bet.kind == 'total':
+                self.ledger.settle(bet.row, self._compare(final[0] + final[1], bet.line))
+        track.bets = remaining
+
+    def _settle_match(self, track: _MatchTrack):
+        p1_sets, p2_sets = track.sets
+        if p1_sets == p2_sets:
+            return
+        winner = 'p1' if p1_sets > p2_sets else 'p2'
+        for bet in track.bets:
+            if bet.kind == 'match':
+                self.ledger.settle(bet.row, WIN if bet.player == winner else LOSS)
+        track.bets = []
+
+    @staticmethod
+    def _final_points(points: Optional[Tuple[int, int]], winner: str) -> Optional[Tuple[int, int]]:
+        if points is None:
+            return None
+        p1, p2 = points
+        if winner == 'p1':
+            return max(p1, 11, p2 + 2), p2
+        return p1, max(p2, 11, p1 + 2)
+
+    @staticmethod
+    def _compare(value: float, threshold: float) -> int:
+        if value > threshold:
+            return WIN
+        if value < threshold:
+            return LOSS
+        return PUSH
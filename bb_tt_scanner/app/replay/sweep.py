@@ -0,0 +1,172 @@
+"""
+StrategyConfig parameter sweeps over captured data (process pool)
+
+    python backtest.py captures/ --grid min_diff=2,3 --grid odds_min=1.6,1.7,1.8 --workers 8
+
+1. Segments are normalized in parallel (each worker compiles its own shape
+   plans; the output does not depend on them) and
+   grouped by match; TT_LIVE_V1 keeps per-match state only, so per-match
+   streams replay exactly like the interleaved capture.
+2. The streams are pickled once; every worker loads them in its
+   initializer and backtests whole configs.
+3. Workers return BetLedger columns; the parent aggregates them into one
+   column per metric and writes the table sorted by PnL.
+"""
+import argparse
+import csv
+import itertools
+import os
+import pickle
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, fields, replace
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from loguru import logger
+
+from app.engine.normalizer import EventNormalizer
+from app.engine.strategy import StrategyConfig
+from app.replay.capture import find_segments, iter_records
+from app.replay.engine import Backtester, BetLedger, payload_of
+
+Stream = List[Tuple[float, Dict[str, Any]]]
+
+_streams: Optional[List[Stream]] = None  # Worker-local, set by _init_worker
+
+
+def parse_grid(specs: Sequence[str], base: Optional[StrategyConfig] = None) -> List[StrategyConfig]:
+    """["min_diff=2,3", "odds_min=1.6,1.7"] -> cartesian product of StrategyConfig"""
+    base = base or StrategyConfig()
+    types = {f.name: f.type for f in fields(StrategyConfig)}
+    axes: List[Tuple[str, List[Any]]] = []
+    for spec in specs:
+        name, _, values = spec.partition('=')
+        name = name.strip()
+        if name not in types or not values:
+            raise ValueError(f"Bad grid axis '{spec}' (fields: {', '.join(types)})")
+        cast = types[name] if types[name] in (int, float) else float
+        axes.append((name, [cast(v) for v in values.split(',') if v.strip()]))
+
+    if not axes:
+        return [base]
+    names = [name for name, _ in axes]
+    return [
+        replace(base, **dict(zip(names, combo)))
+        for combo in itertools.product(*(values for _, values in axes))
+    ]
+
+
+def _normalize_segment(path: str) -> Dict[str, Stream]:
+    """Worker: one segment -> events grouped by match"""
+    streams: Dict[str, Stream] = {}
+    for record in iter_records(path):
+        ts = float(record.get('ts') or 0.0)
+        for event in EventNormalizer.normalize_payload(payload_of(record), record.get('url')):
+            match_id = event.get('match_id')
+            if match_id:
+                streams.setdefault(match_id, []).append((ts, event))
+    return streams
+
+
+def load_match_streams(paths: Sequence[str], workers: int) -> List[Stream]:
+    """Normalize all segments (in parallel) into per-match event streams in capture order"""
+    segments = [str(p) for p in find_segments(paths)]
+    if not segments:
+        return []
+    merged: Dict[str, Stream] = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for streams in pool.map(_normalize_segment, segments):
+            for match_id, events in streams.items():
+                merged.setdefault(match_id, []).extend(events)
+    logger.info(f"Loaded {sum(len(s) for s in merged.values())} events, {len(merged)} matches from {len(segments)} segments")
+    return list(merged.values())
+
+
+def _init_worker(streams_path: str):
+    global _streams
+    with open(streams_path, 'rb') as f:
+        _streams = pickle.load(f)
+
+
+def _run_config(job: Tuple[int, StrategyConfig, float]) -> Tuple[int, Dict[str, Any]]:
+    """Worker: backtest one config over every match stream"""
+    index, config, cooldown = job
+    backtester = Backtester(config, cooldown_seconds=cooldown)
+    for stream in _streams:
+        backtester.run(stream)
+    return index, backtester.ledger.columns()
+
+
+def run_sweep(
+    paths: Sequence[str],
+    configs: Sequence[StrategyConfig],
+    workers: Optional[int] = None,
+    cooldown_seconds: float = 180
+) -> Dict[str, List[Any]]:
+    """Backtest every config; returns a columnar table (one list per parameter/metric), best PnL first"""
+    workers = workers or os.cpu_count() or 1
+    streams = load_match_streams(paths, workers)
+
+    fd, streams_path = tempfile.mkstemp(prefix="tt-streams-", suffix=".pkl")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(streams, f, protocol=pickle.HIGHEST_PROTOCOL)
+        del streams
+
+        summaries: List[Optional[Dict[str, Any]]] = [None] * len(configs)
+        jobs = [(i, config, cooldown_seconds) for i, config in enumerate(configs)]
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(streams_path,)) as pool:
+            for index, columns in pool.map(_run_config, jobs, chunksize=max(1, len(jobs) // (workers * 4))):
+                summaries[index] = BetLedger.summarize(columns)
+    finally:
+        os.unlink(streams_path)
+
+    if not configs:
+        return {}
+    params = [asdict(config) for config in configs]
+    order = sorted(range(len(configs)), key=lambda i: summaries[i]['pnl'], reverse=True)
+    table: Dict[str, List[Any]] = {}
+    for name in list(params[0]) + list(summaries[0]):
+        source = params if name in params[0] else summaries
+        table[name] = [source[i][name] for i in order]
+    return table
+
+
+def write_table(table: Dict[str, List[Any]], path: Path):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(table.keys())
+        writer.writerows(zip(*table.values()))
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description="TT_LIVE_V1 backtest / parameter sweep over captured payloads")
+    parser.add_argument('paths', nargs='+', help="Capture directories or tt-*.jsonl.gz segments")
+    parser.add_argument('--grid', action='append', default=[], help="StrategyConfig axis, e.g. min_diff=2,3")
+    parser.add_argument('--workers', type=int, default=None, help="Process pool size (default: CPU count)")
+    parser.add_argument('--cooldown', type=float, default=180, help="Per-match signal cooldown, seconds")
+    parser.add_argument('--out', default="backtest_results.csv", help="CSV with one row per config")
+    parser.add_argument('--top', type=int, default=10, help="Rows to print")
+    args = parser.parse_args(argv)
+
+    try:
+        configs = parse_grid(args.grid)
+    except ValueError as e:
+        parser.error(str(e))
+
+    logger.info(f"Backtesting {len(configs)} configs")
+    table = run_sweep(args.paths, configs, workers=args.workers, cooldown_seconds=args.cooldown)
+    if not table:
+        logger.warning("Nothing to report")
+        return
+    write_table(table, Path(args.out))
+    logger.info(f"Results written: {args.out}")
+
+    names = [f.name for f in fields(StrategyConfig)]
+    for row in list(zip(*table.values()))[:args.top]:
+        values = dict(zip(table.keys(), row))
+        changed = {n: values[n] for n in names if values[n] != getattr(StrategyConfig, n)}
+        print(
+            f"pnl={values['pnl']:>10.2f} roi={values['roi']} signals={values['signals']} "
+            f"dd={values['max_drawdown']:.2f} {changed or 'defaults'}"
+        )
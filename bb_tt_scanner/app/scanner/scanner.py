@@ -7,13 +7,17 @@ from loguru import logger
 from app.scanner.browser import BrowserManager
 from app.engine.normalizer import EventNormalizer
 from app.engine.strategy import TT_LIVE_V1_Strategy, Signal
+from app.replay.capture import PayloadRecorder
+from app.replay.engine import ReplayEngine
 
 
 class Scanner:
     """Main scanner coordinator"""
     
-    def __init__(self):
+    def __init__(self, recorder: Optional[PayloadRecorder] = None, replay: Optional[ReplayEngine] = None):
         self.browser = BrowserManager()
+        self.recorder = recorder  # Capture mode: every intercepted payload is written to segments
+        self.replay = replay  # Replay mode: captured payloads instead of the browser
         self.normalizer = EventNormalizer()
         self.strategy = TT_LIVE_V1_Strategy()
         self.is_running = False
@@ -35,6 +39,16 @@ class Scanner:
         if self.is_running:
             return
         
+        if self.replay is not None:
+            self.is_running = True
+            self.last_update_time = datetime.now()
+            if self.on_status_change:
+                self.on_status_change("connected")
+            logger.info(f"Scanner started in replay mode (speed: {self.replay.speed or 'max'})")
+            asyncio.create_task(self.replay.play(self._handle_network_data, should_stop=lambda: not self.is_running))
+            asyncio.create_task(self._monitoring_loop())
+            return
+        
         try:
             # Start browser
             await self.browser.start()
@@ -91,8 +105,9 @@ class Scanner:
         """Main monitoring loop"""
         while self.is_running:
             try:
-                # Check for stale events (no update > 60 seconds)
-                await self._check_stale_events()
+                # Check for stale events (no update > 60 seconds; captured timestamps are old in replay)
+                if self.replay is None:
+                    await self._check_stale_events()
                 
                 # Calculate events per minute
                 await self._update_metrics()
@@ -138,6 +153,12 @@ class Scanner:
     
     def _handle_network_data(self, data: Dict[str, Any]):
         """Handle network response data"""
+        if self.recorder is not None and self.replay is None:
+            try:
+                self.recorder.write(data)
+            except Exception as e:
+                logger.warning(f"Capture write failed: {e}")
+        
         try:
             # Try different payload structures
             payload = data.get('data') or data.get('payload') or data
@@ -145,14 +166,8 @@ class Scanner:
             if not payload:
                 return
             
-            # Normalize events from payload
-            events = self.normalizer.normalize_events_list(payload)
-            
-            if not events:
-                # Try single event
-                event = self.normalizer.normalize_event(payload)
-                if event:
-                    events = [event]
+            # Normalize events from payload (events list, then single event)
+            events = self.normalizer.normalize_payload(payload, data.get('url'))
             
             # Process each event
             for event in events:
@@ -289,7 +304,10 @@ class Scanner:
     async def stop(self):
         """Stop scanner"""
         self.is_running = False
-        await self.browser.stop()
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.replay is None:
+            await self.browser.stop()
         logger.info("Scanner stopped")
     
     async def reconnect(self):
@@ -0,0 +1,5 @@
+"""Backtest launcher: python backtest.py <capture dir> [--grid name=v1,v2 ...]"""
+from app.replay.sweep import main
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""Capture segments, replay and bet settlement of the backtester (app.replay)"""
+import gzip
+
+import pytest
+
+from app.engine.strategy import Signal, StrategyConfig
+from app.replay.capture import PayloadRecorder, find_segments, iter_records
+from app.replay.engine import (
+    HEDGE_LEG, LOSS, MAIN_LEG, OPEN, PUSH, WIN, Backtester, BetLedger, ReplayEngine, _Bet,
+)
+
+T0 = 1_700_000_000.0
+
+
+def _event(match_id, sets, points, status='live', markets=None):
+    return {
+        'id': match_id,
+        'status': status,
+        'sets': {'p1': sets[0], 'p2': sets[1]},
+        'currentSet': {'p1': points[0], 'p2': points[1]},
+        'markets': markets or {},
+    }
+
+
+# (offset seconds, raw event): three matches, a won set + handicap, a won match + total,
+# a lost set, and a bet whose set result is skipped by the capture
+CAPTURE = [
+    (0, _event('m1', (0, 0), (3, 6), markets={'handicap_current_set': {'p1 +2.5': 1.6}})),
+    (5, _event('m2', (0, 0), (2, 5))),
+    (7, _event('m3', (0, 0), (1, 4))),
+    (10, _event('m1', (0, 0), (9, 10))),
+    (15, _event('m2', (0, 1), (0, 0))),
+    (17, _event('m3', (2, 0), (0, 0))),
+    (20, _event('m1', (1, 0), (0, 0))),
+    (30, _event('m1', (1, 0), (4, 7), markets={'total_points_current_set': {'Больше 18.5': 1.5}})),
+    (40, _event('m1', (1, 0), (8, 9))),
+    (50, _event('m1', (1, 1), (0, 0))),
+    (60, _event('m1', (2, 1), (11, 7), status='finished')),
+]
+
+# (match_id, sets, points) -> signal fields (TT_LIVE_V1 decides when to bet; settlement is tested here)
+SIGNALS = {
+    ('m1', '0:0', '3:6'): ('set', 'Победа в текущем сете', 2.0, 60.0, 'Фора по очкам в текущем сете p1 +2.5', 1.6, 30.0),
+    ('m2', '0:0', '2:5'): ('set', 'Победа в текущем сете', 1.9, 30.0, None, None, None),
+    ('m3', '0:0', '1:4'): ('set', 'Победа в текущем сете', 2.1, 30.0, None, None, None),
+    ('m1', '1:0', '4:7'): ('match', 'Победа в матче', 2.2, 30.0, 'Тотал очков в текущем сете Больше', 1.5, 30.0),
+}
+
+
+def _write_capture(capture_dir, segment_seconds=25.0):
+    recorder = PayloadRecorder(capture_dir, segment_seconds=segment_seconds)
+    for offset, event in CAPTURE:
+        recorder.write({'url': 'https://example.test/api/live/123', 'data': event}, ts=T0 + offset)
+    recorder.close()
+
+
+def _backtester():
+    backtester = Backtester(StrategyConfig(max_units_per_match=5))
+
+    def check_signal(event):
+        fields = SIGNALS.get((event['match_id'], event['score_sets'], event['score_points_current_set']))
+        if fields is None:
+            return None
+        reason, main_market, main_odds, main_sum, hedge_market, hedge_odds, hedge_sum = fields
+        return Signal(
+            match_id=event['match_id'], match_name='P1 vs P2', reason=reason,
+            main_market=main_market, main_odds=main_odds, main_sum=main_sum,
+            hedge_market=hedge_market, hedge_odds=hedge_odds, hedge_sum=hedge_sum,
+            pnl_data={}, raw_event=event,
+        )
+
+    backtester.strategy.check_signal = check_signal
+    return backtester
+
+
+def test_recorder_rotates_segments_and_replays_them_in_order(tmp_path):
+    _write_capture(tmp_path)
+
+    # Segments opened at +0, +30 and +60 s
+    assert len(find_segments(tmp_path)) == 3
+    records = list(ReplayEngine(tmp_path).records())
+    assert [record['ts'] - T0 for record in records] == [offset for offset, _ in CAPTURE]
+    assert records[0]['url'] == 'https://example.test/api/live/123'
+
+
+def test_same_second_segments_keep_write_order(tmp_path):
+    recorder = PayloadRecorder(tmp_path, segment_max_bytes=1)
+    for n in range(3):
+        recorder.write({'url': None, 'data': {'n': n}}, ts=T0)
+    recorder.close()
+
+    assert len(find_segments(tmp_path)) == 3
+    assert [record['data']['n'] for record in iter_records(tmp_path)] == [0, 1, 2]
+
+
+def test_truncated_segment_tail_is_skipped(tmp_path):
+    _write_capture(tmp_path)
+    last = find_segments(tmp_path)[-1]
+    last.write_bytes(last.read_bytes()[:10])  # Crash right after opening: gzip header only
+
+    records = list(iter_records(tmp_path))
+    assert [record['ts'] - T0 for record in records] == [offset for offset, _ in CAPTURE[:-1]]
+
+    with gzip.open(find_segments(tmp_path)[0], 'rt', encoding='utf-8') as f:
+        assert sum(1 for _ in f) == 7
+
+
+def test_backtest_settles_sets_handicaps_totals_and_match(tmp_path):
+    _write_capture(tmp_path)
+    ledger = _backtester().run(ReplayEngine(tmp_path).events())
+
+    assert list(ledger.match_ids) == ['m1', 'm2', 'm3']
+    assert list(ledger.leg) == [MAIN_LEG, HEDGE_LEG, MAIN_LEG, MAIN_LEG, MAIN_LEG, HEDGE_LEG]
+    # m1 set 1 won by p1 at 12:10 (handicap p1 +2.5 wins), m2 set lost,
+    # m3 skipped two sets (open), m1 set 2 lost 8:11 (total 19 > 18.5 wins), m1 match won 2:1
+    assert list(ledger.outcome) == [WIN, WIN, LOSS, OPEN, WIN, WIN]
+    assert list(ledger.pnl) == pytest.approx([60.0, 18.0, -30.0, 0.0, 36.0, 15.0])
+
+    assert ledger.summary() == {
+        'signals': 4,
+        'bets': 6,
+        'settled': 5,
+        'open': 1,
+        'main_hit_rate': 0.6667,
+        'staked': 180.0,
+        'pnl': 99.0,
+        'roi': 0.55,
+        'max_drawdown': 30.0,
+    }
+
+
+def test_final_points_complete_the_set_for_its_winner():
+    assert Backtester._final_points(None, 'p1') is None
+    assert Backtester._final_points((9, 10), 'p1') == (12, 10)
+    assert Backtester._final_points((5, 3), 'p2') == (5, 11)
+    assert Backtester._final_points((11, 6), 'p1') == (11, 6)
+    assert Backtester._final_points((10, 12), 'p2') == (10, 12)
+
+
+def test_handicap_push_and_drawn_match_stays_open():
+    backtester = _backtester()
+    backtester.feed(T0, {
+        'match_id': 'm9', 'status': 'live', 'score_sets': '0:0', 'score_points_current_set': '1:4', 'odds': {},
+    })
+    track = backtester._matches['m9']
+    row = backtester.ledger.add(T0, 'm9', HEDGE_LEG, 30.0, 1.7)
+    match_row = backtester.ledger.add(T0, 'm9', MAIN_LEG, 30.0, 2.0)
+    track.bets = [_Bet(row, 'handicap', 'p1', 0, 3.0), _Bet(match_row, 'match', 'p1', 0)]
+    track.points = (8, 10)
+
+    # p2 wins the set 8:11: p1 +3 -> 11 vs 11
+    backtester._settle_set(track, (0, 1))
+    assert backtester.ledger.outcome[row] == PUSH and backtester.ledger.pnl[row] == 0.0
+
+    track.sets = (1, 1)
+    backtester._settle_match(track)
+    assert backtester.ledger.outcome[match_row] == OPEN
+
+
+def test_summarize_columns():
+    ledger = BetLedger()
+    rows = [
+        ledger.add(T0, 'a', MAIN_LEG, 60.0, 2.5),
+        ledger.add(T0, 'a', HEDGE_LEG, 30.0, 1.5),
+        ledger.add(T0 + 1, 'b', MAIN_LEG, 30.0, 2.0),
+        ledger.add(T0 + 2, 'b', HEDGE_LEG, 30.0, 1.8),
+        ledger.add(T0 + 3, 'c', MAIN_LEG, 30.0, 1.9),
+    ]
+    for row, outcome in zip(rows, (LOSS, WIN, LOSS, PUSH)):
+        ledger.settle(row, outcome)
+
+    assert BetLedger.summarize(ledger.columns()) == {
+        'signals': 3,
+        'bets': 5,
+        'settled': 4,
+        'open': 1,
+        'main_hit_rate': 0.0,
+        'staked': 150.0,
+        'pnl': -75.0,
+        'roi': -0.5,
+        'max_drawdown': 75.0,
+    }
+    assert BetLedger.summarize(BetLedger().columns())['roi'] is None
@@ -0,0 +1,115 @@
+"""Capture of intercepted API payloads to compressed JSONL segments and their replay"""
+
+import asyncio
+import gzip
+import json
+import logging
+import re
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Same segment format as bb_tt_scanner (app/replay/capture.py)
+SEGMENT_GLOB = "tt-*.jsonl.gz"
+_SEGMENT_NAME = re.compile(r'^tt-(\d{8}-\d{6})(?:-(\d+))?\.jsonl\.gz$')
+
+
+class PayloadRecorder:
+    """
+    Пишет каждый перехваченный JSON-ответ строкой {"ts", "url", "data"}
+    в gzip-сегменты tt-YYYYmmdd-HHMMSS.jsonl.gz (новый сегмент раз в
+    segment_seconds, sync-flush раз в flush_seconds).
+    """
+
+    def __init__(self, capture_dir: str, segment_seconds: float = 3600.0, flush_seconds: float = 5.0):
+        self.capture_dir = Path(capture_dir)
+        self.capture_dir.mkdir(parents=True, exist_ok=True)
+        self.segment_seconds = segment_seconds
+        self.flush_seconds = flush_seconds
+        self._file = None
+        self._opened_at = 0.0
+        self._flushed_at = 0.0
+
+    def write(self, url: str, data: Any):
+        ts = time.time()
+        try:
+            line = json.dumps({"ts": ts, "url": url, "data": data}, ensure_ascii=False, separators=(',', ':'))
+        except (TypeError, ValueError) as e:
+            logger.debug(f"Capture skipped: {e}")
+            return
+
+        if self._file is None or ts - self._opened_at >= self.segment_seconds:
+            self.close()
+            path = self.capture_dir / f"tt-{datetime.fromtimestamp(ts).strftime('%Y%m%d-%H%M%S')}.jsonl.gz"
+            self._file = gzip.open(path, 'at', encoding='utf-8')
+            self._opened_at = self._flushed_at = ts
+            logger.info(f"Capture segment opened: {path}")
+
+        self._file.write(line + "\n")
+        if ts - self._flushed_at >= self.flush_seconds:
+            self._file.flush()
+            self._flushed_at = ts
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def find_segments(path: str) -> List[Path]:
+    """Segments of a capture directory (or a single segment) in chronological order"""
+    root = Path(path)
+    if root.is_dir():
+        return sorted(root.glob(SEGMENT_GLOB), key=_segment_order)
+    return [root] if root.exists() else []
+
+
+def _segment_order(path: Path):
+    """Chronological sort key: by open time, then bb_tt_scanner's same-second suffix"""
+    match = _SEGMENT_NAME.match(path.name)
+    if match is None:
+        return path.name, 0
+    return match.group(1), int(match.group(2) or 0)
+
+
+def iter_records(path: str) -> Iterator[Dict[str, Any]]:
+    """Captured records in order; a truncated segment tail (crash) is skipped"""
+    for segment in find_segments(path):
+        try:
+            with gzip.open(segment, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        logger.warning(f"Skipping corrupt line in {segment.name}")
+        except (EOFError, gzip.BadGzipFile, OSError) as e:
+            logger.warning(f"Segment {segment.name} truncated: {e}")
+
+
+async def replay_records(
+    path: str,
+    callback: Callable[[Dict[str, Any]], Awaitable[None]],
+    speed: Optional[float] = None,
+    should_stop: Optional[Callable[[], bool]] = None
+) -> int:
+    """Feed captured records to callback at speed x real time (None/0 = as fast as possible)"""
+    first_ts = None
+    started = time.monotonic()
+    played = 0
+    for record in iter_records(path):
+        if should_stop and should_stop():
+            break
+        ts = record.get('ts')
+        if speed and isinstance(ts, (int, float)):
+            if first_ts is None:
+                first_ts = ts
+            delay = (ts - first_ts) / speed - (time.monotonic() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await callback(record)
+        played += 1
+    logger.info(f"Replay finished: {played} records")
+    return played
@@ -1,5 +1,7 @@
 """Configuration constants"""
 
+import os
+
 # BetBoom URLs
 LIVE_URL = "https://betboom.ru/sport/table-tennis?period=all&type=live"
 
@@ -49,3 +51,7 @@ SIGNALS_CSV = "signals.csv"
 SIGNALS_DB = "signals.sqlite"
 ERRORS_LOG = "errors.log"
 
+# Capture / replay (app/capture.py)
+CAPTURE_DIR = os.getenv("BB_CAPTURE_DIR", "")  # Каталог для записи всех JSON-ответов (пусто = выключено)
+REPLAY_PATH = os.getenv("BB_REPLAY", "")  # Записанные сегменты вместо браузера (пусто = live)
+REPLAY_SPEED = float(os.getenv("BB_REPLAY_SPEED", "1"))  # Скорость воспроизведения (0 = максимально быстро)
@@ -11,8 +11,10 @@ import logging
 
 from app.config import (
     LIVE_URL, SCAN_INTERVAL_MIN, SCAN_INTERVAL_MAX,
-    MAX_TABS, BROWSER_HEADLESS, BROWSER_TIMEOUT
+    MAX_TABS, BROWSER_HEADLESS, BROWSER_TIMEOUT,
+    CAPTURE_DIR, REPLAY_PATH, REPLAY_SPEED
 )
+from app.capture import PayloadRecorder, replay_records
 from app.models import MatchData, MatchOdds, MatchScore, SetScore, Signal, check_signal_conditions
 from app.storage import Storage
 from app.notify import notify_signal
@@ -38,12 +40,23 @@ class BetBoomScanner:
         
         self.storage = Storage()
         self.retry_count = 0
+        
+        # Capture: every JSON response is recorded; replay: recorded responses instead of the browser
+        self.recorder: Optional[PayloadRecorder] = PayloadRecorder(CAPTURE_DIR) if CAPTURE_DIR and not REPLAY_PATH else None
+        self.replaying = bool(REPLAY_PATH)
     
     async def start(self):
         """Start scanner"""
         if self.is_running:
             return
         
+        if self.replaying:
+            self.is_running = True
+            logger.info(f"Scanner started in replay mode: {REPLAY_PATH} (speed: {REPLAY_SPEED or 'max'})")
+            asyncio.create_task(self._replay())
+            asyncio.create_task(self._monitoring_loop())
+            return
+        
         try:
             await self._init_browser()
             self.is_running = True
@@ -61,10 +74,24 @@ class BetBoomScanner:
     async def stop(self):
         """Stop scanner"""
         self.is_running = False
+        if self.recorder:
+            self.recorder.close()
         if self.browser:
             await self.browser.close()
         logger.info("Scanner stopped")
     
+    async def _replay(self):
+        """Feed recorded responses through the live parsing path"""
+        async def feed(record: dict):
+            await self._parse_api_response(record.get('data'), record.get('url') or '')
+        
+        try:
+            await replay_records(REPLAY_PATH, feed, speed=REPLAY_SPEED, should_stop=lambda: not self.is_running)
+        except Exception as e:
+            logger.error(f"Replay failed: {e}")
+            if self.on_error:
+                self.on_error(str(e))
+    
     async def _init_browser(self):
         """Initialize browser and context"""
         playwright = await async_playwright().start()
@@ -98,6 +125,8 @@ class BetBoomScanner:
             if "application/json" in content_type or "json" in url.lower():
                 try:
                     data = await response.json()
+                    if self.recorder:
+                        self.recorder.write(url, data)
                     await self._parse_api_response(data, url)
                 except Exception:
                     pass  # Not JSON or parse error
@@ -397,9 +426,10 @@ class BetBoomScanner:
             trigger_reason=signal_info.get('trigger_reason', '')
         )
         
-        # Save and notify
-        self.storage.save_signal(signal)
-        notify_signal(signal)
+        # Save and notify (replayed signals only go to the UI and log, not the live journal)
+        if not self.replaying:
+            self.storage.save_signal(signal)
+            notify_signal(signal)
         self.detected_signals.add(signal_key)
         
         match.status = "SIGNAL"
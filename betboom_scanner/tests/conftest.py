@@ -0,0 +1,5 @@
+"""Tests import the scanner's own app package (run from anywhere)"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,74 @@
+"""Capture segments and replay (app.capture)"""
+import asyncio
+import gzip
+import json
+from datetime import datetime
+
+import pytest
+
+from app import capture
+from app.capture import PayloadRecorder, find_segments, iter_records, replay_records
+
+T0 = 1_700_000_000.0
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [T0]
+    monkeypatch.setattr(capture.time, 'time', lambda: now[0])
+    return now
+
+
+def _segment_name(ts):
+    return f"tt-{datetime.fromtimestamp(ts).strftime('%Y%m%d-%H%M%S')}.jsonl.gz"
+
+
+def test_recorder_rotates_segments(tmp_path, clock):
+    recorder = PayloadRecorder(str(tmp_path), segment_seconds=10)
+    for offset in (0, 4, 9, 10, 15, 31):
+        clock[0] = T0 + offset
+        recorder.write('https://example.test/live', {'n': offset})
+    recorder.close()
+
+    assert [p.name for p in find_segments(str(tmp_path))] == [_segment_name(T0 + o) for o in (0, 10, 31)]
+    assert [record['data']['n'] for record in iter_records(str(tmp_path))] == [0, 4, 9, 10, 15, 31]
+
+
+def test_same_second_rotation_appends_to_the_segment(tmp_path, clock):
+    recorder = PayloadRecorder(str(tmp_path), segment_seconds=0)
+    for n in range(3):
+        recorder.write(None, {'n': n})
+    recorder.close()
+
+    assert len(find_segments(str(tmp_path))) == 1
+    assert [record['data']['n'] for record in iter_records(str(tmp_path))] == [0, 1, 2]
+
+
+def test_reads_bb_tt_same_second_segments_in_order(tmp_path):
+    base = _segment_name(T0)[:-len('.jsonl.gz')]
+    for n, name in enumerate((f"{base}.jsonl.gz", f"{base}-1.jsonl.gz", f"{base}-2.jsonl.gz")):
+        with gzip.open(tmp_path / name, 'wt', encoding='utf-8') as f:
+            f.write(json.dumps({'ts': T0, 'url': None, 'data': {'n': n}}) + "\n")
+
+    assert [record['data']['n'] for record in iter_records(str(tmp_path))] == [0, 1, 2]
+
+
+def test_truncated_segment_is_skipped_and_replay_stops_on_request(tmp_path, clock):
+    recorder = PayloadRecorder(str(tmp_path), segment_seconds=10)
+    for offset in (0, 5, 20):
+        clock[0] = T0 + offset
+        recorder.write(None, {'n': offset})
+    recorder.close()
+    last = find_segments(str(tmp_path))[-1]
+    last.write_bytes(last.read_bytes()[:10])  # Crash right after opening: gzip header only
+
+    played = []
+
+    async def callback(record):
+        played.append(record['data']['n'])
+
+    assert asyncio.run(replay_records(str(tmp_path), callback)) == 2
+    assert played == [0, 5]
+
+    played.clear()
+    assert asyncio.run(replay_records(str(tmp_path), callback, should_stop=lambda: len(played) >= 1)) == 1
@@ -15,12 +15,13 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, Message
 
-from app.kie.builder import load_source_of_truth
+from app.kie.catalog import ModelCatalog, get_catalog
 from app.kie.validator import validate_input_type, ModelContractError
 from app.payments.charges import get_charge_manager
 from app.payments.integration import generate_with_payment
 from app.payments.pricing import calculate_kie_cost, calculate_user_price, format_price_rub
 from app.utils.validation import validate_url, validate_file_url, validate_text_input
+from app.ux.screen_cache import ScreenCache, get_screen_cache
 
 logger = logging.getLogger(__name__)
 router = Router(name="flow")
@@ -120,8 +121,12 @@ CATEGORY_LABELS = {
 # Removed WELCOME_BALANCE_RUB - no longer used in premium copy
 
 
+def _catalog() -> ModelCatalog:
+    return get_catalog()
+
+
 def _source_of_truth() -> Dict[str, Any]:
-    return load_source_of_truth()
+    return _catalog().raw
 
 
 def _get_models_list() -> List[Dict[str, Any]]:
@@ -129,17 +134,14 @@ def _get_models_list() -> List[Dict[str, Any]]:
     Получить список моделей из SOURCE_OF_TRUTH.
     Поддерживает оба формата: dict и list.
     """
-    sot = _source_of_truth()
-    models = sot.get("models", {})
-    
-    # Если dict - конвертируем в list
-    if isinstance(models, dict):
-        return list(models.values())
-    # Если уже list - возвращаем как есть
-    elif isinstance(models, list):
-        return models
-    else:
-        return []
+    return list(_catalog().models)
+
+
+def _get_model(model_id: Optional[str]) -> Optional[Dict[str, Any]]:
+    """O(1) lookup by model_id via the catalog index."""
+    if not model_id:
+        return None
+    return _catalog().get(model_id)
 
 
 def _is_valid_model(model: Dict[str, Any]) -> bool:
@@ -174,19 +176,30 @@ def _is_valid_model(model: Dict[str, Any]) -> bool:
     return True
 
 
+# Menu grouping is derived from the catalog; rebuilt only when its version changes
+_grouped_cache: Tuple[Optional[str], Dict[str, Tuple[Dict[str, Any], ...]]] = (None, {})
+
+
 def _models_by_category() -> Dict[str, List[Dict[str, Any]]]:
-    models = [model for model in _get_models_list() if _is_valid_model(model)]
-    grouped: Dict[str, List[Dict[str, Any]]] = {}
-    for model in models:
-        category = model.get("category", "other") or "other"
-        grouped.setdefault(category, []).append(model)
-    # Sort by price (cheapest first), then by name
-    for model_list in grouped.values():
-        model_list.sort(key=lambda item: (
-            item.get("pricing", {}).get("rub_per_gen", 999999),
-            (item.get("name") or item.get("model_id") or "").lower()
-        ))
-    return grouped
+    global _grouped_cache
+    catalog = _catalog()
+    version, grouped_frozen = _grouped_cache
+    if version != catalog.version:
+        grouped: Dict[str, List[Dict[str, Any]]] = {}
+        for category, category_models in catalog.by_category.items():
+            valid = [model for model in category_models if _is_valid_model(model)]
+            if valid:
+                grouped[category] = valid
+        # Sort by price (cheapest first), then by name
+        for model_list in grouped.values():
+            model_list.sort(key=lambda item: (
+                item.get("pricing", {}).get("rub_per_gen", 999999),
+                (item.get("name") or item.get("model_id") or "").lower()
+            ))
+        grouped_frozen = {category: tuple(models) for category, models in grouped.items()}
+        _grouped_cache = (catalog.version, grouped_frozen)
+    # Fresh lists: callers are free to reorder/slice without touching the cache
+    return {category: list(models) for category, models in grouped_frozen.items()}
 
 
 def _category_label(category: str) -> str:
@@ -607,6 +620,80 @@ def _model_detail_keyboard(model_id: str, back_cb: str) -> InlineKeyboardMarkup:
     )
 
 
+# ---------------------------------------------------------------------------
+# Pre-rendered screens (app.ux.screen_cache): menu callbacks read these and
+# do no catalog work; everything is re-rendered when catalog or prices change.
+# ---------------------------------------------------------------------------
+
+MODELS_PER_PAGE = 6
+
+
+def _screen(screen: str, builder, category: str = "", page: int = 0):
+    return get_screen_cache().get(screen, builder, category=category, page=page)
+
+
+def _cached_main_menu_keyboard() -> InlineKeyboardMarkup:
+    return _screen("main_menu", _main_menu_keyboard)
+
+
+def _cached_category_keyboard() -> InlineKeyboardMarkup:
+    return _screen("categories", _category_keyboard)
+
+
+def _valid_model_count() -> int:
+    return _screen(
+        "valid_model_count",
+        lambda: len([m for m in _get_models_list() if _is_valid_model(m) and m.get("enabled", True)]),
+    )
+
+
+def _category_models(category: str) -> Tuple[Dict[str, Any], ...]:
+    # One entry for all categories: callback data cannot grow the cache
+    grouped = _screen(
+        "models_by_category",
+        lambda: {name: tuple(models) for name, models in _models_by_category().items()},
+    )
+    return grouped.get(category, ())
+
+
+def _category_page_count(category: str) -> int:
+    return (len(_category_models(category)) + MODELS_PER_PAGE - 1) // MODELS_PER_PAGE
+
+
+def _category_page_keyboard(category: str, page: int) -> InlineKeyboardMarkup:
+    """Pre-rendered page of a known category (caller checks 0 <= page < page count)."""
+    return _screen(
+        "category_page",
+        lambda: _model_keyboard(list(_category_models(category)), f"cat:{category}", page=page, per_page=MODELS_PER_PAGE),
+        category=category,
+        page=page,
+    )
+
+
+def _cached_model_detail(model: Dict[str, Any], back_cb: str) -> Tuple[str, InlineKeyboardMarkup]:
+    model_id = model.get("model_id", "")
+    text = _screen("model_detail", lambda: _model_detail_text(model), category=model_id)
+    keyboard = _screen(f"model_detail_kb:{back_cb}", lambda: _model_detail_keyboard(model_id, back_cb), category=model_id)
+    return text, keyboard
+
+
+def _warm_screens(cache: ScreenCache) -> int:
+    _cached_main_menu_keyboard()
+    _cached_category_keyboard()
+    _valid_model_count()
+    for category in _models_by_category():
+        for page in range(_category_page_count(category)):
+            _category_page_keyboard(category, page)
+        for model in _category_models(category):
+            _cached_model_detail(model, f"cat:{category}")
+    return len(cache)
+
+
+def warm_screen_cache() -> int:
+    """Render all menu screens for the current catalog/prices (call at startup)."""
+    return get_screen_cache().warm(_warm_screens)
+
+
 class InputFlow(StatesGroup):
     waiting_input = State()
     confirm = State()
@@ -739,8 +826,7 @@ async def start_cmd(message: Message, state: FSMContext) -> None:
     first_name = message.from_user.first_name or "друг"
     
     # Count available models
-    models_list = _get_models_list()
-    total_models = len([m for m in models_list if _is_valid_model(m) and m.get("enabled", True)])
+    total_models = _valid_model_count()
     
     # WOW-menu: vitrina style
     await message.answer(
@@ -749,7 +835,7 @@ async def start_cmd(message: Message, state: FSMContext) -> None:
         f"{t('welcome_description')}\n\n"
         f"{t('welcome_benefit', count=total_models)}\n\n"
         f"<i>{t('welcome_hint')}</i>",
-        reply_markup=_main_menu_keyboard(),
+        reply_markup=_cached_main_menu_keyboard(),
     )
 
 
@@ -762,8 +848,7 @@ async def main_menu_cb(callback: CallbackQuery, state: FSMContext) -> None:
     first_name = callback.from_user.first_name or "друг"
     
     # Count models
-    models_list = _get_models_list()
-    total_models = len([m for m in models_list if _is_valid_model(m) and m.get("enabled", True)])
+    total_models = _valid_model_count()
     
     # WOW-menu: vitrina style
     from app.ux.copy_ru import t
@@ -771,7 +856,7 @@ async def main_menu_cb(callback: CallbackQuery, state: FSMContext) -> None:
         f"{t('main_menu_title')}\n\n"
         f"{t('main_menu_subtitle', count=total_models)}\n\n"
         f"Выберите категорию:",
-        reply_markup=_main_menu_keyboard(),
+        reply_markup=_cached_main_menu_keyboard(),
     )
 
 
@@ -946,7 +1031,7 @@ async def search_models_cb(callback: CallbackQuery, state: FSMContext) -> None:
     
     FLOW:
     1. User enters search query
-    2. Bot searches in: model_id, name, description, category
+    2. Bot searches in: model_id, name, provider, tags, description, category (ranked)
     3. Shows matching models (max 10)
     """
     await callback.answer()
@@ -972,25 +1057,9 @@ async def process_search_query(message: Message, state: FSMContext) -> None:
         await message.answer("Введите минимум 2 символа для поиска.")
         return
     
-    # Get registry
-    from app.kie.registry import get_model_registry
-    registry = get_model_registry()
-    
-    # Search in all fields
-    matches = []
-    for model_id, model in registry.items():
-        searchable_text = " ".join([
-            model_id,
-            model.get("name", ""),
-            model.get("description", ""),
-            model.get("category", ""),
-        ]).lower()
-        
-        if query in searchable_text:
-            matches.append((model_id, model))
-    
-    # Limit results
-    matches = matches[:10]
+    # Ranked search (prebuilt index: transliteration, prefixes, typos, popularity)
+    from app.kie.search_index import search_models
+    matches = [(hit.model_id, hit.model) for hit in search_models(query, limit=10)]
     
     if not matches:
         await message.answer(
@@ -1006,7 +1075,7 @@ async def process_search_query(message: Message, state: FSMContext) -> None:
     # Build results keyboard
     buttons = []
     for model_id, model in matches:
-        name = model.get("name", model_id)
+        name = model.get("name") or model.get("display_name") or model_id
         price = model.get("pricing", {}).get("rub_per_use", 0)
         
         # Add price tag
@@ -1043,7 +1112,7 @@ async def generate_menu_cb(callback: CallbackQuery, state: FSMContext) -> None:
     await state.clear()
     await callback.message.edit_text(
         "🚀 Генерация\n\nВыберите категорию:",
-        reply_markup=_category_keyboard(),
+        reply_markup=_cached_category_keyboard(),
     )
 
 
@@ -1054,7 +1123,7 @@ async def all_categories_cb(callback: CallbackQuery, state: FSMContext) -> None:
     await state.clear()
     await callback.message.edit_text(
         "📂 Все категории\n\nВыберите категорию:",
-        reply_markup=_category_keyboard(),
+        reply_markup=_cached_category_keyboard(),
     )
 
 
@@ -1065,7 +1134,7 @@ async def categories_cb(callback: CallbackQuery, state: FSMContext) -> None:
     await state.clear()
     await callback.message.edit_text(
         "📂 Все модели по категориям\n\nВыберите категорию:",
-        reply_markup=_category_keyboard(),
+        reply_markup=_cached_category_keyboard(),
     )
 
 
@@ -1281,7 +1350,7 @@ async def support_cb(callback: CallbackQuery) -> None:
 @router.callback_query(F.data.in_({"balance", "menu:balance"}))
 async def balance_cb(callback: CallbackQuery) -> None:
     await callback.answer()
-    balance = get_charge_manager().get_user_balance(callback.from_user.id)
+    balance = await get_charge_manager().get_user_balance(callback.from_user.id)
     await callback.message.edit_text(
         f"💰 Баланс: {format_price_rub(balance)}\n\n"
         "Пополнение временно доступно через поддержку.",
@@ -1352,7 +1421,7 @@ async def repeat_cb(callback: CallbackQuery, state: FSMContext) -> None:
     inputs = record.get('inputs', {})
     
     # Re-run generation with same inputs
-    model = next((m for m in _get_models_list() if m.get("model_id") == model_id), None)
+    model = _get_model(model_id)
     if not model:
         await callback.message.edit_text("⚠️ Модель не найдена.")
         return
@@ -1364,7 +1433,7 @@ async def repeat_cb(callback: CallbackQuery, state: FSMContext) -> None:
         amount = 0.0
     
     charge_manager = get_charge_manager()
-    balance = charge_manager.get_user_balance(callback.from_user.id)
+    balance = await charge_manager.get_user_balance(callback.from_user.id)
     if amount > 0 and balance < amount:
         await callback.message.edit_text(
             "❌ Недостаточно средств для повтора.\n\n"
@@ -1461,8 +1530,7 @@ async def category_cb(callback: CallbackQuery, state: FSMContext, data: dict = N
     try:
         await callback.answer()
         category = callback.data.split(":", 1)[1]
-        grouped = _models_by_category()
-        models = grouped.get(category, [])
+        models = _category_models(category)
 
         if not models:
             category_label = _category_label(category)
@@ -1480,7 +1548,8 @@ async def category_cb(callback: CallbackQuery, state: FSMContext, data: dict = N
             log_dispatch_ok(cid=cid)
             return
 
-        await state.update_data(category=category, category_models=models)
+        # Pages are served from the screen cache; no model dicts in FSM state
+        await state.update_data(category=category, category_models=None)
         
         # Category benefit line
         from app.ux.copy_ru import get_category_benefit, t
@@ -1497,7 +1566,7 @@ async def category_cb(callback: CallbackQuery, state: FSMContext, data: dict = N
         
         await callback.message.edit_text(
             category_text,
-            reply_markup=_model_keyboard(models, f"cat:{category}", page=0),
+            reply_markup=_category_page_keyboard(category, 0),
         )
         log_callback_accepted(callback_data=callback.data, handler="category_cb", cid=cid)
         log_ui_render(screen_id=f"category_{category}", cid=cid)
@@ -1519,26 +1588,30 @@ async def category_cb(callback: CallbackQuery, state: FSMContext, data: dict = N
 async def page_cb(callback: CallbackQuery, state: FSMContext) -> None:
     """Handle pagination callbacks."""
     await callback.answer()
-    parts = callback.data.split(":", 2)
-    if len(parts) < 3:
+    # page:<back_cb>:<page>, back_cb itself may contain ':' (cat:image)
+    parts = callback.data.split(":", 1)[1].rsplit(":", 1)
+    if len(parts) < 2:
         return
     
-    back_cb = parts[1]
+    back_cb = parts[0]
     try:
-        page = int(parts[2])
+        page = int(parts[1])
     except ValueError:
         return
     
+    # Category pages are pre-rendered
+    if back_cb.startswith("cat:"):
+        category = back_cb.split(":", 1)[1]
+        if 0 <= page < _category_page_count(category):
+            await callback.message.edit_reply_markup(
+                reply_markup=_category_page_keyboard(category, page)
+            )
+            return
+    
     data = await state.get_data()
     
-    # Get models from state
+    # Get models from state (search results, top lists)
     models = data.get("category_models")
-    if not models:
-        # Fallback: try to get from category
-        if back_cb.startswith("cat:"):
-            category = back_cb.split(":", 1)[1]
-            grouped = _models_by_category()
-            models = grouped.get(category, [])
     
     if not models:
         await callback.answer("⚠️ Модели не найдены", show_alert=True)
@@ -1559,9 +1632,9 @@ async def noop_cb(callback: CallbackQuery) -> None:
 async def model_cb(callback: CallbackQuery, state: FSMContext) -> None:
     await callback.answer()
     model_id = callback.data.split(":", 1)[1]
-    model = next((m for m in _get_models_list() if m.get("model_id") == model_id), None)
+    model = _get_model(model_id)
     if not model:
-        await callback.message.edit_text("⚠️ Модель не найдена.", reply_markup=_category_keyboard())
+        await callback.message.edit_text("⚠️ Модель не найдена.", reply_markup=_cached_category_keyboard())
         return
 
     data = await state.get_data()
@@ -1571,10 +1644,8 @@ async def model_cb(callback: CallbackQuery, state: FSMContext) -> None:
         back_cb = f"cat:{category}"
 
     await state.update_data(model_id=model_id)
-    await callback.message.edit_text(
-        _model_detail_text(model),
-        reply_markup=_model_detail_keyboard(model_id, back_cb),
-    )
+    text, keyboard = _cached_model_detail(model, back_cb)
+    await callback.message.edit_text(text, reply_markup=keyboard)
 
 
 @router.callback_query(F.data.startswith("gen:"))
@@ -1602,9 +1673,9 @@ async def generate_cb(callback: CallbackQuery, state: FSMContext) -> None:
         )
         return
     
-    model = next((m for m in _get_models_list() if m.get("model_id") == model_id), None)
+    model = _get_model(model_id)
     if not model:
-        await callback.message.edit_text("⚠️ Модель не найдена.", reply_markup=_category_keyboard())
+        await callback.message.edit_text("⚠️ Модель не найдена.", reply_markup=_cached_category_keyboard())
         return
 
     input_schema = model.get("input_schema", {})
@@ -1662,7 +1733,7 @@ async def opt_skip_all_cb(callback: CallbackQuery, state: FSMContext) -> None:
     await callback.answer("Используем значения по умолчанию")
     data = await state.get_data()
     flow_ctx = InputContext(**data.get("flow_ctx"))
-    model = next((m for m in _get_models_list() if m.get("model_id") == flow_ctx.model_id), None)
+    model = _get_model(flow_ctx.model_id)
     await _show_confirmation(callback.message, state, model)
 
 
@@ -1894,7 +1965,7 @@ async def _save_input_and_continue(message: Message, state: FSMContext, value: A
             return
         
         # Otherwise, show confirmation
-        model = next((m for m in _get_models_list() if m.get("model_id") == flow_ctx.model_id), None)
+        model = _get_model(flow_ctx.model_id)
         await _show_confirmation(message, state, model)
         return
 
@@ -1991,7 +2062,7 @@ async def _show_confirmation(message: Message, state: FSMContext, model: Optiona
     else:
         params_str = "Параметры по умолчанию"
     
-    balance = get_charge_manager().get_user_balance(message.from_user.id)
+    balance = await get_charge_manager().get_user_balance(message.from_user.id)
     
     # Extract prompt for summary (if exists)
     prompt = flow_ctx.collected.get("prompt", flow_ctx.collected.get("text", ""))
@@ -2027,13 +2098,13 @@ async def cancel_cmd(message: Message, state: FSMContext) -> None:
         await state.clear()
         await message.answer(
             "❌ Операция отменена. Возврат в главное меню.",
-            reply_markup=_main_menu_keyboard()
+            reply_markup=_cached_main_menu_keyboard()
         )
         logger.info(f"[CANCEL] User {message.from_user.id} cancelled from state {current_state}")
     else:
         await message.answer(
             "ℹ️ Вы не находитесь в процессе операции.",
-            reply_markup=_main_menu_keyboard()
+            reply_markup=_cached_main_menu_keyboard()
         )
 
 
@@ -2046,13 +2117,13 @@ async def cancel_cb(callback: CallbackQuery, state: FSMContext) -> None:
         await state.clear()
         await callback.message.edit_text(
             "❌ Отменено. Возврат в меню.",
-            reply_markup=_main_menu_keyboard()
+            reply_markup=_cached_main_menu_keyboard()
         )
         logger.info(f"[CANCEL] User {callback.from_user.id} cancelled from state {current_state}")
     else:
         await callback.message.edit_text(
             "ℹ️ Вы не находитесь в процессе операции.",
-            reply_markup=_main_menu_keyboard()
+            reply_markup=_cached_main_menu_keyboard()
         )
 
 
@@ -2061,7 +2132,7 @@ async def confirm_cb(callback: CallbackQuery, state: FSMContext) -> None:
     await callback.answer()
     data = await state.get_data()
     flow_ctx = InputContext(**data.get("flow_ctx"))
-    model = next((m for m in _get_models_list() if m.get("model_id") == flow_ctx.model_id), None)
+    model = _get_model(flow_ctx.model_id)
     if not model:
         keyboard = InlineKeyboardMarkup(inline_keyboard=[
             [InlineKeyboardButton(text="◀️ В меню", callback_data="main_menu")],
@@ -2081,7 +2152,7 @@ async def confirm_cb(callback: CallbackQuery, state: FSMContext) -> None:
         amount = 0.0
 
     charge_manager = get_charge_manager()
-    balance = charge_manager.get_user_balance(callback.from_user.id)
+    balance = await charge_manager.get_user_balance(callback.from_user.id)
     if amount > 0 and balance < amount:
         await callback.message.edit_text(
             "❌ Недостаточно средств для запуска.\n\n"
@@ -2104,12 +2175,10 @@ async def confirm_cb(callback: CallbackQuery, state: FSMContext) -> None:
     from app.utils.html import escape_html
     
     # Initial progress message with model and inputs info
-    model_name = _get_models_list()
     model_display = "Unknown"
-    for m in model_name:
-        if m.get("model_id") == flow_ctx.model_id:
-            model_display = m.get("name") or flow_ctx.model_id
-            break
+    current_model = _get_model(flow_ctx.model_id)
+    if current_model:
+        model_display = current_model.get("name") or flow_ctx.model_id
 
     # Format inputs for display - ESCAPE USER INPUT
     inputs_preview = ""
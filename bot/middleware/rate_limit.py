@@ -80,28 +80,24 @@ class RateLimitMiddleware(BaseMiddleware):
 class GlobalRateLimiter:
     """
     Глобальный rate limiter для всего бота.
-    Предотвращает слишком частые запросы к Telegram API.
+    
+    Совместимая обёртка над глобальным bucket'ом SendScheduler
+    (app/delivery/send_scheduler.py): запросы через bot.session уже
+    проходят планировщик, acquire() нужен только для вызовов в обход него.
     """
     
     def __init__(self, requests_per_second: float = 20.0):
         """
         Args:
-            requests_per_second: Максимум запросов в секунду
-                                Telegram limit: 30 req/sec, используем 20 для безопасности
+            requests_per_second: Оставлен для совместимости; лимит задаёт
+                                TELEGRAM_GLOBAL_RPS планировщика
         """
         self.min_interval = 1.0 / requests_per_second
-        self.last_request_time = 0.0
     
     async def acquire(self):
-        """Подождать перед следующим запросом если необходимо."""
-        current_time = asyncio.get_event_loop().time()
-        time_since_last = current_time - self.last_request_time
-        
-        if time_since_last < self.min_interval:
-            wait_time = self.min_interval - time_since_last
-            await asyncio.sleep(wait_time)
-        
-        self.last_request_time = asyncio.get_event_loop().time()
+        """Подождать токен глобального bucket'а (приоритет текущего send_lane)."""
+        from app.delivery.send_scheduler import get_send_scheduler
+        await get_send_scheduler().acquire()
 
 
 # Глобальный инстанс rate limiter
@@ -24,16 +24,17 @@ from dataclasses import dataclass
 from datetime import datetime, timezone
 from pathlib import Path
 from typing import Any, Optional
-import json
 
 from aiohttp import web
 
 from app.storage import get_storage
 from app.utils.logging_config import setup_logging  # noqa: E402
-from app.utils.orphan_reconciler import OrphanCallbackReconciler  # PHASE 5
 from app.utils.runtime_state import runtime_state  # noqa: E402
 from app.utils.version import get_app_version, get_version_info  # noqa: E402
 from app.locking.active_state import ActiveState  # NEW: unified active state
+from app.locking.scaleout import get_shard_manager
+from app.utils.update_dedup import RecentIdWindow
+from app.utils.webhook_ingress import parse_raw_update
 from app.utils.webhook import (
     build_kie_callback_url,
     get_kie_callback_path,
@@ -108,6 +109,41 @@ def _bool_env(name: str, default: bool = False) -> bool:
     return val.strip().lower() in {"1", "true", "yes", "y", "on"}
 
 
+def _webhook_dedup_window() -> int:
+    """Size of the webhook update_id dedup window (WEBHOOK_DEDUP_WINDOW)."""
+    try:
+        return max(100, int(os.getenv("WEBHOOK_DEDUP_WINDOW", "10000")))
+    except ValueError:
+        logging.getLogger(__name__).warning("[CONFIG] Invalid WEBHOOK_DEDUP_WINDOW, using 10000")
+        return 10000
+
+
+def _collect_runtime_metrics() -> None:
+    """Scrape-time gauges for /metrics (queue depth, DB pool); runs before each export."""
+    from app.utils.metrics import get_registry
+    from app.utils.update_queue import get_queue_manager
+
+    registry = get_registry()
+    queue_metrics = get_queue_manager().get_metrics()
+    queue_gauge = registry.gauge("update_queue", "Update queue state", ("field",))
+    for field_name in ("queue_depth", "held_depth", "workers_active", "workers_total", "shards_busy"):
+        queue_gauge.labels(field_name).set(queue_metrics.get(field_name, 0))
+    updates_total = registry.gauge("update_queue_updates", "Update queue counters since start", ("outcome",))
+    for outcome in ("received", "processed", "dropped", "errors", "held", "requeued"):
+        updates_total.labels(outcome).set(queue_metrics.get(f"total_{outcome}", 0))
+
+    try:
+        from app.storage import get_storage
+        storage = get_storage()
+        if hasattr(storage, "pool_metrics"):
+            pool_metrics = storage.pool_metrics()
+            pool_gauge = registry.gauge("db_pool", "asyncpg pool state", ("field",))
+            for field_name in ("size", "idle", "in_use", "waiting", "max_size"):
+                pool_gauge.labels(field_name).set(pool_metrics.get(field_name, 0))
+    except Exception:
+        pass
+
+
 def _derive_secret_path_from_token(token: str) -> str:
     """Derive a stable URL-safe secret path.
 
@@ -193,15 +229,19 @@ class SingletonLock:
             return True
 
         try:
-            from app.locking.single_instance import acquire_single_instance_lock
+            from app.locking.single_instance import (
+                acquire_single_instance_lock,
+                try_acquire_single_instance_lock,
+            )
 
             # Signature has no args (it reads env). Run in thread with optional timeout
             if timeout is not None:
                 try:
-                    # Fast non-blocking acquire with timeout
+                    # Fast non-blocking acquire with timeout: a single attempt, so an
+                    # abandoned thread can't grab the lock behind the controller's back
                     self._acquired = bool(
                         await asyncio.wait_for(
-                            asyncio.to_thread(acquire_single_instance_lock),
+                            asyncio.to_thread(try_acquire_single_instance_lock),
                             timeout=timeout
                         )
                     )
@@ -248,6 +288,19 @@ async def preflight_webhook(bot: Bot) -> None:
         logger.warning("[PRE-FLIGHT] Failed to delete webhook: %s", e)
 
 
+def _create_fsm_storage():
+    """FSM on ui_state (survives restart/handover) when DATABASE_URL is set; MemoryStorage otherwise."""
+    backend = os.getenv("FSM_STORAGE", "postgres").strip().lower()
+    if backend == "postgres" and os.getenv("DATABASE_URL", "").strip():
+        try:
+            from app.database.fsm_storage import PostgresFSMStorage
+            # Pool appears once DB services are up; until then the cache holds state
+            return PostgresFSMStorage(lambda: runtime_state.db_pool)
+        except Exception as e:
+            logger.warning(f"[FSM_STORAGE] ⚠️ Postgres FSM storage unavailable, using memory: {e}")
+    return MemoryStorage()
+
+
 def create_bot_application() -> tuple[Dispatcher, Bot]:
     """Create aiogram Dispatcher + Bot (sync factory for tests)."""
     token = os.getenv("TELEGRAM_BOT_TOKEN", "").strip()
@@ -257,7 +310,15 @@ def create_bot_application() -> tuple[Dispatcher, Bot]:
     # aiogram 3.7.0+ requires DefaultBotProperties for parse_mode
     default_properties = DefaultBotProperties(parse_mode="HTML")
     bot = Bot(token=token, default=default_properties)
-    dp = Dispatcher(storage=MemoryStorage())
+    dp = Dispatcher(storage=_create_fsm_storage())
+
+    # Every outbound API call is paced: global + per-chat buckets, priority lanes, 429 retry_after
+    try:
+        from app.delivery.send_scheduler import get_send_scheduler
+        bot.session.middleware(get_send_scheduler())
+        logger.info("[SEND_SCHEDULER] ✅ Registered on bot session")
+    except Exception as e:
+        logger.warning(f"[SEND_SCHEDULER] ⚠️ Not registered (sends unpaced): {e}")
 
     # Routers
     from bot.handlers import (
@@ -385,7 +446,7 @@ def _make_web_app(
 ) -> web.Application:
     app = web.Application()
     # In-memory resilience structures (single instance assumption)
-    recent_update_ids: set[int] = set()
+    recent_update_ids = RecentIdWindow(_webhook_dedup_window())
     rate_map: dict[str, list[float]] = {}
 
     def _client_ip(request: web.Request) -> str:
@@ -629,51 +690,24 @@ def _make_web_app(
             # Still return 200 to avoid Telegram retry storm
             return web.Response(status=200, text="ok")
 
-        # Fast JSON parse (no timeout needed - aiohttp handles this)
+        # Raw-bytes fast parse: only update_id/type/chat key here,
+        # full Update validation is deferred to the queue worker
         try:
-            payload = await request.json()
+            raw_update = parse_raw_update(await request.read())
         except Exception as e:
-            logger.warning("[WEBHOOK] Bad JSON: %s", e)
+            logger.warning("[WEBHOOK] Bad payload: %s", e)
             # Return 200 anyway (invalid updates will be ignored)
             return web.Response(status=200, text="ok")
-
-        # Validate and extract update
-        try:
-            update = Update.model_validate(payload)
-        except Exception as e:
-            logger.warning("[WEBHOOK] Invalid Telegram update: %s", e)
-            # Return 200 anyway
-            return web.Response(status=200, text="ok")
         
-        try:
-            update_id = int(getattr(update, "update_id", 0))
-        except Exception:
-            update_id = 0
-        
-        # Detect update type for logging
-        update_type = "unknown"
-        if getattr(update, "message", None):
-            update_type = "message"
-        elif getattr(update, "callback_query", None):
-            update_type = "callback_query"
-        elif getattr(update, "inline_query", None):
-            update_type = "inline_query"
-        elif getattr(update, "edited_message", None):
-            update_type = "edited_message"
+        update_id = raw_update.update_id
+        update_type = raw_update.update_type
         
         # OBSERVABILITY V2: WEBHOOK_IN
         from app.utils.correlation import ensure_correlation_id
         from app.observability.v2 import log_webhook_in
         from app.observability.explain import log_passive_drop
         cid = ensure_correlation_id(str(update_id) if update_id else None)
-        payload_size = request.headers.get("Content-Length")
-        if payload_size:
-            try:
-                payload_size = int(payload_size)
-            except ValueError:
-                payload_size = None
-        else:
-            payload_size = None
+        payload_size = len(raw_update.raw)
         
         log_webhook_in(
             cid=cid,
@@ -684,7 +718,9 @@ def _make_web_app(
         )
         
         # PASSIVE CHECK: If PASSIVE, drop update and return 200 OK immediately
-        if not active_state.active:
+        # (scale-out mode: shard ownership decides instead, see below)
+        shard_manager = get_shard_manager()
+        if shard_manager is None and not active_state.active:
             log_passive_drop(
                 cid=cid,
                 update_id=update_id,
@@ -699,10 +735,14 @@ def _make_web_app(
             logger.debug("[WEBHOOK] Duplicate update_id=%s ignored", update_id)
             return web.Response(status=200, text="ok")
         
-        # Mark as seen BEFORE enqueueing (prevent duplicate processing)
+        # Mark as seen BEFORE enqueueing (prevent duplicate processing; bounded window)
         if update_id:
             recent_update_ids.add(update_id)
         
+        # Scale-out: updates of shards owned by another replica go through update_forward
+        if shard_manager is not None and not await shard_manager.route(raw_update):
+            return web.Response(status=200, text="ok")
+        
         # 🚀 FASTPATH: Just fast HTTP ACK, ALL updates go to queue for proper processing
         # Business logic (sending messages, menus) happens in worker/handler
         # This architecture ensures:
@@ -723,7 +763,7 @@ def _make_web_app(
                 queue_manager.get_metrics()["queue_max"]
             )
         
-        enqueued = queue_manager.enqueue(update, update_id)
+        enqueued = queue_manager.enqueue(raw_update, update_id)
         
         # OBSERVABILITY V2: ENQUEUE_OK
         from app.observability.v2 import log_enqueue_ok
@@ -901,9 +941,9 @@ def _make_web_app(
             logger.warning(f"[KIE_CALLBACK] JSON parse failed: {exc}")
             return web.json_response({"ok": True, "ignored": True, "reason": "invalid_json"}, status=200)
 
-        # Import unified parser
-        from app.kie.state_parser import parse_kie_state, extract_task_id
+        from app.kie.state_parser import extract_task_id
         from app.utils.correlation import ensure_correlation_id
+        from app.kie.callback_inbox import get_callback_inbox, process_kie_callback, supports_inbox
         
         task_id = extract_task_id(raw_payload)
         if not task_id:
@@ -913,179 +953,21 @@ def _make_web_app(
         corr_id = ensure_correlation_id(task_id)
         logger.info(f"[{corr_id}] [CALLBACK_RECEIVED] task_id={task_id}")
         
-        # Parse state using unified parser
-        state, result_urls, error_msg = parse_kie_state(raw_payload, corr_id)
-        logger.info(f"[{corr_id}] [CALLBACK_PARSED] task_id={task_id} state={state} urls={len(result_urls)} error={error_msg or 'none'}")
-        
-        # Get job from storage
+        # Durable inbox: one INSERT, processing happens in inbox workers
         storage = get_storage()
-        job = None
-        try:
-            job = await storage.find_job_by_task_id(task_id)
-        except Exception as exc:
-            logger.warning(f"[{corr_id}] find_job_by_task_id failed: {exc}")
-
-        if not job:
-            logger.warning(f"[{corr_id}] [CALLBACK_ORPHAN] task_id={task_id} - saving for reconciliation")
-            runtime_state.callback_job_not_found_count += 1
-            
-            # Save orphan callback
+        if supports_inbox(storage):
             try:
-                await storage._save_orphan_callback(task_id, {
-                    'state': state,
-                    'result_urls': result_urls,
-                    'error': error_msg,
-                    'payload': raw_payload
-                })
-            except Exception as e:
-                logger.error(f"[{corr_id}] Failed to save orphan: {e}")
-            
-            return web.json_response({"ok": True}, status=200)
-        
-        # Get job_id (support both old storage and new jobs table)
-        job_id = job.get("job_id") or job.get("id")
-        if not job_id:
-            logger.warning(f"[{corr_id}] [CALLBACK_ERROR] No job_id found in job record")
-            return web.json_response({"ok": True}, status=200)
-        
-        # Try to use JobServiceV2 if DB pool is available (atomic balance updates)
-        job_service = None
-        if runtime_state.db_pool:
-            try:
-                from app.services.job_service_v2 import JobServiceV2
-                job_service = JobServiceV2(runtime_state.db_pool)
-                # Try to get job by task_id from jobs table
-                db_job = await job_service.get_by_task_id(task_id)
-                if db_job:
-                    job_id = db_job['id']  # Use integer ID from jobs table
-                    logger.info(f"[{corr_id}] [CALLBACK_JOB_V2] Found job in jobs table: id={job_id}")
-            except Exception as e:
-                logger.warning(f"[{corr_id}] [CALLBACK_FALLBACK] JobServiceV2 not available: {e}, using legacy storage")
-        
-        # Update job status based on state
-        try:
-            if state in ('waiting', 'running'):
-                if job_service:
-                    await job_service.update_with_kie_task(job_id, task_id, 'running')
-                else:
-                    await storage.update_job_status(str(job_id), 'running')
-                logger.debug(f"[{corr_id}] [CALLBACK_PROGRESS] task_id={task_id} state={state}")
-            
-            elif state == 'fail':
-                # Use JobServiceV2 for atomic balance release on failure
-                if job_service:
-                    await job_service.update_from_callback(
-                        job_id=job_id,
-                        status='failed',
-                        error_text=error_msg,
-                        kie_status=state
-                    )
-                    logger.info(f"[{corr_id}] [CALLBACK_FAIL] task_id={task_id} error={error_msg} (balance released via JobServiceV2)")
-                else:
-                    await storage.update_job_status(str(job_id), 'failed', error_message=error_msg)
-                    logger.info(f"[{corr_id}] [CALLBACK_FAIL] task_id={task_id} error={error_msg} (legacy storage)")
-                
-                # Try to acquire delivery lock for error notification (prevent spam)
-                lock_job = await storage.try_acquire_delivery_lock(task_id, timeout_minutes=5)
-                if lock_job:
-                    logger.info(f"[{corr_id}] [DELIVER_LOCK_WIN] Won lock for error notification")
-                    user_id = job.get('user_id')
-                    chat_id = job.get('chat_id') or user_id  # Use chat_id from job if available
-                    if not chat_id and job.get('params'):
-                        params = job.get('params')
-                        if isinstance(params, dict):
-                            chat_id = params.get('chat_id') or user_id
-                        elif isinstance(params, str):
-                            try:
-                                params_dict = json.loads(params)
-                                chat_id = params_dict.get('chat_id') or user_id
-                            except Exception:
-                                pass
-                    
-                    if chat_id:
-                        try:
-                            await bot.send_message(chat_id, f"❌ Генерация не завершилась: {error_msg}\nID: {task_id}")
-                            await storage.mark_delivered(task_id, success=True)
-                            logger.info(f"[{corr_id}] [MARK_DELIVERED] Error notified")
-                        except Exception as e:
-                            logger.exception(f"[{corr_id}] Failed to send error to user: {e}")
-                            await storage.mark_delivered(task_id, success=False, error=str(e))
-                else:
-                    logger.info(f"[{corr_id}] [DELIVER_LOCK_SKIP] Error already notified")
-            
-            elif state == 'success':
-                # Use JobServiceV2 for atomic balance charge on success
-                result_json = {'resultUrls': result_urls} if result_urls else None
-                if job_service:
-                    await job_service.update_from_callback(
-                        job_id=job_id,
-                        status='done',
-                        result_json=result_json,
-                        kie_status=state
-                    )
-                    logger.info(f"[{corr_id}] [CALLBACK_SUCCESS] task_id={task_id} urls={len(result_urls)} (balance charged via JobServiceV2)")
-                else:
-                    await storage.update_job_status(str(job_id), 'done', result_urls=result_urls)
-                    logger.info(f"[{corr_id}] [CALLBACK_SUCCESS] task_id={task_id} urls={len(result_urls)} (legacy storage)")
-                
-                # Get chat_id and category for delivery
-                user_id = job.get('user_id')
-                chat_id = job.get('chat_id') or user_id  # Use chat_id from job if available
-                if not chat_id and job.get('params'):
-                    params = job.get('params')
-                    if isinstance(params, dict):
-                        chat_id = params.get('chat_id') or user_id
-                    elif isinstance(params, str):
-                        try:
-                            params_dict = json.loads(params)
-                            chat_id = params_dict.get('chat_id') or user_id
-                        except Exception:
-                            pass
-                
-                # Fallback: if still no chat_id, use user_id
-                if not chat_id:
-                    chat_id = user_id
-                    logger.warning(f"[{corr_id}] [CALLBACK_WARN] No chat_id in job, using user_id={user_id}")
-                
-                # Determine category from model_id or params
-                category = 'image'  # default
-                model_id = job.get('model_id', '')
-                if 'video' in model_id.lower():
-                    category = 'video'
-                elif 'audio' in model_id.lower() or 'music' in model_id.lower():
-                    category = 'audio'
-                elif 'upscale' in model_id.lower() or 'enhance' in model_id.lower():
-                    category = 'upscale'
-                
-                if chat_id and result_urls:
-                    # UNIFIED DELIVERY COORDINATOR (platform-wide atomic lock)
-                    from app.delivery import deliver_result_atomic
-                    
-                    delivery_result = await deliver_result_atomic(
-                        storage=storage,
-                        bot=bot,
-                        task_id=task_id,
-                        chat_id=chat_id,
-                        result_urls=result_urls,
-                        category=category,
-                        corr_id=corr_id,
-                        timeout_minutes=5
-                    )
-                    
-                    if not delivery_result['delivered'] and delivery_result['error']:
-                        # Delivery failed, notify user
-                        try:
-                            await bot.send_message(chat_id, f"⚠️ Генерация готова, но не удалось отправить результат.\nID: {task_id}")
-                        except:
-                            pass
-                elif not chat_id:
-                    logger.error(f"[{corr_id}] [CALLBACK_ERROR] Cannot deliver: no chat_id and no user_id")
-                elif not result_urls:
-                    logger.warning(f"[{corr_id}] [CALLBACK_WARN] No result_urls to deliver")
-        
-        except Exception as e:
-            logger.exception(f"[{corr_id}] [CALLBACK_ERROR] task_id={task_id}: {e}")
+                inbox_id = await storage.enqueue_kie_callback(task_id, raw_payload)
+                logger.info(f"[{corr_id}] [CALLBACK_QUEUED] task_id={task_id} inbox_id={inbox_id}")
+                worker = get_callback_inbox()
+                if worker is not None:
+                    worker.wake()
+                return web.json_response({"ok": True}, status=200)
+            except Exception as exc:
+                logger.warning(f"[{corr_id}] [CALLBACK_INBOX] Enqueue failed, processing inline: {exc}")
         
+        # No inbox (JSON storage) or enqueue failed: process inline
+        await process_kie_callback(raw_payload, storage=storage, bot=bot, db_pool=runtime_state.db_pool)
         return web.json_response({"ok": True}, status=200)
 
     callback_route = f"/{cfg.kie_callback_path.lstrip('/')}"
@@ -1164,6 +1046,85 @@ def _make_web_app(
             db_status = "unknown"
             db_warn = "DB check failed"
         
+        # Pool saturation (PostgresStorage only)
+        db_pool_metrics = None
+        try:
+            from app.storage import get_storage
+            storage = get_storage()
+            if hasattr(storage, "pool_metrics"):
+                db_pool_metrics = storage.pool_metrics()
+        except Exception:
+            pass
+        
+        # Buffered app_events sink
+        app_events_metrics = None
+        try:
+            from app.observability.events_db import get_event_buffer
+            event_buffer = get_event_buffer()
+            app_events_metrics = {"pending": event_buffer.pending, **event_buffer.stats.as_dict()}
+        except Exception:
+            pass
+        
+        # Streaming result delivery
+        delivery_metrics = None
+        try:
+            from app.delivery.media_stream import get_media_pipeline
+            delivery_metrics = get_media_pipeline().stats.as_dict()
+        except Exception:
+            pass
+        
+        # Price snapshot (version / FX rate)
+        pricing_metrics = None
+        try:
+            from app.pricing.snapshot import get_pricing_service
+            pricing_service = get_pricing_service()
+            pricing_metrics = {**pricing_service.current().as_dict(), **pricing_service.stats.as_dict()}
+        except Exception:
+            pass
+        
+        # Pre-rendered menu screens
+        screen_cache_metrics = None
+        try:
+            from app.ux.screen_cache import get_screen_cache
+            screen_cache_metrics = get_screen_cache().as_dict()
+        except Exception:
+            pass
+        
+        # Outbound send scheduler
+        send_scheduler_metrics = None
+        try:
+            from app.delivery.send_scheduler import get_send_scheduler
+            send_scheduler_metrics = get_send_scheduler().as_dict()
+        except Exception:
+            pass
+        
+        # FSM storage (write-behind cache over ui_state)
+        fsm_storage_metrics = None
+        if hasattr(dp.storage, "as_dict"):
+            try:
+                fsm_storage_metrics = dp.storage.as_dict()
+            except Exception:
+                pass
+        
+        # KIE callback inbox workers
+        callback_inbox_metrics = None
+        try:
+            from app.kie.callback_inbox import get_callback_inbox
+            worker = get_callback_inbox()
+            callback_inbox_metrics = worker.as_dict() if worker else None
+        except Exception:
+            pass
+        
+        # Lock handover (LISTEN/NOTIFY)
+        lock_handover_metrics = None
+        controller = getattr(active_state, "lock_controller", None)
+        if controller is not None and getattr(controller, "handover", None) is not None:
+            lock_handover_metrics = controller.handover.get_stats()
+        
+        # Scale-out shard ownership
+        shard_manager = get_shard_manager()
+        scaleout_metrics = shard_manager.as_dict() if shard_manager is not None else None
+        
         # Lock info
         lock_debug = get_lock_debug_info()
         
@@ -1199,6 +1160,16 @@ def _make_web_app(
             "db_status": db_status,
             "db_warn": db_warn,
             "db_schema_ready": runtime_state.db_schema_ready,
+            "db_pool": db_pool_metrics,
+            "app_events": app_events_metrics,
+            "delivery": delivery_metrics,
+            "pricing": pricing_metrics,
+            "screen_cache": screen_cache_metrics,
+            "send_scheduler": send_scheduler_metrics,
+            "fsm_storage": fsm_storage_metrics,
+            "callback_inbox": callback_inbox_metrics,
+            "lock_handover": lock_handover_metrics,
+            "scaleout": scaleout_metrics,
             "last_error": last_error,
             "lock_holder_pid": lock_debug.get("holder_pid"),
             "lock_idle_duration": lock_debug.get("idle_duration"),
@@ -1225,6 +1196,20 @@ def _make_web_app(
     except Exception as e:
         logger.debug(f"[ADMIN_DB] Failed to register admin routes (non-critical): {e}")
     
+    # Prometheus scrape endpoint (app.utils.metrics registry); the runtime
+    # collector is registered once here, not on every scrape
+    from app.utils.metrics import PROMETHEUS_CONTENT_TYPE, get_registry
+    metrics_registry = get_registry()
+    metrics_registry.add_collector(_collect_runtime_metrics)
+
+    async def metrics(_request: web.Request) -> web.Response:
+        return web.Response(
+            body=metrics_registry.render_prometheus().encode("utf-8"),
+            headers={"Content-Type": PROMETHEUS_CONTENT_TYPE},
+        )
+
+    app.router.add_get("/metrics", metrics)
+
     # aiohttp auto-registers HEAD for GET; explicit add_head causes duplicate route
     app.router.add_post(callback_route, kie_callback)
     app.router.add_post("/webhook/{secret}", webhook)
@@ -1233,13 +1218,27 @@ def _make_web_app(
         """Graceful shutdown: close all connections and sessions."""
         logger.info("[SHUTDOWN] Starting graceful shutdown...")
         
+        # Stop KIE callback inbox workers (claimed rows are reclaimed after their lease)
+        try:
+            from app.kie.callback_inbox import stop_callback_inbox
+            await stop_callback_inbox()
+        except Exception as e:
+            logger.debug(f"[SHUTDOWN] Callback inbox stop failed: {e}")
+
         # Close bot session
         try:
             await bot.session.close()
             logger.info("[SHUTDOWN] ✅ Bot session closed")
         except Exception as e:
             logger.warning(f"[SHUTDOWN] Failed to close bot session: {e}")
-        
+
+        # Flush buffered app_events while the pool is still open
+        try:
+            from app.observability.events_db import shutdown_events_db
+            await shutdown_events_db()
+        except Exception as e:
+            logger.warning(f"[SHUTDOWN] Failed to flush app_events: {e}")
+
         # Close database pools if available
         try:
             if runtime_state.db_pool:
@@ -1257,7 +1256,28 @@ def _make_web_app(
                 logger.info("[SHUTDOWN] ✅ KIE client session closed")
         except Exception as e:
             logger.debug(f"[SHUTDOWN] KIE client close (may not be initialized): {e}")
-        
+
+        # Close shared KIE HTTP transport (KieApiClientV4)
+        try:
+            from app.kie.http_transport import close_kie_transport
+            await close_kie_transport()
+        except Exception as e:
+            logger.debug(f"[SHUTDOWN] KIE transport close failed: {e}")
+
+        # Close shared result-download session (delivery pipeline)
+        try:
+            from app.delivery.media_stream import close_media_pipeline
+            await close_media_pipeline()
+        except Exception as e:
+            logger.debug(f"[SHUTDOWN] Delivery pipeline close failed: {e}")
+
+        # Stop price snapshot refresher
+        try:
+            from app.pricing.snapshot import close_pricing_service
+            await close_pricing_service()
+        except Exception as e:
+            logger.debug(f"[SHUTDOWN] Pricing refresher stop failed: {e}")
+
         # Close psycopg2 connection pool
         try:
             from database import close_connection_pool
@@ -1454,6 +1474,14 @@ async def main() -> None:
     else:
         logger.info("[BOOT CHECK] ℹ️ Database: Not configured (JSON storage mode)")
     
+    # Check 5: Precompile model input validators (non-critical, falls back to lazy compile)
+    try:
+        from app.kie.schema_compiler import precompile_all
+        compiled_count = precompile_all()
+        logger.info(f"[BOOT CHECK] ✅ Model validators precompiled: {compiled_count}")
+    except Exception as e:
+        logger.warning(f"[BOOT CHECK] ⚠️ Model validators precompile failed (non-critical): {e}")
+    
     # Final boot check summary
     logger.info("=" * 60)
     if boot_check_ok:
@@ -1542,8 +1570,23 @@ async def main() -> None:
         render_service_name=render_service_name,
     )
     
+    # Scale-out (SCALEOUT_ENABLED=1): every replica serves its share of chat shards;
+    # the singleton lock only elects the leader (migrations, webhook setup)
+    from app.locking.scaleout import configure_shard_manager, is_scaleout_enabled
+    scaleout_manager = None
+    if is_scaleout_enabled():
+        if cfg.database_url and effective_bot_mode == "webhook" and lock_key is not None:
+            scaleout_manager = configure_shard_manager(
+                cfg.database_url, lock_key, runtime_state.instance_id, queue_manager, get_storage,
+                fsm_storage=dp.storage,
+            )
+            logger.info("[SCALEOUT] ✅ Active-active mode (%d shards)", scaleout_manager.num_shards)
+        else:
+            logger.warning("[SCALEOUT] ⚠️ SCALEOUT_ENABLED ignored: needs DATABASE_URL and webhook mode")
+    
     # Configure queue manager with dp, bot, and active_state BEFORE starting workers
-    queue_manager.configure(dp, bot, active_state)
+    # (scale-out: no PASSIVE gate in workers, ingress only enqueues owned shards)
+    queue_manager.configure(dp, bot, None if scaleout_manager else active_state)
     
     # 🔧 BACKGROUND TASKS: migrations + lock acquisition (NON-BLOCKING)
     # This ensures HTTP server starts IMMEDIATELY without waiting
@@ -1556,55 +1599,8 @@ async def main() -> None:
         # Mark schema as unknown until ACTIVE instance applies migrations
         runtime_state.db_schema_ready = False
         
-        # PHASE 5: Start orphan callback reconciliation background task
-        if runtime_state.db_schema_ready and cfg.database_url:
-            try:
-                # Create storage instance for reconciler
-                from app.storage import get_storage
-                storage_instance = get_storage()
-                
-                reconciler = OrphanCallbackReconciler(
-                    storage=storage_instance,
-                    bot=bot,
-                    check_interval=10,
-                    max_age_minutes=30
-                )
-                await reconciler.start()
-                logger.info("[RECONCILER] ✅ Background orphan reconciliation started (10s interval, 30min timeout)")
-            except Exception as exc:
-                logger.warning(f"[RECONCILER] ⚠️ Failed to start reconciler: {exc}")
-        
-        # PHASE 5.5: Start FSM state cleanup background task (ONLY on ACTIVE)
-        async def fsm_cleanup_loop():
-            """Periodic cleanup of expired FSM states."""
-            while True:
-                try:
-                    await asyncio.sleep(300)  # Run every 5 minutes
-                    if not active_state.active:
-                        continue  # Only cleanup on ACTIVE instance
-                    
-                    if runtime_state.db_pool:
-                        try:
-                            from app.database.services import DatabaseService, UIStateService
-                            from datetime import datetime, timezone
-                            db_service = DatabaseService(cfg.database_url)
-                            db_service._pool = runtime_state.db_pool
-                            ui_state_service = UIStateService(db_service)
-                            await ui_state_service.cleanup_expired()
-                            # Track last run time for health check
-                            runtime_state.fsm_cleanup_last_run = datetime.now(timezone.utc).isoformat()
-                        except Exception as e:
-                            logger.debug(f"[FSM_CLEANUP] Failed to cleanup expired states: {e}")
-                except asyncio.CancelledError:
-                    break
-                except Exception as e:
-                    from app.utils.correlation import correlation_tag
-                    cid = correlation_tag()
-                    logger.warning(f"{cid} [FSM_CLEANUP] Error in cleanup loop: {e}")
-                    await asyncio.sleep(60)  # Wait before retry
-        
-        asyncio.create_task(fsm_cleanup_loop())
-        logger.info("[FSM_CLEANUP] ✅ Background FSM state cleanup started (5min interval)")
+        # PHASE 5.5: Expired FSM states are dropped by PostgresFSMStorage itself
+        # (ignored on read, deleted in batches alongside write-behind flushes)
         
         # PHASE 5.6: Start stale job cleanup background task (ONLY on ACTIVE)
         async def stale_job_cleanup_loop():
@@ -1671,6 +1667,21 @@ async def main() -> None:
         asyncio.create_task(stuck_payment_cleanup_loop())
         logger.info("[STUCK_PAYMENT_CLEANUP] ✅ Background stuck payment cleanup started (1h interval)")
         
+        # Precomputed price tables + background FX refresh (no sync HTTP in handlers)
+        try:
+            from app.pricing.snapshot import get_pricing_service
+            await get_pricing_service().start()
+            logger.info("[PRICING] ✅ Price snapshot refresher started")
+        except Exception as e:
+            logger.warning(f"[PRICING] ⚠️ Price snapshot refresher not started (prices computed on demand): {e}")
+        
+        # Menu screens rendered once per catalog/price version (handlers only read them)
+        try:
+            from bot.handlers.flow import warm_screen_cache
+            warm_screen_cache()
+        except Exception as e:
+            logger.warning(f"[SCREEN_CACHE] ⚠️ Warmup failed (screens rendered on first use): {e}")
+        
         # Start update queue workers (already configured above)
         await queue_manager.start()
         logger.info("[QUEUE] ✅ Workers started (background update processing)")
@@ -1684,6 +1695,79 @@ async def main() -> None:
         # db_service declared at function level for finally block
         free_manager = None
 
+        async def init_db_services() -> None:
+            """Wire DatabaseService into handlers and start callback inbox workers (idempotent)"""
+            nonlocal db_service, free_manager
+
+            if db_service is not None:
+                return
+
+            # Step 3: Initialize database services
+            if cfg.database_url:
+                logger.info("[INIT_SERVICES] Initializing DatabaseService...")
+                try:
+                    from app.database.services import DatabaseService
+                    from app.free.manager import FreeModelManager
+
+                    db_service = DatabaseService(cfg.database_url)
+                    await db_service.initialize()
+                    free_manager = FreeModelManager(db_service)
+
+                    from bot.handlers.balance import set_database_service as set_balance_db
+                    from bot.handlers.history import set_database_service as set_history_db
+                    from bot.handlers.marketing import (
+                        set_database_service as set_marketing_db,
+                        set_free_manager,
+                    )
+
+                    set_balance_db(db_service)
+                    set_history_db(db_service)
+                    set_marketing_db(db_service)
+                    set_free_manager(free_manager)
+
+                    # Initialize AdminService and inject into admin handlers
+                    from app.admin.service import AdminService
+                    from app.services.wiring import set_services as set_global_services
+                    from bot.handlers.admin import set_services as set_admin_handlers_services
+                    
+                    admin_service = AdminService(db_service, free_manager)
+                    # Single source of truth: set in global wiring
+                    set_global_services(db_service, admin_service, free_manager)
+                    # Also set in admin handlers (backward compatibility)
+                    set_admin_handlers_services(db_service, admin_service, free_manager)
+                    logger.info("[ADMIN] ✅ AdminService initialized and injected into handlers")
+
+                    # Initialize observability events DB
+                    from app.observability.events_db import init_events_db
+                    if hasattr(db_service, '_pool') and db_service._pool:
+                        init_events_db(db_service._pool)
+                        logger.info("[OBSERVABILITY] ✅ Events DB initialized")
+                    
+                    # Search ranking boost from analytics rollups (fail-open)
+                    from app.kie.search_index import load_popularity_from_db
+                    asyncio.create_task(load_popularity_from_db(db_service))
+                    
+                    # Store pool in runtime_state instead of app (avoid DeprecationWarning)
+                    # Admin routes will read from runtime_state or use dependency injection
+                    if hasattr(db_service, '_pool'):
+                        # Store in runtime_state for admin endpoints (fail-open if not available)
+                        runtime_state.db_pool = db_service._pool
+
+                    logger.info("[DB] ✅ DatabaseService initialized and injected into handlers")
+                except Exception as e:
+                    logger.exception("[DB] ❌ Database init failed: %s", e)
+                    db_service = None
+
+            # Step 4: KIE callback inbox workers (also drain callbacks queued while PASSIVE / by other instances)
+            if runtime_state.db_schema_ready:
+                try:
+                    from app.kie.callback_inbox import start_callback_inbox
+                    from app.storage import get_storage
+                    await start_callback_inbox(get_storage(), bot)
+                except Exception as e:
+                    logger.warning(f"[CALLBACK_INBOX] ⚠️ Failed to start inbox workers: {e}")
+
+
         async def init_active_services() -> None:
             """Initialize services when lock acquired (called by controller callback)"""
             nonlocal db_service, free_manager
@@ -1695,6 +1779,13 @@ async def main() -> None:
             # active_state synced automatically by lock_controller, no need to set manually
             runtime_state.lock_acquired = True
             
+            # FSM entries cached during an earlier ACTIVE period may be stale (the
+            # other instance served these users meanwhile): re-read from ui_state
+            if hasattr(dp.storage, "invalidate") and scaleout_manager is None:
+                dropped = dp.storage.invalidate()
+                if dropped:
+                    logger.info("[FSM_STORAGE] Dropped %d cached states on lock acquire", dropped)
+            
             # P0-1: Update DEPLOY_TOPOLOGY with correct ACTIVE state
             # NOTE: os is already imported at module level (line 20), do not import again
             from app.observability.explain import log_deploy_topology
@@ -1774,66 +1865,43 @@ async def main() -> None:
                 else:
                     logger.error("[WEBHOOK_ACTIVE] ❌ Cannot build webhook URL!")
 
-            # Step 3: Initialize database services (ONLY on ACTIVE)
-            if cfg.database_url:
-                logger.info("[INIT_SERVICES] Initializing DatabaseService...")
-                try:
-                    from app.database.services import DatabaseService
-                    from app.free.manager import FreeModelManager
-
-                    db_service = DatabaseService(cfg.database_url)
-                    await db_service.initialize()
-                    free_manager = FreeModelManager(db_service)
-
-                    from bot.handlers.balance import set_database_service as set_balance_db
-                    from bot.handlers.history import set_database_service as set_history_db
-                    from bot.handlers.marketing import (
-                        set_database_service as set_marketing_db,
-                        set_free_manager,
-                    )
-
-                    set_balance_db(db_service)
-                    set_history_db(db_service)
-                    set_marketing_db(db_service)
-                    set_free_manager(free_manager)
-
-                    # Initialize AdminService and inject into admin handlers
-                    from app.admin.service import AdminService
-                    from app.services.wiring import set_services as set_global_services
-                    from bot.handlers.admin import set_services as set_admin_handlers_services
-                    
-                    admin_service = AdminService(db_service, free_manager)
-                    # Single source of truth: set in global wiring
-                    set_global_services(db_service, admin_service, free_manager)
-                    # Also set in admin handlers (backward compatibility)
-                    set_admin_handlers_services(db_service, admin_service, free_manager)
-                    logger.info("[ADMIN] ✅ AdminService initialized and injected into handlers")
-
-                    # Initialize observability events DB
-                    from app.observability.events_db import init_events_db
-                    if hasattr(db_service, '_pool') and db_service._pool:
-                        init_events_db(db_service._pool)
-                        logger.info("[OBSERVABILITY] ✅ Events DB initialized")
-                    
-                    # Store pool in runtime_state instead of app (avoid DeprecationWarning)
-                    # Admin routes will read from runtime_state or use dependency injection
-                    if hasattr(db_service, '_pool'):
-                        # Store in runtime_state for admin endpoints (fail-open if not available)
-                        runtime_state.db_pool = db_service._pool
+            # Step 3-4: Database services + KIE callback inbox (every replica in scale-out mode)
+            await init_db_services()
+        
+        async def start_scaleout_replica() -> None:
+            """Scale-out: wait for the leader's migrations, wire services, then lease shards"""
+            from app.locking.scaleout import SCALEOUT_MIGRATION
+            from app.storage.migrations import get_applied_migrations
 
-                    logger.info("[DB] ✅ DatabaseService initialized and injected into handlers")
-                except Exception as e:
-                    logger.exception("[DB] ❌ Database init failed: %s", e)
-                    db_service = None
+            waiting_logged = False
+            while SCALEOUT_MIGRATION not in (await get_applied_migrations(cfg.database_url) or []):
+                if not waiting_logged:
+                    logger.info("[SCALEOUT] Waiting for leader to apply %s...", SCALEOUT_MIGRATION)
+                    waiting_logged = True
+                await asyncio.sleep(2)
+            runtime_state.db_schema_ready = True
+            await init_db_services()
+            await scaleout_manager.start()
         
         # Step 2: Start unified lock controller with callback + active_state sync
         from app.locking.controller import SingletonLockController
-        
+        from app.locking.handover import LockHandover
+
+        # LISTEN/NOTIFY handover: woken at once when the ACTIVE instance releases the lock
+        # (scale-out: only leadership moves, queued updates follow their shards)
+        lock_handover = LockHandover(
+            cfg.database_url or None,
+            lock_key,
+            runtime_state.instance_id,
+            queue_manager=None if scaleout_manager else queue_manager,
+            storage_getter=get_storage,
+        )
         lock_controller = SingletonLockController(
-            lock, 
-            bot, 
+            lock,
+            bot,
             on_active_callback=init_active_services,
-            active_state=active_state  # CRITICAL: pass same object for sync
+            active_state=active_state,  # CRITICAL: pass same object for sync
+            handover=lock_handover,
         )
         active_state.lock_controller = lock_controller  # Store for webhook access
         
@@ -1847,6 +1915,9 @@ async def main() -> None:
             logger.info("[LOCK_CONTROLLER] ✅ ACTIVE MODE (lock acquired immediately)")
         else:
             logger.info("[LOCK_CONTROLLER] ⏸️ PASSIVE MODE (background watcher started)")
+        
+        if scaleout_manager is not None:
+            asyncio.create_task(start_scaleout_replica())
 
     runner: Optional[web.AppRunner] = None
     # Import DatabaseService type for annotation
@@ -1903,6 +1974,17 @@ async def main() -> None:
                     runtime_state.lock_acquired = new_active
                     lock_acquired_time = None  # Reset safety-net
 
+    # SIGTERM (deploy) ends the wait below; the finally block then hands the lock over
+    shutdown_requested = asyncio.Event()
+    try:
+        import signal
+
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, shutdown_requested.set)
+    except (NotImplementedError, RuntimeError) as e:
+        logger.debug(f"[SHUTDOWN] Signal handlers not installed: {e}")
+
     # 🚀 START BACKGROUND INITIALIZATION (non-blocking)
     asyncio.create_task(background_initialization())
     asyncio.create_task(state_sync_loop())  # Sync active_state with controller
@@ -1921,7 +2003,7 @@ async def main() -> None:
             # If passive mode, keep healthcheck running
             if not active_state.active:
                 logger.info("[PASSIVE MODE] HTTP server running, state_sync_loop monitors lock")
-                await asyncio.Event().wait()
+                await shutdown_requested.wait()
                 return
 
             # Active mode: initialize services and start polling
@@ -1944,8 +2026,48 @@ async def main() -> None:
         if not active_state.active:
             logger.info("[PASSIVE MODE] HTTP server running, state_sync_loop monitors lock")
 
-        await asyncio.Event().wait()
+        await shutdown_requested.wait()
     finally:
+        # Scale-out: forward queued updates of our shards and release them
+        try:
+            from app.locking.scaleout import stop_shard_manager
+            await stop_shard_manager()
+        except Exception as e:
+            logger.warning(f"[SHUTDOWN] Scale-out leave failed: {e}")
+        # Nothing of ours may run once the next instance is ACTIVE: start no new
+        # updates, let in-flight ones finish, and persist their FSM states
+        drain_seconds = float(os.getenv("LOCK_HANDOVER_DRAIN_SECONDS", "10"))
+        try:
+            if not await queue_manager.quiesce(timeout=drain_seconds):
+                logger.warning("[SHUTDOWN] Updates still in flight after %.0fs, handing over anyway", drain_seconds)
+        except Exception as e:
+            logger.warning(f"[SHUTDOWN] Queue quiesce failed: {e}")
+        try:
+            if hasattr(dp.storage, "flush"):
+                await dp.storage.flush()
+        except Exception as e:
+            logger.warning(f"[SHUTDOWN] FSM flush failed: {e}")
+        # Lock handover: stash the still-queued updates, release, pg_notify -> the
+        # waiting instance goes ACTIVE immediately instead of on its next retry
+        lock_controller = getattr(active_state, "lock_controller", None)
+        try:
+            if lock_controller is not None:
+                await lock_controller.stop(handover=True)
+        except Exception as e:
+            logger.warning(f"[SHUTDOWN] Lock handover failed: {e}")
+        # Updates the stash could not take (no handover / stash failed) run before the bot session closes
+        try:
+            queue_manager.resume()
+            if not await queue_manager.drain(timeout=drain_seconds):
+                logger.warning("[SHUTDOWN] Update queue not drained after %.0fs", drain_seconds)
+            await queue_manager.stop()
+        except Exception:
+            pass
+        # States written by those updates (pool is closed below)
+        try:
+            await dp.storage.close()
+        except Exception as e:
+            logger.warning(f"[SHUTDOWN] FSM storage close failed: {e}")
         try:
             if runner is not None:
                 await runner.cleanup()
@@ -0,0 +1,323 @@
+-- Migration 015: Incremental rollup tables for the admin analytics panel
+--
+-- app/admin/analytics.Analytics used to aggregate the full jobs / ledger /
+-- free_usage / users tables on every panel open. The tables below are kept up
+-- to date by AFTER triggers on every row transition (status change, insert,
+-- delete), so the panel reads a bounded number of rollup rows instead.
+--
+--   analytics_jobs_hourly       per (hour, model): uses / done / failed / revenue / last failure
+--   analytics_ledger_hourly     per (hour, kind): entries / amount
+--   analytics_user_daily        per (day, user): jobs / paid done jobs (distinct-user counts)
+--   analytics_new_users_daily   per day: new users
+--   analytics_user_flags        per user: first free use / first paid job (conversion)
+--   analytics_conversion_daily  per day: users reaching free use / free-to-paid conversion
+--   analytics_counters          rebuilt_at
+--
+-- No all-time total lives in a single row that every write bumps: concurrent
+-- writers would serialize on its row lock. Totals are summed by the reader
+-- from the bucketed rows (users_total from analytics_new_users_daily, per-model
+-- totals GROUP BY model_id over analytics_jobs_hourly).
+--
+-- Rollup maintenance never breaks the source write: trigger errors are logged
+-- as WARNING and skipped. SELECT analytics_rollups_rebuild() recomputes all
+-- rollups from the source tables (scripts/backfill_analytics_rollups.py).
+
+CREATE TABLE IF NOT EXISTS analytics_jobs_hourly (
+    bucket TIMESTAMP NOT NULL,
+    model_id TEXT NOT NULL,
+    total_uses BIGINT NOT NULL DEFAULT 0,
+    success_count BIGINT NOT NULL DEFAULT 0,
+    fail_count BIGINT NOT NULL DEFAULT 0,
+    revenue_rub NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    last_fail_at TIMESTAMP,
+    PRIMARY KEY (bucket, model_id)
+);
+
+CREATE TABLE IF NOT EXISTS analytics_ledger_hourly (
+    bucket TIMESTAMP NOT NULL,
+    kind TEXT NOT NULL,
+    entries BIGINT NOT NULL DEFAULT 0,
+    amount_rub NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (bucket, kind)
+);
+
+CREATE TABLE IF NOT EXISTS analytics_user_daily (
+    day DATE NOT NULL,
+    user_id BIGINT NOT NULL,
+    jobs BIGINT NOT NULL DEFAULT 0,
+    paid_done BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, user_id)
+);
+
+CREATE TABLE IF NOT EXISTS analytics_new_users_daily (
+    day DATE PRIMARY KEY,
+    new_users BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS analytics_user_flags (
+    user_id BIGINT PRIMARY KEY,
+    first_free_at TIMESTAMP,
+    first_paid_at TIMESTAMP
+);
+
+-- Users reaching free use / free-to-paid conversion per day (day of the event)
+CREATE TABLE IF NOT EXISTS analytics_conversion_daily (
+    day DATE PRIMARY KEY,
+    free_users BIGINT NOT NULL DEFAULT 0,
+    converted_users BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS analytics_counters (
+    name TEXT PRIMARY KEY,
+    value BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+
+CREATE OR REPLACE FUNCTION analytics_conversion_bump(p_day DATE, p_free BIGINT, p_converted BIGINT) RETURNS VOID AS $$
+BEGIN
+    INSERT INTO analytics_conversion_daily AS d (day, free_users, converted_users)
+    VALUES (p_day, p_free, p_converted)
+    ON CONFLICT (day) DO UPDATE SET
+        free_users = d.free_users + EXCLUDED.free_users,
+        converted_users = d.converted_users + EXCLUDED.converted_users;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- First free use / first paid job per user; counts each user once
+CREATE OR REPLACE FUNCTION analytics_mark_user(p_user_id BIGINT, p_free BOOLEAN, p_at TIMESTAMP) RETURNS VOID AS $$
+DECLARE
+    prev_free TIMESTAMP;
+    prev_paid TIMESTAMP;
+BEGIN
+    INSERT INTO analytics_user_flags (user_id) VALUES (p_user_id) ON CONFLICT (user_id) DO NOTHING;
+    SELECT first_free_at, first_paid_at INTO prev_free, prev_paid
+    FROM analytics_user_flags WHERE user_id = p_user_id FOR UPDATE;
+
+    IF p_free THEN
+        IF prev_free IS NOT NULL THEN
+            RETURN;
+        END IF;
+        UPDATE analytics_user_flags SET first_free_at = p_at WHERE user_id = p_user_id;
+        PERFORM analytics_conversion_bump(p_at::date, 1, CASE WHEN prev_paid IS NOT NULL THEN 1 ELSE 0 END);
+    ELSE
+        IF prev_paid IS NOT NULL THEN
+            RETURN;
+        END IF;
+        UPDATE analytics_user_flags SET first_paid_at = p_at WHERE user_id = p_user_id;
+        IF prev_free IS NOT NULL THEN
+            PERFORM analytics_conversion_bump(p_at::date, 0, 1);
+        END IF;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- Add (sign = 1) or remove (sign = -1) one job row's contribution
+CREATE OR REPLACE FUNCTION analytics_apply_job(j jobs, p_sign INT) RETURNS VOID AS $$
+DECLARE
+    is_done INT := CASE WHEN j.status = 'done' THEN p_sign ELSE 0 END;
+    is_failed INT := CASE WHEN j.status = 'failed' THEN p_sign ELSE 0 END;
+    revenue NUMERIC := CASE WHEN j.status = 'done' THEN p_sign * j.price_rub ELSE 0 END;
+    fail_at TIMESTAMP := CASE WHEN j.status = 'failed' AND p_sign > 0 THEN j.updated_at END;
+BEGIN
+    INSERT INTO analytics_jobs_hourly AS h (bucket, model_id, total_uses, success_count, fail_count, revenue_rub, last_fail_at)
+    VALUES (date_trunc('hour', j.created_at), j.model_id, p_sign, is_done, is_failed, revenue, fail_at)
+    ON CONFLICT (bucket, model_id) DO UPDATE SET
+        total_uses = h.total_uses + EXCLUDED.total_uses,
+        success_count = h.success_count + EXCLUDED.success_count,
+        fail_count = h.fail_count + EXCLUDED.fail_count,
+        revenue_rub = h.revenue_rub + EXCLUDED.revenue_rub,
+        last_fail_at = GREATEST(h.last_fail_at, EXCLUDED.last_fail_at);
+
+    INSERT INTO analytics_user_daily AS d (day, user_id, jobs, paid_done)
+    VALUES (j.created_at::date, j.user_id, p_sign,
+            CASE WHEN j.status = 'done' AND j.price_rub > 0 THEN p_sign ELSE 0 END)
+    ON CONFLICT (day, user_id) DO UPDATE SET
+        jobs = d.jobs + EXCLUDED.jobs,
+        paid_done = d.paid_done + EXCLUDED.paid_done;
+
+    IF p_sign > 0 AND j.status = 'done' AND j.price_rub > 0 THEN
+        PERFORM analytics_mark_user(j.user_id, FALSE, COALESCE(j.finished_at, j.updated_at));
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+
+CREATE OR REPLACE FUNCTION analytics_jobs_rollup() RETURNS TRIGGER AS $$
+BEGIN
+    BEGIN
+        IF TG_OP = 'UPDATE'
+           AND NEW.status IS NOT DISTINCT FROM OLD.status
+           AND NEW.price_rub IS NOT DISTINCT FROM OLD.price_rub
+           AND NEW.model_id IS NOT DISTINCT FROM OLD.model_id
+           AND NEW.user_id IS NOT DISTINCT FROM OLD.user_id
+           AND NEW.created_at IS NOT DISTINCT FROM OLD.created_at THEN
+            RETURN NULL;
+        END IF;
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            PERFORM analytics_apply_job(OLD, -1);
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            PERFORM analytics_apply_job(NEW, 1);
+        END IF;
+    EXCEPTION WHEN OTHERS THEN
+        RAISE WARNING '[ANALYTICS] jobs rollup skipped (rebuild with analytics_rollups_rebuild): %', SQLERRM;
+    END;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+
+CREATE OR REPLACE FUNCTION analytics_apply_ledger(l ledger, p_sign INT) RETURNS VOID AS $$
+BEGIN
+    INSERT INTO analytics_ledger_hourly AS h (bucket, kind, entries, amount_rub)
+    VALUES (date_trunc('hour', l.created_at), l.kind, p_sign, p_sign * l.amount_rub)
+    ON CONFLICT (bucket, kind) DO UPDATE SET
+        entries = h.entries + EXCLUDED.entries,
+        amount_rub = h.amount_rub + EXCLUDED.amount_rub;
+END;
+$$ LANGUAGE plpgsql;
+
+
+CREATE OR REPLACE FUNCTION analytics_ledger_rollup() RETURNS TRIGGER AS $$
+BEGIN
+    BEGIN
+        IF TG_OP = 'UPDATE'
+           AND NEW.kind IS NOT DISTINCT FROM OLD.kind
+           AND NEW.amount_rub IS NOT DISTINCT FROM OLD.amount_rub
+           AND NEW.created_at IS NOT DISTINCT FROM OLD.created_at THEN
+            RETURN NULL;
+        END IF;
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            PERFORM analytics_apply_ledger(OLD, -1);
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            PERFORM analytics_apply_ledger(NEW, 1);
+        END IF;
+    EXCEPTION WHEN OTHERS THEN
+        RAISE WARNING '[ANALYTICS] ledger rollup skipped (rebuild with analytics_rollups_rebuild): %', SQLERRM;
+    END;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+
+CREATE OR REPLACE FUNCTION analytics_free_usage_rollup() RETURNS TRIGGER AS $$
+BEGIN
+    BEGIN
+        PERFORM analytics_mark_user(NEW.user_id, TRUE, NEW.created_at);
+    EXCEPTION WHEN OTHERS THEN
+        RAISE WARNING '[ANALYTICS] free_usage rollup skipped (rebuild with analytics_rollups_rebuild): %', SQLERRM;
+    END;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+
+CREATE OR REPLACE FUNCTION analytics_users_rollup() RETURNS TRIGGER AS $$
+BEGIN
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            INSERT INTO analytics_new_users_daily AS d (day, new_users) VALUES (NEW.created_at::date, 1)
+            ON CONFLICT (day) DO UPDATE SET new_users = d.new_users + 1;
+        ELSE
+            UPDATE analytics_new_users_daily SET new_users = new_users - 1
+            WHERE day = OLD.created_at::date;
+        END IF;
+    EXCEPTION WHEN OTHERS THEN
+        RAISE WARNING '[ANALYTICS] users rollup skipped (rebuild with analytics_rollups_rebuild): %', SQLERRM;
+    END;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- Full recompute from the source tables. Blocks writers to the source
+-- tables for its duration (SHARE lock), so the result is exact.
+CREATE OR REPLACE FUNCTION analytics_rollups_rebuild() RETURNS VOID AS $$
+BEGIN
+    LOCK TABLE jobs, ledger, free_usage, users IN SHARE MODE;
+
+    TRUNCATE analytics_jobs_hourly, analytics_ledger_hourly, analytics_user_daily,
+             analytics_new_users_daily, analytics_user_flags, analytics_conversion_daily,
+             analytics_counters;
+
+    INSERT INTO analytics_jobs_hourly (bucket, model_id, total_uses, success_count, fail_count, revenue_rub, last_fail_at)
+    SELECT date_trunc('hour', created_at), model_id,
+           COUNT(*),
+           COUNT(*) FILTER (WHERE status = 'done'),
+           COUNT(*) FILTER (WHERE status = 'failed'),
+           COALESCE(SUM(price_rub) FILTER (WHERE status = 'done'), 0),
+           MAX(updated_at) FILTER (WHERE status = 'failed')
+    FROM jobs
+    GROUP BY 1, 2;
+
+    INSERT INTO analytics_ledger_hourly (bucket, kind, entries, amount_rub)
+    SELECT date_trunc('hour', created_at), kind, COUNT(*), COALESCE(SUM(amount_rub), 0)
+    FROM ledger
+    GROUP BY 1, 2;
+
+    INSERT INTO analytics_user_daily (day, user_id, jobs, paid_done)
+    SELECT created_at::date, user_id,
+           COUNT(*),
+           COUNT(*) FILTER (WHERE status = 'done' AND price_rub > 0)
+    FROM jobs
+    GROUP BY 1, 2;
+
+    INSERT INTO analytics_new_users_daily (day, new_users)
+    SELECT created_at::date, COUNT(*) FROM users GROUP BY 1;
+
+    INSERT INTO analytics_user_flags (user_id, first_free_at, first_paid_at)
+    SELECT user_id, f.first_free_at, p.first_paid_at
+    FROM (
+        SELECT user_id, MIN(created_at) AS first_free_at FROM free_usage GROUP BY user_id
+    ) f
+    FULL OUTER JOIN (
+        SELECT user_id, MIN(COALESCE(finished_at, updated_at)) AS first_paid_at
+        FROM jobs WHERE status = 'done' AND price_rub > 0 GROUP BY user_id
+    ) p USING (user_id);
+
+    -- A user converts on the later of their first free use and first paid job
+    INSERT INTO analytics_conversion_daily (day, free_users, converted_users)
+    SELECT day, SUM(free_users), SUM(converted_users)
+    FROM (
+        SELECT first_free_at::date AS day, 1 AS free_users, 0 AS converted_users
+        FROM analytics_user_flags WHERE first_free_at IS NOT NULL
+        UNION ALL
+        SELECT GREATEST(first_free_at, first_paid_at)::date, 0, 1
+        FROM analytics_user_flags WHERE first_free_at IS NOT NULL AND first_paid_at IS NOT NULL
+    ) events
+    GROUP BY day;
+
+    INSERT INTO analytics_counters (name, value) VALUES
+        ('rebuilt_at', EXTRACT(EPOCH FROM NOW())::BIGINT);
+
+    RAISE NOTICE '[ANALYTICS] Rollups rebuilt';
+END;
+$$ LANGUAGE plpgsql;
+
+
+DROP TRIGGER IF EXISTS analytics_jobs_rollup ON jobs;
+CREATE TRIGGER analytics_jobs_rollup
+    AFTER INSERT OR DELETE OR UPDATE OF status, price_rub, model_id, user_id, created_at ON jobs
+    FOR EACH ROW EXECUTE FUNCTION analytics_jobs_rollup();
+
+DROP TRIGGER IF EXISTS analytics_ledger_rollup ON ledger;
+CREATE TRIGGER analytics_ledger_rollup
+    AFTER INSERT OR DELETE OR UPDATE OF kind, amount_rub, created_at ON ledger
+    FOR EACH ROW EXECUTE FUNCTION analytics_ledger_rollup();
+
+DROP TRIGGER IF EXISTS analytics_free_usage_rollup ON free_usage;
+CREATE TRIGGER analytics_free_usage_rollup
+    AFTER INSERT ON free_usage
+    FOR EACH ROW EXECUTE FUNCTION analytics_free_usage_rollup();
+
+DROP TRIGGER IF EXISTS analytics_users_rollup ON users;
+CREATE TRIGGER analytics_users_rollup
+    AFTER INSERT OR DELETE ON users
+    FOR EACH ROW EXECUTE FUNCTION analytics_users_rollup();
+
+-- Initial backfill in the same transaction as the triggers: no row is counted twice or missed
+SELECT analytics_rollups_rebuild();
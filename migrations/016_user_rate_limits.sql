@@ -0,0 +1,19 @@
+-- Migration 016: Shared per-user generation rate limit state (GCRA)
+-- Purpose: app/utils/user_rate_limiter keeps fixed-size state per user here so
+-- limits hold across ACTIVE/PASSIVE handover and multiple instances.
+--
+-- Times are unix epoch seconds (DOUBLE PRECISION) as produced by time.time():
+--   tat_minute / tat_hour - GCRA theoretical arrival time for each window
+--   last_paid_at          - last paid generation (cooldown)
+-- A row whose tat_hour and cooldown are in the past carries no information
+-- and is deleted by UserRateLimiter eviction.
+
+CREATE TABLE IF NOT EXISTS user_rate_limits (
+    user_id BIGINT PRIMARY KEY,
+    tat_minute DOUBLE PRECISION NOT NULL DEFAULT 0,
+    tat_hour DOUBLE PRECISION NOT NULL DEFAULT 0,
+    last_paid_at DOUBLE PRECISION NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_user_rate_limits_tat_hour ON user_rate_limits(tat_hour);
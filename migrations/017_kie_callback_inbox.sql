@@ -0,0 +1,45 @@
+-- Migration 017: Durable KIE callback inbox
+-- The callback endpoint only INSERTs here and returns 200; inbox workers
+-- (app/kie/callback_inbox.py) claim rows with FOR UPDATE SKIP LOCKED.
+-- Callbacks that arrive before their job exist are retried from the inbox,
+-- replacing orphan_callbacks reconciliation.
+
+CREATE TABLE IF NOT EXISTS kie_callback_inbox (
+    id BIGSERIAL PRIMARY KEY,
+    task_id TEXT NOT NULL,
+    payload JSONB NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',  -- pending | processing | done | failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    received_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    next_attempt_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    locked_by TEXT,
+    locked_until TIMESTAMPTZ,
+    processed_at TIMESTAMPTZ,
+    last_error TEXT
+);
+
+-- Claim scan: only unfinished rows are indexed
+CREATE INDEX IF NOT EXISTS idx_kie_callback_inbox_ready
+    ON kie_callback_inbox (id)
+    WHERE status IN ('pending', 'processing');
+
+-- Per-task ordering check
+CREATE INDEX IF NOT EXISTS idx_kie_callback_inbox_task_open
+    ON kie_callback_inbox (task_id, id)
+    WHERE status IN ('pending', 'processing');
+
+-- Cleanup of finished rows
+CREATE INDEX IF NOT EXISTS idx_kie_callback_inbox_processed
+    ON kie_callback_inbox (processed_at)
+    WHERE status IN ('done', 'failed');
+
+-- Move unreconciled orphans into the inbox (they keep their received_at,
+-- so the worker still gives up on them after the orphan timeout)
+INSERT INTO kie_callback_inbox (task_id, payload, received_at)
+SELECT task_id, COALESCE(payload -> 'payload', payload), received_at
+FROM orphan_callbacks
+WHERE processed = FALSE;
+
+UPDATE orphan_callbacks
+SET processed = TRUE, processed_at = NOW(), error_message = 'moved to kie_callback_inbox'
+WHERE processed = FALSE;
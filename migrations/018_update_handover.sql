@@ -0,0 +1,15 @@
+-- Migration 018: Update handover between ACTIVE instances
+-- Purpose: on graceful shutdown the ACTIVE instance moves updates that are
+-- still queued (not yet dispatched) here before releasing the advisory lock
+-- and sending pg_notify. The instance that takes the lock over claims them
+-- with DELETE ... RETURNING and enqueues them (app/locking/handover.py).
+--
+-- payload is the raw Telegram webhook body, exactly as received.
+
+CREATE TABLE IF NOT EXISTS update_handover (
+    id BIGSERIAL PRIMARY KEY,
+    update_id BIGINT NOT NULL,
+    payload BYTEA NOT NULL,
+    from_instance TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
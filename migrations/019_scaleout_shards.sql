@@ -0,0 +1,28 @@
+-- Migration 019: Active-active scale-out (SCALEOUT_ENABLED=1)
+-- Purpose: replicas split chat shards between them (app/locking/scaleout.py).
+-- Shard ownership itself is a session advisory lock per shard; these tables
+-- only carry membership and updates that reached a replica not owning their
+-- shard.
+--
+-- scaleout_members: one row per live replica, refreshed every rebalance
+--   round. Rows older than the member TTL are ignored (crashed replica) and
+--   removed by the next heartbeat.
+-- update_forward: raw webhook bodies waiting for the owner of their shard.
+--   The owner claims them with DELETE ... FOR UPDATE SKIP LOCKED.
+
+CREATE TABLE IF NOT EXISTS scaleout_members (
+    instance_id TEXT PRIMARY KEY,
+    shards INTEGER[] NOT NULL DEFAULT '{}',
+    joined_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    heartbeat_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS update_forward (
+    id BIGSERIAL PRIMARY KEY,
+    shard INTEGER NOT NULL,
+    update_id BIGINT NOT NULL,
+    payload BYTEA NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_update_forward_shard ON update_forward (shard, id);
@@ -6,7 +6,7 @@ Supports multiple pricing types: fixed, per_second, matrix
 import os
 import logging
 import json
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Tuple
 from pathlib import Path
 
 # Try to import yaml, fallback to json if not available
@@ -26,6 +26,18 @@ DEFAULT_CONFIG_PATH_JSON = Path(__file__).parent / "config.json"
 USD_TO_RUB = 77.2222  # 1 USD = 77.2222 RUB (calculated from 6.95 / 0.09)
 MARKUP_MULTIPLIER = 2.0  # Multiplier for regular users
 
+# Parsed configs keyed by path: (mtime, config). Re-parsed only when the file changes
+_config_cache: Dict[Path, Tuple[float, Dict[str, Any]]] = {}
+
+
+def resolve_config_path() -> Optional[Path]:
+    """Default config file: config.yaml (if PyYAML available), else config.json."""
+    if YAML_AVAILABLE and DEFAULT_CONFIG_PATH_YAML.exists():
+        return DEFAULT_CONFIG_PATH_YAML
+    if DEFAULT_CONFIG_PATH_JSON.exists():
+        return DEFAULT_CONFIG_PATH_JSON
+    return None
+
 
 def load_config(config_path: Optional[Path] = None) -> Dict[str, Any]:
     """
@@ -35,22 +47,26 @@ def load_config(config_path: Optional[Path] = None) -> Dict[str, Any]:
         config_path: Path to config file (default: tries config.yaml, then config.json)
     
     Returns:
-        Dictionary with pricing configuration
+        Dictionary with pricing configuration (cached until the file mtime
+        changes; shared between callers, treat as read-only)
     """
     if config_path is None:
         # Try YAML first, then JSON
-        if YAML_AVAILABLE and DEFAULT_CONFIG_PATH_YAML.exists():
-            config_path = DEFAULT_CONFIG_PATH_YAML
-        elif DEFAULT_CONFIG_PATH_JSON.exists():
-            config_path = DEFAULT_CONFIG_PATH_JSON
-        else:
+        config_path = resolve_config_path()
+        if config_path is None:
             logger.warning(f"Config file not found: {DEFAULT_CONFIG_PATH_YAML} or {DEFAULT_CONFIG_PATH_JSON}, using defaults")
             return {"models": {}, "settings": {}}
     
-    if not config_path.exists():
+    try:
+        mtime = os.stat(config_path).st_mtime
+    except OSError:
         logger.warning(f"Config file not found: {config_path}, using defaults")
         return {"models": {}, "settings": {}}
     
+    cached = _config_cache.get(config_path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    
     try:
         with open(config_path, 'r', encoding='utf-8') as f:
             if config_path.suffix.lower() == '.yaml' or config_path.suffix.lower() == '.yml':
@@ -64,6 +80,7 @@ def load_config(config_path: Optional[Path] = None) -> Dict[str, Any]:
             else:
                 # Assume JSON
                 config = json.load(f) or {}
+        _config_cache[config_path] = (mtime, config)
         return config
     except Exception as e:
         logger.error(f"Error loading config from {config_path}: {e}")
@@ -91,7 +108,21 @@ def calc_model_price_rub(
     Raises:
         ValueError: If price configuration not found or invalid
     """
-    config = load_config(config_path)
+    if config_path is None:
+        # Default config: O(1) lookup in the precomputed price snapshot
+        from app.pricing.snapshot import get_price_snapshot
+        return get_price_snapshot().engine_price_rub(model_id, params, is_admin)
+    
+    return compute_model_price_rub(load_config(config_path), model_id, params, is_admin)
+
+
+def compute_model_price_rub(
+    config: Dict[str, Any],
+    model_id: str,
+    params: Dict[str, Any],
+    is_admin: bool = False
+) -> float:
+    """Price in RUB from an already loaded config (see calc_model_price_rub)."""
     models = config.get("models", {})
     settings = config.get("settings", {})
     
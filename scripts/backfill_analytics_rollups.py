@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Rebuild the admin analytics rollups (migrations/015_analytics_rollups.sql).
+
+Triggers keep the rollups current; run this after manual data fixes, restores
+or bulk loads that bypassed the triggers. Source tables are locked against
+writes (SHARE MODE) while the rebuild runs, so prefer a quiet window.
+
+Usage:
+    DATABASE_URL=postgres://... python scripts/backfill_analytics_rollups.py
+    python scripts/backfill_analytics_rollups.py --database-url postgres://...
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+async def _rebuild(db_url: str) -> int:
+    import asyncpg
+
+    conn = await asyncpg.connect(db_url, timeout=10)
+    try:
+        started = time.perf_counter()
+        await conn.execute("SELECT analytics_rollups_rebuild()")
+        elapsed = time.perf_counter() - started
+        rows = await conn.fetch(
+            """
+            SELECT 'users_total' AS name, COALESCE(SUM(new_users), 0)::BIGINT AS value FROM analytics_new_users_daily
+            UNION ALL
+            SELECT 'free_users', COALESCE(SUM(free_users), 0)::BIGINT FROM analytics_conversion_daily
+            UNION ALL
+            SELECT 'converted_users', COALESCE(SUM(converted_users), 0)::BIGINT FROM analytics_conversion_daily
+            """
+        )
+    finally:
+        await conn.close()
+
+    print(f"✅ Rollups rebuilt in {elapsed:.2f}s")
+    for row in rows:
+        print(f"  {row['name']:<16} {row['value']}")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    args = parser.parse_args()
+    if not args.database_url:
+        print("❌ DATABASE_URL not set", file=sys.stderr)
+        return 1
+    try:
+        return asyncio.run(_rebuild(args.database_url))
+    except Exception as e:
+        print(f"❌ Rebuild failed: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
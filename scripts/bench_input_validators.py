@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Benchmark: precompiled model validators vs per-request schema walk.
+
+"per-request" compiles the schema on every call, which is exactly the work the
+previous validate_model_inputs / validate_payload_before_create_task did
+(derive fields from SOURCE_OF_TRUTH examples, filter system fields, resolve
+types) before checking the inputs.
+
+Usage:
+    python scripts/bench_input_validators.py [--rounds 200]
+"""
+import argparse
+import logging
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.kie.builder import load_source_of_truth  # noqa: E402
+from app.kie.schema_compiler import compile_model, derive_schema, get_compiled_validator  # noqa: E402
+from app.kie.validator import ModelContractError  # noqa: E402
+
+
+def _sample_inputs(model_schema):
+    """Valid-looking inputs taken from the model's own examples."""
+    input_spec = model_schema.get("input_schema", {}).get("input", {})
+    examples = input_spec.get("examples") if isinstance(input_spec, dict) else None
+    if examples and isinstance(examples[0], dict):
+        return dict(examples[0])
+    properties, required, _optional = derive_schema(model_schema)
+    return {name: "https://example.com/a.png" if "url" in name else "test" for name in required}
+
+
+def _run(validate, cases, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for model_id, model_schema, inputs, payload in cases:
+            try:
+                validate(model_id, model_schema, inputs, payload)
+            except ModelContractError:
+                pass
+    return time.perf_counter() - started
+
+
+def per_request(model_id, model_schema, inputs, payload):
+    validator = compile_model(model_id, model_schema)
+    validator.validate_inputs(inputs)
+    validator.validate_payload(payload)
+
+
+def precompiled(model_id, model_schema, inputs, payload):
+    validator = get_compiled_validator(model_id, model_schema)
+    validator.validate_inputs(inputs)
+    validator.validate_payload(payload)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    models = load_source_of_truth().get("models", {})
+    cases = []
+    for model_id, model_schema in models.items():
+        inputs = _sample_inputs(model_schema)
+        payload = dict(inputs, model=model_id) if model_id in ("veo3_fast", "V4") else {"model": model_id, "input": inputs}
+        cases.append((model_id, model_schema, inputs, payload))
+
+    calls = len(cases) * args.rounds
+    results = {}
+    for name, fn in (("per-request walk", per_request), ("precompiled", precompiled)):
+        _run(fn, cases, 1)  # warm-up (fills compiled cache)
+        elapsed = _run(fn, cases, args.rounds)
+        results[name] = elapsed
+        print(f"{name:18s} {calls:7d} calls  {elapsed * 1000:9.1f} ms  {elapsed / calls * 1e6:7.2f} us/call")
+
+    print(f"speedup: {results['per-request walk'] / results['precompiled']:.1f}x ({len(cases)} models)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+"""
+Admin analytics (app.admin.analytics) reading the rollup tables.
+"""
+
+import re
+from contextlib import asynccontextmanager
+from datetime import datetime
+from decimal import Decimal
+from pathlib import Path
+
+import pytest
+
+from app.admin.analytics import Analytics
+
+MIGRATIONS = Path(__file__).resolve().parent.parent / "migrations"
+MIGRATION = MIGRATIONS / "015_analytics_rollups.sql"
+
+
+class FakeConn:
+    def __init__(self, fetch=None, fetchval=None, fetchrow=None, fail=False):
+        self._fetch = fetch or {}
+        self._fetchval = fetchval or {}
+        self._fetchrow = fetchrow or {}
+        self.fail = fail
+        self.queries = []
+
+    def _lookup(self, table, query):
+        self.queries.append(" ".join(query.split()))
+        if self.fail:
+            raise RuntimeError("connection reset")
+        for needle, value in table.items():
+            if needle in query:
+                return value(query) if callable(value) else value
+        raise AssertionError(f"unexpected query: {query}")
+
+    async def fetch(self, query, *args):
+        return self._lookup(self._fetch, query)
+
+    async def fetchval(self, query, *args):
+        return self._lookup(self._fetchval, query)
+
+    async def fetchrow(self, query, *args):
+        return self._lookup(self._fetchrow, query)
+
+    async def execute(self, query, *args):
+        return self._lookup(self._fetchval, query)
+
+
+class FakeDB:
+    def __init__(self, conn):
+        self.conn = conn
+
+    @asynccontextmanager
+    async def get_connection(self):
+        yield self.conn
+
+
+@pytest.mark.asyncio
+async def test_reads_only_rollup_tables():
+    conn = FakeConn(
+        fetch={
+            "HAVING SUM(fail_count) > 0": [{"model_id": "m/a", "fail_count": 2, "last_fail": datetime(2026, 1, 1)}],
+            "analytics_jobs_hourly": [
+                {"model_id": "m/a", "total_uses": 8, "success_count": 6, "fail_count": 2, "revenue": Decimal("120.50")},
+            ],
+        },
+        fetchval={
+            "SUM(revenue_rub)": Decimal("300"),
+            "paid_done > 0": 4,
+            "analytics_new_users_daily WHERE": 5,
+            "analytics_new_users_daily": 40,
+            "jobs > 0": 12,
+        },
+        fetchrow={
+            "analytics_ledger_hourly": {"topups": Decimal("500"), "refunds": None},
+            "analytics_conversion_daily": {"free_users": 10, "converted_users": 3},
+        },
+    )
+    analytics = Analytics(FakeDB(conn))
+
+    top = await analytics.get_top_models(limit=5)
+    assert top == [{
+        "model_id": "m/a", "total_uses": 8, "success_count": 6, "fail_count": 2,
+        "revenue": 120.5, "success_rate": 75.0,
+    }]
+    assert (await analytics.get_error_stats())[0]["fail_count"] == 2
+    assert await analytics.get_free_to_paid_conversion() == {
+        "total_free_users": 10, "converted_users": 3, "conversion_rate": 30.0,
+    }
+    assert await analytics.get_revenue_stats(30) == {
+        "period_days": 30, "total_revenue": 300.0, "total_topups": 500.0,
+        "total_refunds": 0.0, "paying_users": 4, "avg_revenue_per_user": 75.0,
+    }
+    assert await analytics.get_user_activity(7) == {
+        "period_days": 7, "new_users": 5, "active_users": 12, "total_users": 40,
+    }
+
+    for query in conn.queries:
+        tables = set(re.findall(r"\bFROM (\w+)", query))
+        assert tables and all(t.startswith("analytics_") for t in tables), query
+
+
+@pytest.mark.asyncio
+async def test_empty_rollups_and_errors_fail_open():
+    conn = FakeConn(fetchrow={"analytics_conversion_daily": {"free_users": 0, "converted_users": 0}})
+    assert await Analytics(FakeDB(conn)).get_free_to_paid_conversion() == {
+        "total_free_users": 0, "converted_users": 0, "conversion_rate": 0,
+    }
+
+    broken = Analytics(FakeDB(FakeConn(fail=True)))
+    assert await broken.get_top_models() == []
+    assert (await broken.get_revenue_stats(7))["paying_users"] == 0
+    assert await broken.rebuild_rollups() is False
+    assert await Analytics(None).rebuild_rollups() is False
+
+
+def test_migration_wires_triggers_and_backfill():
+    sql = MIGRATION.read_text(encoding="utf-8")
+    for table in ("jobs", "ledger", "free_usage", "users"):
+        assert re.search(rf"CREATE TRIGGER analytics_{table}_rollup\s+AFTER [^;]+ ON {table}\b", sql)
+    # Initial backfill runs in the migration transaction
+    assert sql.rstrip().endswith("SELECT analytics_rollups_rebuild();")
+
+
+def test_totals_are_not_kept_in_single_hot_rows():
+    sql = MIGRATION.read_text(encoding="utf-8")
+    code = "\n".join(line for line in sql.splitlines() if not line.lstrip().startswith("--"))
+    functions = code.split("CREATE OR REPLACE FUNCTION", 1)[1].split("FUNCTION analytics_rollups_rebuild")[0]
+    # Per-write maintenance only touches bucketed rows
+    assert "analytics_counters" not in functions
+    assert "analytics_model_totals" not in code
+    assert "analytics_bump" not in code
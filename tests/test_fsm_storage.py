@@ -0,0 +1,130 @@
+"""
+PostgresFSMStorage (app.database.fsm_storage): cache hits after the first
+read, write-behind coalescing, TTL expiry, state surviving a new instance.
+"""
+
+import asyncio
+import json
+from contextlib import asynccontextmanager
+
+import pytest
+from aiogram.fsm.storage.base import StorageKey
+
+from app.database.fsm_storage import PostgresFSMStorage
+
+
+class _FakePool:
+    """ui_state rows + users, queried through the few statements the storage issues."""
+
+    def __init__(self, users=(1, 2, 3)):
+        self.users = set(users)
+        self.rows = {}
+        self.selects = 0
+        self.writes = 0
+
+    async def fetchrow(self, query, user_id):
+        self.selects += 1
+        row = self.rows.get(user_id)
+        if row is None or row["ttl_left"] <= 0:
+            return None
+        return row
+
+    async def execute(self, query, *args):
+        if "INSERT INTO ui_state" in query:
+            self.writes += 1
+            user_ids, states, datas, ttl = args
+            for user_id, state, data in zip(user_ids, states, datas):
+                if user_id in self.users:
+                    self.rows[user_id] = {"state": state, "data": data, "ttl_left": ttl}
+        elif "ANY($1::bigint[])" in query:
+            self.writes += 1
+            for user_id in args[0]:
+                self.rows.pop(user_id, None)
+        return "DELETE 0"
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield self
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+
+def _key(user_id, chat_id=None):
+    return StorageKey(bot_id=42, chat_id=user_id if chat_id is None else chat_id, user_id=user_id)
+
+
+def _storage(pool, **kwargs):
+    kwargs.setdefault("flush_interval", 0.01)
+    return PostgresFSMStorage(lambda: pool, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_state_survives_new_instance_and_reads_hit_cache():
+    pool = _FakePool()
+    old = _storage(pool)
+    await old.set_state(_key(1), "FlowStates:waiting_input")
+    await old.set_data(_key(1), {"flow_ctx": {"model_id": "flux", "index": 1}})
+    await old.close()
+    pool.selects = 0
+
+    new = _storage(pool)
+    assert await new.get_state(_key(1)) == "FlowStates:waiting_input"
+    assert (await new.get_data(_key(1)))["flow_ctx"]["index"] == 1
+    assert pool.selects == 1  # second read served from cache
+    assert new.stats["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_writes_are_coalesced_into_one_flush():
+    pool = _FakePool()
+    storage = _storage(pool, flush_interval=0.05)
+    for i in range(10):
+        await storage.update_data(_key(1), {"step": i})
+        await storage.update_data(_key(2), {"step": i})
+    assert pool.writes == 0
+
+    await asyncio.sleep(0.1)
+    assert pool.writes == 1
+    assert json.loads(pool.rows[1]["data"]) == {"step": 9}
+    assert json.loads(pool.rows[2]["data"]) == {"step": 9}
+
+
+@pytest.mark.asyncio
+async def test_clear_deletes_row_and_group_chats_stay_in_memory():
+    pool = _FakePool()
+    storage = _storage(pool)
+    await storage.set_state(_key(1), "FlowStates:search_query")
+    await storage.set_state(_key(2, chat_id=-100500), "FlowStates:search_query")
+    await storage.flush()
+    assert set(pool.rows) == {1}
+
+    await storage.set_state(_key(1), None)
+    await storage.set_data(_key(1), {})
+    await storage.flush()
+    assert pool.rows == {}
+    assert await storage.get_state(_key(2, chat_id=-100500)) == "FlowStates:search_query"
+
+
+@pytest.mark.asyncio
+async def test_expired_state_reads_empty():
+    pool = _FakePool()
+    storage = _storage(pool, ttl_minutes=0)
+    await storage.set_state(_key(1), "FlowStates:waiting_input")
+
+    assert await storage.get_state(_key(1)) is None
+    assert storage.stats["expired"] == 1
+
+
+@pytest.mark.asyncio
+async def test_states_kept_until_pool_is_available():
+    pool = _FakePool()
+    pool_ref = {"pool": None}
+    storage = PostgresFSMStorage(lambda: pool_ref["pool"], flush_interval=0.01)
+    await storage.set_state(_key(3), "FlowStates:waiting_input")
+    assert await storage.flush() == 0  # DB not up yet
+
+    pool_ref["pool"] = pool
+    assert await storage.flush() == 1
+    assert pool.rows[3]["state"] == "FlowStates:waiting_input"
@@ -0,0 +1,152 @@
+"""
+JsonStorage on the append-only log store (app.storage.json_log).
+"""
+
+import json
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from app.storage.json_log import SEQ_KEY, WAL_NAME, WAL_OLD_NAME, JsonLogStore
+from app.storage.json_storage import JsonStorage
+
+
+@pytest.fixture
+def data_dir():
+    # No tmp_path: the pytest_asyncio shim forwards every fixture in the closure
+    with tempfile.TemporaryDirectory() as tmp:
+        yield Path(tmp)
+
+
+@pytest.mark.asyncio
+async def test_writes_survive_restart_without_close(data_dir):
+    storage = JsonStorage(str(data_dir))
+    await storage.set_user_balance(1, 50.0)
+    await storage.add_user_balance(1, 25.0)
+    await storage.set_user_language(1, "en")
+    job_id = await storage.add_generation_job(1, "flux/dev", "Flux", {"prompt": "cat"}, 10.0, task_id="task-1")
+    await storage.update_job_status(job_id, "done", result_urls=["https://x/1.png"])
+    await storage.set_referrer(2, 1)
+    await storage.set_referrer(2, 1)
+
+    # Snapshot files are untouched until compaction; state lives in the WAL
+    assert json.loads((data_dir / "user_balances.json").read_text()) == {}
+
+    # Simulate crash: new instance replays the log
+    reopened = JsonStorage(str(data_dir))
+    assert await reopened.get_user_balance(1) == 75.0
+    assert await reopened.get_user_language(1) == "en"
+    job = await reopened.find_job_by_task_id("task-1")
+    assert job["status"] == "done"
+    assert job["result_urls"] == ["https://x/1.png"]
+    assert await reopened.get_referrer(2) == 1
+    assert await reopened.get_referrals(1) == [2]
+
+
+@pytest.mark.asyncio
+async def test_history_append_is_capped(data_dir):
+    storage = JsonStorage(str(data_dir))
+    for i in range(105):
+        await storage.add_generation_to_history(7, "m", "M", {}, [f"u{i}"], 1.0, operation_id=f"g{i}")
+
+    history = await storage.get_user_generations_history(7, limit=200)
+    assert len(history) == 100
+    assert history[0]["id"] == "g5" and history[-1]["id"] == "g104"
+
+    # One small WAL record per append, not the whole history
+    lines = (data_dir / WAL_NAME).read_text().splitlines()
+    assert len(lines) == 105
+    assert len(lines[-1]) < 400
+
+    reopened = JsonStorage(str(data_dir))
+    assert [g["id"] for g in await reopened.get_user_generations_history(7, limit=200)] == [g["id"] for g in history]
+
+
+@pytest.mark.asyncio
+async def test_returned_records_are_copies(data_dir):
+    storage = JsonStorage(str(data_dir))
+    params = {"prompt": "a"}
+    job_id = await storage.add_generation_job(1, "m", "M", params, 1.0)
+    params["prompt"] = "mutated"
+
+    job = await storage.get_job(job_id)
+    job["status"] = "hacked"
+
+    stored = await storage.get_job(job_id)
+    assert stored["params"] == {"prompt": "a"}
+    assert stored["status"] == "queued"
+
+
+@pytest.mark.asyncio
+async def test_close_compacts_into_snapshots(data_dir):
+    storage = JsonStorage(str(data_dir))
+    await storage.set_user_balance(3, 12.5)
+    pay_id = await storage.add_payment(3, 100.0, "sbp", idempotency_key="k1")
+    assert await storage.add_payment(3, 100.0, "sbp", idempotency_key="k1") == pay_id
+    await storage.close()
+
+    balances = json.loads((data_dir / "user_balances.json").read_text())
+    assert balances["3"] == 12.5
+    assert balances[SEQ_KEY] >= 1
+    assert (data_dir / WAL_NAME).read_text() == ""
+    assert not (data_dir / WAL_OLD_NAME).exists()
+
+    reopened = JsonStorage(str(data_dir))
+    assert await reopened.get_user_balance(3) == 12.5
+    assert (await reopened.get_payment(pay_id))["idempotency_key"] == "k1"
+    assert SEQ_KEY not in [p.get("payment_id") for p in await reopened.list_payments()]
+
+
+@pytest.mark.asyncio
+async def test_background_compaction_and_interrupted_segment(data_dir):
+    store = JsonLogStore(data_dir, ["t"], compact_every=10)
+    for i in range(10):
+        store.add("t", "items", i, cap=5)
+    await store._compaction
+    assert store.compactions == 1
+    assert json.loads((data_dir / "t.json").read_text())["items"] == [5, 6, 7, 8, 9]
+
+    # Crash after the snapshot was written but before the old segment was dropped:
+    # replaying the segment must not duplicate already-snapshotted appends.
+    store.add("t", "items", 10, cap=5)
+    (data_dir / WAL_OLD_NAME).write_text(
+        "\n".join(json.dumps({"t": "t", "op": "add", "k": "items", "v": i, "cap": 5, "s": i + 1}) for i in range(10))
+        + "\n"
+    )
+    # Torn tail line is ignored
+    with open(data_dir / WAL_NAME, "a") as f:
+        f.write('{"t": "t", "op": "set"')
+
+    reopened = JsonLogStore(data_dir, ["t"])
+    assert reopened.table("t")["items"] == [6, 7, 8, 9, 10]
+
+
+@pytest.mark.asyncio
+async def test_write_after_torn_tail_survives_next_restart(data_dir):
+    storage = JsonStorage(str(data_dir))
+    await storage.set_user_balance(1, 10.0)
+    await storage.set_user_balance(2, 20.0)
+    # Crash mid-append
+    with open(data_dir / WAL_NAME, "a") as f:
+        f.write('{"t":"user_balances","op":"set","k":"9","v":9')
+
+    restarted = JsonStorage(str(data_dir))
+    await restarted.set_user_balance(3, 30.0)
+
+    reopened = JsonStorage(str(data_dir))
+    assert await reopened.get_user_balance(1) == 10.0
+    assert await reopened.get_user_balance(2) == 20.0
+    assert await reopened.get_user_balance(3) == 30.0
+    assert await reopened.get_user_balance(9) == 0.0
+    assert (data_dir / (WAL_NAME + ".corrupt")).read_text().startswith('{"t":"user_balances","op":"set","k":"9"')
+
+
+def test_replay_stops_at_corrupt_line(data_dir):
+    records = [json.dumps({"t": "t", "op": "set", "k": str(i), "v": i, "s": i + 1}) for i in range(3)]
+    (data_dir / WAL_NAME).write_text(f"{records[0]}\nnot json\n{records[2]}\n")
+
+    store = JsonLogStore(data_dir, ["t"])
+    assert store.table("t") == {"0": 0}
+    store.set("t", "x", 1)
+    assert JsonLogStore(data_dir, ["t"]).table("t") == {"0": 0, "x": 1}
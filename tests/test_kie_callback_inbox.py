@@ -0,0 +1,185 @@
+"""
+KIE callback inbox (app.kie.callback_inbox): worker draining, orphan retries, backoff.
+"""
+
+import sys
+import types
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import app.kie.callback_inbox as callback_inbox
+from app.kie.callback_inbox import CallbackInboxWorker
+
+
+class _FakeInboxStorage:
+    """In-memory stand-in for the PostgresStorage inbox + job methods."""
+
+    def __init__(self, jobs=None):
+        self.jobs = jobs or {}
+        self.rows = {}
+        self.status_updates = []
+        self.fail_status_updates = False
+        self._next_id = 1
+
+    async def enqueue_kie_callback(self, task_id, payload):
+        item_id = self._next_id
+        self._next_id += 1
+        self.rows[item_id] = {
+            "id": item_id, "task_id": task_id, "payload": payload, "status": "pending",
+            "attempts": 0, "received_at": datetime.now(timezone.utc), "delay": 0, "error": None,
+            "locked_by": None,
+        }
+        return item_id
+
+    async def claim_kie_callbacks(self, worker_id, limit, lease_seconds):
+        claimed = []
+        for row in sorted(self.rows.values(), key=lambda r: r["id"]):
+            if row["status"] != "pending" or row["delay"] > 0:
+                continue
+            older_open = any(
+                other["task_id"] == row["task_id"] and other["id"] < row["id"]
+                and other["status"] in ("pending", "processing")
+                for other in self.rows.values()
+            )
+            if older_open:
+                continue
+            row["status"] = "processing"
+            row["attempts"] += 1
+            row["locked_by"] = worker_id
+            claimed.append(dict(row))
+            if len(claimed) >= limit:
+                break
+        return claimed
+
+    def _owned(self, item_id, worker_id, attempts):
+        row = self.rows[item_id]
+        return row["status"] == "processing" and row["locked_by"] == worker_id and row["attempts"] == attempts
+
+    async def retry_kie_callback(self, item_id, error, delay_seconds, *, worker_id, attempts):
+        if not self._owned(item_id, worker_id, attempts):
+            return False
+        self.rows[item_id].update(status="pending", error=error, delay=delay_seconds, locked_by=None)
+        return True
+
+    async def finish_kie_callback(self, item_id, status, error=None, *, worker_id, attempts):
+        if not self._owned(item_id, worker_id, attempts):
+            return False
+        self.rows[item_id].update(status=status, error=error or self.rows[item_id]["error"], locked_by=None)
+        return True
+
+    async def find_job_by_task_id(self, task_id):
+        return self.jobs.get(task_id)
+
+    async def update_job_status(self, job_id, status, **kwargs):
+        if self.fail_status_updates:
+            raise RuntimeError("db down")
+        self.status_updates.append((job_id, status))
+
+
+def _worker(storage, **kwargs):
+    return CallbackInboxWorker(storage, bot=None, concurrency=1, db_pool_getter=lambda: None, worker_id="test", **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_worker_applies_callbacks_in_task_order():
+    storage = _FakeInboxStorage(jobs={"t1": {"job_id": "job-1", "user_id": 1}})
+    await storage.enqueue_kie_callback("t1", {"data": {"taskId": "t1", "state": "waiting"}})
+    await storage.enqueue_kie_callback("t1", {"data": {"taskId": "t1", "state": "waiting"}})
+    worker = _worker(storage)
+
+    # Second row of the same task waits for the first
+    assert await worker.drain_once() == 1
+    assert await worker.drain_once() == 1
+    assert await worker.drain_once() == 0
+    assert [row["status"] for row in storage.rows.values()] == ["done", "done"]
+    assert storage.status_updates == [("job-1", "running"), ("job-1", "running")]
+    assert worker.stats["processed"] == 2
+
+
+@pytest.mark.asyncio
+async def test_orphan_is_retried_then_times_out():
+    storage = _FakeInboxStorage()
+    item_id = await storage.enqueue_kie_callback("t2", {"data": {"taskId": "t2", "state": "waiting"}})
+    worker = _worker(storage, orphan_retry_seconds=10, orphan_max_age_minutes=30)
+
+    await worker.drain_once()
+    row = storage.rows[item_id]
+    assert row["status"] == "pending" and row["delay"] == 10 and row["error"] == "job_not_found"
+
+    # Job appears: next attempt processes it
+    storage.jobs["t2"] = {"job_id": "job-2", "user_id": 2}
+    row["delay"] = 0
+    await worker.drain_once()
+    assert row["status"] == "done"
+
+    stale = await storage.enqueue_kie_callback("t3", {"data": {"taskId": "t3", "state": "waiting"}})
+    storage.rows[stale]["received_at"] = datetime.now(timezone.utc) - timedelta(minutes=31)
+    await worker.drain_once()
+    assert storage.rows[stale]["status"] == "failed"
+    assert "Orphan timeout" in storage.rows[stale]["error"]
+
+
+@pytest.mark.asyncio
+async def test_processing_errors_back_off_then_fail():
+    storage = _FakeInboxStorage(jobs={"t4": {"job_id": "job-4", "user_id": 4}})
+    storage.fail_status_updates = True
+    item_id = await storage.enqueue_kie_callback("t4", {"data": {"taskId": "t4", "state": "waiting"}})
+    worker = _worker(storage, max_attempts=3)
+
+    delays = []
+    for _ in range(3):
+        await worker.drain_once()
+        delays.append(storage.rows[item_id]["delay"])
+        storage.rows[item_id]["delay"] = 0
+    assert delays[:2] == [5, 10]
+    assert storage.rows[item_id]["status"] == "failed"
+    assert worker.stats == {
+        "processed": 0, "ignored": 0, "orphan_retries": 0, "retries": 2, "failed": 1, "lease_lost": 0,
+    }
+
+
+@pytest.mark.asyncio
+async def test_delivery_error_is_retried(monkeypatch):
+    deliveries = []
+
+    async def flaky_delivery(**kwargs):
+        deliveries.append(kwargs["task_id"])
+        if len(deliveries) == 1:
+            raise RuntimeError("telegram timeout")
+        return {"delivered": True, "error": None}
+
+    monkeypatch.setitem(sys.modules, "app.delivery", types.SimpleNamespace(deliver_result_atomic=flaky_delivery))
+    storage = _FakeInboxStorage(jobs={"t6": {"job_id": "job-6", "user_id": 6, "model_id": "m/image"}})
+    item_id = await storage.enqueue_kie_callback(
+        "t6", {"data": {"taskId": "t6", "state": "success", "resultJson": '{"resultUrls": ["https://r/1.png"]}'}}
+    )
+    worker = _worker(storage)
+
+    await worker.drain_once()
+    assert storage.rows[item_id]["status"] == "pending" and storage.rows[item_id]["delay"] == 5
+    storage.rows[item_id]["delay"] = 0
+    await worker.drain_once()
+    assert storage.rows[item_id]["status"] == "done"
+    assert deliveries == ["t6", "t6"]
+    assert worker.stats["retries"] == 1 and worker.stats["processed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_outcome_of_expired_claim_does_not_override_new_claim(monkeypatch):
+    storage = _FakeInboxStorage(jobs={"t5": {"job_id": "job-5", "user_id": 5}})
+    item_id = await storage.enqueue_kie_callback("t5", {"data": {"taskId": "t5", "state": "waiting"}})
+    slow = _worker(storage)
+    real_process = callback_inbox.process_kie_callback
+
+    async def reclaimed_meanwhile(*args, **kwargs):
+        # Lease expired while processing: another instance claimed the row
+        storage.rows[item_id].update(attempts=2, locked_by="other")
+        return await real_process(*args, **kwargs)
+
+    monkeypatch.setattr(callback_inbox, "process_kie_callback", reclaimed_meanwhile)
+    await slow.drain_once()
+
+    row = storage.rows[item_id]
+    assert row["status"] == "processing" and row["locked_by"] == "other"
+    assert slow.stats["lease_lost"] == 1
@@ -0,0 +1,94 @@
+"""
+Тесты in-memory каталога SOURCE_OF_TRUTH (app.kie.catalog).
+"""
+
+import json
+import os
+
+import pytest
+
+from app.kie import catalog as catalog_module
+from app.kie.builder import load_source_of_truth
+from app.kie.catalog import build_catalog, get_catalog, price_bucket
+
+
+def _write_sot(path, models):
+    path.write_text(json.dumps({"version": "test", "models": models}), encoding="utf-8")
+
+
+@pytest.fixture
+def sot_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(catalog_module, "MTIME_CHECK_INTERVAL", 0.0)
+    path = tmp_path / "KIE_SOURCE_OF_TRUTH.json"
+    _write_sot(path, {
+        "a/one": {"model_id": "a/one", "category": "image", "provider": "a",
+                  "pricing": {"rub_per_gen": 0, "is_free": True}},
+        "b/two": {"model_id": "b/two", "category": "video", "provider": "b",
+                  "pricing": {"rub_per_gen": 120.0}},
+    })
+    return path
+
+
+def test_catalog_indexes(sot_file):
+    catalog = get_catalog(sot_file)
+
+    assert len(catalog) == 2
+    assert catalog.get("a/one")["provider"] == "a"
+    assert [m["model_id"] for m in catalog.in_category("video")] == ["b/two"]
+    assert [m["model_id"] for m in catalog.from_provider("a")] == ["a/one"]
+    assert [m["model_id"] for m in catalog.free_models] == ["a/one"]
+    assert [m["model_id"] for m in catalog.in_price_bucket("premium")] == ["b/two"]
+    assert catalog.in_category("missing") == ()
+
+
+def test_catalog_is_cached_between_calls(sot_file):
+    assert get_catalog(sot_file) is get_catalog(sot_file)
+
+
+def test_catalog_reloads_on_mtime_change(sot_file):
+    first = get_catalog(sot_file)
+
+    _write_sot(sot_file, {"c/three": {"model_id": "c/three", "category": "audio"}})
+    stat = os.stat(sot_file)
+    os.utime(sot_file, (stat.st_atime, first.mtime + 10))
+
+    second = get_catalog(sot_file)
+    assert second is not first
+    assert second.version != first.version
+    assert list(second.by_id) == ["c/three"]
+    # Old snapshot stays intact for readers still holding it
+    assert "a/one" in first.by_id
+
+
+def test_catalog_keeps_last_good_snapshot_on_broken_file(sot_file):
+    first = get_catalog(sot_file)
+
+    sot_file.write_text("{not json", encoding="utf-8")
+    os.utime(sot_file, (first.mtime + 10, first.mtime + 10))
+
+    assert get_catalog(sot_file) is first
+
+
+def test_missing_file_gives_empty_catalog(tmp_path):
+    catalog = get_catalog(tmp_path / "missing.json")
+    assert len(catalog) == 0
+    assert catalog.raw == {}
+
+
+def test_build_catalog_supports_list_format():
+    catalog = build_catalog({"models": [{"model_id": "x", "category": "image"}]})
+    assert catalog.get("x") is not None
+    assert "image" in catalog.by_category
+
+
+def test_price_bucket_bounds():
+    assert price_bucket(0) == "free"
+    assert price_bucket(5) == "cheap"
+    assert price_bucket(10) == "cheap"
+    assert price_bucket(49.9) == "standard"
+    assert price_bucket(1000) == "premium"
+
+
+def test_builder_serves_catalog_snapshot():
+    assert load_source_of_truth() is get_catalog().raw
+    assert len(get_catalog()) > 0
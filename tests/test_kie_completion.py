@@ -0,0 +1,148 @@
+"""
+Callback-first completion engine (app.kie.completion).
+"""
+
+import asyncio
+
+import pytest
+
+from app.kie.completion import CompletionEngine, PollPolicy, policy_category_for_model
+
+FAST_POLICIES = {
+    "image": PollPolicy(callback_grace=0.5, initial_interval=0.01, max_interval=0.04, backoff=2.0),
+    "video": PollPolicy(callback_grace=5.0, initial_interval=0.05, max_interval=0.1),
+}
+
+
+def _poller(results, calls):
+    async def poll(record):
+        calls.append(record)
+        if record is not None:
+            return {"success": True, "via": "callback", "record": record}
+        return results.pop(0) if results else None
+    return poll
+
+
+@pytest.mark.asyncio
+async def test_callback_completes_without_polling():
+    engine = CompletionEngine(policies=FAST_POLICIES)
+    calls = []
+
+    waiter = asyncio.ensure_future(engine.wait(
+        "t1", _poller([], calls), category="video", timeout=5, callback_registered=True
+    ))
+    await asyncio.sleep(0.05)
+    assert engine.pending_count == 1
+    assert engine.notify("t1", {"state": "success"}) is True
+
+    result = await asyncio.wait_for(waiter, 1)
+    assert result["via"] == "callback"
+    assert calls == [{"state": "success"}]
+    assert engine.stats.api_polls == 0
+    assert engine.stats.completed_by_callback == 1
+    assert engine.pending_count == 0
+
+
+@pytest.mark.asyncio
+async def test_falls_back_to_polling_with_backoff():
+    engine = CompletionEngine(policies=FAST_POLICIES)
+    calls = []
+    results = [None, None, None, {"success": True, "via": "poll"}]
+
+    result = await asyncio.wait_for(
+        engine.wait("t2", _poller(results, calls), category="image", timeout=5), 2
+    )
+
+    assert result["via"] == "poll"
+    assert calls == [None, None, None, None]
+    assert engine.stats.api_polls == 4
+    assert engine.stats.completed_by_poll == 1
+
+
+@pytest.mark.asyncio
+async def test_timeout_returns_none():
+    engine = CompletionEngine(policies=FAST_POLICIES)
+
+    result = await asyncio.wait_for(
+        engine.wait("t3", _poller([], []), category="image", timeout=0.1), 2
+    )
+
+    assert result is None
+    assert engine.stats.timed_out == 1
+
+
+@pytest.mark.asyncio
+async def test_overdue_busy_task_does_not_spin_scheduler(monkeypatch):
+    from app.kie import completion
+
+    scheduler_waits = []
+
+    class _CountingAsyncio:
+        def __getattr__(self, name):
+            return getattr(asyncio, name)
+
+        @staticmethod
+        def wait_for(aw, timeout):
+            scheduler_waits.append(timeout)
+            return asyncio.wait_for(aw, timeout)
+
+    monkeypatch.setattr(completion, "asyncio", _CountingAsyncio())
+    engine = CompletionEngine(policies={
+        "image": PollPolicy(callback_grace=0.0, initial_interval=0.1, max_interval=0.1),
+    })
+
+    async def slow_poll(_record):
+        await asyncio.sleep(0.4)  # Still polling long after the 0.05 s deadline
+        return None
+
+    result = await asyncio.wait_for(engine.wait("t-slow", slow_poll, category="image", timeout=0.05), 2)
+
+    assert result is None
+    assert engine.stats.timed_out == 1
+    assert len(scheduler_waits) < 12  # ~1 wake per poll interval, not per 10 ms
+
+
+@pytest.mark.asyncio
+async def test_early_callback_is_picked_up_by_wait():
+    engine = CompletionEngine(policies=FAST_POLICIES)
+    calls = []
+
+    assert engine.notify("t4", {"state": "fail"}) is False
+    result = await asyncio.wait_for(
+        engine.wait("t4", _poller([], calls), category="video", timeout=5, callback_registered=True), 1
+    )
+
+    assert result["record"] == {"state": "fail"}
+    assert engine.stats.api_polls == 0
+
+
+@pytest.mark.asyncio
+async def test_many_tasks_share_one_scheduler():
+    engine = CompletionEngine(policies=FAST_POLICIES, max_concurrent_polls=3)
+
+    waiters = [
+        engine.wait(f"bulk-{i}", _poller([None, {"success": True, "i": i}], []), category="image", timeout=5)
+        for i in range(30)
+    ]
+    results = await asyncio.wait_for(asyncio.gather(*waiters), 5)
+
+    assert [r["i"] for r in results] == list(range(30))
+    assert engine.stats.completed_by_poll == 30
+    assert engine.pending_count == 0
+
+
+@pytest.mark.asyncio
+async def test_poll_exception_propagates_to_waiter():
+    engine = CompletionEngine(policies=FAST_POLICIES)
+
+    async def broken(_record):
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        await asyncio.wait_for(engine.wait("t5", broken, category="image", timeout=5), 1)
+
+
+def test_policy_category_for_model():
+    assert policy_category_for_model("some-text-to-video") == "video"
+    assert policy_category_for_model("suno-music") == "audio"
+    assert policy_category_for_model("flux/dev") == "image"
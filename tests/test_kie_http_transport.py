@@ -0,0 +1,119 @@
+"""
+KieApiClientV4 over the shared aiohttp transport, against a local stub server.
+"""
+
+from contextlib import asynccontextmanager
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from app.kie.client_v4 import KieApiClientV4
+from app.kie.http_transport import KieHttpTransport
+
+
+def _make_stub_app(state):
+    async def create_task(request):
+        state["create_calls"] += 1
+        state["auth"] = request.headers.get("Authorization")
+        body = await request.json()
+        if body.get("fail"):
+            return web.json_response({"code": 422, "msg": "bad input"})
+        return web.json_response({"code": 200, "data": {"taskId": "task-1"}})
+
+    async def record_info(request):
+        state["record_calls"] += 1
+        if state["record_calls"] <= state["record_failures"]:
+            return web.Response(status=502, text="bad gateway")
+        return web.json_response({"code": 200, "data": {"taskId": request.query["taskId"], "state": "success"}})
+
+    app = web.Application()
+    app.router.add_post("/api/v1/jobs/createTask", create_task)
+    app.router.add_get("/api/v1/jobs/recordInfo", record_info)
+    return app
+
+
+@asynccontextmanager
+async def _stub_client():
+    state = {"create_calls": 0, "record_calls": 0, "record_failures": 0, "auth": None}
+    server = TestServer(_make_stub_app(state))
+    await server.start_server()
+    transport = KieHttpTransport(limit=4, limit_per_host=2)
+    base_url = str(server.make_url("")).rstrip("/")
+    client = KieApiClientV4(api_key="test-key", transport=transport, api_url=base_url)
+    client.source_v4 = {
+        "models": {"stub/model": {"model_id": "stub/model", "category": "image",
+                                  "endpoint": "/api/v1/jobs/createTask"}},
+        "categories": {"image": {"base_url": base_url}},
+    }
+    try:
+        yield client, state, transport
+    finally:
+        await transport.close()
+        await server.close()
+
+
+@pytest.mark.asyncio
+async def test_create_task_over_shared_session():
+    async with _stub_client() as (client, state, transport):
+        first = await client.create_task("stub/model", {"prompt": "hi"})
+        session = transport._get_session()
+        second = await client.create_task("stub/model", {"prompt": "again"})
+        # Same keep-alive session reused across calls
+        assert transport._get_session() is session
+
+    assert first["data"]["taskId"] == "task-1"
+    assert second["data"]["taskId"] == "task-1"
+    assert state["create_calls"] == 2
+    assert state["auth"] == "Bearer test-key"
+    assert transport.stats.requests_total == 2
+    assert transport.stats.by_status == {"200": 2}
+    assert transport.stats.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_create_task_api_error():
+    async with _stub_client() as (client, _, _):
+        result = await client.create_task("stub/model", {"fail": True})
+
+    assert result["state"] == "fail"
+    assert result["code"] == 422
+
+
+@pytest.mark.asyncio
+async def test_record_info_retries_http_errors(monkeypatch):
+    async def _no_sleep(_seconds):
+        return None
+
+    monkeypatch.setattr("app.kie.client_v4.asyncio.sleep", _no_sleep)
+    async with _stub_client() as (client, state, transport):
+        state["record_failures"] = 1
+        result = await client.get_record_info("task-1")
+
+    assert result["data"]["state"] == "success"
+    assert state["record_calls"] == 2
+    assert transport.stats.by_status == {"502": 1, "200": 1}
+
+
+@pytest.mark.asyncio
+async def test_connection_error_returns_friendly_error(monkeypatch):
+    transport = KieHttpTransport()
+    client = KieApiClientV4(api_key="test-key", transport=transport, api_url="http://127.0.0.1:9")
+    client.source_v4 = {
+        "models": {"stub/model": {"model_id": "stub/model", "category": "image"}},
+        "categories": {"image": {"base_url": "http://127.0.0.1:9"}},
+    }
+    # Skip tenacity backoff between attempts
+    monkeypatch.setattr(KieApiClientV4._make_request.retry, "sleep", lambda _seconds: _noop())
+
+    result = await client.create_task("stub/model", {"prompt": "hi"})
+    await transport.close()
+
+    assert result["state"] == "fail"
+    assert result["error_type"] == "ClientConnectorError"
+    assert "подключения" in result["user_friendly"]
+    assert transport.stats.errors_total == 3
+
+
+async def _noop():
+    return None
@@ -0,0 +1,88 @@
+"""
+Load-test harness (app.tools.loadtest): fakes, mix parsing, percentiles.
+"""
+
+import asyncio
+import json
+
+import pytest
+from aiohttp import ClientSession, web
+
+from app.tools.loadtest.fakes import RESULT_URL_MARKER, FakeKieServer, FakeTelegramServer, _start_site
+from app.tools.loadtest.runner import ChatTracker, LatencySamples, parse_mix
+
+
+def test_parse_mix_normalizes_and_rejects_unknown_kinds():
+    assert parse_mix("menu=3,generation=1") == {"menu": 0.75, "generation": 0.25}
+    with pytest.raises(ValueError):
+        parse_mix("menu=1,payments=1")
+
+
+def test_latency_percentiles_nearest_rank():
+    samples = LatencySamples()
+    for value in range(1, 101):
+        samples.add(value / 1000)
+    summary = samples.summary()
+    assert summary["count"] == 100
+    assert (summary["p50"], summary["p95"], summary["p99"], summary["max"]) == (50.0, 95.0, 99.0, 100.0)
+    assert LatencySamples().summary() == {"count": 0}
+
+
+@pytest.mark.asyncio
+async def test_fake_telegram_reports_calls_with_buttons():
+    tracker = ChatTracker()
+    server = FakeTelegramServer(on_call=tracker.on_call)
+    base_url = await server.start()
+    try:
+        future = tracker.expect(42, lambda call: call.method == "sendMessage")
+        markup = {"inline_keyboard": [[{"text": "Go", "callback_data": "confirm"}]]}
+        async with ClientSession() as session:
+            async with session.post(
+                f"{base_url}/bot1:TOKEN/sendMessage",
+                json={"chat_id": 42, "text": "hi", "reply_markup": json.dumps(markup)},
+            ) as resp:
+                body = await resp.json()
+        assert body["ok"] and body["result"]["chat"]["id"] == 42
+        assert await tracker.wait(42, future, timeout=1) is not None
+        assert tracker.last_buttons[42] == ["confirm"]
+        assert server.calls_by_method == {"sendMessage": 1}
+    finally:
+        await server.stop()
+
+
+@pytest.mark.asyncio
+async def test_fake_kie_completes_task_and_calls_back_to_local_origin():
+    received = []
+
+    async def on_callback(request):
+        received.append(await request.json())
+        return web.json_response({"ok": True})
+
+    app = web.Application()
+    app.router.add_post("/callbacks/kie", on_callback)
+    runner, app_url = await _start_site(app, "127.0.0.1", 0)
+    kie = FakeKieServer(task_seconds=0.05, callback_origin=app_url)
+    kie_url = await kie.start()
+    try:
+        async with ClientSession() as session:
+            async with session.post(
+                f"{kie_url}/api/v1/jobs/createTask",
+                json={"model": "z-image", "callBackUrl": "https://bot.example.com/callbacks/kie"},
+            ) as resp:
+                task_id = (await resp.json())["data"]["taskId"]
+            async with session.get(f"{kie_url}/api/v1/jobs/recordInfo", params={"taskId": task_id}) as resp:
+                assert (await resp.json())["data"]["state"] == "waiting"
+
+            for _ in range(50):
+                if received:
+                    break
+                await asyncio.sleep(0.02)
+
+            async with session.get(f"{kie_url}/api/v1/jobs/recordInfo", params={"taskId": task_id}) as resp:
+                record = (await resp.json())["data"]
+        assert record["state"] == "success" and RESULT_URL_MARKER in record["resultJson"]
+        assert received and received[0]["data"]["taskId"] == task_id
+        assert kie.created == 1 and kie.callbacks_sent == 1
+    finally:
+        await kie.stop()
+        await runner.cleanup()
@@ -0,0 +1,128 @@
+"""
+Lock handover (app.locking.handover): release notification wakes the watcher,
+queued updates move from the releasing instance to the new ACTIVE one.
+"""
+
+import asyncio
+import json
+import time
+
+import pytest
+
+from app.locking.active_state import ActiveState
+from app.locking.controller import LockState, SingletonLockController
+from app.locking.handover import LockHandover
+from app.utils.update_queue import UpdateQueueManager
+from app.utils.webhook_ingress import parse_raw_update
+
+
+def _raw(update_id, chat_id):
+    return json.dumps({
+        "update_id": update_id,
+        "message": {"message_id": 1, "date": 0, "chat": {"id": chat_id, "type": "private"}, "text": "hi"},
+    }).encode()
+
+
+class _SharedLock:
+    """Advisory lock shared by two fake instances."""
+
+    def __init__(self):
+        self.holder = None
+
+
+class _FakeLock:
+    def __init__(self, shared, name):
+        self.shared = shared
+        self.name = name
+
+    async def acquire(self, timeout=None):
+        if self.shared.holder in (None, self.name):
+            self.shared.holder = self.name
+            return True
+        return False
+
+    async def release(self):
+        if self.shared.holder == self.name:
+            self.shared.holder = None
+
+
+class _FakeHandoverStorage:
+    def __init__(self):
+        self.rows = []
+
+    async def stash_handover_updates(self, instance_id, updates):
+        self.rows.extend(updates)
+        return len(updates)
+
+    async def claim_handover_updates(self, max_age_seconds):
+        rows, self.rows = self.rows, []
+        return rows
+
+
+def _notify_released(handover, instance, lock_key=42):
+    payload = json.dumps({"event": "released", "lock_key": lock_key, "instance": instance, "handed_over": 0})
+    handover._on_notify(None, 0, "singleton_lock_handover", payload)
+
+
+def test_detach_pending_returns_raw_bodies_in_arrival_order():
+    queue = UpdateQueueManager(max_size=10, num_workers=1, num_shards=4)
+    for update_id, chat_id in ((1, 100), (2, 200), (3, 100)):
+        assert queue.enqueue(parse_raw_update(_raw(update_id, chat_id)), update_id)
+
+    detached = queue.detach_pending()
+
+    assert [update_id for update_id, _ in detached] == [1, 2, 3]
+    assert detached[0][1] == _raw(1, 100)
+    assert queue.get_metrics()["queue_depth"] == 0
+    assert queue.detach_pending() == []
+
+
+def test_notifications_filtered_by_lock_key_and_instance():
+    handover = LockHandover(None, 42, "me")
+
+    _notify_released(handover, "me")
+    _notify_released(handover, "other", lock_key=7)
+    assert not handover._released.is_set()
+
+    _notify_released(handover, "other")
+    assert handover._released.is_set()
+    assert handover.stats["notifications"] == 1
+
+
+@pytest.mark.asyncio
+async def test_release_notification_wakes_passive_watcher():
+    shared = _SharedLock()
+    storage = _FakeHandoverStorage()
+    old_queue = UpdateQueueManager(max_size=10, num_workers=1)
+    new_queue = UpdateQueueManager(max_size=10, num_workers=1)
+    old = SingletonLockController(
+        _FakeLock(shared, "old"),
+        active_state=ActiveState(),
+        handover=LockHandover(None, 42, "old", queue_manager=old_queue, storage_getter=lambda: storage),
+    )
+    new_handover = LockHandover(None, 42, "new", queue_manager=new_queue, storage_getter=lambda: storage)
+    new_active = ActiveState()
+    new = SingletonLockController(_FakeLock(shared, "new"), active_state=new_active, handover=new_handover)
+
+    await old.start()
+    await new.start()
+    assert old.state.state == LockState.ACTIVE
+    assert new.state.state == LockState.PASSIVE
+
+    old_queue.enqueue(parse_raw_update(_raw(5, 100)), 5)
+    await old.stop(handover=True)
+    assert storage.rows == [(5, _raw(5, 100))]
+
+    # pg_notify from the releasing instance (delivered by the LISTEN connection)
+    started = time.monotonic()
+    _notify_released(new_handover, "old")
+    assert await new_active.wait_active(timeout=2)
+    assert time.monotonic() - started < 1.0  # not the 10s backoff
+    assert new.state.state == LockState.ACTIVE
+
+    await asyncio.sleep(0)
+    await new._adopt_task
+    assert new_queue.get_metrics()["queue_depth"] == 1
+    assert storage.rows == []
+
+    await new.stop()
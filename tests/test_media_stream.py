@@ -0,0 +1,128 @@
+"""
+Streaming delivery pipeline (app.delivery.media_stream).
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from aiohttp import web
+
+from app.delivery.media_stream import MB, MediaPipeline, MediaProbe, StreamingInputFile, choose_kind
+
+BODY = b"x" * (3 * 65536 + 100)
+
+
+@asynccontextmanager
+async def _result_server(size_header=None, mime="video/mp4"):
+    state = {"active": 0, "peak": 0}
+
+    async def handler(request):
+        headers = {"Content-Type": mime, "Content-Length": str(size_header or len(BODY))}
+        if request.method == "HEAD":
+            return web.Response(headers=headers)
+        state["active"] += 1
+        state["peak"] = max(state["peak"], state["active"])
+        resp = web.StreamResponse(headers={"Content-Type": mime})
+        await resp.prepare(request)
+        for i in range(0, len(BODY), 65536):
+            await resp.write(BODY[i:i + 65536])
+            await asyncio.sleep(0.01)
+        state["active"] -= 1
+        await resp.write_eof()
+        return resp
+
+    app = web.Application()
+    app.router.add_route("*", "/{name}", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        yield f"http://127.0.0.1:{port}", state
+    finally:
+        await runner.cleanup()
+
+
+def _bot(fail_url=True):
+    """Bot whose sends fail for plain URLs and drain InputFile streams."""
+    received = {}
+
+    def sender(field):
+        async def send(chat_id, *args, caption=None, **kwargs):
+            media = args[0] if args else kwargs[field]
+            if isinstance(media, StreamingInputFile):
+                chunks = [chunk async for chunk in media.read(bot)]
+                received.setdefault("chunks", []).append([len(c) for c in chunks])
+                received["filename"] = media.filename
+                return
+            if fail_url:
+                raise RuntimeError("wrong file identifier/HTTP URL specified")
+        return AsyncMock(side_effect=send)
+
+    bot = MagicMock()
+    bot.send_photo = sender("photo")
+    bot.send_video = sender("video")
+    bot.send_audio = sender("audio")
+    bot.send_document = sender("document")
+    bot.send_message = AsyncMock()
+    return bot, received
+
+
+def test_choose_kind_uses_probe():
+    assert choose_kind("image", MediaProbe(size=2 * MB, mime="image/png")) == "photo"
+    assert choose_kind("image", MediaProbe(size=12 * MB, mime="image/png")) == "document"
+    assert choose_kind("video", MediaProbe(mime="video/webm")) == "document"
+    assert choose_kind("music", MediaProbe(mime="audio/mpeg")) == "audio"
+    assert choose_kind("video", MediaProbe()) == "video"
+    assert choose_kind("text2text", MediaProbe()) == "document"
+
+
+@pytest.mark.asyncio
+async def test_video_fallback_streams_in_chunks():
+    pipeline = MediaPipeline(max_downloads=2, chunk_size=65536)
+    bot, received = _bot(fail_url=True)
+    async with _result_server() as (base, _state):
+        method = await pipeline.deliver(bot, 1, f"{base}/clip.mp4", "video", "ok")
+    await pipeline.close()
+
+    assert method == "video_stream"
+    assert max(received["chunks"][0]) <= 65536
+    assert sum(received["chunks"][0]) == len(BODY)
+    assert received["filename"] == "clip.mp4"
+    assert pipeline.stats.bytes_streamed == len(BODY)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_downloads_are_capped():
+    pipeline = MediaPipeline(max_downloads=2)
+    bot, _received = _bot(fail_url=True)
+    async with _result_server() as (base, state):
+        results = await asyncio.gather(*[
+            pipeline.deliver(bot, 1, f"{base}/v{i}.mp4", "video", "ok") for i in range(5)
+        ])
+    await pipeline.close()
+
+    assert results == ["video_stream"] * 5
+    assert state["peak"] == 2
+
+
+@pytest.mark.asyncio
+async def test_size_limits_pick_method():
+    pipeline = MediaPipeline()
+    bot, _received = _bot(fail_url=False)
+    # Probe reads size/MIME from HEAD
+    async with _result_server(size_header=30 * MB) as (base, _state):
+        assert await pipeline.probe(f"{base}/a.mp4") == MediaProbe(size=30 * MB, mime="video/mp4")
+    # Small file: direct URL, no download at all
+    async with _result_server(size_header=1 * MB) as (base, state):
+        assert await pipeline.deliver(bot, 1, f"{base}/b.mp4", "video", "ok") == "video_url"
+        assert state["peak"] == 0
+    # Over upload limit: link message
+    async with _result_server(size_header=80 * MB) as (base, state):
+        assert await pipeline.deliver(bot, 1, f"{base}/c.mp4", "video", "ok") == "link"
+        assert state["peak"] == 0
+    await pipeline.close()
+    bot.send_message.assert_awaited_once()
@@ -0,0 +1,92 @@
+"""
+Metrics registry (app.utils.metrics): bound children, bucket histograms, exporter.
+"""
+
+import random
+
+import pytest
+
+from app.utils.metrics import MetricsCollector, MetricsRegistry, get_registry, track_api_call
+
+
+def test_histogram_buckets_and_quantiles():
+    registry = MetricsRegistry()
+    child = registry.histogram("latency_seconds", buckets=(0.1, 0.2, 0.5, 1.0)).labels()
+    rng = random.Random(7)
+    values = [rng.uniform(0.0, 1.0) for _ in range(10000)]
+    for value in values:
+        child.observe(value)
+    child.observe(3.0)  # lands in +Inf
+
+    assert child.count == 10001 and child.counts[-1] == 1
+    assert child.counts[0] == sum(1 for v in values if v <= 0.1)
+    assert child.sum == pytest.approx(sum(values) + 3.0)
+    # Uniform data: interpolated estimate within one bucket width of the truth
+    ordered = sorted(values)
+    assert abs(child.quantile(0.5) - ordered[5000]) < 0.05
+    assert abs(child.quantile(0.95) - ordered[9500]) < 0.05
+    assert child.quantile(1.0) == 3.0
+
+    single = registry.histogram("single_seconds").labels()
+    single.observe(0.07)
+    assert single.quantile(0.5) == pytest.approx(0.07)
+
+
+def test_labels_bind_once_and_schema_is_fixed():
+    registry = MetricsRegistry()
+    counter = registry.counter("events_total", "Events", ("kind",))
+    assert counter.labels("a") is counter.labels(kind="a")
+    counter.labels("a").inc()
+    counter.labels(kind="a").inc(2)
+    assert counter.labels("a").value == 3
+
+    with pytest.raises(ValueError):
+        counter.labels("a", "b")
+    with pytest.raises(ValueError):
+        registry.gauge("events_total")
+    assert registry.counter("events_total", labelnames=("kind",)) is counter
+
+
+def test_prometheus_text_format():
+    registry = MetricsRegistry()
+    registry.counter("requests_total", "Requests", ("path",)).labels('/a"b').inc()
+    histogram = registry.histogram("rt_seconds", "RT", ("api",), buckets=(0.1, 1.0))
+    histogram.labels("kie").observe(0.05)
+    histogram.labels("kie").observe(0.5)
+    registry.gauge("depth", "Queue depth")  # no children: not exported
+    gauge_value = {"n": 0}
+    registry.add_collector(lambda: registry.gauge("depth").set(gauge_value["n"]))
+    gauge_value["n"] = 4
+
+    text = registry.render_prometheus()
+    assert "# TYPE requests_total counter\nrequests_total{path=\"/a\\\"b\"} 1\n" in text
+    assert 'rt_seconds_bucket{api="kie",le="0.1"} 1' in text
+    assert 'rt_seconds_bucket{api="kie",le="1"} 2' in text
+    assert 'rt_seconds_bucket{api="kie",le="+Inf"} 2' in text
+    assert 'rt_seconds_count{api="kie"} 2' in text
+    assert "depth 4" in text
+
+
+@pytest.mark.asyncio
+async def test_collector_facade_keeps_snapshot_shape():
+    collector = MetricsCollector()
+    await collector.increment("jobs_total", labels={"status": "ok", "api": "kie"})
+    await collector.increment("jobs_total", 2, labels={"api": "kie", "status": "ok"})
+    await collector.set_gauge("users", 5)
+    for value in (1.0, 2.0, 3.0):
+        await collector.observe("job_seconds", value, {"api": "kie"})
+
+    snapshot = await collector.get_metrics()
+    assert snapshot["counters"] == {"jobs_total{api=kie,status=ok}": 3.0}
+    assert snapshot["gauges"] == {"users": 5}
+    summary = snapshot["histograms"]["job_seconds{api=kie}"]
+    assert (summary["count"], summary["sum"], summary["min"], summary["max"]) == (3, 6.0, 1.0, 3.0)
+    assert 1.0 <= summary["p50"] <= 3.0
+
+
+@pytest.mark.asyncio
+async def test_standard_trackers_use_global_registry():
+    await track_api_call("kie", "/api/v1/jobs/createTask", 0.2, 200)
+    family = get_registry().get("api_calls_total")
+    assert family.labels("kie", "/api/v1/jobs/createTask", "200").value >= 1
+    assert "api_call_duration_seconds_bucket" in get_registry().render_prometheus()
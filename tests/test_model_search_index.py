@@ -0,0 +1,76 @@
+"""
+Model search index (app.kie.search_index): ranking, transliteration, typos.
+"""
+
+import pytest
+
+from app.kie import search_index
+from app.kie.catalog import build_catalog
+from app.kie.search_index import build_search_index, get_search_index, search_models, tokenize
+
+MODELS = {
+    "black-forest/flux-pro": {
+        "model_id": "black-forest/flux-pro", "display_name": "Flux Pro", "provider": "flux",
+        "category": "image", "tags": ["картинка"], "description": "Фотореалистичные изображения",
+    },
+    "kling/v2-video": {
+        "model_id": "kling/v2-video", "display_name": "Kling Video", "provider": "kling",
+        "category": "video", "tags": ["видео"], "description": "Генерация видео из текста",
+    },
+    "acme/video-upscale": {
+        "model_id": "acme/video-upscale", "display_name": "Upscale", "provider": "acme",
+        "category": "enhance", "description": "Улучшение видео, совместимо с Kling",
+    },
+    "google/imagen4": {
+        "model_id": "google/imagen4", "display_name": "Google Imagen 4", "provider": "google",
+        "category": "image", "description": "Изображения от Google",
+    },
+}
+
+
+@pytest.fixture
+def index():
+    return build_search_index(build_catalog({"models": MODELS}, path="test", mtime=1.0))
+
+
+def test_transliterated_and_latin_spellings_share_keys():
+    assert tokenize("Kling") == tokenize("клинг")
+    assert tokenize("Flux") == tokenize("флюкс")
+    assert tokenize("Seedream") == tokenize("сидрим")
+    assert tokenize("kling-2.6 Video") == ["kling", "2", "6", "video"]
+
+
+def test_ranking_prefers_identity_fields_and_coverage(index):
+    # Both mention Kling; the Kling model itself ranks above a description mention
+    assert [hit.model_id for hit in index.search("клинг")] == ["kling/v2-video", "acme/video-upscale"]
+    # Matching more query words wins over a higher single-word score
+    assert index.search("video upscale")[0].model_id == "acme/video-upscale"
+    assert index.search("видео")[0].model_id == "kling/v2-video"
+
+
+def test_prefix_and_typo_tolerance(index):
+    assert index.search("fl")[0].model_id == "black-forest/flux-pro"
+    assert index.search("imgen")[0].model_id == "google/imagen4"
+    assert index.search("zzzz") == []
+    assert index.search("  --  ") == []
+
+
+def test_popularity_breaks_ties_without_overriding_coverage(index):
+    plain = {hit.model_id: hit.score for hit in index.search("video", popularity={})}
+    boosted = {hit.model_id: hit.score for hit in index.search("video", popularity={"acme/video-upscale": 1.0})}
+    assert boosted["acme/video-upscale"] == pytest.approx(plain["acme/video-upscale"] * (1 + search_index.POPULARITY_WEIGHT))
+    assert boosted["kling/v2-video"] == plain["kling/v2-video"]
+    # Popularity never lifts a partial match above a full one
+    hits = index.search("video upscale", popularity={"kling/v2-video": 1.0})
+    assert hits[0].model_id == "acme/video-upscale"
+
+
+def test_global_index_and_popularity(monkeypatch):
+    assert get_search_index() is get_search_index()
+    hits = search_models("нано банана", limit=3)
+    assert hits and all("banana" in hit.model_id for hit in hits)
+
+    monkeypatch.setattr(search_index, "_popularity", {})
+    search_index.set_model_popularity({"a": 1000, "b": 10, "c": 0})
+    assert search_index._popularity["a"] == 1.0
+    assert 0 < search_index._popularity["b"] < 0.5 and "c" not in search_index._popularity
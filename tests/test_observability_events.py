@@ -6,7 +6,11 @@ import unittest
 from unittest.mock import AsyncMock, MagicMock, patch
 import asyncio
 
+from app.observability import events_db
 from app.observability.events_db import (
+    EventBuffer,
+    get_event_buffer,
+    shutdown_events_db,
     log_event,
     log_update_received,
     log_callback_received,
@@ -22,10 +26,15 @@ class TestObservabilityEvents(unittest.TestCase):
     
     def setUp(self):
         """Set up test fixtures."""
-        self.mock_pool = AsyncMock()
+        self.mock_pool = MagicMock()
         self.mock_conn = AsyncMock()
         self.mock_pool.acquire.return_value.__aenter__.return_value = self.mock_conn
         self.mock_pool.acquire.return_value.__aexit__.return_value = None
+        events_db._buffer = None
+
+    def tearDown(self):
+        events_db._buffer = None
+        events_db._db_pool = None
     
     def test_init_events_db(self):
         """Test events DB initialization."""
@@ -53,19 +62,24 @@ class TestObservabilityEvents(unittest.TestCase):
                 user_id=12345,
             )
             self.assertTrue(result)
-            self.mock_conn.execute.assert_called_once()
+            # Buffered: nothing written until flush
+            self.mock_conn.copy_records_to_table.assert_not_called()
+            self.assertEqual(await get_event_buffer().flush(), 1)
+            self.mock_conn.copy_records_to_table.assert_called_once()
         
         asyncio.run(run_test())
     
     def test_log_event_with_error(self):
         """Test event logging with exception."""
         init_events_db(self.mock_pool)
-        self.mock_conn.execute.side_effect = Exception("DB error")
+        self.mock_pool.acquire.side_effect = Exception("DB error")
         
         async def run_test():
-            # Should not raise, should return False
+            # Should not raise; the failed batch is counted, not propagated
             result = await log_event("ERROR", "TEST_EVENT", error=ValueError("test error"))
-            self.assertFalse(result)
+            self.assertTrue(result)
+            self.assertEqual(await get_event_buffer().flush(), 0)
+            self.assertEqual(get_event_buffer().stats.failed, 1)
         
         asyncio.run(run_test())
     
@@ -76,8 +90,9 @@ class TestObservabilityEvents(unittest.TestCase):
         async def run_test():
             result = await log_update_received(update_id=123, cid="cid-123", update_type="message")
             self.assertTrue(result)
+            await get_event_buffer().flush()
             # Verify correct parameters passed
-            call_args = self.mock_conn.execute.call_args
+            call_args = self.mock_conn.copy_records_to_table.call_args
             self.assertIn("UPDATE_RECEIVED", str(call_args))
         
         asyncio.run(run_test())
@@ -120,9 +135,10 @@ class TestObservabilityEvents(unittest.TestCase):
                 user_id=12345
             )
             self.assertTrue(result)
+            await get_event_buffer().flush()
             # Verify error stack trace is included
-            call_args = self.mock_conn.execute.call_args
-            self.assertIsNotNone(call_args)
+            row = self.mock_conn.copy_records_to_table.call_args.kwargs["records"][0]
+            self.assertIn("ValueError: Test error", row[10])
         
         asyncio.run(run_test())
     
@@ -136,6 +152,55 @@ class TestObservabilityEvents(unittest.TestCase):
         
         asyncio.run(run_test())
 
+    def test_events_are_flushed_in_batches(self):
+        """Many events -> one COPY per batch, not one INSERT per event."""
+        init_events_db(self.mock_pool)
+        events_db._buffer = EventBuffer(capacity=1000, batch_size=50, flush_interval_ms=10000)
+        
+        async def run_test():
+            for i in range(120):
+                await log_dispatch_ok(cid=f"cid-{i}", handler="h")
+            await shutdown_events_db()
+            self.assertEqual(get_event_buffer().stats.written, 120)
+            calls = self.mock_conn.copy_records_to_table.call_args_list
+            self.assertEqual([len(c.kwargs["records"]) for c in calls], [50, 50, 20])
+            self.mock_conn.execute.assert_not_called()
+        
+        asyncio.run(run_test())
+    
+    def test_full_ring_drops_oldest(self):
+        """Backpressure: bounded ring evicts oldest events and counts drops."""
+        init_events_db(self.mock_pool)
+        events_db._buffer = EventBuffer(capacity=3, batch_size=100, flush_interval_ms=10000)
+        
+        async def run_test():
+            for i in range(5):
+                await log_event("INFO", f"E{i}")
+            buffer = get_event_buffer()
+            self.assertEqual(buffer.pending, 3)
+            self.assertEqual(buffer.stats.dropped, 2)
+            await shutdown_events_db()
+            rows = self.mock_conn.copy_records_to_table.call_args.kwargs["records"]
+            self.assertEqual([r[2] for r in rows], ["E2", "E3", "E4"])
+            self.assertEqual(buffer.pending, 0)
+        
+        asyncio.run(run_test())
+    
+    def test_copy_failure_falls_back_to_row_inserts(self):
+        """A bad row must not lose the whole batch."""
+        init_events_db(self.mock_pool)
+        self.mock_conn.copy_records_to_table.side_effect = Exception("FK violation")
+        self.mock_conn.execute.side_effect = [None, Exception("FK violation"), None]
+        
+        async def run_test():
+            for i in range(3):
+                await log_event("INFO", f"E{i}", task_id=i)
+            self.assertEqual(await get_event_buffer().flush(), 2)
+            self.assertEqual(self.mock_conn.execute.call_count, 3)
+            self.assertEqual(get_event_buffer().stats.failed, 1)
+        
+        asyncio.run(run_test())
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,186 @@
+"""
+PgPoolManager: no per-call health check, passive broken-pool detection.
+"""
+
+import asyncio
+
+import asyncpg
+import pytest
+
+from app.storage import pg_pool
+from app.storage.pg_pool import PgPoolManager
+
+
+class _FakeConn:
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def fetchval(self, query, *args):
+        self.pool.queries.append(query)
+        if self.pool.fail_queries:
+            raise ConnectionResetError("connection reset")
+        return 1
+
+
+class _FakeAcquire:
+    def __init__(self, pool, timeout):
+        self.pool = pool
+        self.timeout = timeout
+
+    async def __aenter__(self):
+        if self.pool.acquire_error is not None:
+            raise self.pool.acquire_error
+        self.pool.acquired += 1
+        return _FakeConn(self.pool)
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+
+class _FakePool:
+    def __init__(self):
+        self.queries = []
+        self.acquired = 0
+        self.closed = False
+        self.fail_queries = False
+        self.acquire_error = None
+
+    def acquire(self, timeout=None):
+        return _FakeAcquire(self, timeout)
+
+    def get_size(self):
+        return 2
+
+    def get_idle_size(self):
+        return 1
+
+    async def close(self):
+        self.closed = True
+
+    def terminate(self):
+        self.terminated = True
+
+
+def _patch_create_pool(monkeypatch):
+    created = []
+
+    async def _create_pool(*_args, **kwargs):
+        pool = _FakePool()
+        pool.kwargs = kwargs
+        created.append(pool)
+        return pool
+
+    monkeypatch.setattr(pg_pool.asyncpg, "create_pool", _create_pool)
+    return created
+
+
+@pytest.mark.asyncio
+async def test_get_pool_has_no_round_trip(monkeypatch):
+    fake_create_pool = _patch_create_pool(monkeypatch)
+    manager = PgPoolManager("postgres://stub", min_size=2, max_size=5, probe_interval=0)
+
+    first = await manager.get()
+    for _ in range(50):
+        assert await manager.get() is first
+
+    assert len(fake_create_pool) == 1
+    raw = fake_create_pool[0]
+    assert raw.kwargs["min_size"] == 2 and raw.kwargs["max_size"] == 5
+    assert raw.queries == []
+    assert raw.acquired == 0
+
+
+@pytest.mark.asyncio
+async def test_connection_error_in_acquire_block_recreates_pool(monkeypatch):
+    fake_create_pool = _patch_create_pool(monkeypatch)
+    manager = PgPoolManager("postgres://stub", probe_interval=0)
+    pool = await manager.get()
+
+    with pytest.raises(asyncpg.InterfaceError):
+        async with pool.acquire():
+            raise asyncpg.InterfaceError("connection is closed")
+
+    fresh = await manager.get()
+    assert fresh is not pool
+    assert len(fake_create_pool) == 2
+    await asyncio.sleep(0.01)  # old pool is closed in the background
+    assert fake_create_pool[0].closed is True
+    assert manager.stats.broken_detected == 1
+    assert manager.stats.recreated == 1
+
+
+@pytest.mark.asyncio
+async def test_recreate_does_not_wait_for_connections_of_old_pool(monkeypatch):
+    fake_create_pool = _patch_create_pool(monkeypatch)
+    manager = PgPoolManager("postgres://stub", probe_interval=0, retire_grace=0.05)
+    pool = await manager.get()
+    old = fake_create_pool[0]
+    returned = asyncio.Event()
+
+    async def close_when_connections_returned():
+        await returned.wait()  # asyncpg: close() waits for checked-out connections
+        old.closed = True
+
+    old.close = close_when_connections_returned
+
+    # A caller holding a connection of the broken pool asks for the pool again
+    async with pool.acquire():
+        manager.mark_broken(old, ConnectionResetError("reset"))
+        fresh = await asyncio.wait_for(manager.get(), 1)
+        assert fresh is not pool
+
+    await asyncio.sleep(0.1)
+    assert getattr(old, "terminated", False) is True
+    assert old.closed is False
+    await manager.close()
+
+
+@pytest.mark.asyncio
+async def test_acquire_timeout_does_not_mark_pool_broken(monkeypatch):
+    fake_create_pool = _patch_create_pool(monkeypatch)
+    manager = PgPoolManager("postgres://stub", probe_interval=0)
+    pool = await manager.get()
+    fake_create_pool[0].acquire_error = asyncio.TimeoutError()
+
+    with pytest.raises(asyncio.TimeoutError):
+        async with pool.acquire(timeout=0.1):
+            pass
+
+    assert await manager.get() is pool
+    assert manager.stats.broken_detected == 0
+
+
+@pytest.mark.asyncio
+async def test_probe_failure_marks_pool_broken(monkeypatch):
+    fake_create_pool = _patch_create_pool(monkeypatch)
+    manager = PgPoolManager("postgres://stub", probe_interval=0)
+    await manager.get()
+
+    assert await manager.probe() is True
+    fake_create_pool[0].fail_queries = True
+    assert await manager.probe() is False
+
+    assert manager.stats.probe_failures == 1
+    assert manager.metrics()["broken"] is True
+    await manager.get()
+    assert len(fake_create_pool) == 2
+
+
+@pytest.mark.asyncio
+async def test_metrics_report_saturation(monkeypatch):
+    fake_create_pool = _patch_create_pool(monkeypatch)
+    manager = PgPoolManager("postgres://stub", max_size=4, probe_interval=0)
+    pool = await manager.get()
+
+    async with pool.acquire():
+        inside = manager.metrics()
+    after = manager.metrics()
+    await manager.close()
+
+    assert inside["in_use"] == 1
+    assert inside["saturation"] == 0.25
+    assert after["in_use"] == 0
+    assert after["acquires"] == 1
+    assert after["size"] == 2 and after["idle"] == 1
+    assert fake_create_pool[0].closed is True
+    assert manager.metrics()["initialized"] is False
@@ -0,0 +1,136 @@
+"""
+Precomputed price snapshot (app.pricing.snapshot) and non-blocking FX.
+"""
+
+import asyncio
+import os
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from app.kie.catalog import get_catalog
+from app.payments.pricing import _calculate_kie_cost, calculate_kie_cost
+from app.pricing import fx
+from app.pricing.snapshot import PricingSnapshotService
+from pricing.engine import DEFAULT_CONFIG_PATH_YAML, calc_model_price_rub, load_config
+
+CONFIG_YAML = """
+models:
+  m/matrix:
+    type: matrix
+    axes: ["duration", "resolution"]
+    table:
+      "5": {"720p": 0.35, "1080p": 0.53}
+  m/fixed:
+    type: fixed
+    price_usd: 0.1
+  m/per-sec:
+    type: per_second
+    price_per_sec_usd: 0.02
+settings:
+  usd_to_rub: %s
+  markup_multiplier: 2.0
+"""
+
+
+@pytest.fixture
+def config_file():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "config.yaml"
+        path.write_text(CONFIG_YAML % 80.0, encoding="utf-8")
+        yield path
+
+
+@pytest.fixture
+def fresh_fx(monkeypatch):
+    monkeypatch.setattr(fx, "_cached_rate", 90.0)
+    monkeypatch.setattr(fx, "_cache_timestamp", None)
+    return fx
+
+
+def test_engine_prices_match_direct_computation():
+    config = load_config(DEFAULT_CONFIG_PATH_YAML)
+    for model_id, model_cfg in config["models"].items():
+        for key1, row in model_cfg.get("table", {}).items():
+            for key2 in row:
+                params = dict(zip(model_cfg["axes"], (key1, key2)))
+                for is_admin in (True, False):
+                    assert calc_model_price_rub(model_id, params, is_admin) == calc_model_price_rub(
+                        model_id, params, is_admin, config_path=DEFAULT_CONFIG_PATH_YAML
+                    )
+
+
+def test_engine_errors_and_per_second(config_file, fresh_fx):
+    snapshot = PricingSnapshotService(config_path=config_file).current()
+    assert snapshot.engine_price_rub("m/matrix", {"duration": 5, "resolution": "720p"}) == 0.35 * 80.0 * 2.0
+    assert snapshot.engine_price_rub("m/fixed", {}, is_admin=True) == 0.1 * 80.0
+    # per_second is not tabulated, still priced from the parsed config
+    assert snapshot.engine_price_rub("m/per-sec", {"duration": 10}) == 0.02 * 10 * 80.0 * 2.0
+
+    with pytest.raises(ValueError, match="missing key2 '4k'"):
+        snapshot.engine_price_rub("m/matrix", {"duration": "5", "resolution": "4k"})
+    with pytest.raises(ValueError, match="not found in pricing config"):
+        snapshot.engine_price_rub("m/unknown", {})
+
+
+def test_kie_costs_match_legacy_for_catalog_models():
+    for model in get_catalog().models:
+        if model.get("model_id"):
+            assert calculate_kie_cost(model, {}, None) == _calculate_kie_cost(model, {}, None)
+
+    # Dicts that are not the catalog's own objects are computed, not looked up
+    model = dict(get_catalog().models[0], pricing={"rub_per_gen": 12.5})
+    assert calculate_kie_cost(model, {}, None) == 12.5
+    # Inputs / Kie response bypass the table
+    assert calculate_kie_cost(get_catalog().models[0], {}, {"cost": 3}) == 3.0
+
+
+def test_version_bumps_only_on_change(config_file, fresh_fx):
+    service = PricingSnapshotService(config_path=config_file)
+    first = service.current()
+    assert service.refresh() is first
+
+    fx.store_rate(95.5)
+    second = service.refresh()
+    assert (second.version, second.fx_rate, second.fx_source) == (first.version + 1, 95.5, "cbr")
+    # Config unchanged: engine table reused as is
+    assert second.engine_prices is first.engine_prices
+
+    config_file.write_text(CONFIG_YAML % 100.0, encoding="utf-8")
+    os.utime(config_file, (first.config_mtime + 10, first.config_mtime + 10))
+    third = service.refresh()
+    assert third.version == second.version + 1
+    assert third.engine_price_rub("m/fixed", {}, is_admin=True) == 0.1 * 100.0
+    # Readers holding the old snapshot keep a consistent view
+    assert first.engine_price_rub("m/fixed", {}, is_admin=True) == 0.1 * 80.0
+
+
+@pytest.mark.asyncio
+async def test_stale_rate_is_not_fetched_inside_event_loop(monkeypatch, fresh_fx):
+    def blocking_fetch():
+        raise AssertionError("sync FX fetch inside the event loop")
+
+    monkeypatch.setattr(fx, "_fetch_fresh_rate", blocking_fetch)
+    assert fx.get_usd_to_rub_rate() == 90.0
+
+
+@pytest.mark.asyncio
+async def test_background_refresher_swaps_snapshot(monkeypatch, config_file, fresh_fx):
+    async def fetch():
+        return 101.25
+
+    monkeypatch.setattr(fx, "fetch_usd_to_rub_rate_async", fetch)
+    service = PricingSnapshotService(config_path=config_file, config_check_seconds=0.01)
+    await service.start()
+    try:
+        for _ in range(200):
+            if service.current().fx_rate == 101.25:
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        await service.stop()
+
+    snapshot = service.current()
+    assert (snapshot.fx_rate, snapshot.fx_source) == (101.25, "cbr")
+    assert service.stats.fx_refreshes == 1 and service._task is None
@@ -0,0 +1,272 @@
+"""
+Active-active scale-out (app.locking.scaleout): shard split, rebalancing on
+join/leave, forwarding of updates for foreign shards.
+"""
+
+import asyncio
+import json
+
+import pytest
+
+from app.locking.scaleout import ShardLeaseManager, preferred_owners, shard_of
+from app.utils.update_queue import UpdateQueueManager
+from app.utils.webhook_ingress import parse_raw_update
+
+NUM_SHARDS = 16
+
+
+def _raw(update_id, chat_id):
+    return json.dumps({
+        "update_id": update_id,
+        "message": {"message_id": 1, "date": 0, "chat": {"id": chat_id, "type": "private"}, "text": "hi"},
+    }).encode()
+
+
+class _FakePostgres:
+    """Advisory locks, membership rows and update_forward shared by fake replicas."""
+
+    def __init__(self):
+        self.locks = {}
+        self.members = set()
+        self.forwarded = []
+
+
+class _FakeSession:
+    def __init__(self, db, owner):
+        self.db = db
+        self.owner = owner
+
+    def is_closed(self):
+        return False
+
+    async def fetchval(self, query, lock_class, shard):
+        if "pg_try_advisory_lock" in query:
+            if self.db.locks.get(shard) in (None, self.owner):
+                self.db.locks[shard] = self.owner
+                return True
+            return False
+        if self.db.locks.get(shard) == self.owner:
+            del self.db.locks[shard]
+            return True
+        return False
+
+    async def execute(self, query, *args):
+        return None
+
+
+class _FakeStorage:
+    def __init__(self, db):
+        self.db = db
+
+    async def scaleout_heartbeat(self, instance_id, shards, ttl_seconds):
+        self.db.members.add(instance_id)
+        return sorted(self.db.members)
+
+    async def scaleout_leave(self, instance_id):
+        self.db.members.discard(instance_id)
+
+    async def forward_updates(self, updates, channel):
+        self.db.forwarded.extend(updates)
+        return len(updates)
+
+    async def claim_forwarded_updates(self, shards, limit):
+        taken = [row for row in self.db.forwarded if row[0] in shards][:limit]
+        self.db.forwarded = [row for row in self.db.forwarded if row not in taken]
+        return [(update_id, raw) for _, update_id, raw in taken]
+
+
+def _replica(db, name):
+    storage = _FakeStorage(db)
+    manager = ShardLeaseManager(
+        "postgresql://fake", 42, name, UpdateQueueManager(max_size=50, num_workers=1),
+        lambda: storage, num_shards=NUM_SHARDS, rebalance_interval=1.0,
+    )
+    manager._conn = _FakeSession(db, name)
+    manager._running = True
+    return manager
+
+
+async def _settle(*replicas):
+    """Let background releases and forwards finish."""
+    for replica in replicas:
+        if replica._release_tasks:
+            await asyncio.gather(*replica._release_tasks)
+        await replica._flush_unforwarded()
+
+
+def test_preferred_owners_move_few_shards_on_join():
+    before = preferred_owners(["a", "b"], 64)
+    after = preferred_owners(["a", "b", "c"], 64)
+
+    moved = [shard for shard in range(64) if before[shard] != after[shard]]
+    assert all(after[shard] == "c" for shard in moved)
+    assert 10 < len(moved) < 35  # about a third, not a full reshuffle
+    assert shard_of(-1001234, 64) == -1001234 % 64
+
+
+@pytest.mark.asyncio
+async def test_replicas_split_shards_and_rebalance_on_leave():
+    db = _FakePostgres()
+    a, b = _replica(db, "a"), _replica(db, "b")
+
+    await a.rebalance()
+    assert len(a.owned) == NUM_SHARDS  # alone: every shard
+
+    await b.rebalance()   # b joins, a still holds everything
+    await a.rebalance()   # a gives b its share
+    await _settle(a)
+    await b.rebalance()
+    assert a.owned | b.owned == set(range(NUM_SHARDS))
+    assert not a.owned & b.owned
+
+    await b.stop()
+    await a.rebalance()
+    assert a.owned == set(range(NUM_SHARDS))
+
+
+@pytest.mark.asyncio
+async def test_foreign_shard_updates_are_forwarded_to_owner():
+    db = _FakePostgres()
+    a, b = _replica(db, "a"), _replica(db, "b")
+    await a.rebalance()
+    await b.rebalance()
+    await a.rebalance()
+    await _settle(a)
+    await b.rebalance()
+
+    chat_b = next(chat for chat in range(1000) if shard_of(chat, NUM_SHARDS) in b.owned)
+    update = parse_raw_update(_raw(7, chat_b))
+
+    assert await a.route(update) is False
+    await _settle(a)
+    assert a.stats["forwarded"] == 1
+    assert await b.pull_forwarded() == 1
+    assert b.queue_manager.get_metrics()["queue_depth"] == 1
+    assert await b.route(update) is True
+
+
+@pytest.mark.asyncio
+async def test_queued_updates_follow_released_shard():
+    db = _FakePostgres()
+    a, b = _replica(db, "a"), _replica(db, "b")
+    await a.rebalance()
+    await b.rebalance()
+
+    # Queued on a while a owns everything; the shard then moves to b
+    moving = next(shard for shard in range(NUM_SHARDS) if preferred_owners(["a", "b"], NUM_SHARDS)[shard] == "b")
+    a.queue_manager.enqueue(parse_raw_update(_raw(9, moving)), 9)
+    await a.rebalance()
+    await _settle(a)
+
+    assert a.queue_manager.get_metrics()["queue_depth"] == 0
+    assert [(shard, update_id) for shard, update_id, _ in db.forwarded] == [(moving, 9)]
+
+
+@pytest.mark.asyncio
+async def test_failed_forward_holds_update_instead_of_processing_locally():
+    db = _FakePostgres()
+    a, b = _replica(db, "a"), _replica(db, "b")
+    for replica in (a, b, a, b):
+        await replica.rebalance()
+        await _settle(replica)
+    chat_b = next(chat for chat in range(1000) if shard_of(chat, NUM_SHARDS) in b.owned)
+
+    storage = a.storage_getter()
+    real_forward = storage.forward_updates
+
+    async def db_down(updates, channel):
+        raise ConnectionError("db down")
+
+    storage.forward_updates = db_down
+    assert await a.route(parse_raw_update(_raw(21, chat_b))) is False
+    assert await a.route(parse_raw_update(_raw(22, chat_b))) is False
+    await a._flush_unforwarded()
+    assert a.queue_manager.get_metrics()["queue_depth"] == 0
+    assert a.stats["forward_failed"] >= 1 and a.as_dict()["unforwarded"] == 2
+
+    # The forwarder retries them, in arrival order
+    storage.forward_updates = real_forward
+    for _ in range(50):
+        if not a._unforwarded:
+            break
+        await asyncio.sleep(0.05)
+    assert [update_id for _, update_id, _ in db.forwarded] == [21, 22]
+    assert a.as_dict()["unforwarded"] == 0
+    await a.stop()
+
+
+@pytest.mark.asyncio
+async def test_route_does_not_wait_for_the_forward_and_batches_it():
+    db = _FakePostgres()
+    a, b = _replica(db, "a"), _replica(db, "b")
+    for replica in (a, b, a, b):
+        await replica.rebalance()
+        await _settle(replica)
+    chats_b = [chat for chat in range(1000) if shard_of(chat, NUM_SHARDS) in b.owned][:3]
+
+    storage = a.storage_getter()
+    real_forward = storage.forward_updates
+    db_slow = asyncio.Event()
+    calls = []
+
+    async def slow_forward(updates, channel):
+        calls.append([update_id for _, update_id, _ in updates])
+        await db_slow.wait()
+        return await real_forward(updates, channel)
+
+    storage.forward_updates = slow_forward
+    for update_id, chat in enumerate(chats_b, 51):
+        assert await asyncio.wait_for(a.route(parse_raw_update(_raw(update_id, chat))), 0.1) is False
+    await asyncio.sleep(0.05)
+    assert calls == [[51]]  # Forwarder woke on the first one; the rest wait for the next batch
+
+    db_slow.set()
+    await asyncio.sleep(0.05)
+    assert calls == [[51], [52, 53]]
+    assert [update_id for _, update_id, _ in db.forwarded] == [51, 52, 53]
+    await a.stop()
+
+
+@pytest.mark.asyncio
+async def test_release_waits_for_in_flight_updates_of_the_shard():
+    db = _FakePostgres()
+    a, b = _replica(db, "a"), _replica(db, "b")
+    await a.rebalance()
+    await b.rebalance()
+
+    moving = next(shard for shard in range(NUM_SHARDS) if preferred_owners(["a", "b"], NUM_SHARDS)[shard] == "b")
+    # A worker of a is still processing an update of the moving shard
+    a.queue_manager._in_flight[0] = {"update": parse_raw_update(_raw(31, moving)), "update_id": 31}
+    await asyncio.wait_for(a.rebalance(), 0.5)  # Heartbeat round is not held up by the release
+    await asyncio.sleep(0.2)
+    assert moving not in a.owned
+    assert db.locks[moving] == "a"  # b can't take the shard yet
+    await b.rebalance()
+    assert moving not in b.owned
+
+    # Still releasing: the next round neither blocks nor locks the shard again
+    await asyncio.wait_for(a.rebalance(), 0.5)
+    assert moving not in a.owned and a._release_tasks
+
+    a.queue_manager._in_flight.clear()
+    await asyncio.wait_for(_settle(a), 1)
+    assert moving not in db.locks
+    await b.rebalance()
+    assert moving in b.owned
+
+
+@pytest.mark.asyncio
+async def test_release_gives_up_waiting_after_timeout():
+    db = _FakePostgres()
+    a, b = _replica(db, "a"), _replica(db, "b")
+    a.release_timeout = 0.1
+    await a.rebalance()
+    await b.rebalance()
+
+    moving = next(shard for shard in range(NUM_SHARDS) if preferred_owners(["a", "b"], NUM_SHARDS)[shard] == "b")
+    a.queue_manager._in_flight[0] = {"update": parse_raw_update(_raw(41, moving)), "update_id": 41}
+    await a.rebalance()
+    await asyncio.wait_for(_settle(a), 1)
+
+    assert moving not in db.locks
+    assert a.stats["release_timeouts"] == 1
@@ -0,0 +1,100 @@
+"""
+Precompiled model validators (app.kie.schema_compiler).
+"""
+
+import copy
+
+import pytest
+
+from app.kie.builder import load_source_of_truth
+from app.kie.schema_compiler import get_compiled_validator, precompile_all, reset_compiled_validators
+from app.kie.validator import ModelContractError, validate_model_inputs, validate_payload_before_create_task
+
+EXAMPLES_SCHEMA = {
+    "category": "t2i",
+    "input_schema": {
+        "model": {"type": "str", "required": True},
+        "callBackUrl": {"type": "str", "required": True},
+        "input": {"type": "dict", "examples": [{"prompt": "a cat", "image_size": "square_hd", "seed": 1}]},
+    },
+}
+
+PROPERTIES_SCHEMA = {
+    "category": "i2v",
+    "input_schema": {
+        "input": {
+            "type": "dict",
+            "properties": {
+                "prompt": {"type": "string", "required": True},
+                "image_url": {"type": "url", "required": True},
+                "resolution": {"type": "string", "enum": ["720p", "1080p"]},
+                "duration": {"type": "number", "minimum": 5, "maximum": 10},
+            },
+        },
+    },
+}
+
+
+def _error(fn, *args):
+    with pytest.raises(ModelContractError) as exc_info:
+        fn(*args)
+    return str(exc_info.value)
+
+
+def test_examples_schema_compiles_to_prompt_required():
+    validator = get_compiled_validator("m/examples", EXAMPLES_SCHEMA)
+    assert [f.name for f in validator.required] == ["prompt"]
+    # System fields are not user inputs
+    assert {f.name for f in validator.fields} == {"prompt", "image_size", "seed"}
+
+    validate_model_inputs("m/examples", EXAMPLES_SCHEMA, {"prompt": "dog"})
+    # Alias: text satisfies prompt
+    validate_model_inputs("m/examples", EXAMPLES_SCHEMA, {"text": "dog"})
+    assert "requires field 'prompt'" in _error(validate_model_inputs, "m/examples", EXAMPLES_SCHEMA, {"seed": 3})
+    assert "requires non-empty text" in _error(validate_model_inputs, "m/examples", EXAMPLES_SCHEMA, {"prompt": "  "})
+
+
+def test_enum_range_and_url_checks():
+    schema = PROPERTIES_SCHEMA
+    ok = {"prompt": "go", "image_url": "https://x/1.png", "resolution": "720p", "duration": 7}
+    validate_model_inputs("m/props", schema, ok)
+
+    assert "must be one of ['720p', '1080p']" in _error(validate_model_inputs, "m/props", schema, dict(ok, resolution="4k"))
+    assert "must be <= 10" in _error(validate_model_inputs, "m/props", schema, dict(ok, duration=11))
+    assert "must be >= 5" in _error(validate_model_inputs, "m/props", schema, dict(ok, duration="2"))
+    assert "requires valid URL" in _error(validate_model_inputs, "m/props", schema, dict(ok, image_url="ftp://x"))
+    # Alias: generic "url" key satisfies a missing image_url
+    validate_model_inputs("m/props", schema, {"prompt": "go", "url": "https://x/2.png"})
+
+
+def test_payload_validation():
+    validate_payload_before_create_task("m/props", {"model": "m/props", "input": {"prompt": "p", "image_url": "https://x"}}, PROPERTIES_SCHEMA)
+    assert "does not match" in _error(validate_payload_before_create_task, "m/props", {"model": "other", "input": {}}, PROPERTIES_SCHEMA)
+    assert "missing from payload['input']" in _error(
+        validate_payload_before_create_task, "m/props", {"model": "m/props", "input": {"prompt": "p"}}, PROPERTIES_SCHEMA
+    )
+
+
+def test_direct_model_only_requires_prompt():
+    schema = {"input_schema": {"prompt": {"type": "str", "required": True}, "style": {"type": "str", "required": True}}}
+    validate_model_inputs("V4", schema, {"prompt": "song"})
+    validate_payload_before_create_task("V4", {"model": "V4", "prompt": "song"}, schema)
+    assert "missing from payload" in _error(validate_payload_before_create_task, "V4", {"model": "V4"}, schema)
+
+
+def test_cache_reuses_and_recompiles_on_new_schema_object():
+    reset_compiled_validators()
+    first = get_compiled_validator("m/cache", EXAMPLES_SCHEMA)
+    assert get_compiled_validator("m/cache", EXAMPLES_SCHEMA) is first
+
+    reloaded = copy.deepcopy(EXAMPLES_SCHEMA)
+    reloaded["input_schema"]["input"]["examples"][0]["negative_prompt"] = ""
+    second = get_compiled_validator("m/cache", reloaded)
+    assert second is not first
+    assert "negative_prompt" in {f.name for f in second.fields}
+
+
+def test_precompile_all_covers_catalog():
+    reset_compiled_validators()
+    models = load_source_of_truth().get("models", {})
+    assert precompile_all() == len(models)
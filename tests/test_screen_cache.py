@@ -0,0 +1,83 @@
+"""
+Pre-rendered menu screens (app.ux.screen_cache) and their use in bot.handlers.flow.
+"""
+
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from app.ux.screen_cache import ScreenCache
+from bot.handlers import flow
+
+
+def _callbacks(markup):
+    return [button.callback_data for row in markup.inline_keyboard for button in row]
+
+
+def test_version_change_drops_screens():
+    version = {"v": "a"}
+    cache = ScreenCache(version_fn=lambda: version["v"])
+    builds = []
+
+    def build():
+        builds.append(1)
+        return object()
+
+    first = cache.get("main_menu", build)
+    assert cache.get("main_menu", build) is first
+    assert cache.get("category_page", build, category="image", page=1) is not first
+    assert len(builds) == 2 and cache.stats.hits == 1
+
+    version["v"] = "b"
+    assert cache.get("main_menu", build) is not first
+    assert len(cache) == 1 and cache.stats.invalidations == 1
+
+
+@pytest.fixture
+def screens(monkeypatch):
+    cache = ScreenCache(version_fn=lambda: "test")
+    monkeypatch.setattr(flow, "get_screen_cache", lambda: cache)
+    return cache
+
+
+def test_warmup_renders_every_category_page_and_detail(screens):
+    built = flow.warm_screen_cache()
+    grouped = flow._models_by_category()
+    pages = sum(flow._category_page_count(category) for category in grouped)
+    details = sum(len(models) for models in grouped.values())
+    # menu + categories + count + grouping, pages, detail text + keyboard per model
+    assert built == 4 + pages + 2 * details
+
+    misses = screens.stats.misses
+    category = next(iter(grouped))
+    assert _callbacks(flow._category_page_keyboard(category, 0)) == _callbacks(
+        flow._model_keyboard(grouped[category], f"cat:{category}", page=0)
+    )
+    assert flow._cached_main_menu_keyboard() is flow._cached_main_menu_keyboard()
+    assert screens.stats.misses == misses
+
+
+@pytest.mark.asyncio
+async def test_page_callback_serves_cached_category_page(screens, monkeypatch):
+    grouped = flow._models_by_category()
+    category = max(grouped, key=lambda name: len(grouped[name]))
+    assert flow._category_page_count(category) > 1
+
+    monkeypatch.setattr(flow, "_model_keyboard", MagicMock(side_effect=AssertionError("rendered on hit")))
+    screens.warm(lambda cache: 0)
+    expected = screens.get(
+        "category_page",
+        lambda: flow.InlineKeyboardMarkup(inline_keyboard=[]),
+        category=category,
+        page=1,
+    )
+
+    callback = MagicMock()
+    callback.data = f"page:cat:{category}:1"
+    callback.answer = AsyncMock()
+    callback.message.edit_reply_markup = AsyncMock()
+    state = MagicMock()
+    state.get_data = AsyncMock(side_effect=AssertionError("state read for a category page"))
+
+    await flow.page_cb(callback, state)
+    callback.message.edit_reply_markup.assert_awaited_once_with(reply_markup=expected)
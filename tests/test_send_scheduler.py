@@ -0,0 +1,90 @@
+"""
+Outbound send scheduler (app.delivery.send_scheduler): buckets, lanes, 429.
+"""
+
+import asyncio
+import time
+
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import AnswerCallbackQuery, SendChatAction, SendMessage
+
+from app.delivery.send_scheduler import SendLane, SendScheduler, send_lane
+
+
+def _recorder(calls, fail_first=None):
+    async def make_request(bot, method):
+        calls.append((method.chat_id if hasattr(method, "chat_id") else None, time.monotonic()))
+        if fail_first is not None and len(calls) == 1:
+            raise fail_first
+        return "ok"
+    return make_request
+
+
+@pytest.mark.asyncio
+async def test_per_chat_bucket_paces_one_chat_only():
+    scheduler = SendScheduler(global_rate=1000, chat_rate=20, chat_burst=1, max_retry_after=5)
+    calls = []
+    make_request = _recorder(calls)
+
+    started = time.monotonic()
+    await asyncio.gather(*(scheduler(make_request, None, SendMessage(chat_id=1, text="x")) for _ in range(3)))
+    # burst 1, then 20/s: third message no earlier than ~0.1s
+    assert time.monotonic() - started >= 0.09
+
+    started = time.monotonic()
+    await asyncio.gather(*(scheduler(make_request, None, SendMessage(chat_id=100 + i, text="x")) for i in range(5)))
+    assert time.monotonic() - started < 0.05
+    # Groups use the per-minute rate
+    assert scheduler._chat_bucket(-100500, time.monotonic()).rate == pytest.approx(20 / 60)
+
+
+@pytest.mark.asyncio
+async def test_results_overtake_queued_broadcasts():
+    scheduler = SendScheduler(global_rate=50, chat_rate=1000, chat_burst=1000)
+    scheduler._global.tokens = 0.0
+    order = []
+
+    async def send(lane, name):
+        with send_lane(lane):
+            await scheduler.acquire(chat_id=None)
+        order.append(name)
+
+    broadcasts = [asyncio.create_task(send(SendLane.BROADCAST, f"b{i}")) for i in range(3)]
+    await asyncio.sleep(0)
+    result = asyncio.create_task(send(SendLane.RESULT, "result"))
+    menu = asyncio.create_task(send(SendLane.MENU, "menu"))
+    await asyncio.gather(result, menu, *broadcasts)
+    assert order[:2] == ["result", "menu"]
+    assert sorted(order[2:]) == ["b0", "b1", "b2"]
+
+
+@pytest.mark.asyncio
+async def test_retry_after_pauses_chat_and_retries():
+    scheduler = SendScheduler(global_rate=1000, chat_rate=1000, chat_burst=10, max_retry_after=5)
+    method = SendMessage(chat_id=7, text="x")
+    error = TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=1)
+    error.retry_after = 0.1
+    calls = []
+
+    assert await scheduler(_recorder(calls, fail_first=error), None, method) == "ok"
+    assert len(calls) == 2 and calls[1][1] - calls[0][1] >= 0.09
+    assert scheduler.stats.retry_after_hits == 1 and scheduler.stats.retries == 1
+
+    # retry_after above the cap is surfaced to the caller at once
+    long_wait = TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=60)
+    with pytest.raises(TelegramRetryAfter):
+        await scheduler(_recorder([], fail_first=long_wait), None, SendMessage(chat_id=8, text="x"))
+    assert scheduler.stats.gave_up == 1
+
+
+@pytest.mark.asyncio
+async def test_unpaced_methods_pass_through():
+    scheduler = SendScheduler(global_rate=1, chat_rate=1, chat_burst=1)
+    scheduler._global.tokens = 0.0
+    calls = []
+    started = time.monotonic()
+    await scheduler(_recorder(calls), None, AnswerCallbackQuery(callback_query_id="1"))
+    await scheduler(_recorder(calls), None, SendChatAction(chat_id=1, action="typing"))
+    assert len(calls) == 2 and time.monotonic() - started < 0.05
+    assert scheduler.stats.sent == 0
@@ -0,0 +1,98 @@
+"""
+UpdateDedup: local window + single atomic storage claim per update.
+"""
+
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from app.storage.pg_storage import PostgresStorage
+from app.utils.update_dedup import RecentIdWindow, UpdateDedup
+
+
+class ClaimStorage:
+    """Storage with claim_update semantics of INSERT ... ON CONFLICT DO NOTHING."""
+
+    def __init__(self):
+        self.rows = set()
+        self.calls = 0
+
+    async def claim_update(self, update_id, worker_id="unknown", update_type="unknown"):
+        self.calls += 1
+        await asyncio.sleep(0)
+        if update_id in self.rows:
+            return False
+        self.rows.add(update_id)
+        return True
+
+
+def test_window_is_bounded_and_evicts_oldest():
+    window = RecentIdWindow(maxlen=3)
+    assert all(window.add(i) for i in range(5))
+    assert len(window) == 3
+    assert 0 not in window and 1 not in window
+    assert not window.add(4)
+
+
+@pytest.mark.asyncio
+async def test_duplicate_costs_zero_round_trips():
+    storage = ClaimStorage()
+    dedup = UpdateDedup(window=100)
+
+    assert await dedup.claim(storage, 1)
+    assert not await dedup.claim(storage, 1)
+    assert storage.calls == 1
+    assert dedup.stats.local_duplicates == 1
+
+
+@pytest.mark.asyncio
+async def test_concurrent_claims_of_same_update():
+    storage = ClaimStorage()
+    # Two instances (two processes) sharing one table
+    a, b = UpdateDedup(), UpdateDedup()
+    results = await asyncio.gather(a.claim(storage, 7), b.claim(storage, 7), a.claim(storage, 7))
+    assert sorted(results) == [False, False, True]
+    assert storage.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_fail_open_and_legacy_storage():
+    broken = MagicMock()
+    broken.claim_update = AsyncMock(side_effect=ConnectionError("db down"))
+    dedup = UpdateDedup()
+    assert await dedup.claim(broken, 1)
+    assert dedup.stats.fail_open == 1
+
+    legacy = MagicMock(spec=["is_update_processed", "mark_update_processed"])
+    legacy.is_update_processed = AsyncMock(side_effect=[True, False])
+    legacy.mark_update_processed = AsyncMock(return_value=True)
+    assert not await dedup.claim(legacy, 2)
+    assert await dedup.claim(legacy, 3)
+    legacy.mark_update_processed.assert_awaited_once()
+
+    # Storage without any dedup API (JsonStorage): local window only
+    assert await dedup.claim(object(), 4)
+    assert not await dedup.claim(object(), 4)
+
+
+@pytest.mark.asyncio
+async def test_pg_claim_update_single_statement():
+    conn = MagicMock()
+    conn.fetchval = AsyncMock(side_effect=[11, None])
+    acquire = MagicMock()
+    acquire.__aenter__ = AsyncMock(return_value=conn)
+    acquire.__aexit__ = AsyncMock(return_value=False)
+    pool = MagicMock()
+    pool.acquire.return_value = acquire
+
+    storage = PostgresStorage.__new__(PostgresStorage)
+    storage._get_pool = AsyncMock(return_value=pool)
+
+    assert await storage.claim_update(11, worker_id="w1", update_type="message")
+    assert not await storage.mark_update_processed(11)
+
+    assert conn.fetchval.await_count == 2
+    sql = conn.fetchval.await_args_list[0].args[0]
+    assert "ON CONFLICT (update_id) DO NOTHING" in sql and "RETURNING" in sql
+    conn.execute.assert_not_called()  # no advisory lock round trips
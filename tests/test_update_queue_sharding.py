@@ -0,0 +1,265 @@
+"""
+UpdateQueueManager: per-chat ordering, dynamic worker pool, PASSIVE hold buffer.
+"""
+
+import asyncio
+import random
+import time
+from dataclasses import dataclass
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+import pytest
+
+from app.utils.update_queue import UpdateQueueManager, _shard_key
+
+
+@dataclass
+class FakeActiveState:
+    active: bool = False
+
+
+def _message(chat_id, seq):
+    return SimpleNamespace(
+        message=SimpleNamespace(chat=SimpleNamespace(id=chat_id), text=f"m{seq}"),
+        callback_query=None,
+        seq=seq,
+    )
+
+
+def _recording_dp(log, running, peak, delay=lambda: 0.0):
+    async def feed_update(_bot, update):
+        running[0] += 1
+        peak[0] = max(peak[0], running[0])
+        await asyncio.sleep(delay())
+        log.append((update.message.chat.id, update.seq))
+        running[0] -= 1
+
+    dp = Mock()
+    dp.feed_update = feed_update
+    return dp
+
+
+async def _drain(queue_mgr, expected, log, timeout=15.0):
+    # Generous: the first dispatch pays the one-off observability import
+    deadline = asyncio.get_running_loop().time() + timeout
+    while len(log) < expected and asyncio.get_running_loop().time() < deadline:
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_updates_of_one_chat_are_processed_in_order():
+    log, running, peak = [], [0], [0]
+    rnd = random.Random(7)
+    queue_mgr = UpdateQueueManager(max_size=200, num_workers=4, num_shards=8)
+    queue_mgr.configure(_recording_dp(log, running, peak, lambda: rnd.uniform(0, 0.01)), Mock())
+    await queue_mgr.start()
+
+    chats = [101, 202, 303, 404]
+    for seq in range(10):
+        for chat_id in chats:
+            # update_id=0 -> no persistent dedup lookup
+            assert queue_mgr.enqueue(_message(chat_id, seq), update_id=0)
+
+    await _drain(queue_mgr, 40, log)
+    await queue_mgr.stop()
+
+    assert len(log) == 40
+    for chat_id in chats:
+        assert [seq for cid, seq in log if cid == chat_id] == list(range(10))
+    # Different chats still run concurrently
+    assert peak[0] > 1
+
+
+@pytest.mark.asyncio
+async def test_pool_grows_with_backlog():
+    log, running, peak = [], [0], [0]
+    queue_mgr = UpdateQueueManager(max_size=50, num_workers=1, max_workers=4, num_shards=16)
+    queue_mgr.configure(_recording_dp(log, running, peak, lambda: 0.05), Mock())
+    await queue_mgr.start()
+
+    for chat_id in range(1, 9):
+        queue_mgr.enqueue(_message(chat_id, 0), update_id=0)
+    await asyncio.sleep(0)
+    workers_during_burst = queue_mgr.get_metrics()["workers_total"]
+
+    await _drain(queue_mgr, 8, log)
+    await queue_mgr.stop()
+
+    assert workers_during_burst == 4
+    assert peak[0] == 4
+    assert len(log) == 8
+
+
+@pytest.mark.asyncio
+async def test_full_queue_drops_and_counts():
+    queue_mgr = UpdateQueueManager(max_size=2, num_workers=1)
+    # Not started: items just accumulate
+    assert queue_mgr.enqueue(_message(1, 0), update_id=0)
+    assert queue_mgr.enqueue(_message(1, 1), update_id=0)
+    assert not queue_mgr.enqueue(_message(1, 2), update_id=0)
+
+    metrics = queue_mgr.get_metrics()
+    assert metrics["total_dropped"] == 1
+    assert metrics["queue_depth"] == 2
+
+
+@pytest.mark.asyncio
+async def test_passive_hold_buffer_releases_in_order_on_active():
+    processed = []
+
+    async def feed_update(_bot, update):
+        processed.append(update.callback_query.data)
+
+    dp = Mock()
+    dp.feed_update = feed_update
+    active_state = FakeActiveState(active=False)
+    queue_mgr = UpdateQueueManager(max_size=10, num_workers=1)
+    queue_mgr.configure(dp, Mock(), active_state)
+    await queue_mgr.start()
+
+    # "help" passes the PASSIVE reject filter but is not processed until ACTIVE
+    for i in range(3):
+        update = SimpleNamespace(
+            message=None,
+            callback_query=SimpleNamespace(data=f"help{i}", from_user=SimpleNamespace(id=5), message=None),
+        )
+        queue_mgr.enqueue(update, update_id=0)
+    await asyncio.sleep(0.1)
+
+    metrics = queue_mgr.get_metrics()
+    assert processed == []
+    assert metrics["held_depth"] == 1
+    assert metrics["queue_depth"] == 2  # Later updates of the chat wait in its frozen shard
+
+    active_state.active = True
+    for _ in range(100):
+        if len(processed) == 3:
+            break
+        await asyncio.sleep(0.02)
+    await queue_mgr.stop()
+
+    assert processed == ["help0", "help1", "help2"]
+    assert queue_mgr.get_metrics()["total_requeued"] == 1  # Only the head of the frozen shard was parked
+
+
+@pytest.mark.asyncio
+async def test_held_update_freezes_its_shard_only():
+    processed = []
+
+    async def feed_update(_bot, update):
+        processed.append((update.chat, update.tag))
+
+    def update(chat_id, tag, *, start=False):
+        return SimpleNamespace(
+            chat=chat_id,
+            tag=tag,
+            message=SimpleNamespace(chat=SimpleNamespace(id=chat_id), text="/start") if start else None,
+            callback_query=None if start else SimpleNamespace(
+                data="help", from_user=SimpleNamespace(id=chat_id), message=None
+            ),
+        )
+
+    dp = Mock()
+    dp.feed_update = feed_update
+    active_state = FakeActiveState(active=False)
+    queue_mgr = UpdateQueueManager(max_size=10, num_workers=2, num_shards=4)
+    queue_mgr.configure(dp, Mock(), active_state)
+    await queue_mgr.start()
+
+    # Chat 1: held "help", then a /start that PASSIVE would allow; chat 2: /start only
+    queue_mgr.enqueue(update(1, "help"), update_id=0)
+    queue_mgr.enqueue(update(1, "start", start=True), update_id=0)
+    queue_mgr.enqueue(update(2, "start", start=True), update_id=0)
+    for _ in range(100):
+        if processed:
+            break
+        await asyncio.sleep(0.02)
+    await asyncio.sleep(0.05)
+
+    assert processed == [(2, "start")]  # Chat 1 waits behind its held update
+
+    active_state.active = True
+    for _ in range(100):
+        if len(processed) == 3:
+            break
+        await asyncio.sleep(0.02)
+    await queue_mgr.stop()
+
+    assert processed == [(2, "start"), (1, "help"), (1, "start")]
+
+
+@pytest.mark.asyncio
+async def test_idle_scale_down_keeps_minimum_pool():
+    log, running, peak = [], [0], [0]
+    queue_mgr = UpdateQueueManager(
+        max_size=50, num_workers=2, max_workers=6, num_shards=16, worker_idle_timeout=0.0
+    )
+    queue_mgr.configure(_recording_dp(log, running, peak, lambda: 0.02), Mock())
+    await queue_mgr.start()
+
+    for chat_id in range(1, 13):
+        queue_mgr.enqueue(_message(chat_id, 0), update_id=0)
+    await _drain(queue_mgr, 12, log)
+    assert queue_mgr.get_metrics()["workers_total"] == 6
+
+    # Let every worker park, then block the loop so all their 1 s idle
+    # timeouts fire in the same tick
+    await asyncio.sleep(0.2)
+    time.sleep(1.2)
+    await asyncio.sleep(0.3)
+    workers_after = queue_mgr.get_metrics()["workers_total"]
+    await queue_mgr.stop()
+
+    assert workers_after == 2
+
+
+@pytest.mark.asyncio
+async def test_cancelled_worker_releases_taken_shard():
+    queue_mgr = UpdateQueueManager(num_workers=1, num_shards=4)
+    queue_mgr._ready = asyncio.Queue()
+    waiter = asyncio.ensure_future(queue_mgr._next_shard(timeout=1.0))
+    await asyncio.sleep(0)
+
+    queue_mgr._scheduled.add(3)
+    queue_mgr._ready.put_nowait(3)
+    await asyncio.sleep(0)  # The shard is taken, the worker not resumed yet
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+
+    assert 3 not in queue_mgr._scheduled  # Empty shard is idle again, not stuck "busy"
+
+
+@pytest.mark.asyncio
+async def test_quiesce_waits_for_in_flight_and_starts_nothing_new():
+    log, running, peak = [], [0], [0]
+    queue_mgr = UpdateQueueManager(max_size=50, num_workers=2, num_shards=4)
+    queue_mgr.configure(_recording_dp(log, running, peak, lambda: 0.2), Mock())
+    await queue_mgr.start()
+
+    queue_mgr.enqueue(_message(1, 0), update_id=1)
+    while running[0] == 0:
+        await asyncio.sleep(0.01)
+    # Queued behind the in-flight update and on another chat
+    queue_mgr.enqueue(_message(1, 1), update_id=2)
+    queue_mgr.enqueue(_message(2, 0), update_id=3)
+
+    assert await queue_mgr.quiesce(timeout=5)
+    assert running[0] == 0 and log == [(1, 0)]
+    queue_mgr.enqueue(_message(3, 0), update_id=4)
+    await asyncio.sleep(0.3)
+    assert log == [(1, 0)]
+    assert queue_mgr.get_metrics()["queue_depth"] == 3
+
+    queue_mgr.resume()
+    await _drain(queue_mgr, 4, log)
+    await queue_mgr.stop()
+    assert sorted(log) == [(1, 0), (1, 1), (2, 0), (3, 0)]
+
+
+def test_shard_key_prefers_chat_then_user():
+    assert _shard_key({"message": {"chat": {"id": -100}}}, 1) == -100
+    assert _shard_key(SimpleNamespace(message=None, callback_query=SimpleNamespace(
+        message=None, from_user=SimpleNamespace(id=42))), 1) == 42
+    assert _shard_key({"poll": {}}, 77) == 77
@@ -0,0 +1,266 @@
+"""
+User generation rate limiter (app.utils.user_rate_limiter): GCRA limits, eviction, backends.
+"""
+
+import asyncio
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from app.payments import integration
+from app.storage.pg_storage import PostgresStorage
+from app.utils.user_rate_limiter import (
+    GcraLimits,
+    InMemoryRateLimitBackend,
+    StorageRateLimitBackend,
+    UserRateLimiter,
+    _admits,
+    _advanced,
+    _released,
+)
+
+
+class _FakeRateLimitStorage:
+    """Storage exposing the PostgresStorage rate limit methods."""
+
+    def __init__(self, fail=False, clock=time.time):
+        self.rows = {}
+        self.fail = fail
+        self.clock = clock
+
+    async def get_rate_limit_state(self, user_id):
+        if self.fail:
+            raise ConnectionError("db down")
+        return self.rows.get(user_id)
+
+    async def advance_rate_limit(self, user_id, now, minute_interval, hour_interval, is_paid):
+        if self.fail:
+            raise ConnectionError("db down")
+        self.rows[user_id] = _advanced(self.rows.get(user_id, (0.0, 0.0, 0.0)), now, minute_interval, hour_interval, is_paid)
+        return self.rows[user_id]
+
+    async def acquire_rate_limit(self, user_id, minute_interval, hour_interval, minute_tolerance,
+                                 hour_tolerance, cooldown_seconds, is_paid):
+        if self.fail:
+            raise ConnectionError("db down")
+        now = self.clock()
+        limits = GcraLimits(minute_interval, hour_interval, minute_tolerance, hour_tolerance, cooldown_seconds)
+        state = self.rows.get(user_id, (0.0, 0.0, 0.0))
+        if not _admits(state, now, limits, is_paid):
+            return False, state, now
+        self.rows[user_id] = _advanced(state, now, minute_interval, hour_interval, is_paid)
+        return True, self.rows[user_id], now
+
+    async def release_rate_limit(self, user_id, minute_interval, hour_interval, is_paid, admitted_at):
+        if self.fail:
+            raise ConnectionError("db down")
+        if user_id in self.rows:
+            self.rows[user_id] = _released(self.rows[user_id], minute_interval, hour_interval, is_paid, admitted_at)
+
+    async def evict_rate_limits(self, now, cooldown_seconds):
+        return 0
+
+
+@pytest.mark.asyncio
+async def test_minute_burst_then_one_per_interval():
+    limiter = UserRateLimiter(InMemoryRateLimitBackend())
+    for _ in range(5):
+        assert (await limiter.check_rate_limit(1, is_paid=False))["allowed"]
+        await limiter.record_generation(1, is_paid=False)
+
+    check = await limiter.check_rate_limit(1, is_paid=False)
+    assert check["allowed"] is False
+    assert check["reason"] == "minute_limit"
+    # Next slot opens 60s / 5 after the burst
+    assert 11 <= check["wait_seconds"] <= 13
+    assert check["minute_used"] == 5
+
+    stats = await limiter.get_user_stats(1)
+    assert stats["minute_used"] == 5 and stats["hour_used"] == 5
+
+
+@pytest.mark.asyncio
+async def test_paid_cooldown_and_hour_limit():
+    backend = InMemoryRateLimitBackend()
+    limiter = UserRateLimiter(backend)
+    await limiter.record_generation(2, is_paid=True)
+    check = await limiter.check_rate_limit(2, is_paid=True)
+    assert check["reason"] == "cooldown" and 9 <= check["wait_seconds"] <= 10
+    # Free generations ignore the paid cooldown
+    assert (await limiter.check_rate_limit(2, is_paid=False))["allowed"]
+
+    now = time.time()
+    for i in range(21):
+        await backend.advance(3, now - 240 + i * 12, limiter.minute_interval, limiter.hour_interval, False)
+    check = await limiter.check_rate_limit(3, is_paid=True)
+    assert check["reason"] == "hour_limit"
+    assert check["hour_used"] == 20
+
+
+@pytest.mark.asyncio
+async def test_idle_users_are_evicted():
+    backend = InMemoryRateLimitBackend()
+    limiter = UserRateLimiter(backend)
+    long_ago = time.time() - 7200
+    for user_id in range(1000):
+        await backend.advance(user_id, long_ago, limiter.minute_interval, limiter.hour_interval, True)
+    assert len(backend) == 1000
+
+    limiter._next_evict = 0
+    await limiter.record_generation(5000, is_paid=True)
+    # Only the active user keeps state
+    assert len(backend) == 1
+    assert await backend.load(5000) is not None
+
+
+@pytest.mark.asyncio
+async def test_storage_backend_shares_state_and_fails_open():
+    storage = _FakeRateLimitStorage()
+    first = UserRateLimiter(StorageRateLimitBackend(lambda: storage))
+    second = UserRateLimiter(StorageRateLimitBackend(lambda: storage))
+
+    await first.record_generation(7, is_paid=True)
+    # Another instance sees the same state
+    assert (await second.check_rate_limit(7, is_paid=True))["reason"] == "cooldown"
+
+    storage.fail = True
+    await second.record_generation(8, is_paid=True)
+    assert (await second.check_rate_limit(8, is_paid=True))["reason"] == "cooldown"
+
+    # Storage without rate limit support (JsonStorage) uses process-local state
+    local = UserRateLimiter(StorageRateLimitBackend(lambda: object()))
+    await local.record_generation(9, is_paid=True)
+    assert (await local.check_rate_limit(9, is_paid=True))["reason"] == "cooldown"
+
+
+@pytest.mark.asyncio
+async def test_concurrent_acquires_admit_exactly_the_burst():
+    storage = _FakeRateLimitStorage()
+    instances = [UserRateLimiter(StorageRateLimitBackend(lambda: storage)) for _ in range(3)]
+
+    results = await asyncio.gather(*(
+        instances[i % 3].acquire(11, is_paid=False) for i in range(12)
+    ))
+
+    assert sum(r["allowed"] for r in results) == UserRateLimiter.MAX_GENS_PER_MINUTE
+    assert {r["reason"] for r in results if not r["allowed"]} == {"minute_limit"}
+    # A read-only check records nothing
+    assert not (await instances[0].check_rate_limit(11, is_paid=False))["allowed"]
+    assert (await instances[0].get_user_stats(11))["minute_used"] == 5
+
+
+@pytest.mark.asyncio
+async def test_acquire_uses_backend_clock():
+    # Database clock 30 s ahead of this instance: its 10 s paid cooldown is measured there
+    storage = _FakeRateLimitStorage(clock=lambda: time.time() + 30)
+    limiter = UserRateLimiter(StorageRateLimitBackend(lambda: storage))
+
+    assert (await limiter.acquire(12, is_paid=True))["allowed"]
+    denied = await limiter.acquire(12, is_paid=True)
+    assert denied["reason"] == "cooldown" and 9 <= denied["wait_seconds"] <= 10
+
+    storage.fail = True
+    # Backend down: admitted against process-local state
+    assert (await limiter.acquire(13, is_paid=True))["allowed"]
+    assert (await limiter.acquire(13, is_paid=True))["reason"] == "cooldown"
+
+
+@pytest.mark.asyncio
+async def test_release_gives_back_the_slot_and_the_cooldown():
+    storage = _FakeRateLimitStorage()
+    limiter = UserRateLimiter(StorageRateLimitBackend(lambda: storage))
+
+    admitted = [await limiter.acquire(15, is_paid=False) for _ in range(5)]
+    assert (await limiter.acquire(15, is_paid=False))["reason"] == "minute_limit"
+    await limiter.release(15, admitted[-1]["admitted_at"], is_paid=False)
+    assert (await limiter.acquire(15, is_paid=False))["allowed"]
+
+    paid = await limiter.acquire(16, is_paid=True)
+    await limiter.release(16, paid["admitted_at"], is_paid=True)
+    again = await limiter.acquire(16, is_paid=True)
+    assert again["allowed"]
+    assert (await limiter.get_user_stats(16))["minute_used"] == 1
+
+    # A stale release doesn't clear the cooldown of a later paid generation
+    await limiter.release(16, paid["admitted_at"], is_paid=True)
+    assert (await limiter.check_rate_limit(16, is_paid=True))["reason"] == "cooldown"
+
+
+@pytest.mark.asyncio
+async def test_failed_generation_does_not_use_up_the_quota(monkeypatch):
+    limiter = UserRateLimiter(InMemoryRateLimitBackend())
+    monkeypatch.setattr(integration, "get_rate_limiter", lambda: limiter)
+    monkeypatch.setattr(integration, "is_free_model", lambda model_id: False)
+    charges = MagicMock()
+    charges.create_pending_charge = AsyncMock(return_value={"status": "insufficient_balance", "message": "no"})
+
+    for _ in range(3):
+        result = await integration.generate_with_payment("m/paid", {}, 17, 10.0, charge_manager=charges)
+        assert result["error_code"] == "INSUFFICIENT_BALANCE"
+    assert (await limiter.get_user_stats(17))["minute_used"] == 0
+    assert (await limiter.check_rate_limit(17, is_paid=True))["allowed"]
+
+    charges.create_pending_charge = AsyncMock(side_effect=RuntimeError("db down"))
+    with pytest.raises(RuntimeError):
+        await integration.generate_with_payment("m/paid", {}, 17, 10.0, charge_manager=charges)
+    assert (await limiter.check_rate_limit(17, is_paid=True))["allowed"]
+
+    generator = MagicMock()
+    generator.generate = AsyncMock(return_value={"success": True, "result_urls": ["https://r/1.png"]})
+    charges.create_pending_charge = AsyncMock(return_value={"status": "pending", "message": ""})
+    charges.commit_charge = AsyncMock(return_value={"status": "committed", "message": ""})
+    with patch.object(integration, "KieGenerator", return_value=generator), \
+            patch.object(integration, "track_generation", AsyncMock()):
+        assert (await integration.generate_with_payment("m/paid", {}, 17, 10.0, charge_manager=charges))["success"]
+    # A successful generation keeps its admission
+    assert (await limiter.check_rate_limit(17, is_paid=True))["reason"] == "cooldown"
+
+
+def _pg_storage(conn):
+    acquire = MagicMock()
+    acquire.__aenter__ = AsyncMock(return_value=conn)
+    acquire.__aexit__ = AsyncMock(return_value=False)
+    pool = MagicMock()
+    pool.acquire.return_value = acquire
+    storage = PostgresStorage.__new__(PostgresStorage)
+    storage._get_pool = AsyncMock(return_value=pool)
+    storage._pool_manager = MagicMock()
+    return storage
+
+
+@pytest.mark.asyncio
+async def test_pg_acquire_is_one_conditional_statement_and_not_retried():
+    limits = UserRateLimiter().limits
+    conn = MagicMock()
+    conn.fetchrow = AsyncMock(return_value={
+        "allowed": False, "tat_minute": 1060.0, "tat_hour": 1180.0, "last_paid_at": 1000.0, "now": 1001.0,
+    })
+    storage = _pg_storage(conn)
+
+    allowed, state, now = await storage.acquire_rate_limit(14, *limits, True)
+
+    assert (allowed, state, now) == (False, (1060.0, 1180.0, 1000.0), 1001.0)
+    sql = conn.fetchrow.await_args.args[0]
+    assert "ON CONFLICT (user_id) DO UPDATE" in sql and "WHERE r.tat_minute" in sql
+    assert "EXTRACT(EPOCH FROM NOW())" in sql
+
+    conn.fetchrow = AsyncMock(side_effect=ConnectionResetError("reply lost"))
+    with pytest.raises(ConnectionResetError):
+        await storage.acquire_rate_limit(14, *limits, True)
+    # A lost reply may hide a committed advance: sent once, never re-run
+    assert conn.fetchrow.await_count == 1
+    storage._pool_manager.mark_broken.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_pg_release_is_one_update_and_not_retried():
+    conn = MagicMock()
+    conn.execute = AsyncMock(side_effect=ConnectionResetError("reply lost"))
+    storage = _pg_storage(conn)
+
+    with pytest.raises(ConnectionResetError):
+        await storage.release_rate_limit(18, 12.0, 180.0, True, 1000.0)
+    assert conn.execute.await_count == 1
+    sql = conn.execute.await_args.args[0]
+    assert "UPDATE user_rate_limits" in sql and "last_paid_at = $5::float8" in sql
@@ -0,0 +1,100 @@
+"""
+Webhook raw-bytes ingress (app.utils.webhook_ingress) and deferred validation in the queue.
+"""
+
+import asyncio
+import json
+from unittest.mock import Mock
+
+import pytest
+
+from app.utils.update_queue import UpdateQueueManager, _shard_key
+from app.utils.webhook_ingress import BadPayload, RawUpdate, parse_raw_update
+
+MESSAGE = {
+    "update_id": 1001,
+    "message": {
+        "message_id": 5,
+        "from": {"id": 42, "is_bot": False, "first_name": "A"},
+        "chat": {"id": -100500, "type": "supergroup", "title": "g"},
+        "date": 1700000000,
+        "text": "/start",
+    },
+}
+CALLBACK = {
+    "update_id": 1002,
+    "callback_query": {
+        "id": "cb1",
+        "from": {"id": 42, "is_bot": False, "first_name": "A"},
+        "chat_instance": "ci",
+        "data": "main_menu",
+        "message": {
+            "message_id": 6,
+            "from": {"id": 7, "is_bot": True, "first_name": "bot"},
+            "chat": {"id": 42, "type": "private", "first_name": "A"},
+            "date": 1700000000,
+            "text": "menu",
+        },
+    },
+}
+INLINE = {
+    "update_id": 1003,
+    "inline_query": {"id": "q", "from": {"id": 77, "is_bot": False, "first_name": "B"}, "query": "", "offset": ""},
+}
+
+
+def _raw(payload, **dump_kwargs):
+    return json.dumps(payload, **dump_kwargs).encode()
+
+
+@pytest.mark.parametrize("payload", [MESSAGE, CALLBACK, INLINE])
+def test_fast_scan_matches_full_shard_key(payload):
+    raw_update = parse_raw_update(_raw(payload, separators=(",", ":")))
+    assert raw_update.update_id == payload["update_id"]
+    assert raw_update.update_type == next(k for k in payload if k != "update_id")
+    assert raw_update.chat_key == _shard_key(payload, payload["update_id"])
+
+
+def test_unusual_layout_falls_back_to_json():
+    reordered = {"message": MESSAGE["message"], "update_id": 1001}
+    raw_update = parse_raw_update(_raw(reordered))
+    assert (raw_update.update_id, raw_update.update_type, raw_update.chat_key) == (1001, "message", -100500)
+
+    with pytest.raises(BadPayload):
+        parse_raw_update(b"not json")
+    with pytest.raises(BadPayload):
+        parse_raw_update(b'{"message": {}}')
+
+
+def test_parse_is_lazy_and_cached():
+    raw_update = parse_raw_update(_raw(MESSAGE))
+    assert raw_update._update is None
+    update = raw_update.parse()
+    assert update.update_id == 1001 and update.message.text == "/start"
+    assert raw_update.parse() is update
+
+
+@pytest.mark.asyncio
+async def test_worker_validates_raw_updates():
+    fed = []
+
+    async def feed_update(_bot, update):
+        fed.append(update)
+
+    dp = Mock()
+    dp.feed_update = feed_update
+    queue_mgr = UpdateQueueManager(max_size=10, num_workers=1)
+    queue_mgr.configure(dp, Mock())
+    await queue_mgr.start()
+
+    # update_id=0: skip persistent dedup, exercise validation only
+    queue_mgr.enqueue(RawUpdate(b'{"update_id": 5, "message": {"bogus": 1}}', 5, "message", 1), update_id=0)
+    queue_mgr.enqueue(parse_raw_update(_raw(CALLBACK)), update_id=0)
+    for _ in range(500):
+        if fed:
+            break
+        await asyncio.sleep(0.02)
+    await queue_mgr.stop()
+
+    assert [u.callback_query.data for u in fed] == ["main_menu"]
+    assert queue_mgr.get_metrics()["total_dropped"] == 1
@@ -410,11 +410,11 @@ class ProductionChecker:
         main_render = PROJECT_ROOT / "main_render.py"
         if main_render.exists():
             content = main_render.read_text()
-            if "OrphanCallbackReconciler" in content and "reconciler.start()" in content:
+            if "start_callback_inbox" in content:
                 suite.checks.append(CheckResult(
                     "PHASE 5: Reconciler integration",
                     CheckStatus.PASS,
-                    "OrphanCallbackReconciler integrated in main_render.py"
+                    "Orphan callbacks retried by KIE callback inbox workers (main_render.py)"
                 ))
             else:
                 suite.checks.append(CheckResult(
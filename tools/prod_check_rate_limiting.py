@@ -31,6 +31,7 @@ Exit Codes:
 - 1: FAILED (critical issue, DO NOT DEPLOY)
 """
 
+import asyncio
 import sys
 import os
 import time
@@ -40,7 +41,7 @@ from pathlib import Path
 # Add project root
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from app.utils.user_rate_limiter import UserRateLimiter, get_rate_limiter
+from app.utils.user_rate_limiter import InMemoryRateLimitBackend, UserRateLimiter, get_rate_limiter
 
 RESET = "\033[0m"
 GREEN = "\033[92m"
@@ -64,6 +65,10 @@ def log_warn(msg: str):
 def log_info(msg: str):
     print(f"ℹ️  {msg}")
 
+def fresh_limiter() -> UserRateLimiter:
+    """Limiter with empty in-process state (does not touch the shared backend)."""
+    return UserRateLimiter(InMemoryRateLimitBackend())
+
 
 # ════════════════════════════════════════════════════════════════════════════
 # PHASE 1: Import and Configuration Validation
@@ -127,23 +132,22 @@ def phase2_cooldown_enforcement():
     """Validate 10s cooldown between paid generations."""
     log_phase(2, "Cooldown Enforcement (10s between paid gens)")
     
-    limiter = get_rate_limiter()
-    limiter._user_limits.clear()  # Reset state
+    limiter = fresh_limiter()
     
     test_user = 99999
     
     # First generation should be allowed
-    check1 = limiter.check_rate_limit(test_user, is_paid=True)
+    check1 = asyncio.run(limiter.check_rate_limit(test_user, is_paid=True))
     if not check1['allowed']:
         log_fail(f"First generation blocked: {check1}")
         return False
     log_pass("First paid generation allowed")
     
     # Record it
-    limiter.record_generation(test_user, is_paid=True)
+    asyncio.run(limiter.record_generation(test_user, is_paid=True))
     
     # Immediate second generation should be BLOCKED (cooldown)
-    check2 = limiter.check_rate_limit(test_user, is_paid=True)
+    check2 = asyncio.run(limiter.check_rate_limit(test_user, is_paid=True))
     if check2['allowed']:
         log_fail("Second generation allowed immediately (cooldown not enforced)")
         return False
@@ -162,7 +166,7 @@ def phase2_cooldown_enforcement():
     log_info("Simulating 11s wait...")
     time.sleep(11)
     
-    check3 = limiter.check_rate_limit(test_user, is_paid=True)
+    check3 = asyncio.run(limiter.check_rate_limit(test_user, is_paid=True))
     if not check3['allowed']:
         log_fail(f"Generation blocked after cooldown: {check3}")
         return False
@@ -180,24 +184,19 @@ def phase3_minute_limit():
     """Validate 5 generations per minute limit."""
     log_phase(3, "Minute Limit (5 gens/minute)")
     
-    limiter = get_rate_limiter()
-    limiter._user_limits.clear()
+    limiter = fresh_limiter()
     
     test_user = 99998
     
     # Record 5 generations with NO cooldown (simulate rapid clicks)
     for i in range(5):
-        # Bypass cooldown by manually adding to history
-        now = time.time()
-        user_limit = limiter._get_user_limit(test_user)
-        user_limit.minute_gens.append(now)
-        user_limit.hour_gens.append(now)
-        time.sleep(0.1)  # Small delay to spread timestamps
+        # Free generations bypass the paid cooldown
+        asyncio.run(limiter.record_generation(test_user, is_paid=False))
     
     log_pass(f"Recorded 5 generations in <1s")
     
     # 6th generation should be BLOCKED (minute limit)
-    check = limiter.check_rate_limit(test_user, is_paid=True)
+    check = asyncio.run(limiter.check_rate_limit(test_user, is_paid=True))
     if check['allowed']:
         log_fail("6th generation allowed (minute limit not enforced)")
         return False
@@ -208,15 +207,15 @@ def phase3_minute_limit():
     
     log_pass(f"Minute limit enforced: {check['reason']}")
     
-    # Check wait_seconds is reasonable (should be ~60s - time_elapsed)
-    if check['wait_seconds'] < 50 or check['wait_seconds'] > 61:
-        log_fail(f"Wait time {check['wait_seconds']}s not in 50-61s range")
+    # GCRA: after a burst of 5 the next slot opens one interval (60s / 5) later
+    if check['wait_seconds'] < 11 or check['wait_seconds'] > 13:
+        log_fail(f"Wait time {check['wait_seconds']}s not in 11-13s range")
         return False
     
     log_pass(f"Wait time {check['wait_seconds']}s is correct")
     
     # Get stats
-    stats = limiter.get_user_stats(test_user)
+    stats = asyncio.run(limiter.get_user_stats(test_user))
     if stats['minute_used'] != 5:
         log_fail(f"Stats show {stats['minute_used']} gens, expected 5")
         return False
@@ -234,25 +233,26 @@ def phase4_hour_limit():
     """Validate 20 generations per hour limit."""
     log_phase(4, "Hour Limit (20 gens/hour)")
     
-    limiter = get_rate_limiter()
-    limiter._user_limits.clear()
+    limiter = fresh_limiter()
     
     test_user = 99997
     
-    # Record 20 generations spread over 10 minutes (bypass minute limit)
+    # Record 21 generations at the sustained minute rate (12s apart, bypass minute limit).
+    # GCRA: the hour burst of 20 refills one slot per 180s, so 4 minutes of
+    # generations at 5/min exhaust it.
     now = time.time()
-    user_limit = limiter._get_user_limit(test_user)
-    for i in range(20):
-        # Spread across 10 minutes (30s apart)
-        timestamp = now - (i * 30)
-        user_limit.hour_gens.append(timestamp)
+    for i in range(21):
+        timestamp = now - 240 + (i * 12)
+        asyncio.run(limiter.backend.advance(
+            test_user, timestamp, limiter.minute_interval, limiter.hour_interval, is_paid=False
+        ))
     
-    log_pass(f"Recorded 20 generations spread over 10 minutes")
+    log_pass(f"Recorded 21 generations spread over 4 minutes")
     
-    # 21st generation should be BLOCKED (hour limit)
-    check = limiter.check_rate_limit(test_user, is_paid=True)
+    # Next generation should be BLOCKED (hour limit)
+    check = asyncio.run(limiter.check_rate_limit(test_user, is_paid=True))
     if check['allowed']:
-        log_fail("21st generation allowed (hour limit not enforced)")
+        log_fail("22nd generation allowed (hour limit not enforced)")
         return False
     
     if check['reason'] != 'hour_limit':
@@ -262,7 +262,7 @@ def phase4_hour_limit():
     log_pass(f"Hour limit enforced: {check['reason']}")
     
     # Get stats
-    stats = limiter.get_user_stats(test_user)
+    stats = asyncio.run(limiter.get_user_stats(test_user))
     if stats['hour_used'] != 20:
         log_fail(f"Stats show {stats['hour_used']} gens, expected 20")
         return False
@@ -280,22 +280,21 @@ def phase5_free_tier():
     """Validate FREE models have no cooldown, only minute/hour limits."""
     log_phase(5, "Free Tier (no cooldown)")
     
-    limiter = get_rate_limiter()
-    limiter._user_limits.clear()
+    limiter = fresh_limiter()
     
     test_user = 99996
     
     # First FREE generation
-    check1 = limiter.check_rate_limit(test_user, is_paid=False)
+    check1 = asyncio.run(limiter.check_rate_limit(test_user, is_paid=False))
     if not check1['allowed']:
         log_fail(f"First FREE gen blocked: {check1}")
         return False
     log_pass("First FREE generation allowed")
     
-    limiter.record_generation(test_user, is_paid=False)
+    asyncio.run(limiter.record_generation(test_user, is_paid=False))
     
     # Immediate second FREE generation should be ALLOWED (no cooldown for free)
-    check2 = limiter.check_rate_limit(test_user, is_paid=False)
+    check2 = asyncio.run(limiter.check_rate_limit(test_user, is_paid=False))
     if not check2['allowed']:
         log_fail(f"Second FREE gen blocked: {check2} (should have no cooldown)")
         return False
@@ -305,10 +304,10 @@ def phase5_free_tier():
     # But minute limit still applies
     # Record 4 more (total 5 in minute)
     for _ in range(4):
-        limiter.record_generation(test_user, is_paid=False)
+        asyncio.run(limiter.record_generation(test_user, is_paid=False))
     
     # 6th should be blocked by minute limit
-    check3 = limiter.check_rate_limit(test_user, is_paid=False)
+    check3 = asyncio.run(limiter.check_rate_limit(test_user, is_paid=False))
     if check3['allowed']:
         log_fail("6th FREE gen allowed (minute limit not enforced)")
         return False